@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of include-pattern matching for s3-log-sync.
+
+Matches synthetic log file names, shaped like the ones in config/config_prod_final.yaml, against the
+include patterns of several nodes, with the original per-pattern loop from ``S3Sync.should_upload_file``
+and with the compiled ``IncludeMatcher``.
+
+Usage:
+    python benchmarks/bench_include_matcher.py [--files 1000000]
+"""
+import argparse
+import os
+import random
+import time
+
+from pds.web_analytics.include_matcher import IncludeMatcher
+
+# Include patterns from config_prod_final.yaml, with the .gz suffix s3-log-sync appends when gzipping
+PATTERNS = [
+    "atm-atmos-apache.2025-*.txt.gz",
+    "atm-atmos-ftp.2025-*.gz",
+    "*.2025-*.txt.gz",
+    "u_ex25*.gz",
+    "*.2025*.gz",
+    "*-2025*.gz",
+    "*_2025*.gz",
+    "*2025-*.log.gz",
+]
+
+NAME_TEMPLATES = [
+    "atm-atmos-apache.{year}-{month:02d}-{day:02d}.txt.gz",
+    "atm-atmos-ftp.{year}-{month:02d}-{day:02d}.gz",
+    "pds-proxy.{year}-{month:02d}-{day:02d}.txt.gz",
+    "u_ex{yy}{month:02d}{day:02d}.log.gz",
+    "access_log-{year}{month:02d}{day:02d}.gz",
+    "localhost_access_log.{year}-{month:02d}-{day:02d}.log.gz",
+    "error_log.{year}{month:02d}{day:02d}",
+]
+
+
+def legacy_should_upload_file(file_path, include_patterns):
+    """The pattern loop S3Sync.should_upload_file used before IncludeMatcher."""
+    file_name = os.path.basename(file_path)
+
+    for pattern in include_patterns:
+        if pattern == "*" or pattern == "*.*":
+            return True
+        if pattern.endswith("*") and file_name.startswith(pattern[:-1]):
+            return True
+        if pattern.startswith("*") and file_name.endswith(pattern[1:]):
+            return True
+        if file_name == pattern:
+            return True
+        if file_name.endswith(pattern):
+            return True
+
+    return False
+
+
+def synthetic_names(count, seed=0):
+    """Generate log file names spread over several years."""
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        year = rng.choice((2023, 2024, 2025))
+        names.append(
+            rng.choice(NAME_TEMPLATES).format(
+                year=year, yy=year % 100, month=rng.randint(1, 12), day=rng.randint(1, 28)
+            )
+        )
+    return names
+
+
+def time_it(label, func, names):
+    """Run a matcher over every name and print its throughput."""
+    start = time.perf_counter()
+    matched = sum(1 for name in names if func(name))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.3f}s  {len(names) / elapsed / 1e6:6.2f}M names/s  {matched} matched")
+    return elapsed
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1_000_000, help="Number of synthetic file names.")
+    args = parser.parse_args()
+
+    names = synthetic_names(args.files)
+    matcher = IncludeMatcher(PATTERNS)
+
+    legacy = time_it("legacy", lambda name: legacy_should_upload_file(name, PATTERNS), names)
+    compiled = time_it("compiled", matcher.match, names)
+    print(f"speedup    {legacy / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
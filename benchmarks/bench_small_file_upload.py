@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Benchmark of small- and large-file uploads for s3-log-sync.
+
+Uploads a batch of small files (a few KB, like hourly HTTP and FTP logs after gzip) and a few large ones, on the
+same number of threads as ``--workers``, and prints files/s for:
+
+* small files through ``upload_file`` (the boto3 TransferManager, as s3-log-sync used to upload every file)
+  and through a single memory-mapped ``put_object``;
+* large files through ``upload_file`` with the boto3 default ``TransferConfig`` and with the multipart
+  settings s3-log-sync uses.
+
+By default nothing leaves the host: a handler on the client's ``before-send`` event reads each request body
+and answers it locally, so the numbers show the client-side cost of each path, which is what dominates for
+small files. Pass ``--bucket`` to upload to a real bucket instead; the objects are written under ``--prefix``
+and deleted afterwards.
+
+Usage:
+    python benchmarks/bench_small_file_upload.py [--small-files 2000] [--small-size 4096]
+        [--large-files 8] [--large-size 67108864] [--workers 8] [--bucket BUCKET] [--profile PROFILE]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+
+from pds.web_analytics.transfer import multipart_transfer_config
+from pds.web_analytics.transfer import put_small_file
+
+CREATE_MULTIPART_RESPONSE = (
+    b'<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+    b"<Bucket>bench</Bucket><Key>key</Key><UploadId>bench-upload</UploadId></InitiateMultipartUploadResult>"
+)
+COMPLETE_MULTIPART_RESPONSE = (
+    b'<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+    b'<Bucket>bench</Bucket><Key>key</Key><ETag>"bench-2"</ETag></CompleteMultipartUploadResult>'
+)
+
+
+class _Raw:
+    """The raw HTTP response body botocore reads from."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def stream(self, **kwargs):
+        yield self.content
+
+
+def answer_locally(request, **kwargs):
+    """Answer a request without sending it, after reading its body as the HTTP client would."""
+    body = request.body
+    if hasattr(body, "read"):
+        while body.read(1024 * 1024):
+            pass
+    query = parse_qs(urlsplit(request.url).query, keep_blank_values=True)
+    content = b""
+    if request.method == "POST" and "uploads" in query:
+        content = CREATE_MULTIPART_RESPONSE
+    elif request.method == "POST" and "uploadId" in query:
+        content = COMPLETE_MULTIPART_RESPONSE
+    return AWSResponse(request.url, 200, {"ETag": '"bench"'}, _Raw(content))
+
+
+def make_client(args):
+    """Create the S3 client, answering requests locally unless a bucket is given."""
+    config = Config(max_pool_connections=max(args.workers, 10), retries={"mode": "standard"})
+    if args.bucket:
+        return boto3.Session(profile_name=args.profile).client("s3", config=config)
+    client = boto3.client(
+        "s3", region_name="us-west-2", aws_access_key_id="bench", aws_secret_access_key="bench", config=config
+    )
+    client.meta.events.register("before-send.s3", answer_locally)
+    return client
+
+
+def write_files(directory, name, count, size):
+    """Write files of random bytes and return their paths."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{name}{i:06d}.gz")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def time_it(label, upload, paths, workers):
+    """Upload every file on a pool of workers and print the throughput."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(upload, paths))
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f"{label:<28} {elapsed:8.3f}s  {len(paths) / elapsed:9.1f} files/s  {size / elapsed / 1024**2:8.1f} MiB/s")
+    return elapsed
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small-files", type=int, default=2000, help="Number of small files.")
+    parser.add_argument("--small-size", type=int, default=4096, help="Size of each small file in bytes.")
+    parser.add_argument("--large-files", type=int, default=8, help="Number of large files.")
+    parser.add_argument("--large-size", type=int, default=64 * 1024**2, help="Size of each large file in bytes.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of files uploaded at once.")
+    parser.add_argument("--bucket", default=None, help="Upload to this bucket instead of answering locally.")
+    parser.add_argument("--prefix", default="s3-log-sync-bench/", help="Key prefix of the uploads in --bucket.")
+    parser.add_argument("--profile", default=None, help="AWS profile for --bucket.")
+    args = parser.parse_args()
+
+    client = make_client(args)
+    bucket = args.bucket or "bench"
+    extra_args = {"ContentType": "application/gzip"}
+    temp_dir = tempfile.mkdtemp()
+    keys = set()
+
+    def key(path):
+        keys.add(args.prefix + os.path.basename(path))
+        return args.prefix + os.path.basename(path)
+
+    try:
+        small = write_files(temp_dir, "small", args.small_files, args.small_size)
+        large = write_files(temp_dir, "large", args.large_files, args.large_size)
+
+        print(f"{args.small_files} small files of {args.small_size} bytes")
+        transfer = time_it(
+            "  upload_file",
+            lambda path: client.upload_file(path, bucket, key(path), ExtraArgs=extra_args),
+            small,
+            args.workers,
+        )
+        put = time_it(
+            "  put_object (mmap)",
+            lambda path: put_small_file(client, bucket, path, key(path), extra_args),
+            small,
+            args.workers,
+        )
+        print(f"  speedup {transfer / put:.1f}x")
+
+        print(f"{args.large_files} large files of {args.large_size} bytes")
+        default = time_it(
+            "  upload_file (default)",
+            lambda path: client.upload_file(path, bucket, key(path), ExtraArgs=extra_args, Config=TransferConfig()),
+            large,
+            args.workers,
+        )
+        tuned_config = multipart_transfer_config()
+        tuned = time_it(
+            "  upload_file (tuned)",
+            lambda path: client.upload_file(path, bucket, key(path), ExtraArgs=extra_args, Config=tuned_config),
+            large,
+            args.workers,
+        )
+        print(f"  speedup {default / tuned:.1f}x")
+    finally:
+        shutil.rmtree(temp_dir, True)
+        if args.bucket:
+            for s3_key in keys:
+                client.delete_object(Bucket=bucket, Key=s3_key)
+
+
+if __name__ == "__main__":
+    main()
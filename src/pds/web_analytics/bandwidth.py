@@ -0,0 +1,260 @@
+"""Bandwidth limits with time-of-day schedules for S3 uploads."""
+import re
+import threading
+import time
+from datetime import datetime
+from datetime import time as time_of_day
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+# Multipliers for the units accepted in rates; decimal and binary prefixes both mean bytes per second
+RATE_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1000,
+    "kb": 1000,
+    "kib": 1024,
+    "m": 1000**2,
+    "mb": 1000**2,
+    "mib": 1024**2,
+    "g": 1000**3,
+    "gb": 1000**3,
+    "gib": 1024**3,
+}
+RATE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*?)(?:/s)?\s*$", re.IGNORECASE)
+HOURS_PATTERN = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$")
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+UNLIMITED = ("unlimited", "none", "off")
+# Seconds of traffic at the current rate that may be sent in one burst
+DEFAULT_BURST_SECONDS = 1.0
+
+
+def parse_rate(value: Union[str, int, float, None]) -> Optional[float]:
+    """Parse a bandwidth such as ``5MB``, ``512KiB/s`` or ``1000000`` into bytes per second.
+
+    Args:
+        value (Union[str, int, float, None]): The rate. None or ``unlimited`` means no limit.
+
+    Returns:
+        Optional[float]: Bytes per second, or None for no limit.
+
+    Raises:
+        ValueError: If the rate cannot be parsed or is not positive.
+    """
+    if value is None or (isinstance(value, str) and value.strip().lower() in UNLIMITED):
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        rate = float(value)
+    else:
+        match = RATE_PATTERN.match(str(value))
+        unit = match.group(2).lower() if match else None
+        if unit not in RATE_UNITS:
+            raise ValueError(f"Invalid bandwidth {value!r}; use e.g. 5MB, 512KiB or a number of bytes per second")
+        rate = float(match.group(1)) * RATE_UNITS[unit]  # type: ignore[union-attr]
+    if rate <= 0:
+        raise ValueError(f"Bandwidth must be positive, got {value!r}; use 'unlimited' to remove the limit")
+    return rate
+
+
+class RateWindow(NamedTuple):
+    """A time-of-day window with its own bandwidth.
+
+    Attributes:
+        start (datetime.time): Local time the window opens.
+        end (datetime.time): Local time the window closes; earlier than ``start`` for windows spanning midnight.
+        rate (Optional[float]): Bytes per second during the window, or None for no limit.
+        days (Tuple[int, ...]): Weekdays (0 is Monday) on which the window opens. Empty means every day.
+    """
+
+    start: time_of_day
+    end: time_of_day
+    rate: Optional[float]
+    days: Tuple[int, ...] = ()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RateWindow":
+        """Build a window from a config entry like ``{"hours": "08:00-18:00", "rate": "5MB", "days": [...]}``.
+
+        Args:
+            config (Dict[str, Any]): The window config.
+
+        Returns:
+            RateWindow: The window.
+
+        Raises:
+            ValueError: If the hours, rate or days are invalid.
+        """
+        match = HOURS_PATTERN.match(str(config.get("hours", "")))
+        if not match:
+            raise ValueError(f"Invalid bandwidth window hours {config.get('hours')!r}; use e.g. 08:00-18:00")
+        start_hour, start_minute, end_hour, end_minute = (int(group) for group in match.groups())
+        days = []
+        for day in config.get("days") or ():
+            if str(day).lower()[:3] not in WEEKDAYS:
+                raise ValueError(f"Invalid weekday {day!r} in bandwidth window; use mon, tue, ...")
+            days.append(WEEKDAYS.index(str(day).lower()[:3]))
+        return cls(
+            time_of_day(start_hour, start_minute),
+            time_of_day(end_hour % 24, end_minute),
+            parse_rate(config.get("rate")),
+            tuple(days),
+        )
+
+    def contains(self, moment: datetime) -> bool:
+        """Check whether a local date and time falls inside the window.
+
+        A window spanning midnight belongs to the day it opens on, and one that opens and closes at the same time
+        (e.g. ``00:00-24:00``) lasts all day.
+
+        Args:
+            moment (datetime): Local date and time.
+
+        Returns:
+            bool: True if the window applies.
+        """
+        now = moment.time()
+        if self.start == self.end:
+            return not self.days or moment.weekday() in self.days
+        if self.start < self.end:
+            return self.start <= now < self.end and (not self.days or moment.weekday() in self.days)
+        if now >= self.start:
+            return not self.days or moment.weekday() in self.days
+        if now < self.end:
+            return not self.days or (moment.weekday() - 1) % 7 in self.days
+        return False
+
+
+class BandwidthSchedule:
+    """A default bandwidth with time-of-day windows that override it.
+
+    Attributes:
+        default_rate (Optional[float]): Bytes per second outside every window, or None for no limit.
+        windows (List[RateWindow]): Windows in config order; the first one that applies wins.
+    """
+
+    def __init__(self, default_rate: Optional[float] = None, windows: Optional[List[RateWindow]] = None) -> None:
+        """Initialize the schedule."""
+        self.default_rate = default_rate
+        self.windows = windows or []
+
+    @classmethod
+    def from_config(cls, config: Union[Dict[str, Any], str, int, float, None]) -> Optional["BandwidthSchedule"]:
+        """Build a schedule from a ``bandwidth`` config entry.
+
+        The entry is either a plain rate, or a mapping with an optional ``rate`` and a ``schedule`` list of
+        windows (see ``RateWindow.from_config``).
+
+        Args:
+            config (Union[Dict[str, Any], str, int, float, None]): The ``bandwidth`` entry.
+
+        Returns:
+            Optional[BandwidthSchedule]: The schedule, or None if it never limits anything.
+        """
+        if config is None:
+            return None
+        if isinstance(config, dict):
+            schedule = cls(
+                parse_rate(config.get("rate")),
+                [RateWindow.from_config(window) for window in config.get("schedule") or ()],
+            )
+        else:
+            schedule = cls(parse_rate(config))
+        if schedule.default_rate is None and all(window.rate is None for window in schedule.windows):
+            return None
+        return schedule
+
+    def rate_at(self, moment: datetime) -> Optional[float]:
+        """Return the bandwidth that applies at a local date and time.
+
+        Args:
+            moment (datetime): Local date and time.
+
+        Returns:
+            Optional[float]: Bytes per second, or None for no limit.
+        """
+        for window in self.windows:
+            if window.contains(moment):
+                return window.rate
+        return self.default_rate
+
+
+class TokenBucket:
+    """A thread-safe token bucket limiting bytes per second to the rate its schedule sets for the current time.
+
+    ``consume`` is called with the bytes about to be, or just, sent. The bytes are taken from the bucket
+    straight away, and the caller sleeps until the bucket is no longer in debt. Concurrent callers queue up
+    behind each other's debt, so together they never exceed the rate by more than one burst of
+    ``burst_seconds`` worth of bytes.
+
+    Attributes:
+        schedule (BandwidthSchedule): The rates to enforce.
+        burst_seconds (float): Seconds of traffic at the current rate the bucket can hold.
+    """
+
+    def __init__(
+        self,
+        schedule: BandwidthSchedule,
+        burst_seconds: float = DEFAULT_BURST_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], datetime] = datetime.now,
+        sleep: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        """Initialize a full bucket."""
+        self.schedule = schedule
+        self.burst_seconds = burst_seconds
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._sleep = sleep or time.sleep
+        self._lock = threading.Lock()
+        self._last = clock()
+        rate = schedule.rate_at(wall_clock())
+        self._tokens = rate * burst_seconds if rate else 0.0
+
+    def consume(self, amount: int) -> None:
+        """Take bytes from the bucket, sleeping until the current rate allows them.
+
+        Args:
+            amount (int): Number of bytes. Zero and negative amounts, which boto3 reports when it rewinds a
+                request body to retry it, are ignored.
+        """
+        if amount <= 0:
+            return
+        with self._lock:
+            rate = self.schedule.rate_at(self._wall_clock())
+            now = self._clock()
+            elapsed, self._last = now - self._last, now
+            if rate is None:
+                self._tokens = 0.0
+                return
+            self._tokens = min(rate * self.burst_seconds, self._tokens + elapsed * rate) - amount
+            wait = -self._tokens / rate
+        if wait > 0:
+            self._sleep(wait)
+
+    __call__ = consume
+
+
+class Throttle:
+    """Feeds the bytes of one upload to several token buckets, such as the host-wide and the node's.
+
+    Instances are passed as the ``Callback`` of ``upload_file``.
+    """
+
+    def __init__(self, *buckets: Optional[TokenBucket]) -> None:
+        """Combine the buckets that are set."""
+        self.buckets = [bucket for bucket in buckets if bucket is not None]
+
+    def __bool__(self) -> bool:
+        """Return True if any bucket limits the upload."""
+        return bool(self.buckets)
+
+    def __call__(self, amount: int) -> None:
+        """Take bytes from every bucket."""
+        for bucket in self.buckets:
+            bucket.consume(amount)
@@ -0,0 +1,104 @@
+"""Content checksums of uploaded files, for S3 integrity checks and change detection."""
+import base64
+import hashlib
+from typing import BinaryIO
+from typing import NamedTuple
+from typing import Optional
+
+from .s3_index import ETAG_PATTERN
+
+# Size of each chunk read when checksumming a file
+DEFAULT_READ_SIZE = 1024 * 1024
+
+
+class FileChecksum(NamedTuple):
+    """Checksums of the exact bytes uploaded for a file.
+
+    Attributes:
+        size (int): Number of bytes.
+        sha256 (str): Base64 SHA256, the form S3 takes in ``ChecksumSHA256`` and stores with the object.
+        md5 (str): Hex MD5, which is the ETag S3 gives objects uploaded in a single part.
+    """
+
+    size: int
+    sha256: str
+    md5: str
+
+    def matches_etag(self, etag: Optional[str]) -> Optional[bool]:
+        """Compare the checksum with the ETag of an S3 object.
+
+        Args:
+            etag (Optional[str]): The object's ETag, quoted or not.
+
+        Returns:
+            Optional[bool]: Whether the contents match, or None if the ETag is not a plain MD5, as for
+                multipart uploads and objects encrypted with SSE-C or SSE-KMS.
+        """
+        match = ETAG_PATTERN.match(etag or "")
+        if not match or match.group(2) is not None:
+            return None
+        return match.group(1).lower() == self.md5
+
+
+class ChecksumHasher:
+    """Accumulates the checksums of a stream of bytes as it is written or read."""
+
+    def __init__(self) -> None:
+        """Start empty."""
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Number of bytes added so far."""
+        return self._size
+
+    def update(self, data: bytes) -> None:
+        """Add the next bytes of the stream."""
+        self._sha256.update(data)
+        self._md5.update(data)
+        self._size += len(data)
+
+    def result(self) -> FileChecksum:
+        """Return the checksums of the bytes added so far."""
+        return FileChecksum(self._size, base64.b64encode(self._sha256.digest()).decode("ascii"), self._md5.hexdigest())
+
+
+class HashingWriter:
+    """A write-only file wrapper that hashes everything written through it.
+
+    Attributes:
+        hasher (ChecksumHasher): The checksums of the bytes written so far.
+    """
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        """Wrap an open binary file."""
+        self._fileobj = fileobj
+        self.hasher = ChecksumHasher()
+
+    def write(self, data: bytes) -> int:
+        """Write and hash bytes."""
+        self.hasher.update(data)
+        return self._fileobj.write(data)
+
+    def flush(self) -> None:
+        """Flush the wrapped file."""
+        self._fileobj.flush()
+
+
+def checksum_file(path: str, buffer_size: int = DEFAULT_READ_SIZE) -> FileChecksum:
+    """Read a file once and return its checksums.
+
+    Args:
+        path (str): The file.
+        buffer_size (int): Size of each chunk read.
+
+    Returns:
+        FileChecksum: The checksums of the file's contents.
+    """
+    hasher = ChecksumHasher()
+    with open(path, "rb") as f:
+        while chunk := f.read(buffer_size):
+            hasher.update(chunk)
+    return hasher.result()
@@ -0,0 +1,279 @@
+"""Coalescing of small log files into larger batch objects, each with a manifest of its sources."""
+import gzip
+import hashlib
+import json
+from datetime import date
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from .manifest import sidecar_key
+
+# Files up to this size are coalesced
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+# Uncompressed bytes per batch; web logs gzip to roughly a tenth of this
+DEFAULT_TARGET_SIZE = 128 * 1024 * 1024
+# A batch short of the target size is held back until all its files are this many seconds old
+DEFAULT_MAX_WAIT = 86400.0
+# Source manifests live under <s3_subdir>/_sources/, outside every dataset prefix that Logstash and Athena read
+SOURCES_DIR = "_sources"
+BATCH_PREFIX = "batch-"
+
+
+class CoalesceSettings(NamedTuple):
+    """How the small files of a source directory are coalesced.
+
+    Attributes:
+        max_file_size (int): Files up to this many bytes are coalesced; larger ones are uploaded on their own.
+        target_size (int): Uncompressed bytes per batch. A batch is closed before the file that would take it
+            past this size.
+        max_wait (float): A batch short of ``target_size`` is only uploaded once every file in it was last
+            modified this many seconds ago, and files are only read to their very end once they are as old.
+    """
+
+    max_file_size: int = DEFAULT_MAX_FILE_SIZE
+    target_size: int = DEFAULT_TARGET_SIZE
+    max_wait: float = DEFAULT_MAX_WAIT
+
+
+def coalesce_settings(config: Any) -> Optional[CoalesceSettings]:
+    """Build coalescing settings from a ``coalesce`` config entry.
+
+    Args:
+        config (Any): True for the default settings, or a mapping with any of ``max_file_size``,
+            ``target_size`` and ``max_wait``. False or None for no coalescing.
+
+    Returns:
+        Optional[CoalesceSettings]: The settings, or None if files are not coalesced.
+
+    Raises:
+        ValueError: If a size is not positive or the wait is negative.
+    """
+    if not config:
+        return None
+    if config is True:
+        return CoalesceSettings()
+    settings = CoalesceSettings(
+        max_file_size=int(config.get("max_file_size", DEFAULT_MAX_FILE_SIZE)),
+        target_size=int(config.get("target_size", DEFAULT_TARGET_SIZE)),
+        max_wait=float(config.get("max_wait", DEFAULT_MAX_WAIT)),
+    )
+    if settings.max_file_size <= 0 or settings.target_size <= 0 or settings.max_wait < 0:
+        raise ValueError(f"Invalid coalesce settings {dict(config)!r}")
+    return settings
+
+
+def sources_key(s3_subdir: str, s3_key: str) -> str:
+    """Return the S3 key of the source manifest of a batch object.
+
+    Args:
+        s3_subdir (str): The sync's ``s3_subdir``.
+        s3_key (str): The batch's key.
+
+    Returns:
+        str: The key, e.g. ``<s3_subdir>/_sources/atm/atm-apache-http/batch-2025-01-31-<digest>.log.gz.json``.
+    """
+    return sidecar_key(s3_subdir, SOURCES_DIR, s3_key)
+
+
+class BatchMember(NamedTuple):
+    """The part of one local file held by a batch.
+
+    Attributes:
+        path (str): Local file path.
+        name (str): The file's path relative to the log directory, with ``/`` separators.
+        start (int): Offset in the file of the first byte held.
+        end (int): Offset in the file just after the last byte held.
+        gzipped (bool): The file is gzipped, and is held whole and decompressed.
+        mtime_ns (int): The file's modification time in nanoseconds when the batch was planned.
+    """
+
+    path: str
+    name: str
+    start: int
+    end: int
+    gzipped: bool
+    mtime_ns: int
+
+    @property
+    def length(self) -> int:
+        """Return the number of bytes of the file held."""
+        return self.end - self.start
+
+
+class Batch(NamedTuple):
+    """Parts of small files of the same day, uploaded together as one gzip object.
+
+    Attributes:
+        day (date): The date of the data in the files.
+        members (Tuple[BatchMember, ...]): The parts, by name.
+    """
+
+    day: date
+    members: Tuple[BatchMember, ...]
+
+    @property
+    def raw_bytes(self) -> int:
+        """Return the number of bytes read from the files."""
+        return sum(member.length for member in self.members)
+
+    @property
+    def mtime_ns(self) -> int:
+        """Return the modification time of the most recently modified file."""
+        return max(member.mtime_ns for member in self.members)
+
+    def name(self) -> str:
+        """Return the file name of the batch object.
+
+        The name carries a digest of the names and byte ranges of the parts, so the same parts always make up
+        the same object: a batch planned again after an interrupted run finds its object already uploaded.
+        """
+        digest = hashlib.sha256()
+        for member in self.members:
+            digest.update(f"{member.name}\0{member.start}\0{member.end}\n".encode())
+        return f"{BATCH_PREFIX}{self.day.isoformat()}-{digest.hexdigest()[:16]}.log.gz"
+
+
+def sources_json(s3_key: str, members: Sequence[BatchMember]) -> bytes:
+    """Return the source manifest of a batch object, listing the byte range of each file it holds.
+
+    Args:
+        s3_key (str): The batch's key.
+        members (Sequence[BatchMember]): The parts of files the batch holds.
+
+    Returns:
+        bytes: The manifest, as JSON.
+    """
+    sources: List[Dict[str, Any]] = [
+        {"path": member.name, "start": member.start, "end": member.end, "gzip": member.gzipped} for member in members
+    ]
+    return json.dumps({"key": s3_key, "sources": sources}, separators=(",", ":")).encode()
+
+
+def segment_end(path: str, start: int, size: int, complete: bool) -> Optional[int]:
+    """Return where a batch should stop reading an uncompressed file.
+
+    A file that may still be written to is only read to the end of its last complete line, so no record is
+    split between two batches; the rest goes into a later batch once the line is finished.
+
+    Args:
+        path (str): Local file path.
+        start (int): Offset of the first byte not yet in a batch.
+        size (int): Size of the file.
+        complete (bool): The file is no longer written to, so it is read to its end.
+
+    Returns:
+        Optional[int]: The end offset, or None if there is nothing to add to a batch yet.
+    """
+    if start >= size:
+        return None
+    if complete:
+        return size
+    with open(path, "rb") as f:
+        f.seek(start)
+        cut = f.read(size - start).rfind(b"\n") + 1
+    return start + cut if cut else None
+
+
+def plan_batches(
+    candidates: Iterable[Tuple[date, BatchMember]], target_size: int, ready_before_ns: int
+) -> Tuple[List[Batch], List[BatchMember]]:
+    """Pack the parts of files into batches of about ``target_size`` bytes, one day at a time.
+
+    Parts are packed in name order, so the same parts are packed into the same batches on every run. The last
+    batch of a day is held back while it is short of ``target_size`` and one of its files was modified
+    recently, as more files of the day are likely to follow.
+
+    Args:
+        candidates (Iterable[Tuple[date, BatchMember]]): Parts, with the date of their data.
+        target_size (int): Bytes per batch.
+        ready_before_ns (int): A short batch is uploaded if every file in it was last modified before this.
+
+    Returns:
+        Tuple[List[Batch], List[BatchMember]]: The batches to upload, and the parts held back.
+    """
+    by_day: Dict[date, List[BatchMember]] = {}
+    for day, member in candidates:
+        by_day.setdefault(day, []).append(member)
+
+    batches: List[Batch] = []
+    held: List[BatchMember] = []
+    for day in sorted(by_day):
+        current: List[BatchMember] = []
+        size = 0
+        for member in sorted(by_day[day], key=lambda member: member.name):
+            if current and size + member.length > target_size:
+                batches.append(Batch(day, tuple(current)))
+                current, size = [], 0
+            current.append(member)
+            size += member.length
+        if size >= target_size or all(member.mtime_ns < ready_before_ns for member in current):
+            batches.append(Batch(day, tuple(current)))
+        else:
+            held.extend(current)
+    return batches, held
+
+
+class BatchReader:
+    """Reads the parts of a batch one after another as a single stream of lines.
+
+    Gzipped files are decompressed. A part that does not end with a line ending is followed by one, so its last
+    record is not run together with the first record of the next.
+    """
+
+    def __init__(self, members: Sequence[BatchMember]) -> None:
+        """Start before the first part."""
+        self._members = iter(members)
+        self._file: Optional[BinaryIO] = None
+        self._remaining: Optional[int] = None
+        self._last = b"\n"
+
+    def __enter__(self) -> "BatchReader":
+        """Return the reader."""
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Close the part being read."""
+        self.close()
+
+    def read(self, size: int) -> bytes:
+        """Return up to ``size`` bytes, or an empty string once every part has been read."""
+        while True:
+            if self._file is None:
+                member = next(self._members, None)
+                if member is None:
+                    return b""
+                self._open(member)
+            limit = size if self._remaining is None else min(size, self._remaining)
+            data = self._file.read(limit) if limit else b""  # type: ignore[union-attr]
+            if data:
+                if self._remaining is not None:
+                    self._remaining -= len(data)
+                self._last = data[-1:]
+                return data
+            self.close()
+            if self._last != b"\n":
+                self._last = b"\n"
+                return b"\n"
+
+    def close(self) -> None:
+        """Close the part being read."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, member: BatchMember) -> None:
+        """Open a part, positioned at its first byte."""
+        if member.gzipped:
+            self._file = gzip.open(member.path, "rb")  # type: ignore[assignment]
+            self._remaining = None
+            return
+        self._file = open(member.path, "rb")
+        self._file.seek(member.start)
+        self._remaining = member.length
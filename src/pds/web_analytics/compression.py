@@ -0,0 +1,164 @@
+"""Gzip compression helpers for PDS web analytics log sync."""
+import gzip
+import os
+import time
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from .checksum import FileChecksum
+from .checksum import HashingWriter
+from .line_filter import FilterRule
+from .line_filter import LineFilter
+from .seekable import BlockCompressor
+from .seekable import BlockIndex
+from .summary import LogSummarizer
+from .summary import LogSummary
+
+# Default zlib level: within a few percent of level 9 on web logs at a fraction of the CPU time
+DEFAULT_GZIP_LEVEL = 6
+# Default read/write buffer for copying a file through the compressor
+DEFAULT_GZIP_BUFFER_SIZE = 1024 * 1024
+
+
+class CompressionStats(NamedTuple):
+    """Outcome of compressing a single file.
+
+    Attributes:
+        source (str): Path of the uncompressed input.
+        target (str): Path of the gzipped output.
+        raw_bytes (int): Size of the input in bytes.
+        compressed_bytes (int): Size of the output in bytes.
+        seconds (float): Wall time spent compressing.
+        checksum (Optional[FileChecksum]): Checksums of the gzipped output, computed as it was written.
+        summary (Optional[LogSummary]): Summary of the output's records, if one was asked for.
+        dropped (Optional[Dict[str, int]]): Records left out by the line filter, by rule name, if one was given.
+        blocks (Optional[BlockIndex]): Index of the output's blocks, if it was written seekable.
+    """
+
+    source: str
+    target: str
+    raw_bytes: int
+    compressed_bytes: int
+    seconds: float
+    checksum: Optional[FileChecksum] = None
+    summary: Optional[LogSummary] = None
+    dropped: Optional[Dict[str, int]] = None
+    blocks: Optional[BlockIndex] = None
+
+    @property
+    def ratio(self) -> float:
+        """Return the compression ratio, the input size divided by the output size."""
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        """Return the compression throughput in MB/s of input."""
+        return self.raw_bytes / (1024 * 1024) / self.seconds if self.seconds > 0 else 0.0
+
+
+def gzip_file(
+    source: str,
+    target: str,
+    level: int = DEFAULT_GZIP_LEVEL,
+    buffer_size: int = DEFAULT_GZIP_BUFFER_SIZE,
+    summarize: bool = False,
+    line_filter: Tuple[FilterRule, ...] = (),
+    block_size: int = 0,
+) -> CompressionStats:
+    """Compress a file to a gzip file.
+
+    The output is written to a temporary name and renamed into place once complete, so an interrupted
+    compression never leaves a truncated ``.gz`` behind. zlib releases the GIL while compressing, so
+    several files can be compressed in parallel from a thread pool.
+
+    The gzip header carries the source's modification time rather than the current time, so compressing the
+    same file twice gives identical output, and the output is checksummed as it is written. With a
+    ``block_size`` the output is written seekable instead, by a ``BlockCompressor``, whose members carry
+    neither a name nor a modification time.
+
+    Args:
+        source (str): Path of the file to compress.
+        target (str): Path of the gzip file to create.
+        level (int): zlib compression level, 1 (fastest) to 9 (smallest).
+        buffer_size (int): Size of each chunk read from the source.
+        summarize (bool): Also summarize the lines and timestamps of the output as it is written.
+        line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the output. Default is none.
+        block_size (int): Uncompressed bytes per independently compressed block, or 0 for a single gzip member.
+
+    Returns:
+        CompressionStats: Sizes and timing for the compressed file.
+    """
+    start_time = time.monotonic()
+    partial_target = target + ".tmp"
+    summarizer = LogSummarizer() if summarize else None
+    filtered = LineFilter(line_filter) if line_filter else None
+    blocks = BlockCompressor(level, block_size) if block_size else None
+
+    try:
+        with open(source, "rb") as f_in, open(partial_target, "wb") as raw_out:
+            hashing_out = HashingWriter(raw_out)
+            if blocks is not None:
+                _compress(f_in, blocks, hashing_out, buffer_size, summarizer, filtered)
+                hashing_out.write(blocks.flush())
+            else:
+                gzip_out = gzip.GzipFile(
+                    os.path.basename(target),
+                    mode="wb",
+                    compresslevel=level,
+                    fileobj=hashing_out,  # type: ignore[arg-type]
+                    mtime=int(os.fstat(f_in.fileno()).st_mtime),
+                )
+                with gzip_out as f_out:
+                    _compress(f_in, f_out, None, buffer_size, summarizer, filtered)
+        os.replace(partial_target, target)
+    except BaseException:
+        if os.path.exists(partial_target):
+            os.remove(partial_target)
+        raise
+
+    return CompressionStats(
+        source=source,
+        target=target,
+        raw_bytes=os.path.getsize(source),
+        compressed_bytes=os.path.getsize(target),
+        seconds=time.monotonic() - start_time,
+        checksum=hashing_out.hasher.result(),
+        summary=summarizer.result() if summarizer is not None else None,
+        dropped=filtered.dropped if filtered is not None else None,
+        blocks=blocks.index if blocks is not None else None,
+    )
+
+
+def _compress(
+    f_in: BinaryIO,
+    compressor: Any,
+    f_out: Optional[HashingWriter],
+    buffer_size: int,
+    summarizer: Optional[LogSummarizer],
+    filtered: Optional[LineFilter],
+) -> None:
+    """Feed a file through the line filter and summarizer to a compressor.
+
+    The compressor is either a file object to write to, when ``f_out`` is None, or an object with a
+    ``compress`` method, whose output is written to ``f_out``.
+    """
+    while chunk := f_in.read(buffer_size):
+        if filtered is not None:
+            chunk = filtered.update(chunk)
+        _feed(chunk, compressor, f_out, summarizer)
+    if filtered is not None:
+        _feed(filtered.flush(), compressor, f_out, summarizer)
+
+
+def _feed(chunk: bytes, compressor: Any, f_out: Optional[HashingWriter], summarizer: Optional[LogSummarizer]) -> None:
+    """Compress one chunk and add it to the summary."""
+    if f_out is None:
+        compressor.write(chunk)
+    else:
+        f_out.write(compressor.compress(chunk))
+    if summarizer is not None:
+        summarizer.update(chunk)
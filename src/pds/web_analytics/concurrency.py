@@ -0,0 +1,305 @@
+"""Adaptive limits on concurrent S3 requests."""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any
+from typing import Deque
+from typing import Iterator
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+
+from botocore.exceptions import BotoCoreError  # type: ignore
+from botocore.exceptions import ClientError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Error codes S3 and the AWS SDKs use to ask a client to slow down
+THROTTLE_CODES = frozenset(
+    {
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "RequestThrottled",
+        "RequestLimitExceeded",
+        "TooManyRequestsException",
+        "ServiceUnavailable",
+        "503",
+    }
+)
+THROTTLE_STATUSES = frozenset({429, 503})
+
+# Attempts botocore makes at a request whose concurrency is limited. Throttling is mostly left to the limiter:
+# a retry that succeeds is still reported to it by ``report_retries``, and one that fails reaches ``request``.
+LIMITED_MAX_ATTEMPTS = 2
+# S3 operations made under the upload and the request limiters
+UPLOAD_OPERATIONS = ("PutObject", "CreateMultipartUpload", "UploadPart", "CompleteMultipartUpload")
+REQUEST_OPERATIONS = ("HeadObject", "ListObjectsV2")
+
+# Outcomes of one request, as seen by the controller
+OK = "ok"
+THROTTLED = "throttled"
+ERROR = "error"
+IGNORED = "ignored"
+
+# Latency samples kept for the percentiles and the baseline
+LATENCY_WINDOW = 256
+# Weight of the newest sample in the smoothed latency
+LATENCY_SMOOTHING = 0.1
+
+
+def classify_exception(error: BaseException) -> str:
+    """Decide what a failed request says about the load on S3.
+
+    Throttling responses, server errors and connection failures mean too many requests are in flight. Other
+    client errors, like the 404 of a ``head_object`` for a key that does not exist yet, are complete round trips
+    that count like successes. Errors that never reached S3, like a local file that cannot be read, are ignored.
+    Other exceptions raised while handling an S3 error, like the ``S3UploadFailedError`` boto3's ``upload_file``
+    raises for a ``ClientError``, are classified by the error they wrap.
+
+    Args:
+        error (BaseException): The exception raised by the request.
+
+    Returns:
+        str: ``THROTTLED``, ``ERROR``, ``OK`` or ``IGNORED``.
+    """
+    if isinstance(error, ClientError):
+        code = str(error.response.get("Error", {}).get("Code", ""))
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if code in THROTTLE_CODES or status in THROTTLE_STATUSES:
+            return THROTTLED
+        if isinstance(status, int) and status >= 500:
+            return ERROR
+        return OK
+    if isinstance(error, BotoCoreError):
+        # Connection resets, timeouts and the like
+        return ERROR
+    cause = error.__cause__ or error.__context__
+    if cause is not None:
+        return classify_exception(cause)
+    return IGNORED
+
+
+def report_retries(s3_client, limiters: Mapping[str, "AdaptiveConcurrency"]) -> None:
+    """Report the requests botocore had to retry to the limiters of their operations.
+
+    botocore retries throttled requests and server errors by itself, and a request that succeeds on a retry
+    raises nothing for ``AdaptiveConcurrency.request`` to see. Its response still counts the retries in
+    ``ResponseMetadata.RetryAttempts``, which a handler of the client's ``after-call`` events reads.
+
+    Args:
+        s3_client: boto3 S3 client.
+        limiters (Mapping[str, AdaptiveConcurrency]): Limiter of each API operation, e.g. ``PutObject``.
+    """
+
+    def after_call(parsed: Any = None, model: Any = None, **kwargs: Any) -> None:
+        limiter = limiters.get(getattr(model, "name", ""))
+        if limiter is None or not isinstance(parsed, dict):
+            return
+        metadata = parsed.get("ResponseMetadata", {})
+        # Failed requests are seen by the limiter when they raise
+        if metadata.get("RetryAttempts") and metadata.get("HTTPStatusCode", 200) < 300:
+            limiter.record_retried()
+
+    s3_client.meta.events.register("after-call.s3", after_call)
+
+
+class ConcurrencyStats(NamedTuple):
+    """A snapshot of an adaptive limiter.
+
+    Attributes:
+        name (str): What the limiter controls, e.g. ``upload``.
+        limit (int): Current number of requests allowed in flight.
+        in_flight (int): Requests in flight right now.
+        requests (int): Requests completed so far.
+        throttled (int): Requests that were throttled.
+        errors (int): Requests that failed with a server or connection error.
+        latency_p50 (float): Median latency of recent requests, in seconds (per MiB for sized requests).
+        latency_p95 (float): 95th percentile latency of recent requests, on the same scale.
+        latency_smoothed (float): Exponentially smoothed latency, on the same scale.
+    """
+
+    name: str
+    limit: int
+    in_flight: int
+    requests: int
+    throttled: int
+    errors: int
+    latency_p50: float
+    latency_p95: float
+    latency_smoothed: float
+
+
+class AdaptiveConcurrency:
+    """Limits concurrent requests with an AIMD (additive increase, multiplicative decrease) controller.
+
+    Every request that completes while the limit is fully used, as long as the smoothed latency stays within
+    ``latency_tolerance`` times the best latency seen recently, raises the limit by ``1 / limit``, so the limit
+    grows by about one per round of requests. A throttled request or a server error multiplies the limit by
+    ``decrease``. Decreases are spaced at least one smoothed latency (and ``min_cooldown`` seconds) apart,
+    because the requests already in flight when S3 started throttling tend to be throttled too.
+
+    Sized requests (uploads) pass their size, and their latency is measured per MiB so large and small files
+    can be compared.
+
+    Attributes:
+        name (str): What the limiter controls, used in logs.
+        min_limit (int): The limit never drops below this.
+        max_limit (int): The limit never rises above this.
+        decrease (float): Factor applied to the limit on throttling.
+        latency_tolerance (float): How much slower than the recent best requests may get before the limit stops
+            growing.
+        min_cooldown (float): Minimum seconds between two decreases.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        initial_limit: Optional[int] = None,
+        min_limit: int = 1,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        min_cooldown: float = 1.0,
+    ) -> None:
+        """Initialize the limiter."""
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(f"Need 1 <= min_limit <= max_limit, got {min_limit} and {max_limit}")
+        if not 0 < decrease < 1:
+            raise ValueError(f"decrease must be between 0 and 1, got {decrease}")
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.min_cooldown = min_cooldown
+        start = initial_limit if initial_limit is not None else max(min_limit, max_limit // 2)
+        self._limit = float(min(max(start, min_limit), max_limit))
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._requests = 0
+        self._throttled = 0
+        self._errors = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._smoothed: Optional[float] = None
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> int:
+        """Return the number of requests currently allowed in flight."""
+        with self._condition:
+            return int(self._limit)
+
+    @contextmanager
+    def request(self, size: Optional[int] = None) -> Iterator[None]:
+        """Hold one request slot for the duration of a ``with`` block and observe how the request went.
+
+        Blocks while the limit is reached. An exception raised in the block is classified with
+        ``classify_exception`` and re-raised.
+
+        Args:
+            size (Optional[int]): Bytes sent by the request, if it is an upload.
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+        start_time = time.monotonic()
+        outcome = OK
+        try:
+            yield
+        except BaseException as e:
+            outcome = classify_exception(e)
+            raise
+        finally:
+            latency = time.monotonic() - start_time
+            if size is not None:
+                latency /= max(size, 1024 * 1024) / (1024 * 1024)
+            self._observe(latency, outcome)
+
+    def _observe(self, latency: float, outcome: str) -> None:
+        """Update the limit after a request completes."""
+        with self._condition:
+            previous = int(self._limit)
+            saturated = self._in_flight >= previous
+            self._in_flight -= 1
+            self._requests += 1
+
+            if outcome == IGNORED:
+                pass
+            elif outcome == OK:
+                self._latencies.append(latency)
+                self._smoothed = (
+                    latency
+                    if self._smoothed is None
+                    else (1 - LATENCY_SMOOTHING) * self._smoothed + LATENCY_SMOOTHING * latency
+                )
+                if saturated and self._smoothed <= self.latency_tolerance * min(self._latencies):
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            else:
+                self._back_off(outcome)
+
+            current = int(self._limit)
+            self._condition.notify_all()
+
+        if current != previous:
+            logger.debug(f"{self.name} concurrency limit {previous} -> {current} after {outcome} request")
+
+    def record_retried(self) -> None:
+        """Back off after a request that only succeeded once botocore retried it, counting it as throttled.
+
+        botocore only retries throttling responses, server errors and connection failures.
+        """
+        with self._condition:
+            previous = int(self._limit)
+            self._back_off(THROTTLED)
+            current = int(self._limit)
+            self._condition.notify_all()
+
+        if current != previous:
+            logger.debug(f"{self.name} concurrency limit {previous} -> {current} after a retried request")
+
+    def _back_off(self, outcome: str) -> None:
+        """Count a throttled or failed request and decrease the limit, unless it was just decreased.
+
+        Called with the condition held.
+        """
+        if outcome == THROTTLED:
+            self._throttled += 1
+        else:
+            self._errors += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= max(self.min_cooldown, self._smoothed or 0.0):
+            self._limit = max(self.min_limit, self._limit * self.decrease)
+            self._last_decrease = now
+
+    def stats(self) -> ConcurrencyStats:
+        """Return a snapshot of the limit, counters and observed latencies.
+
+        Returns:
+            ConcurrencyStats: The current state of the limiter.
+        """
+        with self._condition:
+            latencies = sorted(self._latencies)
+            return ConcurrencyStats(
+                name=self.name,
+                limit=int(self._limit),
+                in_flight=self._in_flight,
+                requests=self._requests,
+                throttled=self._throttled,
+                errors=self._errors,
+                latency_p50=_percentile(latencies, 0.50),
+                latency_p95=_percentile(latencies, 0.95),
+                latency_smoothed=self._smoothed or 0.0,
+            )
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    """Return a percentile of sorted values by the nearest-rank method, or 0.0 if there are none."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
@@ -0,0 +1,313 @@
+"""Additional buckets that synced logs are copied to, alongside the primary one."""
+import logging
+import os
+import posixpath
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+import boto3  # type: ignore
+from boto3.s3.transfer import TransferConfig  # type: ignore
+from botocore.config import Config  # type: ignore
+
+from .checksum import FileChecksum
+from .compression import DEFAULT_GZIP_BUFFER_SIZE
+from .compression import DEFAULT_GZIP_LEVEL
+from .concurrency import AdaptiveConcurrency
+from .concurrency import report_retries
+from .concurrency import REQUEST_OPERATIONS
+from .line_filter import FilterRule
+from .s3_index import S3KeyIndex
+from .streaming import GzipStreamUploader
+from .transfer import abort_multipart
+from .transfer import DEFAULT_SMALL_FILE_THRESHOLD
+from .transfer import multipart_transfer_config
+from .transfer import put_small_file
+
+logger = logging.getLogger(__name__)
+
+# Threads copying files to one destination
+DEFAULT_DESTINATION_WORKERS = 4
+# Copies allowed to wait for a destination's threads, per thread, before further files are left for a later pass
+DEFAULT_BACKLOG_PER_WORKER = 2
+
+
+class Destination:
+    """A bucket, and a prefix in it, that every synced file is also copied to.
+
+    Each destination has its own S3 client, so it may live in another account or region, and its own pool of
+    threads, so a slow or unreachable destination never holds up the primary upload or the other destinations.
+    Copies are queued on the pool without blocking; once ``max_backlog`` copies are waiting, further files are
+    left for a later pass instead. The threads are started by the first copy and stopped by ``close``.
+
+    Attributes:
+        bucket_name (str): The bucket.
+        s3_subdir (str): The prefix in the bucket that takes the place of the primary ``s3_subdir``.
+        profile_name (Optional[str]): AWS CLI profile of the client, if not the default credentials.
+        region (Optional[str]): AWS region of the client, if not the default one.
+        name (str): ``s3://bucket/prefix``, under which copies are recorded and reported.
+        s3_client: boto3 S3 client for this destination.
+        request_concurrency (AdaptiveConcurrency): Adaptive limit on HEAD and LIST requests in flight.
+        stream_uploader (GzipStreamUploader): Uploader for copies made from a compressed stream.
+        workers (int): Number of threads copying files to this destination.
+        max_backlog (int): Number of copies that may wait for a thread.
+        block_size (int): Uncompressed bytes per block of copies compressed seekable, or 0 for ordinary gzip.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        s3_subdir: str,
+        profile_name: Optional[str] = None,
+        region: Optional[str] = None,
+        workers: int = DEFAULT_DESTINATION_WORKERS,
+        max_backlog: Optional[int] = None,
+        small_file_threshold: int = DEFAULT_SMALL_FILE_THRESHOLD,
+        transfer_config: Optional[TransferConfig] = None,
+        gzip_level: int = DEFAULT_GZIP_LEVEL,
+        gzip_buffer_size: int = DEFAULT_GZIP_BUFFER_SIZE,
+        block_size: int = 0,
+    ) -> None:
+        """Create the destination's S3 client and copy threads."""
+        self.bucket_name = bucket_name
+        self.s3_subdir = s3_subdir.strip("/")
+        self.profile_name = profile_name
+        self.region = region
+        self.name = f"s3://{bucket_name}/{self.s3_subdir}".rstrip("/")
+        self.workers = workers
+        self.max_backlog = max_backlog if max_backlog is not None else workers * DEFAULT_BACKLOG_PER_WORKER
+        self.small_file_threshold = small_file_threshold
+        self.transfer_config = transfer_config or multipart_transfer_config()
+        self.block_size = block_size
+
+        client_config = Config(max_pool_connections=max(workers, 10), retries={"mode": "standard"})
+        try:
+            if profile_name:
+                session = boto3.Session(profile_name=profile_name)
+                self.s3_client = session.client("s3", region_name=region, config=client_config)
+            else:
+                self.s3_client = boto3.client("s3", region_name=region, config=client_config)
+        except Exception as e:
+            raise RuntimeError(f"Failed to initialize AWS S3 client for {self.name}: {str(e)}")
+
+        # Copies are not limited, but existence checks are, and report their retries like the primary's
+        self.request_concurrency = AdaptiveConcurrency("request", max_limit=max(workers, 10))
+        report_retries(self.s3_client, dict.fromkeys(REQUEST_OPERATIONS, self.request_concurrency))
+        self.stream_uploader = GzipStreamUploader(
+            self.s3_client, bucket_name, level=gzip_level, buffer_size=gzip_buffer_size
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._backlog = 0
+        self._backlog_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any], s3_subdir: str, **settings: Any) -> "Destination":
+        """Build a destination from an entry of the ``destinations`` config list.
+
+        Args:
+            config (Mapping[str, Any]): The entry: ``s3_bucket``, and optionally ``s3_subdir``, ``profile_name``,
+                ``region``, ``workers`` and ``max_backlog``.
+            s3_subdir (str): The prefix used when the entry has none, normally the primary ``s3_subdir``.
+            **settings (Any): Upload settings shared with the primary bucket, such as ``small_file_threshold``.
+
+        Returns:
+            Destination: The destination.
+
+        Raises:
+            ValueError: If the entry has no ``s3_bucket``.
+        """
+        if not config.get("s3_bucket"):
+            raise ValueError(f"Destination {dict(config)!r} needs an s3_bucket")
+        return cls(
+            config["s3_bucket"],
+            config.get("s3_subdir", s3_subdir),
+            profile_name=config.get("profile_name"),
+            region=config.get("region"),
+            workers=config.get("workers", DEFAULT_DESTINATION_WORKERS),
+            max_backlog=config.get("max_backlog"),
+            **settings,
+        )
+
+    def key(self, relative_key: str) -> str:
+        """Return the key in this destination of an object, given its key relative to the primary ``s3_subdir``.
+
+        Args:
+            relative_key (str): The key without the primary ``s3_subdir``.
+
+        Returns:
+            str: The key under this destination's ``s3_subdir``.
+        """
+        return posixpath.join(self.s3_subdir, relative_key.lstrip("/"))
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """Queue a copy on the destination's threads without waiting for a free one.
+
+        Args:
+            fn (Callable[..., Any]): The copy.
+            *args (Any): Its arguments.
+
+        Returns:
+            Optional[Future]: The queued copy, or None if ``max_backlog`` copies are already waiting.
+        """
+        with self._backlog_lock:
+            if self._backlog >= self.workers + self.max_backlog:
+                return None
+            self._backlog += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="copy")
+            executor = self._executor
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def close(self) -> None:
+        """Wait for the queued copies and stop the destination's threads; a later copy starts them again."""
+        with self._backlog_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _release(self, future: Future) -> None:
+        """Free the backlog slot of a finished copy."""
+        with self._backlog_lock:
+            self._backlog -= 1
+
+    def build_index(self, prefix: str, start_after: Optional[str] = None) -> Optional[S3KeyIndex]:
+        """List the existing keys under a prefix into an in-memory index.
+
+        Args:
+            prefix (str): The S3 prefix to list.
+            start_after (Optional[str]): Only list keys that sort after this one.
+
+        Returns:
+            Optional[S3KeyIndex]: The index, or None if the prefix could not be listed.
+        """
+        try:
+            return S3KeyIndex.from_listing(
+                self.s3_client, self.bucket_name, prefix, start_after, limiter=self.request_concurrency
+            )
+        except Exception as e:
+            logger.warning(f"Unable to list s3://{self.bucket_name}/{prefix}, checking files individually ({str(e)})")
+            return None
+
+    def remote_object(self, s3_key: str, index: Optional[S3KeyIndex] = None) -> Optional[Tuple[int, Optional[str]]]:
+        """Return the size and ETag of an object in this destination, if it exists.
+
+        Args:
+            s3_key (str): The S3 key to check.
+            index (Optional[S3KeyIndex]): Listing of the key's prefix, used instead of a request when it covers
+                the key.
+
+        Returns:
+            Optional[Tuple[int, Optional[str]]]: ``(size, etag)``, or None if the object does not exist.
+        """
+        if index is not None and index.covers(s3_key):
+            return index.lookup(s3_key)
+
+        try:
+            with self.request_concurrency.request():
+                response = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return response.get("ContentLength"), response.get("ETag")
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            logger.debug(f"File {s3_key} not found in {self.name} ({str(e)})")
+            return None
+
+    def upload_file(
+        self,
+        local_path: str,
+        s3_key: str,
+        extra_args: Dict[str, Any],
+        callback: Optional[Callable[[int], None]] = None,
+        checksum: Optional[FileChecksum] = None,
+    ) -> Optional[str]:
+        """Upload a local file to this destination.
+
+        Small files are sent with one ``put_object`` call and larger ones through the boto3 TransferManager, as
+        for the primary bucket. Copies are not resumable; one interrupted part way is started again.
+
+        Args:
+            local_path (str): Local file path to upload.
+            s3_key (str): S3 key for the file.
+            extra_args (Dict[str, Any]): Extra upload parameters, such as ``ContentType``.
+            callback (Optional[Callable[[int], None]]): boto3 transfer callback.
+            checksum (Optional[FileChecksum]): Checksums of the file, for S3 to verify; computed as the file is
+                read if not given.
+
+        Returns:
+            Optional[str]: ETag of the object, if S3 returned it.
+
+        Raises:
+            Exception: Any error from reading the file or from S3.
+        """
+        size = checksum.size if checksum is not None else os.path.getsize(local_path)
+        if size <= self.small_file_threshold:
+            return put_small_file(
+                self.s3_client, self.bucket_name, local_path, s3_key, extra_args, callback, checksum
+            ).get("ETag")
+        extra_args = dict(extra_args, ChecksumAlgorithm="SHA256")
+        kwargs = {"Callback": callback} if callback else {}
+        self.s3_client.upload_file(
+            local_path, self.bucket_name, s3_key, ExtraArgs=extra_args, Config=self.transfer_config, **kwargs
+        )
+        return None
+
+    def upload_stream(
+        self,
+        local_path: str,
+        s3_key: str,
+        extra_args: Dict[str, Any],
+        callback: Optional[Callable[[int], None]] = None,
+        line_filter: Tuple[FilterRule, ...] = (),
+    ) -> Optional[str]:
+        """Gzip a local file on the fly and upload it to this destination alone.
+
+        Used for copies that could not be made from the primary upload, because it had already been done or the
+        copy fell behind it.
+
+        Args:
+            local_path (str): Local file path to compress and upload.
+            s3_key (str): S3 key for the gzipped object.
+            extra_args (Dict[str, Any]): Extra upload parameters, such as ``ContentType``.
+            callback (Optional[Callable[[int], None]]): Called with the compressed bytes before they are sent.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the upload.
+
+        Returns:
+            Optional[str]: ETag of the object.
+
+        Raises:
+            Exception: Any error from reading the file or from S3.
+        """
+        return self.stream_uploader.upload(
+            local_path, s3_key, extra_args, callback, line_filter=line_filter, block_size=self.block_size
+        ).etag
+
+    def abort_abandoned_uploads(self, age: float) -> int:
+        """Abort the multipart uploads under ``s3_subdir`` started more than ``age`` seconds ago.
+
+        Args:
+            age (float): Age in seconds.
+
+        Returns:
+            int: Number of uploads aborted.
+        """
+        cutoff = time.time() - age
+        aborted = 0
+        prefix = self.s3_subdir + "/" if self.s3_subdir else ""
+        try:
+            paginator = self.s3_client.get_paginator("list_multipart_uploads")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for upload in page.get("Uploads", []):
+                    if upload["Initiated"].timestamp() < cutoff:
+                        aborted += abort_multipart(self.s3_client, self.bucket_name, upload["Key"], upload["UploadId"])
+        except Exception as e:
+            logger.warning(f"Unable to list multipart uploads under {self.name}: {str(e)}")
+        return aborted
@@ -0,0 +1,124 @@
+"""Dates of log files, from the date stamps in their names, their first records or their modification times."""
+import gzip
+import re
+import zlib
+from datetime import date
+from typing import Dict
+from typing import Optional
+
+# Date stamps in the names of rotated logs, most specific first: IIS ``u_exYYMMDD``, then ``YYYY-MM-DD``,
+# ``YYYY.MM.DD``, ``YYYY_MM_DD`` or ``YYYYMMDD`` anywhere in the name
+NAME_DATE_PATTERNS = (
+    re.compile(r"u_ex(?P<yy>\d{2})(?P<month>\d{2})(?P<day>\d{2})"),
+    re.compile(r"(?<!\d)(?P<year>(?:19|20)\d{2})([-._]?)(?P<month>0[1-9]|1[0-2])\2(?P<day>0[1-9]|[12]\d|3[01])(?!\d)"),
+)
+
+# Amount of the start of a log read, decompressed, to find its first records
+DEFAULT_HEAD_SIZE = 64 * 1024
+
+# Abbreviated month names as they appear in log timestamps, whatever the locale
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+MONTHS = {name: number for number, name in enumerate(MONTH_NAMES, 1)}
+
+# Timestamps at the start of a log record: Apache and Tomcat ``[25/Dec/2023:10:30:45 +0000]``, IIS
+# ``2023-12-25 10:30:45`` (and its ``#Date:`` header) and xferlog ``Mon Dec 25 10:30:45 2023``
+RECORD_DATE_PATTERNS = (
+    re.compile(r"\[(?P<day>\d{2})/(?P<month_name>[A-Z][a-z]{2})/(?P<year>\d{4}):"),
+    re.compile(r"^(?:#Date: )?(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})[ T]"),
+    re.compile(r"^[A-Z][a-z]{2} (?P<month_name>[A-Z][a-z]{2}) +(?P<day>\d{1,2}) \d{2}:\d{2}:\d{2} (?P<year>\d{4})"),
+)
+
+
+def _date(groups: Dict[str, Optional[str]]) -> Optional[date]:
+    """Build a date from the groups of a date pattern match, or None if it is not a valid date."""
+    if groups.get("year"):
+        year = int(groups["year"])
+    else:
+        year = 2000 + int(groups["yy"])
+    month = MONTHS.get(groups["month_name"]) if groups.get("month_name") else int(groups["month"])
+    try:
+        return date(year, month, int(groups["day"])) if month else None
+    except ValueError:
+        return None
+
+
+def date_from_name(file_name: str) -> Optional[date]:
+    """Parse the date stamp in a log file name.
+
+    Args:
+        file_name (str): The file's base name, e.g. ``atm-atmos-apache.2025-01-31.txt`` or ``u_ex250131.log``.
+
+    Returns:
+        Optional[date]: The date, or None if the name has no valid date stamp.
+    """
+    for pattern in NAME_DATE_PATTERNS:
+        for match in pattern.finditer(file_name):
+            found = _date(match.groupdict())
+            if found:
+                return found
+    return None
+
+
+def read_head(path: str, head_size: int = DEFAULT_HEAD_SIZE) -> Optional[bytes]:
+    """Read the start of a log file, decompressing it if it is gzipped.
+
+    Args:
+        path (str): The log file.
+        head_size (int): Number of bytes, after decompression, to read.
+
+    Returns:
+        Optional[bytes]: Up to ``head_size`` bytes, or None if the file cannot be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(head_size)
+            if head[:2] == b"\x1f\x8b":
+                f.seek(0)
+                with gzip.GzipFile(fileobj=f) as gz:
+                    head = gz.read(head_size)
+    except (OSError, EOFError, zlib.error):
+        return None
+    return head
+
+
+def date_from_contents(path: str, head_size: int = DEFAULT_HEAD_SIZE) -> Optional[date]:
+    """Find the date of the first record in a log file, gzipped or not.
+
+    Args:
+        path (str): The log file.
+        head_size (int): Number of bytes, after decompression, to search.
+
+    Returns:
+        Optional[date]: The date of the first timestamped record, or None if the file cannot be read or no
+            record in its first ``head_size`` bytes has a recognized timestamp.
+    """
+    head = read_head(path, head_size)
+    if head is None:
+        return None
+    for line in head.decode("latin-1").splitlines():
+        for pattern in RECORD_DATE_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                found = _date(match.groupdict())
+                if found:
+                    return found
+    return None
+
+
+def file_date(file_name: str, mtime: float, path: Optional[str] = None) -> date:
+    """Return the date of the data in a log file.
+
+    Args:
+        file_name (str): The file's base name.
+        mtime (float): The file's modification time, used when no other date is found.
+        path (Optional[str]): The file's path. If given, the first records of a file without a date stamp in
+            its name are read for their date.
+
+    Returns:
+        date: The date in the name, else the date of the first record, else the local date of the modification
+            time.
+    """
+    found = date_from_name(file_name)
+    if found is None and path is not None:
+        found = date_from_contents(path)
+    return found or date.fromtimestamp(mtime)
@@ -0,0 +1,86 @@
+"""Compiled matching of file names against include patterns."""
+import fnmatch
+import re
+from functools import lru_cache
+from typing import Iterable
+from typing import Optional
+from typing import Pattern
+from typing import Tuple
+
+# Characters with a special meaning in fnmatch patterns
+WILDCARDS = re.compile(r"[*?\[]")
+
+
+class IncludeMatcher:
+    """Matches file names against a set of fnmatch-style include patterns in one call.
+
+    Patterns are sorted into the cheapest check that implements them exactly: literal names go into a set,
+    ``prefix*`` and ``*suffix`` patterns into tuples for ``str.startswith``/``str.endswith``, and everything
+    else is translated with ``fnmatch`` and joined into a single compiled regular expression. Matching is
+    case-sensitive on every platform, like ``fnmatch.fnmatchcase``.
+
+    Attributes:
+        patterns (Tuple[str, ...]): The include patterns.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        """Compile a set of include patterns."""
+        self.patterns = tuple(patterns)
+        self._match_all = False
+        exact = set()
+        prefixes = []
+        suffixes = []
+        others = []
+
+        for pattern in self.patterns:
+            body = pattern.strip("*")
+            if WILDCARDS.search(body) or not body:
+                if pattern and not pattern.strip("*"):
+                    self._match_all = True
+                else:
+                    others.append(pattern)
+            elif pattern == body:
+                exact.add(pattern)
+            elif pattern == body + "*":
+                prefixes.append(body)
+            elif pattern == "*" + body:
+                suffixes.append(body)
+            else:
+                others.append(pattern)
+
+        self._exact = frozenset(exact)
+        self._prefixes = tuple(prefixes)
+        self._suffixes = tuple(suffixes)
+        self._regex: Optional[Pattern[str]] = (
+            re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in others)) if others else None
+        )
+
+    def match(self, file_name: str) -> bool:
+        """Check whether a file name matches any of the include patterns.
+
+        Args:
+            file_name (str): The base name of the file.
+
+        Returns:
+            bool: True if the name matches at least one pattern.
+        """
+        return (
+            self._match_all
+            or file_name in self._exact
+            or (bool(self._prefixes) and file_name.startswith(self._prefixes))
+            or (bool(self._suffixes) and file_name.endswith(self._suffixes))
+            or (self._regex is not None and self._regex.match(file_name) is not None)
+        )
+
+
+@lru_cache(maxsize=256)
+def compile_include_patterns(patterns: Tuple[str, ...]) -> IncludeMatcher:
+    """Return a compiled matcher for a set of include patterns, reusing earlier compilations.
+
+    Args:
+        patterns (Tuple[str, ...]): The include patterns.
+
+    Returns:
+        IncludeMatcher: The compiled matcher.
+    """
+    return IncludeMatcher(patterns)
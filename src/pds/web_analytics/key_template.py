@@ -0,0 +1,93 @@
+"""Templates for the S3 keys of uploaded logs, such as Hive-style date partitions."""
+import string
+from datetime import date
+from typing import List
+
+# Fields a key template may use. ``node`` and ``dataset`` are the two levels of ``subdirs`` in the sync config,
+# ``year``, ``month`` and ``day`` the date of the data in the file, ``path`` the file's path below its dataset
+# directory and ``name`` its base name, both as uploaded (with ``.gz`` for files gzipped by the sync).
+DIRECTORY_FIELDS = ("node", "dataset")
+FILE_FIELDS = ("year", "month", "day", "path", "name")
+
+
+class KeyTemplate:
+    """Builds the S3 key of each uploaded file from a ``str.format`` template.
+
+    For example ``node={node}/dataset={dataset}/year={year}/month={month}/day={day}/{name}`` places each log under
+    Hive-style partitions that Athena and Logstash can prune by date. Keys are relative to ``s3_subdir``. A template
+    with ``{name}`` but not ``{path}`` gives files of the same name in different subdirectories the same key; the
+    sync refuses to upload the second of them rather than replace the first.
+
+    Attributes:
+        template (str): The template.
+        fields (List[str]): The fields the template uses, in order.
+    """
+
+    def __init__(self, template: str) -> None:
+        """Check a template.
+
+        Raises:
+            ValueError: If the template uses unknown fields, positional fields or format specs, or could give two
+                files in the same directory the same key because it uses neither ``path`` nor ``name``.
+        """
+        self.template = template
+        self.fields: List[str] = []
+        for _, field, spec, conversion in string.Formatter().parse(template):
+            if field is None:
+                continue
+            if field not in DIRECTORY_FIELDS + FILE_FIELDS or spec or conversion:
+                raise ValueError(
+                    f"Invalid key template field {{{field}}} in {template!r}; "
+                    f"use {', '.join('{' + name + '}' for name in DIRECTORY_FIELDS + FILE_FIELDS)}"
+                )
+            self.fields.append(field)
+        if "path" not in self.fields and "name" not in self.fields:
+            raise ValueError(
+                f"Key template {template!r} must use {{path}} or {{name}} so files in the same directory get their own keys"
+            )
+
+    @property
+    def uses_date(self) -> bool:
+        """Whether keys depend on the date of the data in each file."""
+        return any(field in self.fields for field in ("year", "month", "day"))
+
+    def prefix(self, node: str, dataset: str) -> str:
+        """Return the longest directory prefix shared by the keys of every file of a dataset.
+
+        Args:
+            node (str): The node, e.g. ``atm``.
+            dataset (str): The dataset directory, e.g. ``atm-apache-http``.
+
+        Returns:
+            str: The prefix, ending in ``/``, or an empty string if the first directory already varies by file.
+        """
+        static = ""
+        for literal, field, _, _ in string.Formatter().parse(self.template):
+            static += literal
+            if field in FILE_FIELDS:
+                break
+            if field is not None:
+                static += {"node": node, "dataset": dataset}[field]
+        return static[: static.rfind("/") + 1]
+
+    def render(self, node: str, dataset: str, day: date, path: str) -> str:
+        """Return the key of a file.
+
+        Args:
+            node (str): The node, e.g. ``atm``.
+            dataset (str): The dataset directory, e.g. ``atm-apache-http``.
+            day (date): The date of the data in the file.
+            path (str): The file's path below the dataset directory as uploaded, with ``/`` separators.
+
+        Returns:
+            str: The key, relative to ``s3_subdir``.
+        """
+        return self.template.format(
+            node=node,
+            dataset=dataset,
+            year=f"{day.year:04d}",
+            month=f"{day.month:02d}",
+            day=f"{day.day:02d}",
+            path=path,
+            name=path.rsplit("/", 1)[-1],
+        )
@@ -0,0 +1,306 @@
+"""Coordination of several sync workers sharing one log tree, by consistent hashing and S3 lease objects."""
+import bisect
+import hashlib
+import json
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from botocore.exceptions import ClientError  # type: ignore
+
+from .manifest import sidecar_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds a lease is held before other workers may take it over; longer than the slowest upload
+DEFAULT_LEASE_SECONDS = 3600.0
+# Points per worker on the hash ring; more points spread the files more evenly
+DEFAULT_VNODES = 64
+# Lease objects live under <s3_subdir>/_leases/, outside every dataset prefix that Logstash and Athena read
+LEASES_DIR = "_leases"
+# Error codes of a conditional write that lost to another writer
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "NoSuchKey", "412", "409", "404")
+# Attempts at taking a lease that keeps changing hands under us
+MAX_ATTEMPTS = 3
+# Renewals of a held lease per lease duration, so an upload longer than ``lease_seconds`` keeps its lease
+RENEWALS_PER_LEASE = 3
+
+
+class ClusterSettings(NamedTuple):
+    """How this sync shares the log tree with other workers.
+
+    Attributes:
+        worker (str): Name of this worker, written into its leases and placed on the hash ring.
+        workers (Tuple[str, ...]): Every worker sharing the tree. Each syncs the files that hash to it. Empty for
+            workers that all sync every file and rely on leases alone.
+        lease_seconds (float): Seconds a lease is held before another worker may take it over.
+        vnodes (int): Points per worker on the hash ring.
+    """
+
+    worker: str
+    workers: Tuple[str, ...] = ()
+    lease_seconds: float = DEFAULT_LEASE_SECONDS
+    vnodes: int = DEFAULT_VNODES
+
+
+def cluster_settings(config: Any) -> Optional[ClusterSettings]:
+    """Build cluster settings from a ``cluster`` config entry.
+
+    Args:
+        config (Any): A mapping with any of ``worker`` (default the host name), ``workers``, ``lease_seconds`` and
+            ``vnodes``, or True for leases alone under the host name. False or None for a sync working alone.
+
+    Returns:
+        Optional[ClusterSettings]: The settings, or None if the sync works alone.
+
+    Raises:
+        ValueError: If this worker is not one of ``workers``, or the lease duration or vnodes are not positive.
+    """
+    if not config:
+        return None
+    if config is True:
+        config = {}
+    settings = ClusterSettings(
+        worker=str(config.get("worker") or socket.gethostname()),
+        workers=tuple(str(worker) for worker in config.get("workers") or ()),
+        lease_seconds=float(config.get("lease_seconds", DEFAULT_LEASE_SECONDS)),
+        vnodes=int(config.get("vnodes", DEFAULT_VNODES)),
+    )
+    if settings.workers and settings.worker not in settings.workers:
+        raise ValueError(f"Worker {settings.worker!r} is not one of the cluster workers {list(settings.workers)!r}")
+    if settings.lease_seconds <= 0 or settings.vnodes <= 0:
+        raise ValueError(f"Invalid cluster settings {dict(config)!r}")
+    return settings
+
+
+def lease_key(s3_subdir: str, s3_key: str) -> str:
+    """Return the S3 key of the lease object on an upload.
+
+    Args:
+        s3_subdir (str): The sync's ``s3_subdir``.
+        s3_key (str): The key being uploaded.
+
+    Returns:
+        str: The key, e.g. ``<s3_subdir>/_leases/atm/atm-apache-http/access.log.gz.json``.
+    """
+    return sidecar_key(s3_subdir, LEASES_DIR, s3_key)
+
+
+def _hash(value: str) -> int:
+    """Return a stable 64-bit hash of a string, the same on every host and Python process."""
+    return int.from_bytes(hashlib.sha256(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing of file paths onto workers.
+
+    Each worker is placed at ``vnodes`` points on a ring of hashes, and a path belongs to the worker at the first
+    point after the path's hash. Adding or removing a worker therefore only moves the paths next to its points,
+    about one worker's share, while every other path stays where it was.
+    """
+
+    def __init__(self, workers: Tuple[str, ...], vnodes: int = DEFAULT_VNODES) -> None:
+        """Place each worker on the ring."""
+        points = sorted((_hash(f"{worker}#{i}"), worker) for worker in set(workers) for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._workers = [worker for _, worker in points]
+
+    def owner(self, path: str) -> str:
+        """Return the worker a path belongs to.
+
+        Args:
+            path (str): The path, the same on every worker, e.g. relative to the log directory.
+
+        Returns:
+            str: The worker's name.
+        """
+        return self._workers[bisect.bisect(self._hashes, _hash(path)) % len(self._hashes)]
+
+
+class Lease(NamedTuple):
+    """A lease held on an upload.
+
+    Attributes:
+        key (str): Key of the lease object.
+        etag (str): ETag of the lease object as written by this worker, so it is only released while still ours.
+        expires (float): Unix time after which other workers may take the lease over.
+    """
+
+    key: str
+    etag: str
+    expires: float
+
+
+def _is_conflict(error: ClientError) -> bool:
+    """Check whether a conditional write failed because another worker wrote or removed the object first."""
+    return str(error.response.get("Error", {}).get("Code")) in CONFLICT_CODES
+
+
+class LeaseManager:
+    """Takes and releases leases on uploads with S3 conditional writes.
+
+    A lease is a small JSON object naming its holder and expiry. It is created with ``If-None-Match: *``, so of
+    several workers creating it at once exactly one succeeds. An expired lease is replaced with ``If-Match`` on the
+    ETag that was read, so only one of the workers finding it expired takes it over. A lease is removed the same
+    way, so a worker never removes a lease taken over from it, and renewed the same way while it is held. No
+    coordinator is needed beyond the bucket itself.
+    """
+
+    def __init__(
+        self,
+        s3_client: Any,
+        bucket_name: str,
+        s3_subdir: str,
+        owner: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Take leases as ``owner`` under ``<s3_subdir>/_leases/``."""
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_subdir = s3_subdir
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    def acquire(self, s3_key: str) -> Optional[Lease]:
+        """Take the lease on an upload, unless another worker holds it.
+
+        Args:
+            s3_key (str): The key being uploaded.
+
+        Returns:
+            Optional[Lease]: The lease, or None if another worker holds it and it has not expired.
+
+        Raises:
+            ClientError: If the lease object could not be read or written for any other reason.
+        """
+        key = lease_key(self.s3_subdir, s3_key)
+        for _ in range(MAX_ATTEMPTS):
+            lease = self._write(key, IfNoneMatch="*")
+            if lease is not None:
+                return lease
+            current = self._read(key)
+            if current is None:
+                # Released since our attempt; try again
+                continue
+            etag, holder, expires = current
+            if holder == self.owner:
+                # Left behind by a release that failed
+                logger.debug(f"Taking back our own lease on {s3_key}")
+            elif expires > self.clock():
+                logger.debug(f"{s3_key} is leased to {holder} until {time.ctime(expires)}")
+                return None
+            else:
+                logger.warning(f"Taking over the lease on {s3_key} from {holder}, expired at {time.ctime(expires)}")
+            lease = self._write(key, IfMatch=etag)
+            if lease is not None:
+                return lease
+        return None
+
+    def renew(self, lease: Lease) -> Optional[Lease]:
+        """Extend a lease by ``lease_seconds`` from now, unless another worker has taken it over since.
+
+        Args:
+            lease (Lease): The lease.
+
+        Returns:
+            Optional[Lease]: The renewed lease, or None if it is no longer ours.
+
+        Raises:
+            ClientError: If the lease object could not be written for any other reason.
+        """
+        return self._write(lease.key, IfMatch=lease.etag)
+
+    @contextmanager
+    def held(self, lease: Lease) -> Iterator[None]:
+        """Keep a lease renewed while the block runs, then release it.
+
+        Renewing ``RENEWALS_PER_LEASE`` times per ``lease_seconds`` keeps other workers from taking over the lease
+        of an upload that takes longer than that. A lease taken over all the same is not released.
+
+        Args:
+            lease (Lease): The lease.
+        """
+        current = [lease]
+        stop = threading.Event()
+
+        def renew() -> None:
+            while not stop.wait(self.lease_seconds / RENEWALS_PER_LEASE):
+                try:
+                    renewed = self.renew(current[0])
+                except Exception as e:
+                    logger.warning(f"Unable to renew lease s3://{self.bucket_name}/{lease.key} ({str(e)})")
+                    continue
+                if renewed is None:
+                    logger.warning(f"Lease s3://{self.bucket_name}/{lease.key} was taken over by another worker")
+                    current.clear()
+                    return
+                current[0] = renewed
+
+        renewer = threading.Thread(target=renew, name="lease-renewal", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+            if current:
+                self.release(current[0])
+
+    def release(self, lease: Lease) -> None:
+        """Remove a lease, unless another worker has taken it over since.
+
+        A lease that cannot be removed is only logged; it expires in time.
+
+        Args:
+            lease (Lease): The lease.
+        """
+        try:
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=lease.key, IfMatch=lease.etag)
+        except Exception as e:
+            logger.warning(f"Unable to release lease s3://{self.bucket_name}/{lease.key} ({str(e)})")
+
+    def _write(self, key: str, **condition: str) -> Optional[Lease]:
+        """Write a lease object held by this worker under a condition, returning None if the condition fails."""
+        now = self.clock()
+        lease: Dict[str, Any] = {"owner": self.owner, "acquired": now, "expires": now + self.lease_seconds}
+        try:
+            response = self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=json.dumps(lease).encode(),
+                ContentType="application/json",
+                **condition,
+            )
+        except ClientError as e:
+            if _is_conflict(e):
+                return None
+            raise
+        return Lease(key, response["ETag"], lease["expires"])
+
+    def _read(self, key: str) -> Optional[Tuple[str, str, float]]:
+        """Return the ETag, holder and expiry of a lease object, or None if there is none.
+
+        A lease that cannot be parsed is taken to have expired.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if _is_conflict(e):
+                return None
+            raise
+        try:
+            lease = json.loads(response["Body"].read())
+            return response["ETag"], str(lease["owner"]), float(lease["expires"])
+        except (ValueError, KeyError, TypeError):
+            return response["ETag"], "unknown", 0.0
@@ -0,0 +1,147 @@
+"""Filtering of known-noise log records out of files as they are compressed, before they are uploaded."""
+import re
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Pattern
+from typing import Tuple
+
+_IP = rb"(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9A-Fa-f]*:[0-9A-Fa-f:.]+)"
+_LOOPBACK = rb"(?:::1|127\.0\.0\.1) "
+# Start of an IIS record: date, time, optional s-sitename and s-ip
+_W3C_START = rb"\n\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} (?:\S+ )?" + _IP + rb" "
+# Methods pds-filter.conf accepts, after upper-casing: HTTP methods, and FTP commands logged as methods by IIS
+_VALID_METHOD = (
+    rb"(?i:(?:GET|POST|PUT|DELETE|HEAD|OPTIONS|PATCH|ABOR|ACCT|ALLO|APPE|AUTH|CDUP|CWD|DELE|FEAT|HELP|LIST|MODE|MKD|"
+    rb"NLST|NOOP|OPTS|PASS|PASV|PBSZ|PORT|PROT|PWD|QUIT|REIN|REST|RETR|RMD|RNFR|RNTO|SITE|SIZE|STAT|STOR|STOU|STRU|"
+    rb"SYST|TYPE|USER|DATACHANNELOPENED|DATACHANNELCLOSED|CONTROLCHANNELOPENED|CONTROLCHANNELCLOSED)(?!\w))"
+)
+
+# Patterns of the records pds-filter.conf drops after parsing them, by rule name. Each starts with a literal, which
+# the regular expression engine finds far faster than it tries an alternation or ``^`` at every position.
+BUILTIN_RULES = {
+    # W3C and IIS header lines such as #Fields:
+    "comments": (rb"\n#",),
+    # Requests from the server itself: Apache's client address, or IIS's c-ip after s-port and cs-username
+    "loopback": (rb"\n" + _LOOPBACK, _W3C_START + rb"\w+ \S+ \S+ \d+ \S+ " + _LOOPBACK),
+    # Apache waking its own idle workers
+    "dummy-connection": (rb"\(internal dummy connection\)",),
+    # SSTP_DUPLEX_POST, TRACE, scanner fuzzing and other methods that are neither HTTP nor FTP
+    "invalid-method": (rb'] "(?!' + _VALID_METHOD + rb")\w+ ", _W3C_START + rb"(?!" + _VALID_METHOD + rb")\w+ [/-]"),
+}
+
+
+class FilterRule(NamedTuple):
+    r"""A rule dropping every log record that matches a pattern.
+
+    Attributes:
+        name (str): Name of the rule, under which dropped records are counted.
+        pattern (Pattern[bytes]): Searched for in each record along with the line ending before it, so ``\n``
+            matches at the start of a record, as does ``^``; ``$`` matches at its end.
+    """
+
+    name: str
+    pattern: Pattern[bytes]
+
+
+def filter_rules(config: Any) -> Tuple[FilterRule, ...]:
+    """Build filter rules from a ``line_filter`` config entry.
+
+    Args:
+        config (Any): True for every built-in rule, or a list whose items are the names of built-in rules
+            (``comments``, ``loopback``, ``dummy-connection`` and ``invalid-method``) or mappings with a
+            ``name`` and a regular expression ``pattern``. False or None for no filtering.
+
+    Returns:
+        Tuple[FilterRule, ...]: The rules, in the order records are checked against them.
+
+    Raises:
+        ValueError: If a rule is unknown, has no name or pattern, or its pattern is not a valid expression.
+    """
+    if not config:
+        return ()
+    if config is True:
+        config = list(BUILTIN_RULES)
+    rules: List[FilterRule] = []
+    for item in config:
+        if isinstance(item, str):
+            if item not in BUILTIN_RULES:
+                raise ValueError(f"Unknown line filter rule {item!r}; built-in rules are {', '.join(BUILTIN_RULES)}")
+            name, patterns = item, BUILTIN_RULES[item]
+        else:
+            name, source = item.get("name"), item.get("pattern")
+            if not name or not source:
+                raise ValueError(f"Line filter rule {dict(item)!r} needs a name and a pattern")
+            patterns = (source.encode(),)
+        try:
+            rules.extend(FilterRule(name, re.compile(pattern, re.M)) for pattern in patterns)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern for line filter rule {name!r}: {str(e)}")
+    return tuple(rules)
+
+
+class LineFilter:
+    """Drops the records matching any of a set of rules from the contents of a file as it is fed through.
+
+    Each rule is searched for over a whole block of lines at a time, so a block without noise costs one
+    regular expression scan per rule and is passed on as it is. A record matching several rules is counted
+    under the first of them.
+
+    Attributes:
+        rules (Tuple[FilterRule, ...]): The rules.
+        dropped (Dict[str, int]): Number of records dropped so far, by rule name.
+    """
+
+    def __init__(self, rules: Tuple[FilterRule, ...]) -> None:
+        """Start with no records seen."""
+        self.rules = rules
+        self.dropped: Dict[str, int] = {rule.name: 0 for rule in rules}
+        self._tail = b""
+
+    def update(self, data: bytes) -> bytes:
+        """Add the next bytes of the file and return those of its complete records that are kept."""
+        # Blocks start with the line ending before their first record, so every record is preceded by one
+        block = b"\n" + self._tail + data
+        cut = block.rfind(b"\n") + 1
+        self._tail = block[cut:]
+        return self._filter(block, cut) if cut > 1 else b""
+
+    def flush(self) -> bytes:
+        """Return the last record if it is kept, for a file that does not end with a line ending."""
+        tail, self._tail = self._tail, b""
+        return self._filter(b"\n" + tail, len(tail) + 1) if tail else b""
+
+    def _filter(self, block: bytes, end: int) -> bytes:
+        """Return the records in ``block[1:end]`` that match no rule."""
+        drops: Dict[int, int] = {}
+        for rule in self.rules:
+            position = 0
+            while position < end:
+                match = rule.pattern.search(block, position, end)
+                if match is None:
+                    break
+                # A match starting with a line ending belongs to the record after it, an empty one at a line ending
+                # to the record before it, which is no record at all for the one before the block or after its end
+                at = match.start()
+                start = block.rfind(b"\n", 0, at + 1 if match.end() > at else at) + 1
+                if start == 0 or start == end:
+                    position = at + 1
+                    continue
+                stop = block.find(b"\n", start, end)
+                stop = end if stop < 0 else stop
+                # A pattern that matched past the end of the record is checked again against the record alone
+                if match.end() <= stop or rule.pattern.search(block, start - 1, stop):
+                    if start not in drops:
+                        drops[start] = stop + 1
+                        self.dropped[rule.name] += 1
+                position = max(stop, at + 1)
+        if not drops:
+            return block[1:end]
+        kept = []
+        position = 1
+        for start in sorted(drops):
+            kept.append(block[position:start])
+            position = drops[start]
+        kept.append(block[position:end])
+        return b"".join(kept)
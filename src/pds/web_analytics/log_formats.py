@@ -0,0 +1,114 @@
+"""Detection of the format of a log file from its first lines, mirroring the grok alternatives in pds-filter.conf."""
+import re
+from collections import Counter
+from typing import NamedTuple
+from typing import Optional
+from typing import Pattern
+
+from .file_dates import DEFAULT_HEAD_SIZE
+from .file_dates import read_head
+
+# Number of records, after comment lines, that vote on a file's format
+SAMPLE_LINES = 200
+# S3 user metadata key (``x-amz-meta-log-format``) holding the detected format of an uploaded log
+LOG_FORMAT_METADATA = "log-format"
+
+_IP = rb"(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9A-Fa-f]*:[0-9A-Fa-f:.]+)"
+_W3C_TIME = rb"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"
+_HTTPDATE = rb"\[\d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}:\d{2} [-+]\d{4}\]"
+
+
+class LogFormat(NamedTuple):
+    """A log format recognized from the start of its records.
+
+    Attributes:
+        name (str): Name of the format, attached to uploads and recorded in manifests.
+        pattern (Pattern[bytes]): Matches the start of a record in this format.
+        timestamps (str): Name of the timestamp style of its records, from ``summary.TIMESTAMP_STYLES``.
+    """
+
+    name: str
+    pattern: Pattern[bytes]
+    timestamps: str
+
+
+# Most specific first: a record is classified by the first format whose pattern matches it
+LOG_FORMATS = (
+    # CloudFront W3C: date time x-edge-location sc-bytes c-ip cs-method, tab or space delimited
+    LogFormat(
+        "cloudfront-w3c",
+        re.compile(rb"\d{4}-\d{2}-\d{2}([ \t])\d{2}:\d{2}:\d{2}\1\S+\1\d+\1" + _IP + rb"\1[A-Z]+(?:\1|$)"),
+        "w3c",
+    ),
+    # IIS FTP: date time c-ip cs-username s-sitename s-ip s-port cs-method
+    LogFormat("iis-ftp", re.compile(_W3C_TIME + rb" " + _IP + rb" \S+ \S+ " + _IP + rb" \d+ [A-Z]+ "), "w3c"),
+    # IIS HTTP with a site name: date time s-sitename s-ip cs-method cs-uri-stem
+    LogFormat("iis", re.compile(_W3C_TIME + rb" [^\s\d]\S* " + _IP + rb" [A-Z]+ \S+"), "w3c"),
+    # IIS HTTP without a site name: date time s-ip cs-method cs-uri-stem
+    LogFormat("iis-nosite", re.compile(_W3C_TIME + rb" " + _IP + rb" [A-Z]+ \S+"), "w3c"),
+    LogFormat(
+        "xferlog",
+        re.compile(rb"[A-Z][a-z]{2} [A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2} \d{4} \d+ \S+ \d+ "),
+        "xferlog",
+    ),
+    # Apache and Tomcat; the user field is sometimes free text with spaces
+    LogFormat(
+        "apache-combined",
+        re.compile(rb"\S+ \S+ .*?" + _HTTPDATE + rb' "[^"]*" \d{3} (?:\d+|-) "[^"]*" "[^"]*"'),
+        "apache",
+    ),
+    LogFormat("apache-common", re.compile(rb"\S+ \S+ .*?" + _HTTPDATE + rb' "[^"]*" \d{3} (?:\d+|-)'), "apache"),
+    # Requests logged without a status code, response size, referrer or user agent
+    LogFormat("apache-minimal", re.compile(rb"\S+ \S+ .*?" + _HTTPDATE + rb' "[A-Z]+ \S+ HTTP/[\d.]+"'), "apache"),
+)
+
+
+def classify_line(line: bytes) -> Optional[LogFormat]:
+    """Return the format of one record, or None if it matches none."""
+    for log_format in LOG_FORMATS:
+        if log_format.pattern.match(line):
+            return log_format
+    return None
+
+
+def detect_format(head: bytes, sample_lines: int = SAMPLE_LINES) -> Optional[LogFormat]:
+    """Detect the format of a log from its first bytes.
+
+    Comment lines (``#Fields:`` and the like) are skipped, and each of the next ``sample_lines`` records votes for
+    the format it matches; ties go to the more specific format.
+
+    Args:
+        head (bytes): The start of the uncompressed log.
+        sample_lines (int): Number of records to classify.
+
+    Returns:
+        Optional[LogFormat]: The format most records match, or None if none matched.
+    """
+    votes: Counter = Counter()
+    sampled = 0
+    for line in head.splitlines():
+        if not line.strip() or line.startswith(b"#"):
+            continue
+        log_format = classify_line(line)
+        if log_format is not None:
+            votes[log_format] += 1
+        sampled += 1
+        if sampled == sample_lines:
+            break
+    if not votes:
+        return None
+    return max(LOG_FORMATS, key=lambda log_format: votes[log_format])
+
+
+def detect_file_format(path: str, head_size: int = DEFAULT_HEAD_SIZE) -> Optional[LogFormat]:
+    """Detect the format of a log file, gzipped or not.
+
+    Args:
+        path (str): The log file.
+        head_size (int): Number of bytes, after decompression, to sample.
+
+    Returns:
+        Optional[LogFormat]: The format, or None if it was not recognized or the file cannot be read.
+    """
+    head = read_head(path, head_size)
+    return detect_format(head) if head is not None else None
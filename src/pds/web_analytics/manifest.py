@@ -0,0 +1,208 @@
+"""Per-dataset manifests of uploaded log objects, for finding the objects that cover a time range."""
+import bisect
+import json
+import logging
+from datetime import datetime
+from datetime import timezone
+from itertools import accumulate
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from botocore.exceptions import ClientError  # type: ignore
+
+from .summary import LogSummary
+
+logger = logging.getLogger(__name__)
+
+# Manifests live under <s3_subdir>/_manifests/, outside every dataset prefix that Logstash and Athena read
+MANIFEST_DIR = "_manifests"
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def manifest_key(s3_subdir: str, dataset: str) -> str:
+    """Return the S3 key of a dataset's manifest.
+
+    Args:
+        s3_subdir (str): The sync's ``s3_subdir``.
+        dataset (str): The dataset directory relative to the log directory, e.g. ``atm/atm-apache-http``.
+
+    Returns:
+        str: The key, e.g. ``<s3_subdir>/_manifests/atm/atm-apache-http.jsonl``.
+    """
+    return "/".join(part.strip("/") for part in (s3_subdir, MANIFEST_DIR, dataset + ".jsonl") if part.strip("/"))
+
+
+def sidecar_key(s3_subdir: str, directory: str, s3_key: str) -> str:
+    """Return the key of a JSON document describing an object, kept outside the dataset prefixes.
+
+    Args:
+        s3_subdir (str): The sync's ``s3_subdir``.
+        directory (str): Directory of the documents under ``s3_subdir``, e.g. ``_indexes``.
+        s3_key (str): The object's key.
+
+    Returns:
+        str: The key, e.g. ``<s3_subdir>/<directory>/atm/atm-apache-http/access.log.gz.json`` for
+            ``<s3_subdir>/atm/atm-apache-http/access.log.gz``.
+    """
+    prefix = s3_subdir.strip("/")
+    relative = s3_key[len(prefix) :] if prefix and s3_key.startswith(prefix + "/") else s3_key
+    return "/".join(part.strip("/") for part in (prefix, directory, relative + ".json") if part.strip("/"))
+
+
+def _format_time(timestamp: Optional[float]) -> Optional[str]:
+    """Format a Unix timestamp as ISO 8601 UTC."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIMESTAMP_FORMAT) if timestamp is not None else None
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse an ISO 8601 UTC time written by ``_format_time``."""
+    return datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp() if value else None
+
+
+class ManifestEntry(NamedTuple):
+    """One uploaded object in a manifest.
+
+    Attributes:
+        key (str): The object's S3 key.
+        size (int): Size of the object in bytes.
+        raw_bytes (int): Size of the uncompressed log in bytes.
+        lines (int): Number of lines in the log.
+        start (Optional[float]): Earliest record timestamp, as a Unix timestamp, or None if unknown.
+        end (Optional[float]): Latest record timestamp, as a Unix timestamp, or None if unknown.
+        log_format (Optional[str]): The detected log format, or None if it was not recognized.
+    """
+
+    key: str
+    size: int
+    raw_bytes: int
+    lines: int
+    start: Optional[float]
+    end: Optional[float]
+    log_format: Optional[str]
+
+    @classmethod
+    def from_summary(cls, key: str, size: int, summary: LogSummary) -> "ManifestEntry":
+        """Build the entry of an object from the summary of its log."""
+        return cls(key, size, summary.raw_bytes, summary.lines, summary.start, summary.end, summary.log_format)
+
+    def to_json(self) -> str:
+        """Return the entry as one line of JSON, with times in ISO 8601 UTC."""
+        return json.dumps(
+            {
+                "key": self.key,
+                "size": self.size,
+                "raw_bytes": self.raw_bytes,
+                "lines": self.lines,
+                "start": _format_time(self.start),
+                "end": _format_time(self.end),
+                "format": self.log_format,
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, line: str) -> "ManifestEntry":
+        """Parse one line written by ``to_json``."""
+        record: Dict[str, Any] = json.loads(line)
+        return cls(
+            record["key"],
+            record["size"],
+            record["raw_bytes"],
+            record["lines"],
+            _parse_time(record.get("start")),
+            _parse_time(record.get("end")),
+            record.get("format"),
+        )
+
+
+class ManifestIndex:
+    """A manifest's entries ordered by start time, for finding those that overlap a time range.
+
+    Entries without timestamps are kept apart in ``undated``. Overlapping entries are found with two binary
+    searches, one over the start times and one over the running maximum of the end times, so a lookup costs
+    ``O(log n)`` plus the entries in between, which for logs rotated in time order are just the matches.
+
+    Attributes:
+        entries (List[ManifestEntry]): Entries with timestamps, by start time then key.
+        undated (List[ManifestEntry]): Entries without timestamps, by key.
+    """
+
+    def __init__(self, entries: Iterable[ManifestEntry]) -> None:
+        """Order entries, keeping the last one given for each key."""
+        by_key = {entry.key: entry for entry in entries}
+        dated = [entry for entry in by_key.values() if entry.start is not None and entry.end is not None]
+        self.entries = sorted(dated, key=lambda entry: (entry.start, entry.key))
+        undated = [entry for entry in by_key.values() if entry.start is None or entry.end is None]
+        self.undated = sorted(undated, key=lambda entry: entry.key)
+        self._starts = [entry.start for entry in self.entries]
+        self._max_ends = list(accumulate((entry.end for entry in self.entries), max))
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return len(self.entries) + len(self.undated)
+
+    def covering(self, start: float, end: float) -> List[ManifestEntry]:
+        """Return the entries with records between two times.
+
+        Args:
+            start (float): Start of the range, as a Unix timestamp.
+            end (float): End of the range, inclusive, as a Unix timestamp.
+
+        Returns:
+            List[ManifestEntry]: Entries whose time ranges overlap the range, by start time.
+        """
+        low = bisect.bisect_left(self._max_ends, start)  # type: ignore[arg-type]
+        high = bisect.bisect_right(self._starts, end)  # type: ignore[arg-type]
+        return [entry for entry in self.entries[low:high] if entry.end >= start]  # type: ignore[operator]
+
+    def to_jsonl(self) -> bytes:
+        """Return the manifest as JSON lines, dated entries by start time first."""
+        return "".join(entry.to_json() + "\n" for entry in self.entries + self.undated).encode()
+
+    @classmethod
+    def from_jsonl(cls, body: bytes) -> "ManifestIndex":
+        """Parse a manifest written by ``to_jsonl``."""
+        return cls(ManifestEntry.from_json(line) for line in body.decode().splitlines() if line.strip())
+
+
+def read_manifest(s3_client, bucket: str, key: str) -> ManifestIndex:
+    """Download a manifest from S3.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket (str): The bucket.
+        key (str): The manifest's key.
+
+    Returns:
+        ManifestIndex: The manifest, empty if there is none yet.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchKey":
+            return ManifestIndex([])
+        raise
+    return ManifestIndex.from_jsonl(response["Body"].read())
+
+
+def publish_manifest(s3_client, bucket: str, key: str, entries: List[ManifestEntry]) -> ManifestIndex:
+    """Add entries to a manifest in S3, replacing earlier entries for the same objects.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket (str): The bucket.
+        key (str): The manifest's key.
+        entries (List[ManifestEntry]): The new entries.
+
+    Returns:
+        ManifestIndex: The manifest as written.
+    """
+    existing = read_manifest(s3_client, bucket, key)
+    manifest = ManifestIndex(existing.entries + existing.undated + entries)
+    s3_client.put_object(Bucket=bucket, Key=key, Body=manifest.to_jsonl(), ContentType="application/x-ndjson")
+    logger.debug(f"Manifest s3://{bucket}/{key} has {len(manifest)} entries")
+    return manifest
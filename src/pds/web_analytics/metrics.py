@@ -0,0 +1,394 @@
+"""Throughput and latency metrics for S3 log sync runs."""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# Phases of syncing one file, in the order they happen
+PHASES = ("scan", "compress", "check", "upload", "delete")
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Prefix of every Prometheus metric name
+METRIC_PREFIX = "s3_log_sync"
+
+
+class Histogram:
+    """A latency histogram with fixed buckets, in the cumulative form Prometheus expects.
+
+    Attributes:
+        bounds (Tuple[float, ...]): Upper bounds of the buckets, in seconds.
+        counts (List[int]): Observations per bucket; the last entry counts those above every bound.
+        count (int): Number of observations.
+        total (float): Sum of the observations, in seconds.
+    """
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """Create an empty histogram."""
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Add one observation.
+
+        Args:
+            seconds (float): The observed duration.
+        """
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Return ``(le, count)`` pairs with the number of observations at or below each bound.
+
+        Returns:
+            List[Tuple[str, int]]: The cumulative buckets, ending with ``+Inf``.
+        """
+        buckets = []
+        running = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            running += count
+            buckets.append(("+Inf" if bound == float("inf") else repr(bound), running))
+        return buckets
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the histogram as a JSON-serializable dict."""
+        return {"count": self.count, "seconds": round(self.total, 6), "buckets": dict(self.cumulative())}
+
+
+class _CopyMetrics:
+    """Counters for the copies of one source directory's files in one additional destination."""
+
+    def __init__(self) -> None:
+        self.files: Dict[str, int] = {}
+        self.bytes_uploaded = 0
+
+
+class _NodeMetrics(_CopyMetrics):
+    """Counters for one source directory."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.raw_bytes = 0
+        self.lines_dropped: Dict[str, int] = {}
+        self.phases: Dict[str, Histogram] = {phase: Histogram() for phase in PHASES}
+        self.destinations: Dict[str, _CopyMetrics] = {}
+
+    def counters(self, destination: Optional[str]) -> _CopyMetrics:
+        """Return the counters of the primary bucket, or of an additional destination."""
+        if destination is None:
+            return self
+        copies = self.destinations.get(destination)
+        if copies is None:
+            copies = self.destinations[destination] = _CopyMetrics()
+        return copies
+
+
+class SyncMetrics:
+    """Thread-safe collector of the throughput and per-phase latency of a sync run, per node.
+
+    Upload bytes are counted from the boto3 transfer ``Callback`` as they are sent, so throughput reflects the
+    bytes actually put on the wire, including those of uploads that later fail. Phase durations are recorded
+    per file, except for ``scan``, which is the time spent walking each node's directory tree. Files and bytes
+    copied to additional destinations are counted per destination, apart from those of the primary bucket.
+
+    Attributes:
+        started (float): Unix time the run started.
+        finished (Optional[float]): Unix time the run finished, once ``finish`` is called.
+    """
+
+    def __init__(self) -> None:
+        """Start collecting."""
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._start_monotonic = time.monotonic()
+        self._duration: Optional[float] = None
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, _NodeMetrics] = {}
+
+    def _node(self, node: str) -> _NodeMetrics:
+        """Return the counters of a node, creating them on first use; the lock must be held."""
+        metrics = self._nodes.get(node)
+        if metrics is None:
+            metrics = self._nodes[node] = _NodeMetrics()
+        return metrics
+
+    def record_phase(self, node: str, phase: str, seconds: float) -> None:
+        """Record how long one phase took.
+
+        Args:
+            node (str): The node the work belongs to.
+            phase (str): One of ``PHASES``.
+            seconds (float): The duration.
+        """
+        with self._lock:
+            self._node(node).phases[phase].observe(seconds)
+
+    @contextmanager
+    def phase(self, node: str, phase: str) -> Iterator[None]:
+        """Time the body of a ``with`` block as one phase, whether or not it raises.
+
+        Args:
+            node (str): The node the work belongs to.
+            phase (str): One of ``PHASES``.
+        """
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_phase(node, phase, time.monotonic() - start_time)
+
+    def record_file(self, node: str, result: str, destination: Optional[str] = None) -> None:
+        """Count a file by the outcome of its sync.
+
+        Args:
+            node (str): The node the file belongs to.
+            result (str): ``uploaded``, ``skipped`` or ``failed``, ``leased`` for a file left to another worker, or
+                ``deferred`` for a copy left for a later pass.
+            destination (Optional[str]): The additional destination the file was copied to, if not the primary
+                bucket.
+        """
+        with self._lock:
+            files = self._node(node).counters(destination).files
+            files[result] = files.get(result, 0) + 1
+
+    def record_dropped_lines(self, node: str, dropped: Dict[str, int]) -> None:
+        """Count the records the line filter left out of a file.
+
+        Args:
+            node (str): The node the file belongs to.
+            dropped (Dict[str, int]): Records left out, by filter rule name.
+        """
+        with self._lock:
+            lines_dropped = self._node(node).lines_dropped
+            for rule, count in dropped.items():
+                lines_dropped[rule] = lines_dropped.get(rule, 0) + count
+
+    def add_bytes(self, node: str, amount: int, destination: Optional[str] = None) -> None:
+        """Count bytes sent to S3.
+
+        Args:
+            node (str): The node the bytes belong to.
+            amount (int): Bytes sent; negative when boto3 rewinds a body to retry it.
+            destination (Optional[str]): The additional destination the bytes were sent to, if not the primary
+                bucket.
+        """
+        with self._lock:
+            self._node(node).counters(destination).bytes_uploaded += amount
+
+    def add_raw_bytes(self, node: str, amount: int) -> None:
+        """Count the size of uploaded files before compression.
+
+        Args:
+            node (str): The node the files belong to.
+            amount (int): Bytes read from the files.
+        """
+        with self._lock:
+            self._node(node).raw_bytes += amount
+
+    def transfer_callback(
+        self, node: str, throttle: Optional[Callable[[int], None]] = None, destination: Optional[str] = None
+    ) -> Callable[[int], None]:
+        """Return a boto3 transfer ``Callback`` that counts the bytes sent for a node.
+
+        Args:
+            node (str): The node being uploaded.
+            throttle (Optional[Callable[[int], None]]): A bandwidth limit to call after counting.
+            destination (Optional[str]): The additional destination being copied to, if not the primary bucket.
+
+        Returns:
+            Callable[[int], None]: The callback.
+        """
+
+        def callback(amount: int) -> None:
+            self.add_bytes(node, amount, destination)
+            if throttle:
+                throttle(amount)
+
+        return callback
+
+    def finish(self) -> None:
+        """Mark the end of the run."""
+        self.finished = time.time()
+        self._duration = time.monotonic() - self._start_monotonic
+
+    def report(self) -> Dict[str, Any]:
+        """Return the metrics of the run as a JSON-serializable dict.
+
+        Returns:
+            Dict[str, Any]: Totals and rates for the run, and counters, the size of the files uploaded before
+                compression, records dropped by line filter rule and phase histograms per node. Totals and rates
+                are those of the primary bucket; the files and bytes copied to each additional destination are
+                under the node's ``destinations``.
+        """
+        duration = self._duration if self._duration is not None else time.monotonic() - self._start_monotonic
+        with self._lock:
+            nodes = {
+                node: {
+                    "files": dict(metrics.files),
+                    "bytes_uploaded": metrics.bytes_uploaded,
+                    "raw_bytes": metrics.raw_bytes,
+                    "lines_dropped": dict(metrics.lines_dropped),
+                    "phases": {phase: histogram.to_dict() for phase, histogram in metrics.phases.items()},
+                    "destinations": {
+                        name: {"files": dict(copies.files), "bytes_uploaded": copies.bytes_uploaded}
+                        for name, copies in sorted(metrics.destinations.items())
+                    },
+                }
+                for node, metrics in sorted(self._nodes.items())
+            }
+        files = sum(sum(node["files"].values()) for node in nodes.values())
+        uploaded = sum(node["files"].get("uploaded", 0) for node in nodes.values())
+        bytes_uploaded = sum(node["bytes_uploaded"] for node in nodes.values())
+        raw_bytes = sum(node["raw_bytes"] for node in nodes.values())
+        lines_dropped = sum(sum(node["lines_dropped"].values()) for node in nodes.values())
+        return {
+            "started": self.started,
+            "finished": self.finished,
+            "duration_seconds": round(duration, 6),
+            "files": files,
+            "files_uploaded": uploaded,
+            "bytes_uploaded": bytes_uploaded,
+            "raw_bytes": raw_bytes,
+            "lines_dropped": lines_dropped,
+            "files_per_second": uploaded / duration if duration > 0 else 0.0,
+            "bytes_per_second": bytes_uploaded / duration if duration > 0 else 0.0,
+            "nodes": nodes,
+        }
+
+    def write_json(self, path: str) -> None:
+        """Write the run report as JSON.
+
+        Args:
+            path (str): Output file path.
+        """
+        _write_atomically(path, json.dumps(self.report(), indent=2, sort_keys=True) + "\n")
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the metrics in the Prometheus text format, e.g. for the node_exporter textfile collector.
+
+        Args:
+            path (str): Output file path; node_exporter only reads files ending in ``.prom``.
+        """
+        _write_atomically(path, self.prometheus_text())
+
+    def prometheus_text(self) -> str:
+        """Return the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        report = self.report()
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, Any]]) -> None:
+            full_name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for suffix_labels, value in samples:
+                lines.append(f"{full_name}{suffix_labels} {value}")
+
+        metric(
+            "last_run_timestamp_seconds",
+            "gauge",
+            "Unix time the last run finished.",
+            [("", report["finished"] or time.time())],
+        )
+        metric("run_duration_seconds", "gauge", "Duration of the last run.", [("", report["duration_seconds"])])
+        metric("bytes_per_second", "gauge", "Upload throughput of the last run.", [("", report["bytes_per_second"])])
+        metric(
+            "files_per_second",
+            "gauge",
+            "Files uploaded per second in the last run.",
+            [("", report["files_per_second"])],
+        )
+
+        nodes = report["nodes"]
+        metric(
+            "files",
+            "gauge",
+            "Files handled by the last run, by outcome.",
+            [
+                (_labels(node=node, result=result), count)
+                for node, data in nodes.items()
+                for result, count in sorted(data["files"].items())
+            ],
+        )
+        metric(
+            "bytes_uploaded",
+            "gauge",
+            "Bytes sent to S3 by the last run.",
+            [(_labels(node=node), data["bytes_uploaded"]) for node, data in nodes.items()],
+        )
+        metric(
+            "lines_dropped",
+            "gauge",
+            "Log records left out of uploads by the last run, by line filter rule.",
+            [
+                (_labels(node=node, rule=rule), count)
+                for node, data in nodes.items()
+                for rule, count in sorted(data["lines_dropped"].items())
+            ],
+        )
+
+        metric(
+            "destination_files",
+            "gauge",
+            "Files copied to additional destinations by the last run, by outcome.",
+            [
+                (_labels(node=node, destination=name, result=result), count)
+                for node, data in nodes.items()
+                for name, copies in data["destinations"].items()
+                for result, count in sorted(copies["files"].items())
+            ],
+        )
+        metric(
+            "destination_bytes_uploaded",
+            "gauge",
+            "Bytes sent to additional destinations by the last run.",
+            [
+                (_labels(node=node, destination=name), copies["bytes_uploaded"])
+                for node, data in nodes.items()
+                for name, copies in data["destinations"].items()
+            ],
+        )
+
+        samples: List[Tuple[str, Any]] = []
+        for node, data in nodes.items():
+            for phase, histogram in data["phases"].items():
+                if not histogram["count"]:
+                    continue
+                for le, count in histogram["buckets"].items():
+                    samples.append((_labels("_bucket", node=node, phase=phase, le=le), count))
+                samples.append((_labels("_sum", node=node, phase=phase), histogram["seconds"]))
+                samples.append((_labels("_count", node=node, phase=phase), histogram["count"]))
+        metric("phase_seconds", "histogram", "Time spent per file in each sync phase.", samples)
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(suffix: str = "", **labels: str) -> str:
+    """Format a metric name suffix and label set, escaping label values."""
+    escaped = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return f"{suffix}{{{escaped}}}" if escaped else suffix
+
+
+def _write_atomically(path: str, content: str) -> None:
+    """Write a file through a temporary name so readers never see it half written."""
+    partial_path = path + ".tmp"
+    with open(partial_path, "w") as f:
+        f.write(content)
+    os.replace(partial_path, path)
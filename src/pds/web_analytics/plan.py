@@ -0,0 +1,185 @@
+"""Plans of what a sync would upload, with size and duration estimates from the throughput of recent runs."""
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+from .sync_state import ThroughputRecord
+
+# Compressed size of a log relative to its size, for a node with no uploads recorded yet; web logs gzip to about
+# a tenth
+DEFAULT_COMPRESSION_RATIO = 0.1
+# Seconds of past runs the estimates are based on
+THROUGHPUT_WINDOW = 7 * 86400
+
+
+class NodePlan:
+    """What a sync would do with the files of one node.
+
+    Attributes:
+        files (int): Files that would be uploaded, on their own or in batches.
+        batches (int): Batch objects among the uploads.
+        replaced (int): Uploads that replace an object the file has changed since.
+        raw_bytes (int): Size of the files to upload.
+        gzip_bytes (int): The part of ``raw_bytes`` that would be gzipped; the rest is uploaded as it is.
+        existing_files (int): Files found in S3 already.
+        unchanged_files (int): Files the local state records as uploaded and unchanged since, never looked up.
+        unsettled_files (int): Files left for a later run because they are still being written.
+        held_files (int): Small files waiting for a fuller batch.
+        foreign_files (int): Files left to other workers of the cluster.
+    """
+
+    def __init__(self) -> None:
+        """Start with nothing to do."""
+        self.files = 0
+        self.batches = 0
+        self.replaced = 0
+        self.raw_bytes = 0
+        self.gzip_bytes = 0
+        self.existing_files = 0
+        self.unchanged_files = 0
+        self.unsettled_files = 0
+        self.held_files = 0
+        self.foreign_files = 0
+
+    def add_upload(
+        self, raw_bytes: int, gzip_bytes: int, files: int = 1, batch: bool = False, replace: bool = False
+    ) -> None:
+        """Count an upload.
+
+        Args:
+            raw_bytes (int): Bytes read from the files.
+            gzip_bytes (int): The part of them that is gzipped.
+            files (int): Files uploaded, more than one for a batch.
+            batch (bool): The upload is a batch object.
+            replace (bool): The upload replaces an existing object.
+        """
+        self.files += files
+        self.batches += int(batch)
+        self.replaced += int(replace)
+        self.raw_bytes += raw_bytes
+        self.gzip_bytes += gzip_bytes
+
+    def estimated_bytes(self, ratio: Optional[float]) -> int:
+        """Return the estimated size of the uploads.
+
+        Args:
+            ratio (Optional[float]): Bytes uploaded per byte read for the node in recent runs, if any were recorded.
+                Otherwise gzipped files are taken to shrink by ``DEFAULT_COMPRESSION_RATIO``.
+
+        Returns:
+            int: The estimate, in bytes.
+        """
+        if ratio is not None:
+            return round(self.raw_bytes * ratio)
+        return round(self.gzip_bytes * DEFAULT_COMPRESSION_RATIO) + self.raw_bytes - self.gzip_bytes
+
+
+class Throughput(NamedTuple):
+    """Throughput of recent runs.
+
+    Attributes:
+        runs (int): Runs that uploaded anything.
+        bytes_per_second (float): Bytes read from uploaded files per second of those runs, compression included.
+        ratios (Dict[str, float]): Bytes uploaded per byte read, by node.
+    """
+
+    runs: int
+    bytes_per_second: float
+    ratios: Dict[str, float]
+
+
+def throughput(records: Sequence[ThroughputRecord]) -> Optional[Throughput]:
+    """Work out the throughput of recent runs from what they uploaded.
+
+    Args:
+        records (Sequence[ThroughputRecord]): What each run uploaded per node.
+
+    Returns:
+        Optional[Throughput]: The throughput, or None if no run uploaded anything.
+    """
+    durations: Dict[float, float] = {}
+    raw: Dict[str, int] = {}
+    uploaded: Dict[str, int] = {}
+    for record in records:
+        durations[record.finished] = record.duration
+        raw[record.node] = raw.get(record.node, 0) + record.raw_bytes
+        uploaded[record.node] = uploaded.get(record.node, 0) + record.bytes_uploaded
+    seconds = sum(durations.values())
+    if not seconds or not sum(raw.values()):
+        return None
+    ratios = {node: uploaded[node] / raw[node] for node in raw if raw[node]}
+    return Throughput(len(durations), sum(raw.values()) / seconds, ratios)
+
+
+class SyncPlan:
+    """What a sync would upload, per node, gathered by scans running in parallel."""
+
+    def __init__(self) -> None:
+        """Start an empty plan."""
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, NodePlan] = {}
+
+    def node(self, node: str) -> NodePlan:
+        """Return the plan of a node, creating it on first use.
+
+        Args:
+            node (str): The node.
+
+        Returns:
+            NodePlan: Its plan.
+        """
+        with self._lock:
+            return self._nodes.setdefault(node, NodePlan())
+
+    def to_dict(self, history: Sequence[ThroughputRecord] = ()) -> Dict[str, Any]:
+        """Return the plan as a JSON-serializable dict, with estimates from the throughput of recent runs.
+
+        Durations are projected from the bytes recent runs read per second, so they assume as many workers and
+        the same bandwidth as those runs had; they are None without any recorded run.
+
+        Args:
+            history (Sequence[ThroughputRecord]): What recent runs uploaded.
+
+        Returns:
+            Dict[str, Any]: Totals, the throughput the estimates are based on, and counters and estimates per node.
+        """
+        rate = throughput(history)
+
+        def seconds(raw_bytes: int) -> Optional[float]:
+            return round(raw_bytes / rate.bytes_per_second, 1) if rate is not None else None
+
+        with self._lock:
+            plans = sorted(self._nodes.items())
+        nodes: Dict[str, Dict[str, Any]] = {}
+        for node, plan in plans:
+            ratio = rate.ratios.get(node) if rate is not None else None
+            nodes[node] = {
+                "files": plan.files,
+                "batches": plan.batches,
+                "replaced": plan.replaced,
+                "raw_bytes": plan.raw_bytes,
+                "estimated_bytes": plan.estimated_bytes(ratio),
+                "compression_ratio": ratio,
+                "projected_seconds": seconds(plan.raw_bytes),
+                "existing_files": plan.existing_files,
+                "unchanged_files": plan.unchanged_files,
+                "unsettled_files": plan.unsettled_files,
+                "held_files": plan.held_files,
+                "foreign_files": plan.foreign_files,
+            }
+        raw_bytes = sum(node["raw_bytes"] for node in nodes.values())
+        return {
+            "generated": time.time(),
+            "files": sum(node["files"] for node in nodes.values()),
+            "raw_bytes": raw_bytes,
+            "estimated_bytes": sum(node["estimated_bytes"] for node in nodes.values()),
+            "projected_seconds": seconds(raw_bytes),
+            "throughput": (
+                {"runs": rate.runs, "bytes_per_second": round(rate.bytes_per_second, 1)} if rate is not None else None
+            ),
+            "nodes": nodes,
+        }
@@ -0,0 +1,208 @@
+"""Compact in-memory index of the objects under an S3 prefix."""
+import hashlib
+import heapq
+import logging
+import re
+from array import array
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .concurrency import AdaptiveConcurrency
+
+logger = logging.getLogger(__name__)
+
+# ETags of single-part uploads are the hex MD5 of the object; multipart ETags append "-<part count>"
+ETAG_PATTERN = re.compile(r'^"?([0-9a-fA-F]{32})(?:-(\d+))?"?$')
+# Marker stored in the part-count array for ETags that do not follow either form (e.g. SSE-C objects)
+UNKNOWN_ETAG = 0xFFFFFFFF
+
+
+def key_hash(key: str) -> int:
+    """Return the 64-bit hash used to store a key in the index.
+
+    Args:
+        key (str): The S3 key.
+
+    Returns:
+        int: An unsigned 64-bit hash of the key.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class S3KeyIndex:
+    """A sorted, hashed index of S3 keys with their sizes and ETags.
+
+    Keys are not stored; each one is reduced to a 64-bit hash kept in a sorted ``array``, alongside
+    parallel arrays for the object size and the binary ETag. An entry costs 36 bytes no matter how long
+    the key is, so ten million keys fit in roughly 360MB. The chance of two keys in a 10M-key listing
+    sharing a hash is about 1 in 370,000.
+
+    Attributes:
+        prefix (str): The S3 prefix the index was built from.
+        start_after (Optional[str]): The ``StartAfter`` key the listing began after, if any.
+    """
+
+    def __init__(self, prefix: str = "", start_after: Optional[str] = None) -> None:
+        """Create an empty index for a prefix."""
+        self.prefix = prefix
+        self.start_after = start_after
+        self._hashes = array("Q")
+        self._sizes = array("q")
+        self._md5s = bytearray()
+        self._parts = array("I")
+        # Entries are appended in sorted runs (one per listing page) and merged by _freeze()
+        self._runs: list = []
+        self._sorted = True
+
+    @classmethod
+    def from_listing(
+        cls,
+        s3_client,
+        bucket: str,
+        prefix: str,
+        start_after: Optional[str] = None,
+        limiter: Optional["AdaptiveConcurrency"] = None,
+    ) -> "S3KeyIndex":
+        """Build an index by listing a prefix with paginated ``ListObjectsV2`` calls.
+
+        Args:
+            s3_client: boto3 S3 client.
+            bucket (str): The bucket to list.
+            prefix (str): Only keys under this prefix are indexed.
+            start_after (Optional[str]): Skip keys that sort at or before this key.
+            limiter (Optional[AdaptiveConcurrency]): Concurrency limit each page request is made under.
+
+        Returns:
+            S3KeyIndex: The populated index.
+        """
+        index = cls(prefix, start_after)
+        params = {"Bucket": bucket, "Prefix": prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+
+        pages = iter(s3_client.get_paginator("list_objects_v2").paginate(**params))
+        while True:
+            with limiter.request() if limiter is not None else nullcontext():
+                page = next(pages, None)
+            if page is None:
+                break
+            index.add_many((obj["Key"], obj["Size"], obj.get("ETag")) for obj in page.get("Contents", []))
+
+        index._freeze()
+        logger.debug(f"Indexed {len(index)} keys under s3://{bucket}/{prefix}")
+        return index
+
+    def add_many(self, objects: Iterable[Tuple[str, int, Optional[str]]]) -> None:
+        """Add a batch of ``(key, size, etag)`` entries to the index.
+
+        Args:
+            objects (Iterable[Tuple[str, int, Optional[str]]]): The entries to add.
+        """
+        entries = sorted((key_hash(key), size, etag) for key, size, etag in objects)
+        if not entries:
+            return
+
+        start = len(self._hashes)
+        for hashed, size, etag in entries:
+            md5, parts = self._pack_etag(etag)
+            self._hashes.append(hashed)
+            self._sizes.append(size)
+            self._md5s += md5
+            self._parts.append(parts)
+        self._runs.append((start, len(self._hashes)))
+        self._sorted = len(self._runs) == 1
+
+    def _freeze(self) -> None:
+        """Merge the sorted runs added so far into a single sorted set of arrays."""
+        if self._sorted:
+            return
+
+        hashes, sizes, md5s, parts = array("Q"), array("q"), bytearray(), array("I")
+        for hashed, position in heapq.merge(*(self._iter_run(start, end) for start, end in self._runs)):
+            hashes.append(hashed)
+            sizes.append(self._sizes[position])
+            md5s += self._md5s[position * 16 : position * 16 + 16]
+            parts.append(self._parts[position])
+
+        self._hashes, self._sizes, self._md5s, self._parts = hashes, sizes, md5s, parts
+        self._runs = [(0, len(hashes))]
+        self._sorted = True
+
+    def _iter_run(self, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """Yield ``(hash, position)`` pairs for one sorted run."""
+        for position in range(start, end):
+            yield self._hashes[position], position
+
+    @staticmethod
+    def _pack_etag(etag: Optional[str]) -> Tuple[bytes, int]:
+        """Split an ETag into its binary MD5 and part count."""
+        match = ETAG_PATTERN.match(etag or "")
+        if not match:
+            return bytes(16), UNKNOWN_ETAG
+        return bytes.fromhex(match.group(1)), int(match.group(2) or 0)
+
+    def _position(self, key: str) -> Optional[int]:
+        """Return the array position of a key, or None if it is not indexed."""
+        self._freeze()
+        hashed = key_hash(key)
+        position = bisect_left(self._hashes, hashed)
+        if position < len(self._hashes) and self._hashes[position] == hashed:
+            return position
+        return None
+
+    def covers(self, key: str) -> bool:
+        """Check whether a key falls inside the range this index was listed over.
+
+        Args:
+            key (str): The S3 key.
+
+        Returns:
+            bool: True if a missing entry means the key does not exist in S3.
+        """
+        return key.startswith(self.prefix) and (not self.start_after or key > self.start_after)
+
+    def __contains__(self, key: object) -> bool:
+        """Check whether a key exists in the index."""
+        return isinstance(key, str) and self._position(key) is not None
+
+    def __len__(self) -> int:
+        """Return the number of keys in the index."""
+        return len(self._hashes)
+
+    def lookup(self, key: str) -> Optional[Tuple[int, Optional[str]]]:
+        """Return the size and ETag recorded for a key.
+
+        Args:
+            key (str): The S3 key.
+
+        Returns:
+            Optional[Tuple[int, Optional[str]]]: ``(size, etag)`` if the key is indexed, otherwise None.
+                The ETag is quoted like S3 returns it, or None if it could not be stored.
+        """
+        position = self._position(key)
+        if position is None:
+            return None
+
+        parts = self._parts[position]
+        if parts == UNKNOWN_ETAG:
+            return self._sizes[position], None
+        etag = self._md5s[position * 16 : position * 16 + 16].hex()
+        if parts:
+            etag += f"-{parts}"
+        return self._sizes[position], f'"{etag}"'
+
+    def size(self, key: str) -> Optional[int]:
+        """Return the size of an indexed key, or None if it is not indexed."""
+        entry = self.lookup(key)
+        return entry[0] if entry else None
+
+    def etag(self, key: str) -> Optional[str]:
+        """Return the ETag of an indexed key, or None if it is not indexed."""
+        entry = self.lookup(key)
+        return entry[1] if entry else None
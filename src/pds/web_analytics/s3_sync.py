@@ -1,25 +1,133 @@
 """S3 synchronization module for PDS web analytics."""
 import argparse
-import gzip
+import heapq
+import itertools
+import json
 import logging
 import math
 import os
-import shutil
+import re
+import signal
+import sqlite3
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
 from multiprocessing import cpu_count
+from typing import Any
+from typing import Callable
+from typing import Collection
 from typing import Dict
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Sequence
+from typing import Set
 from typing import Tuple
 
 import boto3  # type: ignore
 import yaml  # type: ignore
 from box import Box
+from botocore.config import Config  # type: ignore
+
+from .bandwidth import BandwidthSchedule
+from .bandwidth import Throttle
+from .bandwidth import TokenBucket
+from .checksum import checksum_file
+from .checksum import ChecksumHasher
+from .checksum import FileChecksum
+from .coalesce import Batch
+from .coalesce import BatchMember
+from .coalesce import BatchReader
+from .coalesce import coalesce_settings
+from .coalesce import CoalesceSettings
+from .coalesce import plan_batches
+from .coalesce import segment_end
+from .coalesce import sources_json
+from .coalesce import sources_key
+from .compression import CompressionStats
+from .compression import DEFAULT_GZIP_BUFFER_SIZE
+from .compression import DEFAULT_GZIP_LEVEL
+from .compression import gzip_file
+from .concurrency import AdaptiveConcurrency
+from .concurrency import ConcurrencyStats
+from .concurrency import LIMITED_MAX_ATTEMPTS
+from .concurrency import report_retries
+from .concurrency import REQUEST_OPERATIONS
+from .concurrency import UPLOAD_OPERATIONS
+from .destinations import Destination
+from .file_dates import file_date
+from .include_matcher import compile_include_patterns
+from .key_template import KeyTemplate
+from .leases import cluster_settings
+from .leases import ClusterSettings
+from .leases import HashRing
+from .leases import LeaseManager
+from .line_filter import filter_rules
+from .line_filter import FilterRule
+from .log_formats import detect_file_format
+from .log_formats import LOG_FORMAT_METADATA
+from .manifest import manifest_key
+from .manifest import ManifestEntry
+from .manifest import publish_manifest
+from .metrics import SyncMetrics
+from .plan import SyncPlan
+from .plan import THROUGHPUT_WINDOW
+from .s3_index import S3KeyIndex
+from .scheduler import DEFAULT_WEIGHT
+from .scheduler import FairScheduler
+from .seekable import BlockIndex
+from .seekable import index_gzip_file
+from .seekable import index_key
+from .streaming import GzipStreamUploader
+from .streaming import StreamCopy
+from .streaming import StreamStats
+from .summary import LogSummary
+from .sync_state import STATUS_PENDING
+from .sync_state import SyncState
+from .sync_state import ThroughputRecord
+from .transfer import abort_multipart
+from .transfer import DEFAULT_ABANDONED_UPLOAD_AGE
+from .transfer import DEFAULT_MULTIPART_CHUNKSIZE
+from .transfer import DEFAULT_MULTIPART_CONCURRENCY
+from .transfer import DEFAULT_SMALL_FILE_THRESHOLD
+from .transfer import multipart_transfer_config
+from .transfer import put_small_file
+from .transfer import upload_multipart
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Outcomes of syncing a single file
+UPLOADED = "uploaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+# Outcome of a copy to an additional destination that was too far behind to take it
+DEFERRED = "deferred"
+# Outcome of a file left to another worker holding its lease
+LEASED = "leased"
+
+# Allowance for clock skew between this host and the file server when comparing directory mtimes with the
+# start of the last sync
+SCAN_PRUNE_MARGIN = 15 * 60
+# Files recorded as modified this many seconds ago or less may still be appended to, which does not change their
+# directory's mtime; their directories are listed on every run
+HOT_FILE_WINDOW = 2 * 86400
+# Files per upload worker a directory scan keeps back to order newest first; once the window is full the newest
+# file in it is queued for upload as the scan goes on
+PRIORITY_WINDOW_PER_WORKER = 16
+
+# Seconds between sync passes in watch mode
+DEFAULT_WATCH_INTERVAL = 10.0
+# Seconds a file must go unmodified in watch mode before it is considered complete
+DEFAULT_SETTLE_SECONDS = 60.0
+# Minimum seconds between two searches for abandoned multipart uploads in watch mode
+ABANDONED_UPLOAD_CHECK_INTERVAL = 3600.0
+
 
 class S3Sync:
     """A class to sync directories from a local filesystem to an AWS S3 bucket.
@@ -31,10 +139,58 @@ class S3Sync:
         s3_subdir (str): The target directory within the S3 bucket.
         profile_name (Optional[str]): AWS CLI profile name. Default is None.
         delete (bool): Flag to delete source files after sync. Default is False.
-        workers (int): Number of worker processes to use. Default is the number of CPUs.
-        s3_client: boto3 S3 client for AWS operations.
+        workers (int): Maximum number of concurrent upload threads to use. Default is the number of CPUs.
+        s3_client: boto3 S3 client for AWS operations, shared by all upload threads.
+        limited_client: boto3 S3 client for the uploads, HEAD and LIST requests made under the adaptive limiters,
+            with fewer retries than ``s3_client``.
+        upload_concurrency (AdaptiveConcurrency): Adaptive limit on uploads in flight, up to ``workers``.
+        request_concurrency (AdaptiveConcurrency): Adaptive limit on HEAD and LIST requests in flight.
         enable_gzip (bool): Flag to enable/disable gzip compression. Default is True.
         force (bool): Flag to force upload even if files already exist in S3. Default is False.
+        gzip_level (int): zlib compression level (1-9) used when gzipping files. Default is 6.
+        gzip_buffer_size (int): Read buffer size in bytes used when gzipping files. Default is 1MiB.
+        streaming (bool): Flag to compress files straight into S3 uploads instead of gzipping them in place.
+            Local files are left untouched unless ``delete`` is set. Default is False.
+        state_file (Optional[str]): Path of a SQLite database recording uploaded files, so unchanged files
+            are skipped on later runs without any S3 requests. Default is None (no local state).
+        read_only_state (bool): Flag to only read ``state_file``, never creating or migrating it, as ``--plan``
+            does; a missing or outdated state is then ignored. Default is False.
+        state (Optional[SyncState]): The opened local state, if ``state_file`` is set.
+        full_scan (bool): Flag to list every directory even when local state shows it unchanged since the
+            last sync. Default is False.
+        bandwidth (Optional[TokenBucket]): Host-wide upload bandwidth limit built from the ``bandwidth`` config
+            entry, shared by all uploads. Default is None (no limit).
+        report_file (Optional[str]): Path of a JSON run report written at the end of ``run``. Default is None.
+        prometheus_file (Optional[str]): Path of a Prometheus textfile written at the end of ``run``.
+            Default is None.
+        metrics (SyncMetrics): Throughput and per-phase latency of the run, per node.
+        settle_seconds (float): Files modified less than this many seconds ago are taken to be still being
+            written and are left for a later run. Default is 0 (sync every matching file).
+        small_file_threshold (int): Files up to this many bytes are uploaded with a single ``put_object`` call
+            instead of the boto3 TransferManager. Default is 8MiB.
+        transfer_config (TransferConfig): TransferManager settings for larger files, built from
+            ``multipart_chunksize`` (default 16MiB) and ``multipart_concurrency`` (default 4 threads per file).
+            With local state, files larger than one chunk are uploaded by ``upload_multipart`` with the same
+            settings instead, so an interrupted upload resumes where it stopped on the next run.
+        abandoned_upload_age (float): Multipart uploads under ``s3_subdir`` started this many seconds ago and
+            never completed are aborted at the start of a run. Default is 7 days; 0 disables the cleanup.
+        line_filters (Dict[str, Tuple[FilterRule, ...]]): Rules for the records left out of each source path's
+            logs as they are compressed, from the top-level ``line_filter`` config entry or the path's own.
+        destinations (List[Destination]): Additional buckets every file is copied to, from the ``destinations``
+            config entry. Each file is read and compressed once for all of them, and each destination's copies are
+            checked, uploaded and recorded on its own, so a slow one does not hold up the primary bucket.
+        seekable_block_size (int): Uncompressed bytes per independently compressed block of the gzip files the
+            sync writes, each of which then gets a block index under ``<s3_subdir>/_indexes/``. Default is 0
+            (ordinary single-member gzip files, without indexes).
+        coalesce (Dict[str, Optional[CoalesceSettings]]): How the small files of each source path are gathered into
+            batch objects, from the top-level ``coalesce`` config entry or the path's own; None for a path whose
+            files are uploaded one by one. Coalescing needs the local state and gzip compression.
+        cluster (Optional[ClusterSettings]): How the tree is shared with other sync workers, from the ``cluster``
+            config entry. Default is None (this sync works alone).
+        ring (Optional[HashRing]): Consistent hashing of file paths onto the cluster's ``workers``; files that hash
+            to another worker are left to it.
+        leases (Optional[LeaseManager]): Leases taken in S3 on each upload, so no two workers upload the same
+            file at once, and a file one of them uploaded is found by the next.
     """
 
     def __init__(
@@ -48,6 +204,27 @@ class S3Sync:
         workers: Optional[int] = None,
         enable_gzip: bool = True,
         force: bool = False,
+        gzip_level: int = DEFAULT_GZIP_LEVEL,
+        gzip_buffer_size: int = DEFAULT_GZIP_BUFFER_SIZE,
+        streaming: bool = False,
+        state_file: Optional[str] = None,
+        full_scan: bool = False,
+        bandwidth: Optional[Any] = None,
+        report_file: Optional[str] = None,
+        prometheus_file: Optional[str] = None,
+        settle_seconds: float = 0.0,
+        small_file_threshold: int = DEFAULT_SMALL_FILE_THRESHOLD,
+        multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
+        multipart_concurrency: int = DEFAULT_MULTIPART_CONCURRENCY,
+        abandoned_upload_age: float = DEFAULT_ABANDONED_UPLOAD_AGE,
+        key_template: Optional[str] = None,
+        manifests: bool = False,
+        line_filter: Optional[Any] = None,
+        destinations: Optional[List[Dict[str, Any]]] = None,
+        seekable_block_size: int = 0,
+        coalesce: Optional[Any] = None,
+        cluster: Optional[Any] = None,
+        read_only_state: bool = False,
     ) -> None:
         """Initialize the S3Sync object with configuration for syncing."""
         self.src_paths = src_paths
@@ -59,17 +236,212 @@ class S3Sync:
         self.workers = workers if workers else cpu_count()
         self.enable_gzip = enable_gzip
         self.force = force
+        self.gzip_level = gzip_level
+        self.gzip_buffer_size = gzip_buffer_size
+        self.streaming = streaming
+        self.state_file = state_file
+        self.full_scan = full_scan
+        self.bandwidth = self.token_bucket(bandwidth)
+        self.report_file = report_file
+        self.prometheus_file = prometheus_file
+        self.metrics = SyncMetrics()
+        self.settle_seconds = settle_seconds
+        self._watching = False
+        self.small_file_threshold = small_file_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.multipart_concurrency = multipart_concurrency
+        self.transfer_config = multipart_transfer_config(multipart_chunksize, multipart_concurrency)
+        self.abandoned_upload_age = abandoned_upload_age
+        self._next_upload_cleanup = 0.0
+        self.seekable_block_size = seekable_block_size
+
+        # A subdirectory's own key_template overrides the top-level one; both are checked before anything is synced
+        self.key_templates: Dict[str, Optional[KeyTemplate]] = {}
+        for src_path, path_include in src_paths.items():
+            template = path_include.get("key_template", key_template)
+            self.key_templates[src_path] = KeyTemplate(template) if template else None
+
+        # Likewise for the records left out of compressed logs; an empty list turns the filter off for a subdirectory
+        self.line_filters: Dict[str, Tuple[FilterRule, ...]] = {
+            src_path: filter_rules(path_include.get("line_filter", line_filter))
+            for src_path, path_include in src_paths.items()
+        }
+
+        # Likewise for gathering small files into batches
+        self.coalesce: Dict[str, Optional[CoalesceSettings]] = {
+            src_path: coalesce_settings(path_include.get("coalesce", coalesce))
+            for src_path, path_include in src_paths.items()
+        }
+        if destinations and any(self.coalesce.values()):
+            raise ValueError("Coalescing small files cannot be combined with additional destinations")
+
+        # Files are split between the cluster's workers by a hash of their path, and leased while they are uploaded
+        self.cluster: Optional[ClusterSettings] = cluster_settings(cluster)
+        if self.cluster is not None and any(self.coalesce.values()):
+            raise ValueError("Coalescing small files cannot be combined with a cluster of sync workers")
+        self.ring = (
+            HashRing(self.cluster.workers, self.cluster.vnodes) if self.cluster and self.cluster.workers else None
+        )
 
-        # Initialize boto3 session and S3 client
+        # Summaries of the logs compressed by the sync are published to a manifest per dataset; without local
+        # state, those waiting to be published are kept here
+        self.manifests = manifests
+        self._manifest_entries: Dict[str, List[ManifestEntry]] = {}
+        self._manifest_lock = threading.Lock()
+
+        # Initialize boto3 session and S3 clients. boto3 clients are thread-safe, so each is shared by all upload
+        # threads; their connection pools are sized so no thread waits on a connection. Requests under the adaptive
+        # limiters below go through ``limited_client``, which leaves throttling to the limiters rather than retries;
+        # every other request, such as manifests and leases, keeps botocore's standard retries.
+        client_config = Config(max_pool_connections=max(self.workers, 10), retries={"mode": "standard"})
+        limited_config = client_config.merge(Config(retries={"mode": "standard", "max_attempts": LIMITED_MAX_ATTEMPTS}))
         try:
             if self.profile_name:
                 session = boto3.Session(profile_name=self.profile_name)
-                self.s3_client = session.client("s3")
+                self.s3_client = session.client("s3", config=client_config)
+                self.limited_client = session.client("s3", config=limited_config)
             else:
-                self.s3_client = boto3.client("s3")
+                self.s3_client = boto3.client("s3", config=client_config)
+                self.limited_client = boto3.client("s3", config=limited_config)
         except Exception as e:
             raise RuntimeError(f"Failed to initialize AWS S3 client: {str(e)}")
 
+        self.leases = (
+            LeaseManager(
+                self.s3_client,
+                self.bucket_name,
+                self.s3_subdir,
+                f"{self.cluster.worker}:{os.getpid()}",
+                self.cluster.lease_seconds,
+            )
+            if self.cluster is not None
+            else None
+        )
+
+        # Uploads and metadata requests ramp up while S3 answers promptly and back off when it throttles
+        self.upload_concurrency = AdaptiveConcurrency("upload", max_limit=self.workers)
+        self.request_concurrency = AdaptiveConcurrency("request", max_limit=max(self.workers, 10))
+        report_retries(
+            self.limited_client,
+            {
+                **dict.fromkeys(UPLOAD_OPERATIONS, self.upload_concurrency),
+                **dict.fromkeys(REQUEST_OPERATIONS, self.request_concurrency),
+            },
+        )
+
+        self.stream_uploader = GzipStreamUploader(
+            self.limited_client, self.bucket_name, level=self.gzip_level, buffer_size=self.gzip_buffer_size
+        )
+
+        # Each additional destination has its own client and threads; copies still waiting for them are tracked
+        # per node, so a directory is only recorded as synced once every copy is done
+        self.destinations = [
+            Destination.from_config(
+                destination,
+                s3_subdir,
+                small_file_threshold=small_file_threshold,
+                transfer_config=self.transfer_config,
+                gzip_level=gzip_level,
+                gzip_buffer_size=gzip_buffer_size,
+                block_size=seekable_block_size,
+            )
+            for destination in destinations or []
+        ]
+        self._copies: Dict[str, List[Optional[Future]]] = {}
+        self._copies_lock = threading.Lock()
+        # Files that key templates gave each key this run, to catch templates that give two files the same key
+        self._template_keys: Dict[str, str] = {}
+        self._template_keys_lock = threading.Lock()
+
+        self.state: Optional[SyncState] = None
+        if self.state_file and read_only_state:
+            try:
+                self.state = SyncState(self.state_file, read_only=True)
+            except sqlite3.Error as e:
+                logger.warning(f"Ignoring the local state {self.state_file} ({str(e)})")
+        elif self.state_file:
+            self.state = SyncState(self.state_file)
+        # Batches are told apart from the files they hold by the local state alone
+        if any(self.coalesce.values()) and (self.state is None or not enable_gzip):
+            logger.warning("Coalescing small files needs local state and gzip compression; uploading them one by one.")
+            self.coalesce = dict.fromkeys(self.coalesce)
+        if self.state:
+            pending = len(self.state.pending())
+            if pending:
+                logger.info(f"{pending} uploads from an interrupted run will be verified against S3.")
+
+    @staticmethod
+    def token_bucket(bandwidth: Optional[Any]) -> Optional[TokenBucket]:
+        """Build a bandwidth limiter from a ``bandwidth`` config entry.
+
+        Args:
+            bandwidth (Optional[Any]): A rate such as ``5MB``, or a mapping with a default ``rate`` and a
+                ``schedule`` of time-of-day windows with their own rates.
+
+        Returns:
+            Optional[TokenBucket]: The limiter, or None if the entry sets no limit.
+        """
+        schedule = BandwidthSchedule.from_config(bandwidth)
+        return TokenBucket(schedule) if schedule else None
+
+    def is_unchanged_since_sync(self, file_path: str, stat_result: os.stat_result) -> bool:
+        """Check the local state for a file that is already uploaded and unchanged.
+
+        Args:
+            file_path (str): Local file path.
+            stat_result (os.stat_result): Current ``stat`` of the file.
+
+        Returns:
+            bool: True if the file can be skipped without any S3 request, because it is in the primary bucket and
+                every additional destination.
+        """
+        if self.state is None or self.force:
+            return False
+        size, mtime_ns = stat_result.st_size, stat_result.st_mtime_ns
+        return self.state.is_synced(file_path, size, mtime_ns) and all(
+            self.state.is_copied(destination.name, file_path, size, mtime_ns) for destination in self.destinations
+        )
+
+    def claim_key(self, s3_key: str, file_path: str, upload_name: str) -> Optional[str]:
+        """Claim a key rendered from a key template for a file, unless another file already has it.
+
+        A template that uses ``{name}`` without ``{path}`` gives files of the same name in different subdirectories
+        the same key, so the second upload would replace the first. Keys are claimed for the whole run, and files the
+        local state records under the key count as long as they still exist.
+
+        Args:
+            s3_key (str): The rendered S3 key.
+            file_path (str): Local file path.
+            upload_name (str): The file path plus .gz if the file is compressed on upload.
+
+        Returns:
+            Optional[str]: The path of the other file with the key, or None if the key is the file's own.
+        """
+        with self._template_keys_lock:
+            owner = self._template_keys.setdefault(s3_key, file_path)
+        if owner != file_path:
+            return owner
+        if self.state is not None:
+            for path in self.state.paths_for_key(s3_key):
+                if path not in (file_path, upload_name) and os.path.exists(path):
+                    return path
+        return None
+
+    @staticmethod
+    def file_size(file_path: str) -> Optional[int]:
+        """Return the size of a file in bytes, or None if it cannot be read.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            Optional[int]: The file size.
+        """
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return None
+
     def is_gzipped(self, file_path: str) -> bool:
         """Check if a file is already gzipped by examining its magic bytes.
 
@@ -86,89 +458,185 @@ class S3Sync:
         except OSError:
             return False
 
-    def gzip_file_in_place(self, file_path: str) -> str:
-        """Gzip a file in place and return the path to the gzipped version.
+    def compress_file(self, file_path: str, line_filter: Tuple[FilterRule, ...] = ()) -> CompressionStats:
+        """Gzip a file in place, removing the original, and return the compression statistics.
 
         Args:
             file_path (str): Path to the original file.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the gzipped file.
 
         Returns:
-            str: Path to the gzipped file (same as input with .gz added).
+            CompressionStats: Sizes and timing of the compression; the gzipped file is ``stats.target``.
         """
-        gzipped_path = file_path + ".gz"
-
-        with open(file_path, "rb") as f_in:
-            with gzip.open(gzipped_path, "wb") as f_out:
-                shutil.copyfileobj(f_in, f_out)
+        stats = gzip_file(
+            file_path,
+            file_path + ".gz",
+            level=self.gzip_level,
+            buffer_size=self.gzip_buffer_size,
+            summarize=self.manifests,
+            line_filter=line_filter,
+            block_size=self.seekable_block_size,
+        )
 
         # Remove the original file
         os.remove(file_path)
 
-        return gzipped_path
-
-    def ensure_files_are_gzipped(self, src_path: str) -> None:
-        """Ensure all files in a directory are gzipped by compressing them in place.
+        return stats
 
-        Args:
-            src_path (str): Path to the source directory.
-        """
-        if not self.enable_gzip:
-            logger.debug(f"Gzip compression disabled, skipping compression for: {src_path}")
-            return
-
-        # Process all files in the source directory
-        for root, _dirs, files in os.walk(src_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-
-                # Skip files that are already gzipped
-                if self.is_gzipped(file_path):
-                    logger.debug(f"File already gzipped: {file_path}")
-                    continue
-
-                # Skip files that already have .gz extension
-                if file.endswith(".gz"):
-                    logger.debug(f"File already has .gz extension: {file_path}")
-                    continue
-
-                # Gzip the file in place
-                try:
-                    gzipped_path = self.gzip_file_in_place(file_path)
-                    logger.info(f"Gzipped file in place: {file_path} -> {gzipped_path}")
-                except Exception as e:
-                    logger.error(f"Error gzipping {file_path}: {str(e)}")
-
-    def upload_file(self, local_path: str, s3_key: str) -> bool:
+    def upload_file(
+        self,
+        local_path: str,
+        s3_key: str,
+        callback: Optional[Callable[[int], None]] = None,
+        checksum: Optional[FileChecksum] = None,
+        log_format: Optional[str] = None,
+        hasher: Optional[ChecksumHasher] = None,
+    ) -> bool:
         """Upload a single file to S3.
 
+        Files up to ``small_file_threshold`` bytes are sent with one ``put_object`` call from a memory map of the
+        file; larger ones go through the boto3 TransferManager with ``transfer_config``, or, with local state and
+        more than one chunk to send, through a multipart upload that a later run can resume.
+
         Args:
             local_path (str): Local file path to upload.
             s3_key (str): S3 key (path) for the file.
+            callback (Optional[Callable[[int], None]]): boto3 transfer callback, called with the bytes sent as
+                the upload progresses; it counts them and may sleep to hold the upload to a bandwidth limit.
+            checksum (Optional[FileChecksum]): Checksums of the file. A single ``put_object`` sends its SHA256
+                for S3 to verify; multipart uploads have S3 verify a SHA256 of every part instead.
+            log_format (Optional[str]): Format of the log, attached to the object as ``x-amz-meta-log-format``.
+            hasher (Optional[ChecksumHasher]): Without ``checksum``, filled with the checksums of the file from
+                the reads of a single ``put_object`` or resumable multipart upload. The TransferManager reads
+                the file itself and leaves it empty.
 
         Returns:
             bool: True if upload was successful, False otherwise.
         """
         try:
-            # Determine content type based on file extension
-            content_type = None
-            if local_path.endswith(".gz"):
-                content_type = "application/gzip"
-            elif local_path.endswith(".log") or local_path.endswith(".txt"):
-                content_type = "text/plain"
-
-            extra_args = {}
-            if content_type:
-                extra_args["ContentType"] = content_type
-
-            self.s3_client.upload_file(local_path, self.bucket_name, s3_key, ExtraArgs=extra_args)
+            extra_args = self.upload_args(local_path, log_format)
+            size = self.file_size(local_path)
+            with self.upload_concurrency.request(size=size):
+                if size is not None and size <= self.small_file_threshold:
+                    put_small_file(
+                        self.limited_client,
+                        self.bucket_name,
+                        local_path,
+                        s3_key,
+                        extra_args,
+                        callback,
+                        checksum,
+                        hasher,
+                    )
+                elif self.state is not None and size is not None and size > self.multipart_chunksize:
+                    upload_multipart(
+                        self.limited_client,
+                        self.bucket_name,
+                        local_path,
+                        s3_key,
+                        self.state,
+                        extra_args,
+                        callback,
+                        self.multipart_chunksize,
+                        self.multipart_concurrency,
+                        hasher if checksum is None else None,
+                    )
+                else:
+                    extra_args["ChecksumAlgorithm"] = "SHA256"
+                    kwargs = {"Callback": callback} if callback else {}
+                    self.limited_client.upload_file(
+                        local_path,
+                        self.bucket_name,
+                        s3_key,
+                        ExtraArgs=extra_args,
+                        Config=self.transfer_config,
+                        **kwargs,
+                    )
             return True
         except Exception as e:
             logger.error(f"Error uploading {local_path} to s3://{self.bucket_name}/{s3_key}: {str(e)}")
             return False
 
+    @staticmethod
+    def upload_args(local_path: str, log_format: Optional[str] = None) -> Dict[str, Any]:
+        """Return the content type and metadata a file is uploaded with.
+
+        Args:
+            local_path (str): Path of the file, or of its gzipped version for a file compressed as it is uploaded.
+            log_format (Optional[str]): Format of the log, attached to the object as ``x-amz-meta-log-format``.
+
+        Returns:
+            Dict[str, Any]: Extra upload parameters.
+        """
+        # Determine content type based on file extension
+        content_type = None
+        if local_path.endswith(".gz"):
+            content_type = "application/gzip"
+        elif local_path.endswith(".log") or local_path.endswith(".txt"):
+            content_type = "text/plain"
+
+        extra_args: Dict[str, Any] = {}
+        if content_type:
+            extra_args["ContentType"] = content_type
+        if log_format:
+            extra_args["Metadata"] = {LOG_FORMAT_METADATA: log_format}
+        return extra_args
+
+    def upload_stream(
+        self,
+        local_path: str,
+        s3_key: str,
+        callback: Optional[Callable[[int], None]] = None,
+        log_format: Optional[str] = None,
+        line_filter: Tuple[FilterRule, ...] = (),
+        copies: Sequence[StreamCopy] = (),
+    ) -> Optional[StreamStats]:
+        """Gzip a local file on the fly and upload the compressed stream to S3.
+
+        Nothing is written to local disk and the local file is left untouched.
+
+        Args:
+            local_path (str): Local file path to compress and upload.
+            s3_key (str): S3 key (path) for the gzipped object.
+            callback (Optional[Callable[[int], None]]): Called with the compressed bytes before they are sent,
+                like the transfer callback of ``upload_file``.
+            log_format (Optional[str]): Format of the log, attached to the object as ``x-amz-meta-log-format``.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the upload.
+            copies (Sequence[StreamCopy]): Copies to additional destinations, fed the compressed parts of the upload.
+                They are abandoned if the upload fails.
+
+        Returns:
+            Optional[StreamStats]: Sizes, timing and ETag of the upload, or None if it failed.
+        """
+        try:
+            extra_args = self.upload_args(local_path + ".gz", log_format)
+            with self.upload_concurrency.request(size=self.file_size(local_path)):
+                stats = self.stream_uploader.upload(
+                    local_path,
+                    s3_key,
+                    extra_args,
+                    callback=callback,
+                    summarize=self.manifests,
+                    line_filter=line_filter,
+                    copies=copies,
+                    block_size=self.seekable_block_size,
+                )
+            logger.debug(
+                f"Streamed {local_path}: {self.convert_size(stats.raw_bytes)} -> "
+                f"{self.convert_size(stats.compressed_bytes)} in {stats.parts or 1} part(s)"
+            )
+            return stats
+        except Exception as e:
+            for copy in copies:
+                copy.abandon()
+            logger.error(f"Error streaming {local_path} to s3://{self.bucket_name}/{s3_key}: {str(e)}")
+            return None
+
     def should_upload_file(self, file_path: str, include_patterns: list) -> bool:
         """Check if a file should be uploaded based on include patterns.
 
+        Patterns use ``fnmatch`` syntax and are matched case-sensitively against the file's base name.
+
         Args:
             file_path (str): Path to the file to check.
             include_patterns (list): List of include patterns.
@@ -176,112 +644,1429 @@ class S3Sync:
         Returns:
             bool: True if file should be uploaded, False otherwise.
         """
-        file_name = os.path.basename(file_path)
+        return compile_include_patterns(tuple(include_patterns)).match(os.path.basename(file_path))
+
+    def build_s3_index(self, prefix: str, start_after: Optional[str] = None) -> Optional[S3KeyIndex]:
+        """List the existing keys under a prefix into an in-memory index.
 
-        for pattern in include_patterns:
-            # Simple pattern matching - can be enhanced with fnmatch if needed
-            if pattern == "*" or pattern == "*.*":
-                return True
-            if pattern.endswith("*") and file_name.startswith(pattern[:-1]):
-                return True
-            if pattern.startswith("*") and file_name.endswith(pattern[1:]):
-                return True
-            if file_name == pattern:
-                return True
-            if file_name.endswith(pattern):
-                return True
+        Args:
+            prefix (str): The S3 prefix to list.
+            start_after (Optional[str]): Only list keys that sort after this one.
 
-        return False
+        Returns:
+            Optional[S3KeyIndex]: The index, or None if the prefix could not be listed, in which case
+                callers fall back to per-file ``head_object`` checks.
+        """
+        try:
+            return S3KeyIndex.from_listing(
+                self.limited_client, self.bucket_name, prefix, start_after, limiter=self.request_concurrency
+            )
+        except Exception as e:
+            logger.warning(f"Unable to list s3://{self.bucket_name}/{prefix}, checking files individually ({str(e)})")
+            return None
 
-    def file_exists_in_s3(self, s3_key: str) -> bool:
+    def file_exists_in_s3(self, s3_key: str, index: Optional[S3KeyIndex] = None) -> bool:
         """Check if a file already exists in S3.
 
         Args:
             s3_key (str): The S3 key to check.
+            index (Optional[S3KeyIndex]): Listing of the key's prefix. When the key falls inside it,
+                the answer comes from the index without a request to S3.
 
         Returns:
             bool: True if the file exists in S3, False otherwise.
         """
+        return self.remote_object(s3_key, index) is not None
+
+    def remote_object(self, s3_key: str, index: Optional[S3KeyIndex] = None) -> Optional[Tuple[int, Optional[str]]]:
+        """Return the size and ETag of an S3 object, if it exists.
+
+        Args:
+            s3_key (str): The S3 key to check.
+            index (Optional[S3KeyIndex]): Listing of the key's prefix. When the key falls inside it,
+                the answer comes from the index without a request to S3.
+
+        Returns:
+            Optional[Tuple[int, Optional[str]]]: ``(size, etag)``, or None if the object does not exist.
+        """
+        if index is not None and index.covers(s3_key):
+            return index.lookup(s3_key)
+
         try:
-            self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
-            return True
-        except self.s3_client.exceptions.NoSuchKey:
-            return False
+            with self.request_concurrency.request():
+                response = self.limited_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return response.get("ContentLength"), response.get("ETag")
+        except self.limited_client.exceptions.NoSuchKey:
+            return None
         except Exception as e:
             logger.debug(f"File {s3_key} not found in S3 ({str(e)})")
             # If we can't check, assume it doesn't exist to be safe
+            return None
+
+    def matches_remote(
+        self,
+        file_path: str,
+        s3_key: str,
+        stat_result: os.stat_result,
+        remote: Tuple[int, Optional[str]],
+        checksum: Optional[FileChecksum] = None,
+    ) -> Tuple[bool, Optional[FileChecksum]]:
+        """Decide whether an existing S3 object holds the same bytes as a local file uploaded as it is.
+
+        Sizes are compared first, then the local state: a file recorded as uploaded to the key and unchanged since
+        matches, and one changed since an upload whose checksum was recorded does not. Only otherwise is the file
+        read for its checksums, if they are not given. Objects uploaded in a single part have the MD5 of their
+        contents as ETag, which settles it. For multipart objects the SHA256 recorded in the local state when the
+        file was uploaded is compared instead. Without either, an object of the same size is taken to match.
+
+        Args:
+            file_path (str): Local file path.
+            s3_key (str): The S3 key of the object.
+            stat_result (os.stat_result): Current ``stat`` of the file.
+            remote (Tuple[int, Optional[str]]): Size and ETag of the object.
+            checksum (Optional[FileChecksum]): Checksums of the file, if already known.
+
+        Returns:
+            Tuple[bool, Optional[FileChecksum]]: True if the object does not need replacing, and the checksums
+                of the file if they were given or read.
+
+        Raises:
+            OSError: If the file had to be read and could not be.
+        """
+        size, etag = remote
+        if size is not None and size != stat_result.st_size:
+            return False, checksum
+        record = self.state.get(file_path) if self.state is not None else None
+        if record is not None and record.s3_key != s3_key:
+            record = None
+        if checksum is None and record is not None:
+            if self.state.is_synced(file_path, stat_result.st_size, stat_result.st_mtime_ns):  # type: ignore[union-attr]
+                return True, None
+            if record.checksum:
+                return False, None
+        checksum = checksum or checksum_file(file_path, self.gzip_buffer_size)
+        etag_match = checksum.matches_etag(etag)
+        if etag_match is not None:
+            return etag_match, checksum
+        if record is not None and record.checksum:
+            return record.checksum == checksum.sha256, checksum
+        return True, checksum
+
+    def changed_since_upload(self, file_path: str, s3_key: str, stat_result: Optional[os.stat_result]) -> bool:
+        """Check the local state for a file modified after it was uploaded to a key.
+
+        Args:
+            file_path (str): Local file path.
+            s3_key (str): The S3 key the file is uploaded to.
+            stat_result (Optional[os.stat_result]): Current ``stat`` of the file, if available.
+
+        Returns:
+            bool: True if the state records an upload of the file to the key, and the file's size or
+                modification time has changed since.
+        """
+        record = self.state.get(file_path) if self.state is not None else None
+        if record is None or record.s3_key != s3_key:
             return False
+        stat_result = stat_result or os.stat(file_path)
+        return (record.size, record.mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns)
 
     def run(self) -> None:
-        """Execute the sync process for all configured source paths."""
-        for src_path in self.src_paths.items():
-            self.sync_directory(src_path)
+        """Execute the sync process for all configured source paths.
+
+        All source paths are scanned at the same time, and their files share one pool of ``workers`` upload
+        threads. Each source path's share of the pool follows the ``weight`` (default 1) and ``max_workers``
+        set for it in the config, so a node with a large backlog does not hold back the others.
+        """
+        if not self.src_paths:
+            return
+        if self.abandoned_upload_age and time.monotonic() >= self._next_upload_cleanup:
+            self._next_upload_cleanup = time.monotonic() + ABANDONED_UPLOAD_CHECK_INTERVAL
+            self.abort_abandoned_uploads()
+        self.metrics = SyncMetrics()
+        self._template_keys = {}
+        try:
+            with FairScheduler(self.workers) as scheduler:
+                with ThreadPoolExecutor(max_workers=len(self.src_paths), thread_name_prefix="scan") as scanners:
+                    futures = [
+                        scanners.submit(self.sync_directory, path_tuple, scheduler)
+                        for path_tuple in self.src_paths.items()
+                    ]
+            for future in futures:
+                future.result()
+        finally:
+            # The copy threads are kept from one pass of watch to the next
+            if not self._watching:
+                self.close_destinations()
+        self.finish_run()
+
+        for stats in self.concurrency_stats():
+            if stats.requests:
+                logger.info(
+                    f"S3 {stats.name} requests: {stats.requests} sent, {stats.throttled} throttled, "
+                    f"{stats.errors} failed, final concurrency {stats.limit}, "
+                    f"latency p50 {stats.latency_p50:.3f}s p95 {stats.latency_p95:.3f}s"
+                    f"{' per MiB' if stats.name == 'upload' else ''}"
+                )
+
+    def plan(self) -> Dict[str, Any]:
+        """Work out what ``run`` would upload, without compressing, uploading or deleting anything.
+
+        Every source path is scanned and its files matched and looked up in S3 as a run would, and the local state
+        is only read. Sizes and durations are estimated from the throughput of the runs recorded in the local state
+        over the last ``THROUGHPUT_WINDOW`` seconds.
+
+        Returns:
+            Dict[str, Any]: The plan: files and bytes to upload, estimated upload size and projected duration, in
+                total and per node, and the throughput the estimates are based on.
+        """
+        plan = SyncPlan()
+        self._template_keys = {}
+        if self.src_paths:
+            with ThreadPoolExecutor(max_workers=len(self.src_paths), thread_name_prefix="scan") as scanners:
+                futures = [
+                    scanners.submit(self.sync_directory, path_tuple, None, plan)
+                    for path_tuple in self.src_paths.items()
+                ]
+            for future in futures:
+                future.result()
+        history = self.state.throughput(time.time() - THROUGHPUT_WINDOW) if self.state is not None else []
+        return plan.to_dict(history)
+
+    def abort_abandoned_uploads(self) -> int:
+        """Abort the multipart uploads under ``s3_subdir`` started more than ``abandoned_upload_age`` ago.
+
+        The same is done under the prefix of every additional destination.
+
+        Uploads a run was killed in the middle of keep their parts, and S3 keeps billing for them, until they are
+        completed or aborted. Those recorded in the local state are resumed by the next run that uploads the
+        same file; the ones nothing has resumed by this age, or that were never recorded, are aborted here.
+
+        Returns:
+            int: Number of uploads aborted.
+        """
+        cutoff = time.time() - self.abandoned_upload_age
+        aborted = set()
+        if self.state is not None:
+            for record in self.state.multipart_uploads():
+                if record.started < cutoff:
+                    if abort_multipart(self.s3_client, self.bucket_name, record.s3_key, record.upload_id):
+                        self.state.finish_multipart(record.upload_id)
+                        aborted.add(record.upload_id)
+
+        prefix = self.s3_subdir.rstrip("/") + "/"
+        try:
+            paginator = self.s3_client.get_paginator("list_multipart_uploads")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for upload in page.get("Uploads", []):
+                    if upload["UploadId"] in aborted or upload["Initiated"].timestamp() >= cutoff:
+                        continue
+                    if abort_multipart(self.s3_client, self.bucket_name, upload["Key"], upload["UploadId"]):
+                        if self.state is not None:
+                            self.state.finish_multipart(upload["UploadId"])
+                        aborted.add(upload["UploadId"])
+        except Exception as e:
+            logger.warning(f"Unable to list multipart uploads under s3://{self.bucket_name}/{prefix}: {str(e)}")
+
+        # Copies to additional destinations are not resumed, so all their abandoned uploads are aborted
+        count = len(aborted) + sum(
+            destination.abort_abandoned_uploads(self.abandoned_upload_age) for destination in self.destinations
+        )
+        if count:
+            logger.info(f"Aborted {count} multipart uploads abandoned for over {self.abandoned_upload_age:g}s.")
+        return count
+
+    def watch(self, interval: float = DEFAULT_WATCH_INTERVAL, stop_event: Optional[threading.Event] = None) -> None:
+        """Sync continuously, running a pass over all source paths every ``interval`` seconds until stopped.
+
+        Each pass is an incremental ``run``: with local state, files already uploaded are skipped without S3
+        requests and directories unchanged since the last complete pass are not listed, so an idle pass only
+        costs a walk of the directory tree. Files still being written are left alone until they have been
+        unmodified for ``settle_seconds``. The state persists across restarts, so a restarted watcher picks up
+        where it stopped.
+
+        Args:
+            interval (float): Seconds from the start of one pass to the start of the next.
+            stop_event (Optional[threading.Event]): Set it to stop after the current pass.
+        """
+        stop_event = stop_event or threading.Event()
+        self._watching = True
+        logger.info(
+            f"Watching {len(self.src_paths)} directories every {interval:g}s "
+            f"(files settle after {self.settle_seconds:g}s)"
+        )
+        try:
+            while not stop_event.is_set():
+                pass_started = time.monotonic()
+                try:
+                    self.run()
+                except Exception as e:
+                    logger.error(f"Sync pass failed: {str(e)}")
+                stop_event.wait(max(0.0, interval - (time.monotonic() - pass_started)))
+        finally:
+            self._watching = False
+            self.close_destinations()
+        logger.info("Stopped watching.")
+
+    def close_destinations(self) -> None:
+        """Stop the copy threads of the additional destinations once their queued copies are done."""
+        for destination in self.destinations:
+            destination.close()
+
+    def finish_run(self) -> None:
+        """Log the throughput of the run and write the configured metrics files."""
+        self.metrics.finish()
+        report = self.metrics.report()
+        # Idle passes in watch mode would otherwise log a line every few seconds
+        logger.log(
+            logging.INFO if report["files"] else logging.DEBUG,
+            f"Uploaded {report['files_uploaded']}/{report['files']} files, "
+            f"{self.convert_size(report['bytes_uploaded'])} in {report['duration_seconds']:.1f}s "
+            f"({report['bytes_per_second'] / (1024 * 1024):.2f} MB/s, {report['files_per_second']:.2f} files/s)",
+        )
+        # Later plans estimate their duration from the throughput of recent runs
+        if self.state is not None and report["raw_bytes"]:
+            self.state.record_throughput(
+                [
+                    ThroughputRecord(
+                        report["finished"],
+                        node,
+                        report["duration_seconds"],
+                        data["files"].get(UPLOADED, 0),
+                        data["raw_bytes"],
+                        data["bytes_uploaded"],
+                    )
+                    for node, data in report["nodes"].items()
+                    if data["raw_bytes"]
+                ]
+            )
+        for path, write in (
+            (self.report_file, self.metrics.write_json),
+            (self.prometheus_file, self.metrics.write_prometheus),
+        ):
+            if path:
+                try:
+                    write(path)
+                except OSError as e:
+                    logger.error(f"Unable to write metrics to {path}: {str(e)}")
+
+    def concurrency_stats(self) -> List[ConcurrencyStats]:
+        """Return the current limits and observed latencies of the adaptive concurrency controllers.
+
+        Returns:
+            List[ConcurrencyStats]: Snapshots of the upload and request limiters.
+        """
+        return [self.upload_concurrency.stats(), self.request_concurrency.stats()]
+
+    def scan_directory(
+        self, src_path: str, since: Optional[float] = None, hot_directories: Collection[str] = ()
+    ) -> Iterator[Tuple[str, os.stat_result]]:
+        """Walk a directory tree with ``os.scandir``, yielding each file with its ``stat``.
+
+        Files are yielded as they are found, so memory does not grow with the size of the tree. The ``stat``
+        comes from the directory entry and is reused for every later size, mtime and state decision.
+
+        When ``since`` is given, files are not listed in directories whose mtime is older than it. Creating,
+        renaming or deleting a file updates its directory's mtime, so such a directory has gained no files
+        since then. Appending to a file does not, so directories holding logs that may still be written to are
+        passed as ``hot_directories`` and always listed. Subdirectories are still descended into, because a new
+        file deep in the tree does not update the mtime of the directories above it.
+
+        Args:
+            src_path (str): The directory to walk.
+            since (Optional[float]): Unix timestamp; skip the files of directories not modified after it.
+            hot_directories (Collection[str]): Directories whose files are listed whatever their mtime.
+
+        Yields:
+            Tuple[str, os.stat_result]: The path and ``stat`` of each regular file.
+        """
+        try:
+            stack = [(src_path, os.stat(src_path).st_mtime)]
+        except OSError as e:
+            logger.warning(f"Unable to scan {src_path}: {str(e)}")
+            return
+
+        while stack:
+            directory, directory_mtime = stack.pop()
+            list_files = since is None or directory_mtime >= since or directory in hot_directories
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        # Partial output of a compression, renamed or removed at any moment
+                        if entry.name.endswith(".gz.tmp"):
+                            continue
+                        # Uploads gzip files in place while the directory is listed, so an entry can be gone by
+                        # the time it is looked at; only that entry is passed over
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append((entry.path, entry.stat(follow_symlinks=False).st_mtime))
+                                continue
+                            if not list_files or not entry.is_file():
+                                continue
+                            stat_result = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        except OSError as e:
+                            logger.warning(f"Unable to scan {entry.path}: {str(e)}")
+                            continue
+                        yield entry.path, stat_result
+            except OSError as e:
+                logger.warning(f"Unable to scan {directory}: {str(e)}")
+
+    def sync_file(
+        self,
+        file_path: str,
+        s3_key: str,
+        index: Optional[S3KeyIndex] = None,
+        compress: bool = False,
+        stat_result: Optional[os.stat_result] = None,
+        throttle: Optional[Callable[[int], None]] = None,
+        node: Optional[str] = None,
+        line_filter: Tuple[FilterRule, ...] = (),
+        copy_index: Optional[Callable[[Destination], Optional[S3KeyIndex]]] = None,
+    ) -> str:
+        """Upload a single file to S3 unless an identical object exists, deleting the source if requested.
+
+        This is the unit of work run by the upload thread pool. When local state is enabled the upload is
+        journaled: the file is marked pending before the upload and uploaded once S3 confirms it, along with
+        the checksum of the uploaded bytes. A file whose key already exists is compared with the object using
+        ``matches_remote`` and uploaded again if it has changed, e.g. because the log was appended to.
+
+        Copies to the additional destinations that lack the file are queued on their own threads, fed the parts
+        of a streamed upload as they are compressed, and finish after this returns. The source is only deleted
+        once the upload and every copy have succeeded.
+
+        Args:
+            file_path (str): Local file path to upload.
+            s3_key (str): S3 key (path) for the file.
+            index (Optional[S3KeyIndex]): Listing of the destination prefix used for the existence check.
+            compress (bool): Gzip the file first. In streaming mode it is compressed during the upload,
+                otherwise it is gzipped in place and the ``.gz`` is uploaded.
+            stat_result (Optional[os.stat_result]): ``stat`` of the file taken while scanning, if available.
+            throttle (Optional[Callable[[int], None]]): Bandwidth limit for the upload. Default is the host-wide
+                ``bandwidth`` limit.
+            node (Optional[str]): Node the file's metrics are recorded under. Default is the file's directory
+                relative to ``src_logdir``.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the file as it is gzipped.
+                Files uploaded as they are are not filtered.
+            copy_index (Optional[Callable[[Destination], Optional[S3KeyIndex]]]): Returns the listing of the
+                file's prefix in an additional destination, used for the existence check of its copy there.
+
+        Returns:
+            str: ``UPLOADED``, ``SKIPPED`` if an identical object already exists in S3, or ``FAILED``; the outcome
+                of the upload to the primary bucket, whatever becomes of the copies.
+        """
+        if node is None:
+            node = os.path.relpath(os.path.dirname(file_path), self.src_logdir)
+
+        # Gzip the file in place and upload the .gz instead; its checksums are computed while it is written
+        checksum: Optional[FileChecksum] = None
+        summary: Optional[LogSummary] = None
+        blocks: Optional[BlockIndex] = None
+        if compress and not self.streaming:
+            try:
+                with self.metrics.phase(node, "compress"):
+                    stats = self.compress_file(file_path, line_filter)
+            except Exception as e:
+                logger.error(f"Error gzipping {file_path}: {str(e)}")
+                return FAILED
+            logger.info(
+                f"Gzipped file in place: {file_path} -> {stats.target} "
+                f"({self.convert_size(stats.raw_bytes)} -> {self.convert_size(stats.compressed_bytes)}, "
+                f"ratio {stats.ratio:.1f}, {stats.mb_per_second:.2f} MB/s)"
+            )
+            file_path, stat_result, compress, checksum = stats.target, None, False, stats.checksum
+            summary, blocks = stats.summary, stats.blocks
+            if stats.dropped:
+                self.metrics.record_dropped_lines(node, stats.dropped)
+
+        # An existing object is only replaced if the file has changed since it was uploaded. Files uploaded as
+        # they are are only read to compare when neither the sizes nor the local state settle it; otherwise their
+        # checksums are computed as they are uploaded. Streamed files would need a compression pass of their own
+        # to compare, so the local state decides for them.
+        unchanged = False
+        try:
+            with self.metrics.phase(node, "check"):
+                stat_result = stat_result or os.stat(file_path)
+                remote = None if self.force else self.remote_object(s3_key, index)
+                if remote is not None and compress:
+                    unchanged = not self.changed_since_upload(file_path, s3_key, stat_result)
+                elif remote is not None:
+                    unchanged, checksum = self.matches_remote(file_path, s3_key, stat_result, remote, checksum)
+                targets = self.missing_copies(
+                    file_path, s3_key, stat_result, None if compress else stat_result.st_size, copy_index
+                )
+        except OSError as e:
+            logger.error(f"Error reading {file_path}: {str(e)}")
+            return FAILED
+
+        if remote is not None:
+            if unchanged:
+                logger.debug(f"Skipping (already exists): {file_path} -> s3://{self.bucket_name}/{s3_key}")
+                if self.state is not None:
+                    record = self.state.get(file_path)
+                    recorded = record.checksum if record is not None and record.s3_key == s3_key else None
+                    self.state.mark_uploaded(
+                        file_path,
+                        stat_result.st_size,
+                        stat_result.st_mtime_ns,
+                        s3_key,
+                        remote[1],
+                        checksum.sha256 if checksum is not None else recorded,
+                    )
+                if summary is not None and checksum is not None:
+                    self.record_summary(node, s3_key, checksum.size, summary)
+                # Copies the destinations still lack are made from the file alone, compressing it again if needed
+                if targets:
+                    on_done = self.delete_when_done(node, file_path, len(targets) + 1) if self.delete else None
+                    log_format = summary.log_format if summary is not None else self.log_format(file_path)
+                    extra_args = self.upload_args(file_path + ".gz" if compress else file_path, log_format)
+                    self.start_copies(
+                        node,
+                        file_path,
+                        targets,
+                        stat_result,
+                        extra_args,
+                        checksum,
+                        throttle,
+                        compress,
+                        line_filter,
+                        on_done=on_done,
+                    )
+                    if on_done is not None:
+                        on_done(SKIPPED)
+                return SKIPPED
+            logger.info(f"Changed since it was uploaded: {file_path}, replacing s3://{self.bucket_name}/{s3_key}")
+
+        # The format comes with the summary of a compressed log; otherwise the first lines are sampled for it
+        log_format = summary.log_format if summary is not None else self.log_format(file_path)
+
+        logger.info(f"Uploading: {file_path} -> s3://{self.bucket_name}/{s3_key}")
+
+        if self.state is not None:
+            self.state.mark_pending(file_path, stat_result.st_size, stat_result.st_mtime_ns, s3_key)
+
+        # Copies run alongside the upload; those of a streamed file are fed its compressed parts
+        on_done = self.delete_when_done(node, file_path, len(targets) + 1) if self.delete and targets else None
+        streams: List[StreamCopy] = []
+        if targets:
+            extra_args = self.upload_args(file_path + ".gz" if compress else file_path, log_format)
+            self.start_copies(
+                node,
+                file_path,
+                targets,
+                stat_result,
+                extra_args,
+                checksum,
+                throttle,
+                compress,
+                line_filter,
+                streams=streams if compress else None,
+                on_done=on_done,
+            )
+
+        callback = self.metrics.transfer_callback(node, throttle or self.bandwidth)
+        with self.metrics.phase(node, "upload"):
+            if compress:
+                stream_stats = self.upload_stream(file_path, s3_key, callback, log_format, line_filter, streams)
+                uploaded = stream_stats is not None
+                etag = stream_stats.etag if stream_stats is not None else None
+                checksum = stream_stats.checksum if stream_stats is not None else None
+                summary = stream_stats.summary if stream_stats is not None else None
+                blocks = stream_stats.blocks if stream_stats is not None else None
+                if stream_stats is not None and stream_stats.dropped:
+                    self.metrics.record_dropped_lines(node, stream_stats.dropped)
+            else:
+                hasher = ChecksumHasher() if checksum is None else None
+                uploaded = self.upload_file(file_path, s3_key, callback, checksum, log_format, hasher)
+                etag = None
+                # Kept only if the upload read the whole file as it was when checked
+                if hasher is not None and hasher.size == stat_result.st_size:
+                    checksum = hasher.result()
+        if not uploaded:
+            return FAILED
+
+        if self.state is not None:
+            self.state.mark_uploaded(
+                file_path,
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+                s3_key,
+                etag,
+                checksum.sha256 if checksum is not None else None,
+            )
+        if summary is not None and checksum is not None:
+            self.record_summary(node, s3_key, checksum.size, summary)
+        # A .gz written seekable by an earlier run is indexed again from its members
+        if blocks is None and self.seekable_block_size and file_path.endswith(".gz"):
+            blocks = index_gzip_file(file_path, self.gzip_buffer_size, self.seekable_block_size)
+        if blocks is not None:
+            self.publish_block_index(s3_key, blocks)
+
+        # Delete source file if requested, once any copies of it are done as well
+        if on_done is not None:
+            on_done(UPLOADED)
+        elif self.delete:
+            self.delete_source(node, file_path)
+
+        return UPLOADED
+
+    def publish_block_index(self, s3_key: str, blocks: BlockIndex) -> None:
+        """Upload the block index of a seekable object next to the dataset manifests.
+
+        An index that fails to upload is only logged: the object itself is complete, and readers without an
+        index download it whole.
+
+        Args:
+            s3_key (str): The object's key.
+            blocks (BlockIndex): The object's blocks.
+        """
+        key = index_key(self.s3_subdir, s3_key)
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name, Key=key, Body=blocks.to_json(), ContentType="application/json"
+            )
+            logger.debug(f"Indexed {len(blocks)} blocks of s3://{self.bucket_name}/{s3_key}")
+        except Exception as e:
+            logger.error(f"Error uploading block index s3://{self.bucket_name}/{key}: {str(e)}")
+
+    def leased(self, s3_key: str, sync: Callable[..., str], *args: Any) -> str:
+        """Run the sync of a file while holding the lease on its key, unless another worker holds it.
+
+        Args:
+            s3_key (str): The S3 key the file is uploaded to.
+            sync (Callable[..., str]): The sync, returning its outcome.
+            *args (Any): Arguments of the sync.
+
+        Returns:
+            str: The outcome of the sync, ``LEASED`` if another worker holds the lease, or ``FAILED`` if the lease
+                could not be taken.
+        """
+        try:
+            lease = self.leases.acquire(s3_key)  # type: ignore[union-attr]
+        except Exception as e:
+            logger.error(f"Unable to take the lease on s3://{self.bucket_name}/{s3_key}: {str(e)}")
+            return FAILED
+        if lease is None:
+            logger.info(f"Leaving s3://{self.bucket_name}/{s3_key} to the worker holding its lease")
+            return LEASED
+        with self.leases.held(lease):  # type: ignore[union-attr]
+            return sync(*args)
+
+    def delete_source(self, node: str, file_path: str) -> None:
+        """Delete a source file once it is synced, and forget it in the local state.
+
+        Args:
+            node (str): Node the file's metrics are recorded under.
+            file_path (str): Local file path.
+        """
+        try:
+            with self.metrics.phase(node, "delete"):
+                os.remove(file_path)
+            logger.info(f"Deleted source file: {file_path}")
+            if self.state is not None:
+                self.state.forget(file_path)
+        except Exception as e:
+            logger.error(f"Error deleting source file {file_path}: {str(e)}")
+
+    def delete_when_done(self, node: str, file_path: str, uploads: int) -> Callable[[str], None]:
+        """Return a function to call with the outcome of each upload of a file, deleting it after the last one.
+
+        The file is only deleted if every upload succeeded or found the object already there.
+
+        Args:
+            node (str): Node the file's metrics are recorded under.
+            file_path (str): Local file path.
+            uploads (int): Number of uploads: the one to the primary bucket and the copies.
+
+        Returns:
+            Callable[[str], None]: Called with ``UPLOADED``, ``SKIPPED``, ``FAILED`` or ``DEFERRED``.
+        """
+        lock = threading.Lock()
+        outcomes: List[str] = []
+
+        def on_done(result: str) -> None:
+            with lock:
+                outcomes.append(result)
+                last = len(outcomes) == uploads
+            if last and all(outcome in (UPLOADED, SKIPPED) for outcome in outcomes):
+                self.delete_source(node, file_path)
+
+        return on_done
+
+    @staticmethod
+    def log_format(file_path: str) -> Optional[str]:
+        """Detect the format of a log from its first lines.
+
+        Args:
+            file_path (str): Local file path.
+
+        Returns:
+            Optional[str]: Name of the format, or None if it was not recognized.
+        """
+        detected = detect_file_format(file_path)
+        return detected.name if detected is not None else None
+
+    def missing_copies(
+        self,
+        file_path: str,
+        s3_key: str,
+        stat_result: Optional[os.stat_result],
+        size: Optional[int] = None,
+        copy_index: Optional[Callable[[Destination], Optional[S3KeyIndex]]] = None,
+    ) -> List[Tuple[Destination, str]]:
+        """Work out which additional destinations still need a copy of a file.
+
+        A destination the local state records as holding the file, unchanged since, needs no request; one it
+        records as holding an older version of the file needs a new copy. Otherwise the destination is checked for
+        an object at the file's key, of the size of the upload when it is known.
+
+        Args:
+            file_path (str): Local file path.
+            s3_key (str): The file's key in the primary bucket.
+            stat_result (Optional[os.stat_result]): ``stat`` of the file, if available.
+            size (Optional[int]): Size of the bytes uploaded, if known before the upload.
+            copy_index (Optional[Callable[[Destination], Optional[S3KeyIndex]]]): Returns the listing of the
+                file's prefix in a destination.
+
+        Returns:
+            List[Tuple[Destination, str]]: Each destination lacking the file, with the file's key there.
+        """
+        relative_key = s3_key[len(self.s3_subdir) :]
+        missing = []
+        for destination in self.destinations:
+            key = destination.key(relative_key)
+            if self.force:
+                missing.append((destination, key))
+                continue
+            if self.state is not None:
+                stat_result = stat_result or os.stat(file_path)
+                record = self.state.get_copy(destination.name, file_path)
+                if record is not None and record.s3_key == key:
+                    if (record.size, record.mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns):
+                        missing.append((destination, key))
+                    continue
+            remote = destination.remote_object(key, copy_index(destination) if copy_index else None)
+            if remote is None or (size is not None and remote[0] != size):
+                missing.append((destination, key))
+            elif self.state is not None and stat_result is not None:
+                self.state.mark_copied(
+                    destination.name, file_path, stat_result.st_size, stat_result.st_mtime_ns, key, remote[1]
+                )
+        return missing
+
+    def start_copies(
+        self,
+        node: str,
+        file_path: str,
+        targets: List[Tuple[Destination, str]],
+        stat_result: Optional[os.stat_result],
+        extra_args: Dict[str, Any],
+        checksum: Optional[FileChecksum] = None,
+        throttle: Optional[Callable[[int], None]] = None,
+        compress: bool = False,
+        line_filter: Tuple[FilterRule, ...] = (),
+        streams: Optional[List[StreamCopy]] = None,
+        on_done: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        """Queue copies of a file to additional destinations on their own threads, without waiting for them.
+
+        A destination that already has its full backlog of copies waiting is left to a later pass. The copies of a
+        node are waited for by ``wait_for_copies``.
+
+        Args:
+            node (str): Node the copies' metrics are recorded under.
+            file_path (str): Local file path.
+            targets (List[Tuple[Destination, str]]): The destinations, each with the file's key there.
+            stat_result (Optional[os.stat_result]): ``stat`` of the file, recorded with each copy in the local state.
+            extra_args (Dict[str, Any]): Content type and metadata of the copies.
+            checksum (Optional[FileChecksum]): Checksums of the file, for files copied as they are.
+            throttle (Optional[Callable[[int], None]]): Bandwidth limit for the copies. Default is the host-wide
+                ``bandwidth`` limit.
+            compress (bool): Gzip the file as it is copied.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of a file gzipped as it is copied.
+            streams (Optional[List[StreamCopy]]): With ``compress``, the copies are made from the parts of the
+                primary upload instead of compressing the file again; they are appended here, to be passed to
+                ``upload_stream``.
+            on_done (Optional[Callable[[str], None]]): Called with the outcome of each copy.
+        """
+        futures: List[Optional[Future]] = []
+        for destination, key in targets:
+            callback = self.metrics.transfer_callback(node, throttle or self.bandwidth, destination.name)
+            stream = None
+            if compress and streams is not None:
+                stream = StreamCopy(destination.stream_uploader, key, extra_args, callback)
+                upload: Callable[[], Optional[str]] = stream.run
+            elif compress:
+                upload = partial(destination.upload_stream, file_path, key, extra_args, callback, line_filter)
+            else:
+                upload = partial(destination.upload_file, file_path, key, extra_args, callback, checksum)
+            future = destination.submit(self.copy_file, node, destination, file_path, key, stat_result, upload, on_done)
+            if future is None:
+                logger.warning(f"{destination.name} is behind, leaving the copy of {file_path} for a later pass")
+                self.metrics.record_file(node, DEFERRED, destination.name)
+                if on_done is not None:
+                    on_done(DEFERRED)
+            elif stream is not None:
+                streams.append(stream)  # type: ignore[union-attr]
+            futures.append(future)
+        with self._copies_lock:
+            self._copies.setdefault(node, []).extend(futures)
+
+    def copy_file(
+        self,
+        node: str,
+        destination: Destination,
+        file_path: str,
+        s3_key: str,
+        stat_result: Optional[os.stat_result],
+        upload: Callable[[], Optional[str]],
+        on_done: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Make one copy of a file in an additional destination and record it; run on the destination's threads.
+
+        Args:
+            node (str): Node the copy's metrics are recorded under.
+            destination (Destination): The destination.
+            file_path (str): Local file path.
+            s3_key (str): The file's key in the destination.
+            stat_result (Optional[os.stat_result]): ``stat`` of the file, recorded with the copy in the local state.
+            upload (Callable[[], Optional[str]]): Uploads the copy and returns its ETag.
+            on_done (Optional[Callable[[str], None]]): Called with the outcome.
+
+        Returns:
+            str: ``UPLOADED`` or ``FAILED``.
+        """
+        try:
+            etag = upload()
+        except Exception as e:
+            logger.error(f"Error copying {file_path} to {destination.name}: {str(e)}")
+            result = FAILED
+        else:
+            logger.debug(f"Copied: {file_path} -> s3://{destination.bucket_name}/{s3_key}")
+            if self.state is not None and stat_result is not None:
+                self.state.mark_copied(
+                    destination.name, file_path, stat_result.st_size, stat_result.st_mtime_ns, s3_key, etag
+                )
+            result = UPLOADED
+        self.metrics.record_file(node, result, destination.name)
+        if on_done is not None:
+            on_done(result)
+        return result
+
+    def wait_for_copies(self, node: str) -> int:
+        """Wait for the copies queued for a node's files.
+
+        Args:
+            node (str): The node.
+
+        Returns:
+            int: Number of copies that failed or were left for a later pass.
+        """
+        with self._copies_lock:
+            futures = self._copies.pop(node, [])
+        return sum(1 for future in futures if future is None or future.result() != UPLOADED)
+
+    def coalesced_start(
+        self,
+        file_path: str,
+        stat_result: os.stat_result,
+        gzipped: bool,
+        get_index: Callable[[], Optional[S3KeyIndex]],
+        resolved: Dict[str, bool],
+    ) -> Optional[int]:
+        """Return the offset in a file from which its next batch part starts.
+
+        A file held by a batch whose upload was interrupted is resolved first: if the batch object is in S3 the
+        file is recorded as uploaded, and otherwise the part is planned again from where it started.
+
+        Args:
+            file_path (str): Local file path.
+            stat_result (os.stat_result): Current ``stat`` of the file.
+            gzipped (bool): The file is gzipped, and so can only be coalesced whole.
+            get_index (Callable[[], Optional[S3KeyIndex]]): Returns the listing of the directory's prefix.
+            resolved (Dict[str, bool]): Whether each interrupted batch looked up so far is in S3, by key.
+
+        Returns:
+            Optional[int]: The offset, or None if the file was uploaded on its own by an earlier run and is
+                replaced in the same way.
+        """
+        record = self.state.get(file_path)  # type: ignore[union-attr]
+        if record is None:
+            return 0
+        member = self.state.batch_member(record.s3_key, file_path)  # type: ignore[union-attr]
+        if member is None:
+            return None
+        start, end = member
+        if record.status == STATUS_PENDING:
+            if record.s3_key not in resolved:
+                resolved[record.s3_key] = self.resolve_batch(record.s3_key, get_index())
+            if not resolved[record.s3_key]:
+                return start
+        # Logs only grow; one that shrank, or a gzipped one that changed at all, was replaced
+        if stat_result.st_size < end or (gzipped and stat_result.st_mtime_ns != record.mtime_ns):
+            logger.warning(f"{file_path} was replaced since it was coalesced into {record.s3_key}; adding it again")
+            return 0
+        return end
+
+    def resolve_batch(self, s3_key: str, index: Optional[S3KeyIndex] = None) -> bool:
+        """Record the files of an interrupted batch upload as uploaded if the batch object is in S3.
+
+        Args:
+            s3_key (str): The batch's key.
+            index (Optional[S3KeyIndex]): Listing of the batch's prefix, used for the existence check.
+
+        Returns:
+            bool: True if the batch object exists.
+        """
+        remote = self.remote_object(s3_key, index)
+        if remote is None:
+            return False
+        logger.info(f"Batch s3://{self.bucket_name}/{s3_key} was uploaded by an interrupted run")
+        members = self.state.batch_members(s3_key)  # type: ignore[union-attr]
+        records = [self.state.get(path) for path, _, _ in members]  # type: ignore[union-attr]
+        parts = [
+            BatchMember(
+                path, os.path.relpath(path, self.src_logdir).replace(os.sep, "/"), start, end, path.endswith(".gz"), 0
+            )
+            for path, start, end in members
+        ]
+        self.publish_sources(s3_key, parts)
+        for record in records:
+            if record is not None and record.status == STATUS_PENDING and record.s3_key == s3_key:
+                self.state.mark_uploaded(  # type: ignore[union-attr]
+                    record.path, record.size, record.mtime_ns, s3_key, remote[1]
+                )
+        return True
+
+    def publish_sources(self, s3_key: str, members: Sequence[BatchMember]) -> None:
+        """Upload the source manifest of a batch object next to the dataset manifests.
+
+        A manifest that fails to upload is only logged: the local state records which files the batch holds.
+
+        Args:
+            s3_key (str): The batch's key.
+            members (Sequence[BatchMember]): The parts of files the batch holds.
+        """
+        key = sources_key(self.s3_subdir, s3_key)
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=sources_json(s3_key, members),
+                ContentType="application/json",
+            )
+        except Exception as e:
+            logger.error(f"Error uploading source manifest s3://{self.bucket_name}/{key}: {str(e)}")
+
+    def sync_batch(
+        self,
+        batch: Batch,
+        s3_key: str,
+        index: Optional[S3KeyIndex] = None,
+        throttle: Optional[Callable[[int], None]] = None,
+        node: str = "",
+        line_filter: Tuple[FilterRule, ...] = (),
+    ) -> str:
+        """Upload a batch of small files as one gzip object, unless it is already in S3.
+
+        The parts are journaled under the batch's key before the upload starts. Since the key is derived from
+        the parts, a run interrupted at any point leaves either the object, and the next run records the files
+        as uploaded, or no object, and the next run plans the parts again; no line is uploaded twice or missed.
+
+        Args:
+            batch (Batch): The batch.
+            s3_key (str): S3 key for the batch object.
+            index (Optional[S3KeyIndex]): Listing of the batch's prefix, used for the existence check.
+            throttle (Optional[Callable[[int], None]]): Bandwidth limit for the upload. Default is the host-wide
+                ``bandwidth`` limit.
+            node (str): Node the batch's metrics are recorded under.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the batch.
+
+        Returns:
+            str: ``UPLOADED``, ``SKIPPED`` if the batch object already exists in S3, or ``FAILED``.
+        """
+        state: SyncState = self.state  # type: ignore[assignment]
+        state.add_batch(s3_key, [(member.path, member.start, member.end) for member in batch.members])
+        for member in batch.members:
+            state.mark_pending(member.path, member.end, member.mtime_ns, s3_key)
+
+        with self.metrics.phase(node, "check"):
+            remote = None if self.force else self.remote_object(s3_key, index)
+        if remote is not None:
+            logger.debug(f"Skipping (already exists): batch of {len(batch.members)} files -> {s3_key}")
+            result, etag = SKIPPED, remote[1]
+        else:
+            logger.info(f"Uploading: batch of {len(batch.members)} files -> s3://{self.bucket_name}/{s3_key}")
+            extra_args = self.upload_args(s3_key, self.log_format(batch.members[0].path))
+            callback = self.metrics.transfer_callback(node, throttle or self.bandwidth)
+            try:
+                with self.metrics.phase(node, "upload"), self.upload_concurrency.request(size=batch.raw_bytes):
+                    with BatchReader(batch.members) as f_in:
+                        stats = self.stream_uploader.upload_fileobj(
+                            f_in,
+                            s3_key,
+                            extra_args,
+                            callback=callback,
+                            summarize=self.manifests,
+                            line_filter=line_filter,
+                            block_size=self.seekable_block_size,
+                        )
+            except Exception as e:
+                logger.error(f"Error uploading batch s3://{self.bucket_name}/{s3_key}: {str(e)}")
+                return FAILED
+            result, etag = UPLOADED, stats.etag
+            if stats.dropped:
+                self.metrics.record_dropped_lines(node, stats.dropped)
+            if stats.summary is not None and stats.checksum is not None:
+                self.record_summary(node, s3_key, stats.checksum.size, stats.summary)
+            if stats.blocks is not None:
+                self.publish_block_index(s3_key, stats.blocks)
+
+        self.publish_sources(s3_key, batch.members)
+        for member in batch.members:
+            state.mark_uploaded(member.path, member.end, member.mtime_ns, s3_key, etag)
+            # Only files read to their end, and not written to since, are deleted
+            if self.delete and self.file_size(member.path) == member.end:
+                self.delete_source(node, member.path)
+        return result
+
+    def record_summary(self, node: str, s3_key: str, size: int, summary: LogSummary) -> None:
+        """Queue the summary of an uploaded log for its dataset's manifest.
+
+        Args:
+            node (str): The dataset directory relative to ``src_logdir``.
+            s3_key (str): Key of the uploaded object.
+            size (int): Size of the uploaded object in bytes.
+            summary (LogSummary): Summary of the log.
+        """
+        manifest = manifest_key(self.s3_subdir, node)
+        entry = ManifestEntry.from_summary(s3_key, size, summary)
+        if self.state is not None:
+            self.state.record_summary(manifest, entry)
+        else:
+            with self._manifest_lock:
+                self._manifest_entries.setdefault(manifest, []).append(entry)
 
-    def sync_directory(self, path_tuple: Tuple[str, Dict[str, str]]) -> None:
+    def update_manifest(self, node: str) -> None:
+        """Add the summaries queued for a dataset to its manifest in S3.
+
+        Summaries that cannot be published stay queued, in the local state if there is one, for the next pass.
+
+        Args:
+            node (str): The dataset directory relative to ``src_logdir``.
+        """
+        manifest = manifest_key(self.s3_subdir, node)
+        if self.state is not None:
+            entries = self.state.summaries(manifest, unpublished=True)
+        else:
+            with self._manifest_lock:
+                entries = self._manifest_entries.pop(manifest, [])
+        if not entries:
+            return
+
+        try:
+            publish_manifest(self.s3_client, self.bucket_name, manifest, entries)
+        except Exception as e:
+            logger.error(f"Error updating manifest s3://{self.bucket_name}/{manifest}: {str(e)}")
+            if self.state is None:
+                with self._manifest_lock:
+                    self._manifest_entries.setdefault(manifest, [])[:0] = entries
+            return
+        if self.state is not None:
+            self.state.mark_published(manifest, [entry.key for entry in entries])
+        logger.debug(f"Added {len(entries)} summaries to s3://{self.bucket_name}/{manifest}")
+
+    @staticmethod
+    def listing_start_after(prefix: str, include_patterns: list) -> Optional[str]:
+        """Work out where a listing of a prefix can start, given the include patterns.
+
+        Log names are date-stamped, so patterns such as ``u_ex25*`` name a late slice of the prefix. Every key
+        for a file directly under the prefix sorts after the literal text before the first wildcard of the
+        pattern it matched; keys that do not (files in subdirectories) fall back to per-file checks.
+
+        Args:
+            prefix (str): The S3 prefix being listed, ending in ``/``.
+            include_patterns (list): The include patterns in use.
+
+        Returns:
+            Optional[str]: A ``StartAfter`` key, or None if some pattern starts with a wildcard.
+        """
+        literals = [re.split(r"[*?\[]", pattern, maxsplit=1)[0] for pattern in include_patterns]
+        if not literals or not all(literals):
+            return None
+        return prefix + min(literals)[:-1]
+
+    def sync_directory(
+        self,
+        path_tuple: Tuple[str, Dict[str, str]],
+        scheduler: Optional[FairScheduler] = None,
+        plan: Optional[SyncPlan] = None,
+    ) -> None:
         """Sync a single directory to S3, including progress logging and deletion if specified.
 
+        The tree is walked once, and the matching files are handed to the upload workers as it is walked and
+        compressed there if needed. They are ordered newest first, by the date stamp in their names or else their
+        modification time, within a window of ``PRIORITY_WINDOW_PER_WORKER`` files per worker: once the window is
+        full, the newest file in it is queued, blocking the walk while this directory's queue is full. Recent logs
+        therefore reach S3 ahead of the backlog found with them, and a tree of any size is synced in bounded
+        memory. With coalescing, small files are packed into batches once the whole tree is walked, and each batch
+        is queued as a single upload. In a cluster, files that hash to another worker are left to it, and each
+        upload is made under a lease on its key.
+
         Args:
-            path_tuple (tuple): A tuple containing the source path and include patterns.
+            path_tuple (tuple): A tuple containing the source path and its config: include patterns and
+                optionally a scheduling ``weight`` and ``max_workers``, a ``bandwidth`` limit applied on top of
+                the host-wide one, a ``key_template`` for the S3 keys of its files, a ``line_filter`` and
+                ``coalesce`` settings.
+            scheduler (Optional[FairScheduler]): Upload workers shared with other source paths. Default is a
+                pool of ``workers`` threads used by this directory alone.
+            plan (Optional[SyncPlan]): Record what would be uploaded here instead: the files are scanned, matched
+                and looked up in S3, but nothing is compressed, uploaded, deleted or recorded in the local state.
         """
+        if scheduler is None and plan is None:
+            with FairScheduler(self.workers) as own_scheduler:
+                self.sync_directory(path_tuple, own_scheduler)
+            return
+
         src_path, path_include = path_tuple
+        if scheduler is not None:
+            scheduler.add_node(
+                src_path,
+                weight=path_include.get("weight", DEFAULT_WEIGHT),
+                max_workers=path_include.get("max_workers"),
+            )
+        scan_started = time.time()
 
-        # Ensure all files are gzipped before sync (if enabled)
+        # Uncompressed files are gzipped in place by the upload workers before they are uploaded or, in
+        # streaming mode, compressed during the upload
         if self.enable_gzip:
-            logger.info(f"Ensuring files are gzipped in: {src_path}")
-            self.ensure_files_are_gzipped(src_path)
+            logger.log(
+                logging.DEBUG if self._watching else logging.INFO,
+                f"Syncing {src_path}, gzipping files {'during upload' if self.streaming else 'in place'}",
+            )
         else:
             logger.debug(f"Gzip compression disabled, syncing files as-is: {src_path}")
 
-        s3_base_path = os.path.join(self.s3_subdir, os.path.relpath(src_path, self.src_logdir))
+        node = os.path.relpath(src_path, self.src_logdir)
+        key_template = self.key_templates.get(src_path)
+        line_filter = self.line_filters.get(src_path, ())
+        if key_template is None:
+            s3_base_path = os.path.join(self.s3_subdir, node)
+        else:
+            node_name, _, dataset = node.replace("\\", "/").partition("/")
+            s3_base_path = os.path.join(self.s3_subdir, key_template.prefix(node_name, dataset))
 
         # Collect all include patterns
         all_patterns = []
-        for includes in path_include.values():
-            for pattern in includes:
-                # Update include patterns based on gzip setting
-                if self.enable_gzip and not pattern.endswith(".gz"):
-                    pattern += ".gz"
-                all_patterns.append(pattern)
-
-        # Upload files
-        uploaded_count = 0
-        total_files = 0
-
-        for root, _dirs, files in os.walk(src_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-
-                if self.should_upload_file(file_path, all_patterns):
-                    total_files += 1
-
-                    # Calculate S3 key
-                    rel_path = os.path.relpath(file_path, src_path)
-                    s3_key = os.path.join(s3_base_path, rel_path).replace("\\", "/")
+        for pattern in path_include.get("include", []):
+            # Update include patterns based on gzip setting
+            if self.enable_gzip and not pattern.endswith(".gz"):
+                pattern += ".gz"
+            all_patterns.append(pattern)
+        matcher = compile_include_patterns(tuple(all_patterns))
+
+        # Only look at directories changed since the last sync that uploaded everything it found
+        since = None
+        hot_directories: Set[str] = set()
+        if self.state is not None and not self.full_scan and not self.force:
+            last_scan = self.state.last_scan(src_path)
+            since = last_scan - SCAN_PRUNE_MARGIN if last_scan is not None else None
+            # Logs uploaded while still being written grow without touching their directory
+            if since is not None:
+                recent = self.state.modified_since(src_path, time.time() - max(HOT_FILE_WINDOW, self.settle_seconds))
+                hot_directories = {os.path.dirname(path) for path in recent}
+
+        # The destination prefix is listed once, the first time a file needs an existence check, instead of
+        # issuing a HEAD request per file
+        index_prefix = s3_base_path.rstrip("/") + "/"
+        index_lock = threading.Lock()
+        indexes: List[Optional[S3KeyIndex]] = []
+
+        def get_index() -> Optional[S3KeyIndex]:
+            if self.force:
+                return None
+            with index_lock:
+                if not indexes:
+                    with self.metrics.phase(node, "check"):
+                        # Templated keys do not start with the file name, so the whole prefix is listed
+                        start_after = None if key_template else self.listing_start_after(index_prefix, all_patterns)
+                        indexes.append(self.build_s3_index(index_prefix, start_after))
+                return indexes[0]
+
+        # Each additional destination's prefix is listed the same way, the first time one of its copies is checked
+        copy_index_lock = threading.Lock()
+        copy_indexes: Dict[str, Optional[S3KeyIndex]] = {}
+
+        def get_copy_index(destination: Destination) -> Optional[S3KeyIndex]:
+            with copy_index_lock:
+                if destination.name not in copy_indexes:
+                    with self.metrics.phase(node, "check"):
+                        start_after = None if key_template else self.listing_start_after(index_prefix, all_patterns)
+                        copy_indexes[destination.name] = destination.build_index(
+                            destination.key(index_prefix[len(self.s3_subdir) :]),
+                            destination.key(start_after[len(self.s3_subdir) :]) if start_after else None,
+                        )
+                return copy_indexes[destination.name]
+
+        # Uploads of this directory draw from its own bandwidth limit as well as the host-wide one
+        node_bandwidth = self.token_bucket(path_include.get("bandwidth"))
+        throttle = Throttle(self.bandwidth, node_bandwidth) if node_bandwidth else None
+
+        def sync_candidate(file_path: str, s3_key: str, compress: bool, stat_result: os.stat_result) -> str:
+            index = get_index()
+            if self.leases is not None:
+                # The worker that held the lease before may have gzipped, uploaded or deleted the file since the
+                # scan, after the prefix was listed
+                if not os.path.exists(file_path):
+                    return SKIPPED
+                index = None
+            return self.sync_file(
+                file_path, s3_key, index, compress, stat_result, throttle, node, line_filter, get_copy_index
+            )
 
-                    # Check if file already exists in S3
-                    if self.file_exists_in_s3(s3_key):
-                        logger.debug(f"Skipping (already exists): {file_path} -> s3://{self.bucket_name}/{s3_key}")
+        def sync_batch(batch: Batch, s3_key: str) -> str:
+            return self.sync_batch(batch, s3_key, get_index(), throttle, node, line_filter)
+
+        # A plan makes the same existence checks, without reading the files: an object of the same size as a file
+        # uploaded as it is is taken to match
+        node_plan = plan.node(node) if plan is not None else None
+
+        def plan_candidate(file_path: str, s3_key: str, compress: bool, stat_result: os.stat_result) -> str:
+            remote = None if self.force else self.remote_object(s3_key, get_index())
+            if remote is not None:
+                if compress:
+                    unchanged = not self.changed_since_upload(file_path, s3_key, stat_result)
+                else:
+                    unchanged = remote[0] == stat_result.st_size
+                if unchanged:
+                    node_plan.existing_files += 1  # type: ignore[union-attr]
+                    return SKIPPED
+            gzip_bytes = stat_result.st_size if compress else 0
+            node_plan.add_upload(stat_result.st_size, gzip_bytes, replace=remote is not None)  # type: ignore
+            return UPLOADED
+
+        def plan_batch(batch: Batch, s3_key: str) -> str:
+            if not self.force and self.file_exists_in_s3(s3_key, get_index()):
+                node_plan.existing_files += len(batch.members)  # type: ignore[union-attr]
+                return SKIPPED
+            gzip_bytes = sum(member.length for member in batch.members if not member.gzipped)
+            node_plan.add_upload(batch.raw_bytes, gzip_bytes, len(batch.members), batch=True)  # type: ignore
+            return UPLOADED
+
+        file_sync: Callable[..., str] = sync_candidate if node_plan is None else plan_candidate
+        batch_sync: Callable[..., str] = sync_batch if node_plan is None else plan_batch
+
+        results: Dict[str, int] = {UPLOADED: 0, SKIPPED: 0, FAILED: 0, LEASED: 0}
+        results_lock = threading.Lock()
+
+        def on_done(future, files: int = 1, size: int = 0) -> None:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Unexpected error syncing file: {str(e)}")
+                result = FAILED
+            with results_lock:
+                results[result] += files
+            for _ in range(files):
+                self.metrics.record_file(node, result)
+            if result == UPLOADED:
+                self.metrics.add_raw_bytes(node, size)
+
+        # Pending files and batches wait in a bounded window and are queued newest first, so recent logs reach S3
+        # ahead of any backlog. Queued files may be gzipped in place before their directory is fully listed, so the
+        # scan leaves out the .gz files of the files it queued, and entries gone by the time they are looked at. A
+        # plan counts them on this thread instead.
+        scan_started_monotonic = time.monotonic()
+        pending: List[Tuple[int, float, int, int, int, Callable[..., str], tuple]] = []
+        window = PRIORITY_WINDOW_PER_WORKER * self.workers
+        sequence = itertools.count()
+        submit_seconds = 0.0
+
+        def dispatch() -> None:
+            nonlocal submit_seconds
+            _, _, _, size, files, sync, args = heapq.heappop(pending)
+            if node_plan is not None:
+                sync(*args)
+                return
+            # Blocks while this directory already has a full queue, so only a bounded number of uploads wait
+            submit_started = time.monotonic()
+            future = scheduler.submit(src_path, size, sync, *args)  # type: ignore[union-attr]
+            submit_seconds += time.monotonic() - submit_started
+            future.add_done_callback(partial(on_done, files=files, size=size))
+
+        unchanged_files = 0
+        unsettled_files = 0
+        foreign_files = 0
+        collisions = 0
+        compressed_names: Set[str] = set()
+        settled_before = time.time() - self.settle_seconds
+        # The next run must list the directories of files left because they were still being written
+        rescan_from = scan_started
+        # Small files are gathered into batches, planned once the whole directory is scanned
+        coalesce = self.coalesce.get(src_path)
+        batch_parts: List[Tuple[date, BatchMember]] = []
+        resolved_batches: Dict[str, bool] = {}
+        held_files = 0
+        if coalesce is not None and node_plan is not None:
+            # A plan looks interrupted batches up in S3 without resolving them in the local state
+            for record in self.state.pending():  # type: ignore[union-attr]
+                if record.path.startswith(os.path.join(src_path, "")) and record.s3_key not in resolved_batches:
+                    resolved_batches[record.s3_key] = self.file_exists_in_s3(record.s3_key, get_index())
+        for file_path, stat_result in self.scan_directory(src_path, since, hot_directories):
+            file_name = os.path.basename(file_path)
+
+            # Queued uploads gzip their files in place while the scan goes on; the .gz is theirs to upload
+            if file_path in compressed_names:
+                continue
+
+            # Files recorded as uploaded and unchanged since need no S3 request at all
+            if self.is_unchanged_since_sync(file_path, stat_result):
+                unchanged_files += 1
+                continue
+
+            # An uncompressed file is uploaded under its name plus .gz
+            compress = self.enable_gzip and not file_name.endswith(".gz") and not self.is_gzipped(file_path)
+            upload_name = file_path + ".gz" if compress else file_path
+
+            if matcher.match(os.path.basename(upload_name)):
+                # Leave files still being written for a later run
+                if self.settle_seconds and stat_result.st_mtime > settled_before:
+                    unsettled_files += 1
+                    try:
+                        rescan_from = min(rescan_from, os.stat(os.path.dirname(file_path)).st_mtime)
+                    except OSError:
+                        pass
+                    continue
+
+                # Files that hash to another worker of the cluster are left to it
+                if self.ring is not None:
+                    owner = self.ring.owner(os.path.relpath(upload_name, self.src_logdir).replace(os.sep, "/"))
+                    if owner != self.cluster.worker:  # type: ignore[union-attr]
+                        foreign_files += 1
                         continue
 
-                    logger.info(f"Uploading: {file_path} -> s3://{self.bucket_name}/{s3_key}")
+                # Calculate S3 key; date partitions may need the date of the file's first record
+                rel_path = os.path.relpath(upload_name, src_path).replace("\\", "/")
+                read_contents = key_template is not None and key_template.uses_date
+                day = file_date(file_name, stat_result.st_mtime, file_path if read_contents else None)
+                if key_template is None:
+                    s3_key = os.path.join(s3_base_path, rel_path).replace("\\", "/")
+                else:
+                    rendered = key_template.render(node_name, dataset, day, rel_path)
+                    s3_key = os.path.join(self.s3_subdir, rendered).replace("\\", "/")
+                    # Uploading it would replace another file's object; left failed until the template is fixed
+                    other = self.claim_key(s3_key, file_path, upload_name)
+                    if other is not None:
+                        logger.error(
+                            f"Key template gives {file_path} the same key as {other}: {s3_key}; use {{path}} "
+                            f"to tell files in different subdirectories apart."
+                        )
+                        collisions += 1
+                        continue
 
-                    if self.upload_file(file_path, s3_key):
-                        uploaded_count += 1
+                # Small files go into a batch instead, from where the last batch holding them stopped
+                if coalesce is not None and stat_result.st_size <= coalesce.max_file_size:
+                    start = self.coalesced_start(file_path, stat_result, not compress, get_index, resolved_batches)
+                    if start is not None:
+                        complete = stat_result.st_mtime < time.time() - coalesce.max_wait
+                        if compress:
+                            end = segment_end(file_path, start, stat_result.st_size, complete)
+                        else:
+                            end = stat_result.st_size if start == 0 else None
+                        if end is not None:
+                            name = os.path.relpath(file_path, self.src_logdir).replace(os.sep, "/")
+                            member = BatchMember(file_path, name, start, end, not compress, stat_result.st_mtime_ns)
+                            batch_parts.append((day, member))
+                        elif start < stat_result.st_size:
+                            held_files += 1
+                            rescan_from = min(rescan_from, os.path.getmtime(os.path.dirname(file_path)))
+                        continue
 
-                        # Delete source file if requested
-                        if self.delete:
-                            try:
-                                os.remove(file_path)
-                                logger.info(f"Deleted source file: {file_path}")
-                            except Exception as e:
-                                logger.error(f"Error deleting source file {file_path}: {str(e)}")
+                if compress:
+                    compressed_names.add(upload_name)
+                newest = -day.toordinal()
+                sync: Callable[..., str] = file_sync
+                args: tuple = (file_path, s3_key, compress, stat_result)
+                if self.leases is not None and node_plan is None:
+                    sync, args = self.leased, (s3_key, sync, *args)
+                heapq.heappush(
+                    pending, (newest, -stat_result.st_mtime, next(sequence), stat_result.st_size, 1, sync, args)
+                )
+                if len(pending) > window:
+                    dispatch()
+
+        if coalesce is not None and batch_parts:
+            ready_before_ns = time.time_ns() - int(coalesce.max_wait * 1e9)
+            batches, held = plan_batches(batch_parts, coalesce.target_size, ready_before_ns)
+            for member in held:
+                held_files += 1
+                rescan_from = min(rescan_from, os.path.getmtime(os.path.dirname(member.path)))
+            for batch in batches:
+                if key_template is None:
+                    s3_key = os.path.join(s3_base_path, batch.name()).replace("\\", "/")
+                else:
+                    rendered = key_template.render(node_name, dataset, batch.day, batch.name())
+                    s3_key = os.path.join(self.s3_subdir, rendered).replace("\\", "/")
+                heapq.heappush(
+                    pending,
+                    (
+                        -batch.day.toordinal(),
+                        -batch.mtime_ns / 1e9,
+                        next(sequence),
+                        batch.raw_bytes,
+                        len(batch.members),
+                        batch_sync,
+                        (batch, s3_key),
+                    ),
+                )
+        self.metrics.record_phase(node, "scan", time.monotonic() - scan_started_monotonic - submit_seconds)
+
+        while pending:
+            dispatch()
+        if node_plan is not None:
+            node_plan.unchanged_files += unchanged_files
+            node_plan.unsettled_files += unsettled_files
+            node_plan.held_files += held_files
+            node_plan.foreign_files += foreign_files
+            return
 
+        scheduler.drain(src_path)  # type: ignore[union-attr]
+        results[FAILED] += collisions
+        for _ in range(collisions):
+            self.metrics.record_file(node, FAILED)
+        copies_missing = self.wait_for_copies(node) if self.destinations else 0
+        if self.manifests:
+            self.update_manifest(node)
+
+        if unchanged_files:
+            logger.debug(f"{src_path}: {unchanged_files} files unchanged since they were uploaded.")
+        if unsettled_files:
+            logger.debug(f"{src_path}: {unsettled_files} files still being written, leaving them for later.")
+        if foreign_files:
+            logger.debug(f"{src_path}: {foreign_files} files left to other workers of the cluster.")
+        if results[LEASED]:
+            logger.info(f"{src_path}: {results[LEASED]} files being uploaded by other workers, checking them later.")
+        if held_files:
+            logger.debug(f"{src_path}: {held_files} small files waiting for a fuller batch.")
+        if copies_missing:
+            logger.warning(f"{src_path}: {copies_missing} copies to additional destinations left for a later pass.")
+
+        # Later runs only need to look at directories changed after this one started, as long as nothing failed
+        # or was left to another worker's lease
+        if self.state is not None and not results[FAILED] and not results[LEASED] and not copies_missing:
+            self.state.record_scan(src_path, rescan_from)
+
+        uploaded_count = results[UPLOADED]
+        total_files = sum(results.values())
         if uploaded_count > 0:
             logger.info(
                 f"{src_path} sync to {s3_base_path}: {uploaded_count}/{total_files} files uploaded successfully."
             )
         else:
-            logger.info(f"{src_path} sync to {s3_base_path}: no files to upload.")
+            logger.log(
+                logging.DEBUG if self._watching else logging.INFO,
+                f"{src_path} sync to {s3_base_path}: no files to upload.",
+            )
 
     @staticmethod
     def convert_size(size: int) -> str:
@@ -301,67 +2086,6 @@ class S3Sync:
         s = round(size / p, 2)
         return f"{s}{size_name[i]}"
 
-    @staticmethod
-    def get_bytes(size: int, size_incre: str) -> int:
-        """Convert a size with unit to bytes.
-
-        Args:
-            size (int): The numerical part of the size.
-            size_incre (str): The unit of the size (e.g., "KiB", "MiB").
-
-        Returns:
-            int: The size in bytes.
-        """
-        # Convert size to bytes based on unit
-        if size_incre == "KiB":
-            size *= 2**10
-        elif size_incre == "MiB":
-            size *= 2**20
-        elif size_incre == "GiB":
-            size *= 2**30
-        elif size_incre == "TiB":
-            size *= 2**40
-        return size
-
-    @staticmethod
-    def get_throughput(sent: int, start_time: float) -> str:
-        """Calculate and return the data transfer throughput.
-
-        Args:
-            sent (int): The number of bytes sent.
-            start_time (float): The start time of the transfer (must be set with time.monotonic()).
-
-        Returns:
-            str: The throughput in MB/s.
-        """
-        elapsed_time = time.monotonic() - start_time
-        mb_sent = sent / (1024 * 1024)
-        return f"{mb_sent / elapsed_time:.2f} MB/s"
-
-    def process_progress(self, line: str, src_path: str, start_time: float) -> None:
-        """Process and print the progress of the sync operation based on AWS CLI output.
-
-        Args:
-            line (str): The output line from AWS CLI.
-            src_path (str): The source path being synced.
-            start_time (float): The start time of the sync operation (must be set with time.monotonic()).
-        """
-        # Extract and process progress information from AWS CLI output
-        line_components = line.split()
-        sent = int(float(line_components[1]))
-        sent_incre = line_components[2].split("/")[0]
-        total_size = int(float(line_components[2].split("/")[1].replace("~", "")))
-        total_size_incre = line_components[3]
-        sent = self.get_bytes(sent, sent_incre)
-        total_size = self.get_bytes(total_size, total_size_incre)
-        progress = sent / total_size
-        logger.info(
-            f"{src_path} - "
-            f"{self.convert_size(sent)} / {self.convert_size(total_size)} - "
-            f"{progress:.0%} - "
-            f"{self.get_throughput(sent, start_time)}"
-        )
-
 
 def parse_args():
     """Parse command line arguments for the script.
@@ -387,11 +2111,83 @@ def parse_args():
         action="store_true",
         help="Disable gzip compression. Files will be synced as-is without compression.",
     )
+    parser.add_argument(
+        "--gzip-level",
+        type=int,
+        choices=range(1, 10),
+        default=DEFAULT_GZIP_LEVEL,
+        metavar="{1-9}",
+        help="Gzip compression level, from 1 (fastest) to 9 (smallest).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Gzip files while uploading them instead of compressing them in place first. "
+        "Local files are left untouched.",
+    )
+    parser.add_argument(
+        "--state-file",
+        default=None,
+        help="SQLite file recording uploaded files so unchanged files are skipped without S3 requests. "
+        "Defaults to the config file path with a .state.db extension.",
+    )
+    parser.add_argument(
+        "--no-state",
+        action="store_true",
+        help="Do not keep local sync state; check every matching file against S3.",
+    )
+    parser.add_argument(
+        "--full-scan",
+        action="store_true",
+        help="List every directory, including those unchanged since the last sync.",
+    )
     parser.add_argument(
         "--force",
         action="store_true",
         help="Force upload even if files already exist in S3.",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running, syncing new and rotated files every --watch-interval seconds.",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=DEFAULT_WATCH_INTERVAL,
+        help="Seconds between sync passes in --watch mode.",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=None,
+        help="Only sync files unmodified for this many seconds, leaving files still being written for later. "
+        f"Defaults to {DEFAULT_SETTLE_SECONDS:g} in --watch mode and 0 otherwise.",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Write a JSON report of the run's throughput and per-phase latencies to this file.",
+    )
+    parser.add_argument(
+        "--prometheus-file",
+        default=None,
+        help="Write the run's metrics in Prometheus text format to this file, "
+        "e.g. in the node_exporter textfile collector directory.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Scan and check S3 as a sync would, without compressing, uploading or deleting anything, and print "
+        "the files and bytes to upload per node, with size and duration estimates, as JSON.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent upload threads. Uploads in flight ramp up to this while S3 responds "
+        "promptly and back off when it throttles. Defaults to the number of CPUs.",
+    )
 
     args = parser.parse_args()
 
@@ -454,16 +2250,58 @@ def main():
         for subdir in config.subdirs[dir]
     }
 
+    state_file = None
+    if not args.no_state:
+        state_file = args.state_file or os.path.splitext(args.config)[0] + ".state.db"
+
     s3_sync = S3Sync(
         src_paths=local_dirs,
         src_logdir=args.log_directory,
         bucket_name=config.s3_bucket,
         s3_subdir=config.s3_subdir,
         profile_name=args.aws_profile,
+        workers=args.workers,
         enable_gzip=not args.no_gzip,
         force=args.force,
+        gzip_level=args.gzip_level,
+        gzip_buffer_size=config.get("gzip_buffer_size", DEFAULT_GZIP_BUFFER_SIZE),
+        streaming=args.stream,
+        state_file=state_file,
+        read_only_state=args.plan,
+        full_scan=args.full_scan,
+        bandwidth=config.get("bandwidth"),
+        report_file=args.report,
+        prometheus_file=args.prometheus_file,
+        small_file_threshold=config.get("small_file_threshold", DEFAULT_SMALL_FILE_THRESHOLD),
+        multipart_chunksize=config.get("multipart_chunksize", DEFAULT_MULTIPART_CHUNKSIZE),
+        multipart_concurrency=config.get("multipart_concurrency", DEFAULT_MULTIPART_CONCURRENCY),
+        abandoned_upload_age=config.get("abandoned_upload_age", DEFAULT_ABANDONED_UPLOAD_AGE),
+        key_template=config.get("key_template"),
+        manifests=config.get("manifests", False),
+        line_filter=config.get("line_filter"),
+        destinations=config.get("destinations"),
+        seekable_block_size=config.get("seekable_block_size", 0),
+        coalesce=config.get("coalesce"),
+        cluster=config.get("cluster"),
+        settle_seconds=args.settle if args.settle is not None else (DEFAULT_SETTLE_SECONDS if args.watch else 0.0),
     )
-    s3_sync.run()
+
+    if args.plan:
+        print(json.dumps(s3_sync.plan(), indent=2, sort_keys=True))
+        return
+
+    if not args.watch:
+        s3_sync.run()
+        return
+
+    if state_file is None:
+        logger.warning("Watching without local state; every pass checks every matching file against S3.")
+
+    # Finish the current pass and exit cleanly on SIGTERM (e.g. systemctl stop) or Ctrl-C
+    stop_event = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop_event.set())
+    s3_sync.watch(args.watch_interval, stop_event)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""Weighted fair sharing of upload workers between source directories."""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHT = 1.0
+# Fixed cost charged for every file on top of its size, so a node with many tiny files still pays for the
+# request round-trips it uses
+FILE_COST_BYTES = 256 * 1024
+
+
+class _Node:
+    """Queue and accounting for one source directory."""
+
+    def __init__(self, name: str, weight: float, max_workers: Optional[int], queue_depth: int) -> None:
+        self.name = name
+        self.weight = weight
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.queue: Deque[Tuple[float, Future, Callable[..., Any], tuple]] = deque()
+        self.running = 0
+        self.finish_tag = 0.0
+
+    def idle(self) -> bool:
+        return not self.queue and not self.running
+
+    def ready(self) -> bool:
+        return bool(self.queue) and (self.max_workers is None or self.running < self.max_workers)
+
+
+class FairScheduler:
+    """A fixed pool of worker threads shared between nodes by weighted fair queueing.
+
+    Each node (a source directory) has its own bounded queue. Whenever a worker is free it takes the next
+    file from the ready node with the smallest virtual finish tag, and that node's tag advances by the file's
+    cost (its size plus ``FILE_COST_BYTES``) divided by the node's weight. Over time every busy node receives
+    a share of the upload bandwidth proportional to its weight, however many files it has queued, so a
+    node with a large backlog cannot hold back the others. A node that was idle restarts at the current
+    virtual time instead of spending credit it built up while idle.
+
+    A node can also be capped at ``max_workers`` concurrent files. ``submit`` blocks while the node's queue
+    is full, so a directory scan never runs far ahead of its uploads.
+
+    Attributes:
+        workers (int): Number of worker threads, the global concurrency budget.
+        queue_depth (int): Default number of files each node may have waiting for a worker.
+    """
+
+    def __init__(self, workers: int, queue_depth: Optional[int] = None) -> None:
+        """Start the worker threads."""
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        self.workers = workers
+        self.queue_depth = queue_depth if queue_depth else workers * 4
+        self._nodes: Dict[str, _Node] = {}
+        self._condition = threading.Condition()
+        self._virtual_time = 0.0
+        self._shutdown = False
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"upload-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self) -> "FairScheduler":
+        """Return the scheduler."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Wait for all queued work and stop the workers."""
+        self.shutdown()
+
+    def add_node(self, name: str, weight: float = DEFAULT_WEIGHT, max_workers: Optional[int] = None) -> None:
+        """Register a node, or update the weight and cap of an existing one.
+
+        Args:
+            name (str): Node name, e.g. the source directory.
+            weight (float): Relative share of the workers the node receives while it has work queued.
+            max_workers (Optional[int]): Most files of the node processed at once. Default is no cap.
+
+        Raises:
+            ValueError: If the weight is not positive or the cap is below 1.
+        """
+        if not weight > 0:
+            raise ValueError(f"{name}: weight must be positive, got {weight}")
+        if max_workers is not None and max_workers < 1:
+            raise ValueError(f"{name}: max_workers must be at least 1, got {max_workers}")
+        with self._condition:
+            node = self._nodes.get(name)
+            if node is None:
+                self._nodes[name] = _Node(name, float(weight), max_workers, self.queue_depth)
+            else:
+                node.weight = float(weight)
+                node.max_workers = max_workers
+            self._condition.notify_all()
+
+    def submit(self, name: str, cost: int, fn: Callable[..., Any], *args: Any) -> Future:
+        """Queue a call for a node, blocking while the node's queue is full.
+
+        Args:
+            name (str): A registered node name.
+            cost (int): Size of the work in bytes, usually the file size.
+            fn (Callable[..., Any]): The function to call on a worker thread.
+            *args (Any): Arguments for ``fn``.
+
+        Returns:
+            Future: The future of the call.
+
+        Raises:
+            RuntimeError: If the scheduler has been shut down.
+        """
+        future: Future = Future()
+        with self._condition:
+            node = self._nodes[name]
+            while len(node.queue) >= node.queue_depth and not self._shutdown:
+                self._condition.wait()
+            if self._shutdown:
+                raise RuntimeError("Cannot submit to a scheduler that has been shut down")
+            if node.idle():
+                node.finish_tag = max(node.finish_tag, self._virtual_time)
+            node.queue.append((max(cost, 0) + FILE_COST_BYTES, future, fn, args))
+            self._condition.notify_all()
+        return future
+
+    def drain(self, name: str) -> None:
+        """Wait until every call submitted for a node has finished.
+
+        Args:
+            name (str): A registered node name.
+        """
+        with self._condition:
+            node = self._nodes[name]
+            while not node.idle():
+                self._condition.wait()
+
+    def shutdown(self) -> None:
+        """Wait for all queued work to finish and stop the worker threads."""
+        with self._condition:
+            while any(not node.idle() for node in self._nodes.values()):
+                self._condition.wait()
+            self._shutdown = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _next(self) -> Optional[Tuple[_Node, Future, Callable[..., Any], tuple]]:
+        """Take the next call from the ready node with the smallest finish tag; the lock must be held."""
+        ready = [node for node in self._nodes.values() if node.ready()]
+        if not ready:
+            return None
+        node = min(ready, key=lambda n: n.finish_tag)
+        cost, future, fn, args = node.queue.popleft()
+        self._virtual_time = node.finish_tag
+        node.finish_tag += cost / node.weight
+        node.running += 1
+        return node, future, fn, args
+
+    def _work(self) -> None:
+        """Run queued calls until the scheduler is shut down."""
+        while True:
+            with self._condition:
+                item = self._next()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._condition.wait()
+                    item = self._next()
+                # A queue slot was freed for the node's scanner
+                self._condition.notify_all()
+
+            node, future, fn, args = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+
+            with self._condition:
+                node.running -= 1
+                self._condition.notify_all()
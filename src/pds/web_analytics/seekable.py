@@ -0,0 +1,313 @@
+"""Seekable gzip output: logs compressed in independent blocks, with an index of each block's time range."""
+import gzip
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from botocore.exceptions import ClientError  # type: ignore
+
+from .manifest import sidecar_key
+from .summary import DETECT_SIZE
+from .summary import detect_style
+from .summary import time_range
+from .summary import TimestampStyle
+
+# Uncompressed bytes per block: small enough for a range GET to fetch little beyond the records asked for, large
+# enough that the gzip header and reset dictionary of each block cost well under 1% of the compressed size
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# A block with no line ending this many times its size in is cut anyway, so binary files stay bounded
+MAX_BLOCK_FACTOR = 4
+# Largest range fetched with one GET by ``read_blocks``; adjacent blocks are merged up to it
+DEFAULT_MAX_RANGE = 8 * 1024 * 1024
+# Block indexes live under <s3_subdir>/_indexes/, outside every dataset prefix that Logstash and Athena read
+INDEX_DIR = "_indexes"
+# wbits value that makes zlib emit a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def index_key(s3_subdir: str, s3_key: str) -> str:
+    """Return the S3 key of the block index of an object.
+
+    Args:
+        s3_subdir (str): The sync's ``s3_subdir``.
+        s3_key (str): The object's key.
+
+    Returns:
+        str: The key, e.g. ``<s3_subdir>/_indexes/atm/atm-apache-http/access.log.gz.json`` for
+            ``<s3_subdir>/atm/atm-apache-http/access.log.gz``.
+    """
+    return sidecar_key(s3_subdir, INDEX_DIR, s3_key)
+
+
+class Block(NamedTuple):
+    """One gzip member of a seekable object.
+
+    Attributes:
+        offset (int): Offset of the member in the object.
+        length (int): Compressed size of the member in bytes.
+        raw_offset (int): Offset of the member's contents in the uncompressed log.
+        raw_length (int): Uncompressed size of the member in bytes.
+        lines (int): Number of lines in the member.
+        start (Optional[float]): Earliest record timestamp, as a Unix timestamp, or None if no record had one.
+        end (Optional[float]): Latest record timestamp, as a Unix timestamp, or None if no record had one.
+    """
+
+    offset: int
+    length: int
+    raw_offset: int
+    raw_length: int
+    lines: int
+    start: Optional[float]
+    end: Optional[float]
+
+
+class BlockIndex:
+    """The blocks of a seekable object, built as they are compressed or read back.
+
+    The log format, and with it the timestamp style, is detected from the start of the first block.
+
+    Attributes:
+        blocks (List[Block]): The blocks, in the order they appear in the object.
+        log_format (Optional[str]): The detected log format, or None if it was not recognized.
+    """
+
+    def __init__(self, blocks: Iterable[Block] = (), log_format: Optional[str] = None) -> None:
+        """Start with the given blocks."""
+        self.blocks = list(blocks)
+        self.log_format = log_format
+        self._style: Optional[TimestampStyle] = None
+        self._detected = bool(self.blocks)
+
+    def __len__(self) -> int:
+        """Return the number of blocks."""
+        return len(self.blocks)
+
+    @property
+    def compressed_bytes(self) -> int:
+        """Return the size of the object in bytes."""
+        return self.blocks[-1].offset + self.blocks[-1].length if self.blocks else 0
+
+    @property
+    def raw_bytes(self) -> int:
+        """Return the size of the uncompressed log in bytes."""
+        return self.blocks[-1].raw_offset + self.blocks[-1].raw_length if self.blocks else 0
+
+    def add(self, length: int, raw: bytes) -> Block:
+        """Add the next block, given its compressed size and its uncompressed contents."""
+        if not self._detected:
+            self._detected = True
+            self.log_format, self._style = detect_style(raw[:DETECT_SIZE])
+        lines = raw.count(b"\n") + (1 if raw and not raw.endswith(b"\n") else 0)
+        start = end = None
+        style = self._style
+        found = time_range(style, raw, len(raw)) if style is not None else None
+        if style is not None and found is not None:
+            start, end = style.to_epoch(found[0]), style.to_epoch(found[1])
+        block = Block(self.compressed_bytes, length, self.raw_bytes, len(raw), lines, start, end)
+        self.blocks.append(block)
+        return block
+
+    def covering(self, start: float, end: float) -> List[Block]:
+        """Return the blocks with records between two times.
+
+        Args:
+            start (float): Start of the range, as a Unix timestamp.
+            end (float): End of the range, inclusive, as a Unix timestamp.
+
+        Returns:
+            List[Block]: Blocks whose time ranges overlap the range, in object order. Blocks without timestamps
+                are left out.
+        """
+        return [
+            block
+            for block in self.blocks
+            if block.start is not None and block.end is not None and block.start <= end and block.end >= start
+        ]
+
+    def to_json(self) -> bytes:
+        """Return the index as JSON."""
+        return json.dumps(
+            {"format": self.log_format, "blocks": [block._asdict() for block in self.blocks]},
+            separators=(",", ":"),
+        ).encode()
+
+    @classmethod
+    def from_json(cls, body: bytes) -> "BlockIndex":
+        """Parse an index written by ``to_json``."""
+        record: Dict[str, Any] = json.loads(body)
+        return cls((Block(**block) for block in record["blocks"]), record.get("format"))
+
+
+class BlockCompressor:
+    """Compresses a log into a gzip stream of independent members, indexing each member as it is written.
+
+    Each member holds about ``block_size`` uncompressed bytes and ends at a line ending, so no record spans two
+    of them. A multi-member gzip file is still an ordinary gzip file to ``gzip``, ``zcat``, Logstash and Athena,
+    while a reader holding the index can fetch and decompress any member on its own. ``compress`` and ``flush``
+    work like those of ``zlib.compressobj``.
+
+    Attributes:
+        level (int): zlib compression level.
+        block_size (int): Uncompressed bytes per block.
+        index (BlockIndex): The blocks written so far.
+    """
+
+    def __init__(self, level: int, block_size: int = DEFAULT_BLOCK_SIZE) -> None:
+        """Start with no blocks."""
+        self.level = level
+        self.block_size = block_size
+        self.index = BlockIndex()
+        self._pending = bytearray()
+
+    def compress(self, data: bytes) -> bytes:
+        """Add the next bytes of the log and return the blocks completed by them."""
+        self._pending += data
+        members = []
+        while len(self._pending) >= self.block_size:
+            cut = self._pending.find(b"\n", self.block_size - 1) + 1
+            if not cut:
+                if len(self._pending) < MAX_BLOCK_FACTOR * self.block_size:
+                    break
+                cut = self.block_size
+            members.append(self._member(cut))
+        return b"".join(members)
+
+    def flush(self) -> bytes:
+        """Return the last block; an empty log gets one empty block, so the output is still a gzip file."""
+        if self._pending or not self.index.blocks:
+            return self._member(len(self._pending))
+        return b""
+
+    def _member(self, cut: int) -> bytes:
+        """Compress the first ``cut`` pending bytes into a gzip member and index it."""
+        raw = bytes(self._pending[:cut])
+        del self._pending[:cut]
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        member = compressor.compress(raw) + compressor.flush()
+        self.index.add(len(member), raw)
+        return member
+
+
+def index_gzip_file(path: str, buffer_size: int, block_size: int = DEFAULT_BLOCK_SIZE) -> Optional[BlockIndex]:
+    """Index the members of a local multi-member gzip file, such as one written by ``BlockCompressor``.
+
+    Used for files that were compressed without their index being kept, e.g. gzipped in place by a run whose
+    upload failed. A file is given up on as soon as its first member outgrows ``MAX_BLOCK_FACTOR`` blocks,
+    so an ordinary single-member gzip file costs little more than one block's decompression.
+
+    Args:
+        path (str): Path of the gzip file.
+        buffer_size (int): Size of each chunk read from the file.
+        block_size (int): Uncompressed bytes per block the file was written with.
+
+    Returns:
+        Optional[BlockIndex]: The index, or None if the file has a single member, a member too large to be a
+            block, or is not valid gzip.
+    """
+    try:
+        return _index_members(path, buffer_size, block_size)
+    except zlib.error:
+        return None
+
+
+def _index_members(path: str, buffer_size: int, block_size: int) -> Optional[BlockIndex]:
+    """Index the members of a gzip file, letting zlib errors through."""
+    index = BlockIndex()
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    raw = bytearray()
+    position = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(buffer_size):
+            data = chunk
+            while data:
+                raw += decompressor.decompress(data)
+                if not decompressor.eof:
+                    position += len(data)
+                    break
+                end = position + len(data) - len(decompressor.unused_data)
+                index.add(end - index.compressed_bytes, bytes(raw))
+                position, data = end, decompressor.unused_data
+                decompressor, raw = zlib.decompressobj(GZIP_WBITS), bytearray()
+            if len(raw) > MAX_BLOCK_FACTOR * block_size:
+                return None
+    if raw or position != index.compressed_bytes or len(index) < 2:
+        return None
+    return index
+
+
+def read_block_index(s3_client, bucket: str, key: str) -> Optional[BlockIndex]:
+    """Download the block index of an object from S3.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket (str): The bucket.
+        key (str): The index's key, from ``index_key``.
+
+    Returns:
+        Optional[BlockIndex]: The index, or None if the object has none.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchKey":
+            return None
+        raise
+    return BlockIndex.from_json(response["Body"].read())
+
+
+def byte_ranges(blocks: Iterable[Block], max_range: int = DEFAULT_MAX_RANGE) -> List[Tuple[int, int]]:
+    """Merge blocks into the byte ranges to fetch them with, adjacent blocks sharing a range up to ``max_range``.
+
+    Args:
+        blocks (Iterable[Block]): Blocks in object order.
+        max_range (int): Largest range in bytes, unless a single block is larger.
+
+    Returns:
+        List[Tuple[int, int]]: First and last byte, inclusive, of each range, as in an HTTP ``Range`` header.
+    """
+    ranges: List[Tuple[int, int]] = []
+    for block in blocks:
+        last = block.offset + block.length - 1
+        if ranges and ranges[-1][1] + 1 == block.offset and last - ranges[-1][0] < max_range:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((block.offset, last))
+    return ranges
+
+
+def read_blocks(
+    s3_client,
+    bucket: str,
+    key: str,
+    blocks: Iterable[Block],
+    workers: int = 4,
+    max_range: int = DEFAULT_MAX_RANGE,
+) -> Iterator[bytes]:
+    """Fetch blocks of a seekable object with range GETs and decompress them, several at a time.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket (str): The bucket.
+        key (str): The object's key.
+        blocks (Iterable[Block]): Blocks to fetch, in object order, e.g. from ``BlockIndex.covering``.
+        workers (int): Number of ranges fetched and decompressed at once.
+        max_range (int): Largest range fetched with one GET.
+
+    Yields:
+        bytes: The uncompressed contents of each range, in object order.
+    """
+
+    def fetch(byte_range: Tuple[int, int]) -> bytes:
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={byte_range[0]}-{byte_range[1]}")
+        return gzip.decompress(response["Body"].read())
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(fetch, byte_ranges(blocks, max_range))
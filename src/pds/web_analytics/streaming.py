@@ -0,0 +1,437 @@
+"""Streaming gzip compression straight into S3 multipart uploads."""
+import base64
+import hashlib
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any
+from typing import BinaryIO
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from .checksum import ChecksumHasher
+from .checksum import FileChecksum
+from .compression import DEFAULT_GZIP_BUFFER_SIZE
+from .compression import DEFAULT_GZIP_LEVEL
+from .line_filter import FilterRule
+from .line_filter import LineFilter
+from .seekable import BlockCompressor
+from .seekable import BlockIndex
+from .seekable import GZIP_WBITS
+from .summary import LogSummarizer
+from .summary import LogSummary
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# Number of compressed parts allowed to wait for an uploader before the compressor blocks
+DEFAULT_QUEUE_DEPTH = 2
+DEFAULT_UPLOAD_THREADS = 2
+# Number of compressed parts a copy may fall behind the upload it copies before it is abandoned
+DEFAULT_COPY_LAG = 4
+
+
+class StreamStats(NamedTuple):
+    """Outcome of streaming a single file to S3.
+
+    Attributes:
+        raw_bytes (int): Bytes read from the local file.
+        compressed_bytes (int): Bytes written to S3.
+        parts (int): Number of multipart parts uploaded, or 0 for a single ``put_object``.
+        seconds (float): Wall time from first read to completed upload.
+        etag (Optional[str]): ETag of the uploaded object.
+        checksum (Optional[FileChecksum]): Checksums of the compressed bytes uploaded.
+        summary (Optional[LogSummary]): Summary of the uploaded records, if one was asked for.
+        dropped (Optional[Dict[str, int]]): Records left out by the line filter, by rule name, if one was given.
+        blocks (Optional[BlockIndex]): Index of the object's blocks, if it was written seekable.
+    """
+
+    raw_bytes: int
+    compressed_bytes: int
+    parts: int
+    seconds: float
+    etag: Optional[str] = None
+    checksum: Optional[FileChecksum] = None
+    summary: Optional[LogSummary] = None
+    dropped: Optional[Dict[str, int]] = None
+    blocks: Optional[BlockIndex] = None
+
+
+class GzipStreamUploader:
+    """Compresses a local file in chunks and uploads the gzip stream to S3 without a local copy.
+
+    The calling thread reads and compresses the file, cutting the output into parts that are handed to a
+    small pool of uploader threads through a bounded queue. When the uploaders fall behind, the queue fills
+    and the compressor blocks, so memory stays under ``(queue_depth + upload_threads + 1) * part_size``
+    regardless of the file size. Outputs smaller than one part are sent with a single ``put_object``, along
+    with their SHA256 for S3 to verify.
+
+    Attributes:
+        s3_client: boto3 S3 client.
+        bucket_name (str): Target bucket.
+        level (int): zlib compression level.
+        buffer_size (int): Size of each chunk read from the local file.
+        part_size (int): Size of each multipart part.
+        queue_depth (int): Number of parts that may wait for an uploader.
+        upload_threads (int): Number of threads uploading parts of one file.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket_name: str,
+        level: int = DEFAULT_GZIP_LEVEL,
+        buffer_size: int = DEFAULT_GZIP_BUFFER_SIZE,
+        part_size: int = DEFAULT_PART_SIZE,
+        queue_depth: int = DEFAULT_QUEUE_DEPTH,
+        upload_threads: int = DEFAULT_UPLOAD_THREADS,
+    ) -> None:
+        """Initialize the uploader."""
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes, got {part_size}")
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.level = level
+        self.buffer_size = buffer_size
+        self.part_size = part_size
+        self.queue_depth = queue_depth
+        self.upload_threads = upload_threads
+
+    def upload(
+        self,
+        local_path: str,
+        s3_key: str,
+        extra_args: Optional[Dict[str, Any]] = None,
+        callback: Optional[Callable[[int], None]] = None,
+        summarize: bool = False,
+        line_filter: Tuple[FilterRule, ...] = (),
+        copies: Sequence["StreamCopy"] = (),
+        block_size: int = 0,
+    ) -> StreamStats:
+        """Compress a local file and upload it to S3 as a gzip object.
+
+        Args:
+            local_path (str): Local file to compress; it is only read, never modified.
+            s3_key (str): S3 key for the gzip object.
+            extra_args (Optional[Dict[str, Any]]): Extra ``put_object``/``create_multipart_upload``
+                parameters, such as ``ContentType``.
+            callback (Optional[Callable[[int], None]]): Called with the size of each part, or of the whole
+                object, before it is sent, like the ``Callback`` of ``upload_file``.
+            summarize (bool): Also summarize the lines and timestamps of the uploaded records.
+            line_filter (Tuple[FilterRule, ...]): Rules for records to leave out of the upload. Default is none.
+            copies (Sequence[StreamCopy]): Copies of the upload to other destinations, handed every compressed part
+                as it is cut, so the file is read and compressed once for all of them. They get the last part once
+                the upload is complete, and are abandoned if it fails.
+            block_size (int): Uncompressed bytes per independently compressed block of a seekable object, or 0 for
+                a single gzip member.
+
+        Returns:
+            StreamStats: Sizes and timing for the upload.
+
+        Raises:
+            Exception: Any error from reading the file or from S3. A started multipart upload is aborted, and so
+                are the copies.
+        """
+        with open(local_path, "rb") as f_in:
+            return self.upload_fileobj(f_in, s3_key, extra_args, callback, summarize, line_filter, copies, block_size)
+
+    def upload_fileobj(
+        self,
+        f_in: BinaryIO,
+        s3_key: str,
+        extra_args: Optional[Dict[str, Any]] = None,
+        callback: Optional[Callable[[int], None]] = None,
+        summarize: bool = False,
+        line_filter: Tuple[FilterRule, ...] = (),
+        copies: Sequence["StreamCopy"] = (),
+        block_size: int = 0,
+    ) -> StreamStats:
+        """Compress the contents of a readable binary stream and upload them to S3 as a gzip object.
+
+        Takes the same arguments as ``upload``, but reads from ``f_in`` until it is exhausted instead of opening
+        a local file.
+        """
+        extra_args = extra_args or {}
+        start_time = time.monotonic()
+        blocks = BlockCompressor(self.level, block_size) if block_size else None
+        compressor = blocks if blocks is not None else zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        hasher = ChecksumHasher()
+        summarizer = LogSummarizer() if summarize else None
+        filtered = LineFilter(line_filter) if line_filter else None
+        pending = bytearray()
+        raw_bytes = 0
+        compressed_bytes = 0
+        upload: Optional[_MultipartUpload] = None
+
+        try:
+            while chunk := f_in.read(self.buffer_size):
+                raw_bytes += len(chunk)
+                if filtered is not None:
+                    chunk = filtered.update(chunk)
+                pending += compressor.compress(chunk)
+                if summarizer is not None:
+                    summarizer.update(chunk)
+                while len(pending) >= self.part_size:
+                    if upload is None:
+                        upload = _MultipartUpload(self, s3_key, extra_args)
+                    if callback:
+                        callback(self.part_size)
+                    part = bytes(pending[: self.part_size])
+                    hasher.update(part)
+                    upload.put(part)
+                    for copy in copies:
+                        copy.put(part)
+                    compressed_bytes += self.part_size
+                    del pending[: self.part_size]
+            if filtered is not None:
+                chunk = filtered.flush()
+                pending += compressor.compress(chunk)
+                if summarizer is not None:
+                    summarizer.update(chunk)
+            pending += compressor.flush()
+            compressed_bytes += len(pending)
+            if callback:
+                callback(len(pending))
+            last_part = bytes(pending)
+            hasher.update(last_part)
+
+            if upload is None:
+                response = self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=last_part,
+                    ChecksumSHA256=hasher.result().sha256,
+                    **extra_args,
+                )
+                parts = 0
+            else:
+                upload.put(last_part)
+                response = upload.complete()
+                parts = len(upload.parts)
+            # Copies are only completed once the upload they copy is, so none outlives a failed upload
+            for copy in copies:
+                copy.finish(last_part, hasher.result())
+        except BaseException:
+            for copy in copies:
+                copy.abandon()
+            if upload is not None:
+                upload.abort()
+            raise
+
+        return StreamStats(
+            raw_bytes,
+            compressed_bytes,
+            parts,
+            time.monotonic() - start_time,
+            response.get("ETag"),
+            hasher.result(),
+            summarizer.result() if summarizer is not None else None,
+            filtered.dropped if filtered is not None else None,
+            blocks.index if blocks is not None else None,
+        )
+
+
+class StreamCopy:
+    """A copy of a streamed upload to another destination, built from the parts of the upload it copies.
+
+    The compressor hands each part over without waiting, and ``run``, on a thread of the destination, uploads them
+    as a multipart upload of its own, or a single ``put_object`` if there is only one. A copy therefore never holds
+    back the upload it copies: if it falls more than ``max_lag`` parts behind, e.g. because the destination is slow
+    or all its threads are busy, it is abandoned, its parts are released and ``run`` fails.
+
+    Attributes:
+        uploader (GzipStreamUploader): Uploader of the destination, providing its client, bucket and threads.
+        s3_key (str): S3 key of the copy.
+        extra_args (Dict[str, Any]): Extra ``put_object``/``create_multipart_upload`` parameters.
+        callback (Optional[Callable[[int], None]]): Called with the size of each part before it is sent.
+        max_lag (int): Number of parts the copy may have waiting.
+    """
+
+    def __init__(
+        self,
+        uploader: GzipStreamUploader,
+        s3_key: str,
+        extra_args: Optional[Dict[str, Any]] = None,
+        callback: Optional[Callable[[int], None]] = None,
+        max_lag: int = DEFAULT_COPY_LAG,
+    ) -> None:
+        """Start with no parts."""
+        self.uploader = uploader
+        self.s3_key = s3_key
+        self.extra_args = extra_args or {}
+        self.callback = callback
+        self.max_lag = max_lag
+        self.abandoned = False
+        self.finished = False
+        self._queue: queue.Queue = queue.Queue()
+
+    def put(self, part: bytes) -> None:
+        """Hand over the next part, abandoning the copy if it has fallen too far behind."""
+        if self.abandoned:
+            return
+        if self._queue.qsize() >= self.max_lag:
+            logger.warning(f"Copy to s3://{self.uploader.bucket_name}/{self.s3_key} fell behind, abandoning it")
+            self.abandon()
+            return
+        self._queue.put((part, None))
+
+    def finish(self, last_part: bytes, checksum: FileChecksum) -> None:
+        """Hand over the last part, with the checksums of the whole object."""
+        if not self.abandoned:
+            self.finished = True
+            self._queue.put((last_part, checksum))
+
+    def abandon(self) -> None:
+        """Give up on a copy that is not finished, dropping the parts waiting for it."""
+        if self.abandoned or self.finished:
+            return
+        self.abandoned = True
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._queue.put(None)
+
+    def run(self) -> Optional[str]:
+        """Upload the parts as they are handed over, until the last one.
+
+        Returns:
+            Optional[str]: ETag of the copy.
+
+        Raises:
+            Exception: If the copy was abandoned, or any error from S3. A started multipart upload is aborted.
+        """
+        uploader = self.uploader
+        upload: Optional[_MultipartUpload] = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None or self.abandoned:
+                    raise RuntimeError("Copy abandoned")
+                part, checksum = item
+                if self.callback:
+                    self.callback(len(part))
+                if checksum is not None and upload is None:
+                    response = uploader.s3_client.put_object(
+                        Bucket=uploader.bucket_name,
+                        Key=self.s3_key,
+                        Body=part,
+                        ChecksumSHA256=checksum.sha256,
+                        **self.extra_args,
+                    )
+                    return response.get("ETag")
+                if upload is None:
+                    upload = _MultipartUpload(uploader, self.s3_key, self.extra_args)
+                upload.put(part)
+                if checksum is not None:
+                    return upload.complete().get("ETag")
+        except BaseException:
+            self.abandon()
+            if upload is not None:
+                upload.abort()
+            raise
+
+
+class _MultipartUpload:
+    """A multipart upload fed by a bounded queue and drained by uploader threads.
+
+    Every part carries its SHA256 for S3 to verify, as in ``transfer.upload_multipart``.
+    """
+
+    def __init__(self, uploader: GzipStreamUploader, s3_key: str, extra_args: Dict[str, Any]) -> None:
+        """Create the multipart upload and start the uploader threads."""
+        self.s3_client = uploader.s3_client
+        self.bucket_name = uploader.bucket_name
+        self.s3_key = s3_key
+        response = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=s3_key, ChecksumAlgorithm="SHA256", **extra_args
+        )
+        self.upload_id = response["UploadId"]
+        self.parts: Dict[int, Tuple[str, str]] = {}
+        self.error: Optional[BaseException] = None
+        self.next_part_number = 1
+        self.stopped = False
+        self.queue: queue.Queue = queue.Queue(maxsize=uploader.queue_depth)
+        self.threads: List[threading.Thread] = [
+            threading.Thread(target=self._upload_parts, daemon=True) for _ in range(uploader.upload_threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, body: bytes) -> None:
+        """Queue the next part, blocking while the queue is full."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((self.next_part_number, body))
+        self.next_part_number += 1
+
+    def _upload_parts(self) -> None:
+        """Upload queued parts until a stop marker is received."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            part_number, body = item
+            if self.error is not None:
+                # Keep draining so the compressor never blocks on a failed upload
+                continue
+            try:
+                checksum = base64.b64encode(hashlib.sha256(body).digest()).decode("ascii")
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=self.s3_key,
+                    UploadId=self.upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                    ChecksumSHA256=checksum,
+                )
+                self.parts[part_number] = (response["ETag"], checksum)
+            except BaseException as e:
+                self.error = e
+
+    def _stop(self) -> None:
+        """Signal the uploader threads to exit once the queue is drained and wait for them."""
+        if self.stopped:
+            return
+        self.stopped = True
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def complete(self) -> Dict[str, Any]:
+        """Wait for all parts and complete the upload, returning the ``complete_multipart_upload`` response."""
+        self._stop()
+        if self.error is not None:
+            raise self.error
+        return self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"ETag": etag, "PartNumber": number, "ChecksumSHA256": checksum}
+                    for number, (etag, checksum) in sorted(self.parts.items())
+                ]
+            },
+        )
+
+    def abort(self) -> None:
+        """Stop the uploader threads and abort the multipart upload."""
+        if self.error is None:
+            self.error = RuntimeError("Upload aborted")
+        self._stop()
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id)
+        except Exception as e:
+            logger.warning(f"Failed to abort multipart upload {self.upload_id} for {self.s3_key}: {str(e)}")
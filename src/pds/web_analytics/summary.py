@@ -0,0 +1,228 @@
+"""Summaries of log files computed while they are compressed: line counts, sizes and time ranges."""
+import re
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Pattern
+from typing import Tuple
+
+from .file_dates import MONTHS
+from .log_formats import detect_format
+
+# Amount of the start of a file used to work out its format
+DETECT_SIZE = 64 * 1024
+
+BYTE_MONTHS = {name.encode(): number for name, number in MONTHS.items()}
+
+
+def _apache_epoch(timestamp: bytes) -> float:
+    """Convert an Apache ``25/Dec/2023:10:30:45 +0000`` timestamp to a Unix timestamp."""
+    offset = int(timestamp[22:24]) * 60 + int(timestamp[24:26])
+    tz = timezone(timedelta(minutes=-offset if timestamp[21:22] == b"-" else offset))
+    return _epoch(int(timestamp[7:11]), BYTE_MONTHS[timestamp[3:6]], int(timestamp[:2]), timestamp[12:20], tz)
+
+
+def _w3c_epoch(timestamp: bytes) -> float:
+    """Convert a W3C ``2023-12-25 10:30:45`` timestamp, which is always UTC, to a Unix timestamp."""
+    return _epoch(int(timestamp[:4]), int(timestamp[5:7]), int(timestamp[8:10]), timestamp[11:], timezone.utc)
+
+
+def _xferlog_epoch(timestamp: bytes) -> float:
+    """Convert an xferlog ``Mon Dec 25 10:30:45 2023`` timestamp, in the host's local time, to a Unix timestamp."""
+    _, month, day, clock, year = timestamp.split()
+    return _epoch(int(year), BYTE_MONTHS[month], int(day), clock, None)
+
+
+def _epoch(year: int, month: int, day: int, clock: bytes, tz: Optional[timezone]) -> float:
+    """Build a Unix timestamp from a date and an ``HH:MM:SS`` time."""
+    hour, minute, second = (int(field) for field in clock.split(b":"))
+    return datetime(year, month, day, hour, minute, second, tzinfo=tz).timestamp()
+
+
+class TimestampStyle(NamedTuple):
+    """How one family of log formats writes the timestamp of each record.
+
+    Attributes:
+        name (str): Name of the style, as given in ``LogFormat.timestamps``.
+        pattern (Pattern[bytes]): Finds the timestamp of every record in a block of lines, as its one group.
+        day_length (int): Length of the leading part of a timestamp that names its day, or 0 if timestamps sort
+            chronologically as they are. Timestamps of the same day sort chronologically as they are.
+        day_key (Callable[[bytes], tuple]): Orders the days of timestamps chronologically.
+        to_epoch (Callable[[bytes], float]): Converts a timestamp to a Unix timestamp.
+    """
+
+    name: str
+    pattern: Pattern[bytes]
+    day_length: int
+    day_key: Callable[[bytes], tuple]
+    to_epoch: Callable[[bytes], float]
+
+
+# Apache timestamps keep one time zone within a file, so those of the same day sort as they are
+TIMESTAMP_STYLES = (
+    TimestampStyle(
+        "apache",
+        re.compile(rb"\[(\d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}:\d{2} [-+]\d{4})\]"),
+        11,
+        lambda timestamp: (timestamp[7:11], BYTE_MONTHS.get(timestamp[3:6], 0), timestamp[:2]),
+        _apache_epoch,
+    ),
+    TimestampStyle(
+        "w3c",
+        re.compile(rb"^(\d{4}-\d{2}-\d{2}[ \tT]\d{2}:\d{2}:\d{2})", re.M),
+        0,
+        lambda timestamp: (),
+        _w3c_epoch,
+    ),
+    TimestampStyle(
+        "xferlog",
+        re.compile(rb"^([A-Z][a-z]{2} [A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2} \d{4})", re.M),
+        10,
+        lambda timestamp: (timestamp[-4:], BYTE_MONTHS.get(timestamp[4:7], 0), int(timestamp[8:10])),
+        _xferlog_epoch,
+    ),
+)
+STYLES_BY_NAME = {style.name: style for style in TIMESTAMP_STYLES}
+
+
+def detect_style(head: bytes) -> Tuple[Optional[str], Optional[TimestampStyle]]:
+    """Detect the log format of the start of a file and pick the timestamp style of its records.
+
+    Logs in an unrecognized format are timed by whichever timestamp style most of their first records use.
+
+    Args:
+        head (bytes): The first bytes of the file, normally ``DETECT_SIZE`` of them.
+
+    Returns:
+        Tuple[Optional[str], Optional[TimestampStyle]]: Name of the format, or None if it was not recognized, and
+            the timestamp style, or None if no record had a timestamp.
+    """
+    log_format = detect_format(head)
+    if log_format is not None:
+        return log_format.name, STYLES_BY_NAME[log_format.timestamps]
+    counts: Dict[str, int] = {style.name: len(style.pattern.findall(head)) for style in TIMESTAMP_STYLES}
+    best = max(TIMESTAMP_STYLES, key=lambda style: counts[style.name])
+    return None, best if counts[best.name] else None
+
+
+def sort_key(style: TimestampStyle, timestamp: bytes) -> tuple:
+    """Order timestamps of a style chronologically."""
+    return (style.day_key(timestamp), timestamp[style.day_length :])
+
+
+def time_range(style: TimestampStyle, block: bytes, end: int) -> Optional[Tuple[bytes, bytes]]:
+    """Find the earliest and latest timestamps of the complete lines in ``block[:end]``.
+
+    Args:
+        style (TimestampStyle): Timestamp style of the records.
+        block (bytes): The lines.
+        end (int): End of the lines to scan, just after a line ending or at the end of the log.
+
+    Returns:
+        Optional[Tuple[bytes, bytes]]: The earliest and latest timestamps as they are written, or None if no
+            record had one.
+    """
+    timestamps: List[bytes] = style.pattern.findall(block, 0, end)
+    if not timestamps:
+        return None
+    # Usually every record of a block is from the same day, which one count over the block confirms
+    if not style.day_length or block.count(timestamps[0][: style.day_length], 0, end) == len(timestamps):
+        return min(timestamps), max(timestamps)
+    return min(timestamps, key=lambda t: sort_key(style, t)), max(timestamps, key=lambda t: sort_key(style, t))
+
+
+class LogSummary(NamedTuple):
+    """Summary of the contents of one log file.
+
+    Attributes:
+        lines (int): Number of lines.
+        raw_bytes (int): Size of the uncompressed contents in bytes.
+        start (Optional[float]): Earliest record timestamp, as a Unix timestamp, or None if no record had one.
+        end (Optional[float]): Latest record timestamp, as a Unix timestamp, or None if no record had one.
+        log_format (Optional[str]): The detected log format, or None if it was not recognized.
+    """
+
+    lines: int
+    raw_bytes: int
+    start: Optional[float]
+    end: Optional[float]
+    log_format: Optional[str]
+
+
+class LogSummarizer:
+    """Builds a LogSummary from the uncompressed contents of a file as it is fed through a compressor.
+
+    The log format, and with it the timestamp style, is detected from the first ``DETECT_SIZE`` bytes. Logs in
+    an unrecognized format are timed by whichever timestamp style most of their first records use. After that
+    each block of complete lines costs one regular expression scan and a ``min``/``max`` over its matches, and
+    only the earliest and latest timestamps of the block are converted to Unix timestamps.
+    """
+
+    def __init__(self) -> None:
+        """Start empty."""
+        self._lines = 0
+        self._raw_bytes = 0
+        self._head = bytearray()
+        self._tail = b""
+        self._style: Optional[TimestampStyle] = None
+        self._format: Optional[str] = None
+        self._detected = False
+        self._first: Optional[bytes] = None
+        self._last: Optional[bytes] = None
+
+    def update(self, data: bytes) -> None:
+        """Add the next bytes of the file."""
+        self._raw_bytes += len(data)
+        self._lines += data.count(b"\n")
+        if not self._detected:
+            self._head += data
+            if len(self._head) < DETECT_SIZE:
+                return
+            data, self._head = bytes(self._head), bytearray()
+            self._detect(data)
+
+        block = self._tail + data if self._tail else data
+        cut = block.rfind(b"\n") + 1
+        self._tail = block[cut:]
+        if cut:
+            self._scan(block, cut)
+
+    def result(self) -> LogSummary:
+        """Return the summary of the bytes added so far."""
+        lines = self._lines
+        if not self._detected:
+            self._tail, self._head = bytes(self._head), bytearray()
+            self._detect(self._tail)
+        if self._tail:
+            if not self._tail.endswith(b"\n"):
+                lines += 1
+            self._scan(self._tail, len(self._tail))
+            self._tail = b""
+        style = self._style
+        if style is None or self._first is None or self._last is None:
+            return LogSummary(lines, self._raw_bytes, None, None, self._format)
+        return LogSummary(lines, self._raw_bytes, style.to_epoch(self._first), style.to_epoch(self._last), self._format)
+
+    def _detect(self, head: bytes) -> None:
+        """Detect the log format and pick the timestamp style of its records."""
+        self._detected = True
+        self._format, self._style = detect_style(head)
+
+    def _scan(self, block: bytes, end: int) -> None:
+        """Fold the timestamps of the lines in ``block[:end]`` into the time range."""
+        style = self._style
+        if style is None:
+            return
+        found = time_range(style, block, end)
+        if found is None:
+            return
+        first, last = found
+        if self._first is None or sort_key(style, first) < sort_key(style, self._first):
+            self._first = first
+        if self._last is None or sort_key(style, last) > sort_key(style, self._last):
+            self._last = last
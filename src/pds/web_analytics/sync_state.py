@@ -0,0 +1,668 @@
+"""Local SQLite record of the files S3Sync has uploaded."""
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from .manifest import ManifestEntry
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_UPLOADED = "uploaded"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    s3_key TEXT NOT NULL,
+    etag TEXT,
+    status TEXT NOT NULL,
+    updated REAL NOT NULL,
+    checksum TEXT
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime_ns);
+CREATE INDEX IF NOT EXISTS files_s3_key ON files (s3_key);
+CREATE TABLE IF NOT EXISTS scans (
+    src_path TEXT PRIMARY KEY,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS multipart_uploads (
+    path TEXT PRIMARY KEY,
+    s3_key TEXT NOT NULL,
+    upload_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    part_size INTEGER NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS multipart_parts (
+    upload_id TEXT NOT NULL,
+    part_number INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    checksum TEXT,
+    PRIMARY KEY (upload_id, part_number)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    s3_key TEXT PRIMARY KEY,
+    manifest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    raw_bytes INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    log_format TEXT,
+    published INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS summaries_manifest ON summaries (manifest, published);
+CREATE TABLE IF NOT EXISTS copies (
+    destination TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    s3_key TEXT NOT NULL,
+    etag TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (destination, path)
+);
+CREATE TABLE IF NOT EXISTS batch_members (
+    s3_key TEXT NOT NULL,
+    path TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (s3_key, path)
+);
+CREATE TABLE IF NOT EXISTS throughput (
+    finished REAL NOT NULL,
+    node TEXT NOT NULL,
+    duration REAL NOT NULL,
+    files INTEGER NOT NULL,
+    raw_bytes INTEGER NOT NULL,
+    bytes_uploaded INTEGER NOT NULL,
+    PRIMARY KEY (finished, node)
+);
+"""
+# Columns added since the first release, created in existing databases when they are opened
+MIGRATIONS = (("files", "checksum", "TEXT"),)
+RECORD_COLUMNS = "path, size, mtime_ns, s3_key, etag, status, checksum"
+SUMMARY_COLUMNS = "s3_key, size, raw_bytes, lines, start_time, end_time, log_format"
+COPY_COLUMNS = "destination, path, size, mtime_ns, s3_key, etag"
+THROUGHPUT_COLUMNS = "finished, node, duration, files, raw_bytes, bytes_uploaded"
+# Seconds the throughput of past runs is kept for
+THROUGHPUT_HISTORY = 30 * 86400
+
+
+class FileRecord(NamedTuple):
+    """State recorded for one local file.
+
+    Attributes:
+        path (str): Local file path.
+        size (int): File size in bytes when it was recorded.
+        mtime_ns (int): File modification time in nanoseconds when it was recorded.
+        s3_key (str): The S3 key the file is uploaded to.
+        etag (Optional[str]): ETag of the S3 object, if known.
+        status (str): ``pending`` while an upload is in flight, ``uploaded`` once it is confirmed.
+        checksum (Optional[str]): Base64 SHA256 of the uploaded bytes, if known.
+    """
+
+    path: str
+    size: int
+    mtime_ns: int
+    s3_key: str
+    etag: Optional[str]
+    status: str
+    checksum: Optional[str] = None
+
+
+class CopyRecord(NamedTuple):
+    """A copy of a local file in one of the additional destinations.
+
+    Attributes:
+        destination (str): Name of the destination, ``s3://bucket/prefix``.
+        path (str): Local file path.
+        size (int): File size in bytes when it was copied.
+        mtime_ns (int): File modification time in nanoseconds when it was copied.
+        s3_key (str): The S3 key of the copy.
+        etag (Optional[str]): ETag of the copy, if known.
+    """
+
+    destination: str
+    path: str
+    size: int
+    mtime_ns: int
+    s3_key: str
+    etag: Optional[str]
+
+
+class ThroughputRecord(NamedTuple):
+    """What one run uploaded for one node.
+
+    Attributes:
+        finished (float): When the run finished, as a Unix timestamp.
+        node (str): The node.
+        duration (float): Duration of the whole run in seconds, shared by all of its nodes.
+        files (int): Files uploaded for the node.
+        raw_bytes (int): Size of those files before compression.
+        bytes_uploaded (int): Bytes sent to S3 for them.
+    """
+
+    finished: float
+    node: str
+    duration: float
+    files: int
+    raw_bytes: int
+    bytes_uploaded: int
+
+
+class MultipartRecord(NamedTuple):
+    """A multipart upload started for a local file and not yet completed.
+
+    Attributes:
+        path (str): Local file path.
+        s3_key (str): The S3 key being uploaded to.
+        upload_id (str): The S3 multipart upload ID.
+        size (int): File size in bytes when the upload started.
+        mtime_ns (int): File modification time in nanoseconds when the upload started.
+        part_size (int): Size of every part but the last.
+        started (float): When the upload started, as a Unix timestamp.
+        parts (Dict[int, Tuple[str, Optional[str]]]): ETag and base64 SHA256 of each part S3 has confirmed,
+            by part number.
+    """
+
+    path: str
+    s3_key: str
+    upload_id: str
+    size: int
+    mtime_ns: int
+    part_size: int
+    started: float
+    parts: Dict[int, Tuple[str, Optional[str]]]
+
+
+class SyncState:
+    """A SQLite-backed journal of local files and their S3 upload status.
+
+    A file is recorded as ``pending`` before its upload starts and ``uploaded`` once S3 has confirmed it,
+    either by accepting the upload or because the key was already there. On later runs a file whose size and
+    modification time still match an ``uploaded`` record can be skipped without touching S3. A run that is
+    interrupted leaves ``pending`` records behind, and only those files need to be checked against S3 again.
+
+    The upload IDs and confirmed parts of multipart uploads are recorded as well, so an upload interrupted
+    part way through a large file can be resumed by a later run. So are the summaries of uploaded logs, until
+    they are published to their manifests in S3 and afterwards as a local copy of the manifests. Copies of files
+    in additional destinations are recorded per destination. Files coalesced into batch objects are recorded
+    under the batch's key, with the byte range of each file the batch holds. The throughput of recent runs is
+    kept per node, to estimate how long a sync will take.
+
+    The connection is shared between threads and serialized with a lock.
+
+    Attributes:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path: str, read_only: bool = False) -> None:
+        """Open (creating if needed) the state database.
+
+        Args:
+            path (str): Path of the database file.
+            read_only (bool): Only read an existing database, never creating, migrating or writing to it.
+
+        Raises:
+            sqlite3.Error: If a database opened read-only does not exist or predates the current schema.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        if read_only:
+            uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            missing = [
+                table for table in re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)", SCHEMA) if table not in tables
+            ]
+            missing += [
+                f"{table}.{column}"
+                for table, column, _ in MIGRATIONS
+                if table in tables and column not in self._columns(table)
+            ]
+            if missing:
+                self._conn.close()
+                raise sqlite3.OperationalError(f"State database {path} predates {', '.join(missing)}")
+            return
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        for table, column, column_type in MIGRATIONS:
+            if column not in self._columns(table):
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _columns(self, table: str) -> List[str]:
+        """Return the names of the columns of a table."""
+        return [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def get(self, path: str) -> Optional[FileRecord]:
+        """Return the record for a local file, if any.
+
+        Args:
+            path (str): Local file path.
+
+        Returns:
+            Optional[FileRecord]: The record, or None if the file has never been seen.
+        """
+        with self._lock:
+            row = self._conn.execute(f"SELECT {RECORD_COLUMNS} FROM files WHERE path = ?", (path,)).fetchone()
+        return FileRecord(*row) if row else None
+
+    def is_synced(self, path: str, size: int, mtime_ns: int) -> bool:
+        """Check whether a file is confirmed uploaded and unchanged since.
+
+        Args:
+            path (str): Local file path.
+            size (int): Current file size in bytes.
+            mtime_ns (int): Current file modification time in nanoseconds.
+
+        Returns:
+            bool: True if the file can be skipped without asking S3.
+        """
+        record = self.get(path)
+        return (
+            record is not None
+            and record.status == STATUS_UPLOADED
+            and record.size == size
+            and record.mtime_ns == mtime_ns
+        )
+
+    def _upsert(
+        self,
+        path: str,
+        size: int,
+        mtime_ns: int,
+        s3_key: str,
+        etag: Optional[str],
+        status: str,
+        checksum: Optional[str] = None,
+    ) -> None:
+        """Insert or replace the record for a file."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, s3_key, etag, status, updated, checksum) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, s3_key, etag, status, time.time(), checksum),
+            )
+
+    def mark_pending(self, path: str, size: int, mtime_ns: int, s3_key: str) -> None:
+        """Record that an upload of a file is about to start.
+
+        Args:
+            path (str): Local file path.
+            size (int): File size in bytes.
+            mtime_ns (int): File modification time in nanoseconds.
+            s3_key (str): The S3 key being uploaded to.
+        """
+        self._upsert(path, size, mtime_ns, s3_key, None, STATUS_PENDING)
+
+    def mark_uploaded(
+        self,
+        path: str,
+        size: int,
+        mtime_ns: int,
+        s3_key: str,
+        etag: Optional[str] = None,
+        checksum: Optional[str] = None,
+    ) -> None:
+        """Record that a file is confirmed present in S3.
+
+        Args:
+            path (str): Local file path.
+            size (int): File size in bytes.
+            mtime_ns (int): File modification time in nanoseconds.
+            s3_key (str): The S3 key holding the file.
+            etag (Optional[str]): ETag of the S3 object, if known.
+            checksum (Optional[str]): Base64 SHA256 of the uploaded bytes, if known.
+        """
+        self._upsert(path, size, mtime_ns, s3_key, etag, STATUS_UPLOADED, checksum)
+
+    def forget(self, path: str) -> None:
+        """Remove the record for a file and its copies, e.g. after the local file is deleted.
+
+        Args:
+            path (str): Local file path.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM copies WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM batch_members WHERE path = ?", (path,))
+
+    def get_copy(self, destination: str, path: str) -> Optional[CopyRecord]:
+        """Return the record of a file's copy in a destination, if any.
+
+        Args:
+            destination (str): Name of the destination.
+            path (str): Local file path.
+
+        Returns:
+            Optional[CopyRecord]: The record, or None if the file has not been copied there.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {COPY_COLUMNS} FROM copies WHERE destination = ? AND path = ?", (destination, path)
+            ).fetchone()
+        return CopyRecord(*row) if row else None
+
+    def is_copied(self, destination: str, path: str, size: int, mtime_ns: int) -> bool:
+        """Check whether a file is copied to a destination and unchanged since.
+
+        Args:
+            destination (str): Name of the destination.
+            path (str): Local file path.
+            size (int): Current file size in bytes.
+            mtime_ns (int): Current file modification time in nanoseconds.
+
+        Returns:
+            bool: True if the copy is up to date.
+        """
+        record = self.get_copy(destination, path)
+        return record is not None and record.size == size and record.mtime_ns == mtime_ns
+
+    def mark_copied(
+        self, destination: str, path: str, size: int, mtime_ns: int, s3_key: str, etag: Optional[str] = None
+    ) -> None:
+        """Record that a file is confirmed present in a destination.
+
+        Args:
+            destination (str): Name of the destination.
+            path (str): Local file path.
+            size (int): File size in bytes.
+            mtime_ns (int): File modification time in nanoseconds.
+            s3_key (str): The S3 key of the copy.
+            etag (Optional[str]): ETag of the copy, if known.
+        """
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO copies ({COPY_COLUMNS}, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (destination, path, size, mtime_ns, s3_key, etag, time.time()),
+            )
+
+    def add_batch(self, s3_key: str, members: List[Tuple[str, int, int]]) -> None:
+        """Record the byte ranges of the files a batch object holds.
+
+        Args:
+            s3_key (str): The batch's S3 key.
+            members (List[Tuple[str, int, int]]): Local file path, and start and end offsets in the file, of each
+                part of the batch.
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO batch_members (s3_key, path, start, end) VALUES (?, ?, ?, ?)",
+                [(s3_key, path, start, end) for path, start, end in members],
+            )
+
+    def batch_member(self, s3_key: str, path: str) -> Optional[Tuple[int, int]]:
+        """Return the byte range of a file held by a batch object.
+
+        Args:
+            s3_key (str): The batch's S3 key.
+            path (str): Local file path.
+
+        Returns:
+            Optional[Tuple[int, int]]: Start and end offsets in the file, or None if the batch does not hold it.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT start, end FROM batch_members WHERE s3_key = ? AND path = ?", (s3_key, path)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def batch_members(self, s3_key: str) -> List[Tuple[str, int, int]]:
+        """Return the files held by a batch object.
+
+        Args:
+            s3_key (str): The batch's S3 key.
+
+        Returns:
+            List[Tuple[str, int, int]]: Local file path, and start and end offsets in the file, of each part of
+                the batch, by path.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, start, end FROM batch_members WHERE s3_key = ? ORDER BY path", (s3_key,)
+            ).fetchall()
+        return [(path, start, end) for path, start, end in rows]
+
+    def modified_since(self, src_path: str, since: float) -> List[str]:
+        """Return the recorded files under a directory that were last modified after a time.
+
+        Args:
+            src_path (str): The directory.
+            since (float): Unix timestamp.
+
+        Returns:
+            List[str]: Local paths of the files whose recorded modification time is after ``since``.
+        """
+        prefix = os.path.join(src_path, "")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE mtime_ns > ? AND substr(path, 1, ?) = ?",
+                (int(since * 1e9), len(prefix), prefix),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def paths_for_key(self, s3_key: str) -> List[str]:
+        """Return the recorded files uploaded, or being uploaded, under an S3 key.
+
+        Args:
+            s3_key (str): The S3 key.
+
+        Returns:
+            List[str]: Local paths of the files, more than one for a batch.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM files WHERE s3_key = ?", (s3_key,)).fetchall()
+        return [row[0] for row in rows]
+
+    def last_scan(self, src_path: str) -> Optional[float]:
+        """Return when the last fully successful sync of a source directory started.
+
+        Args:
+            src_path (str): The source directory.
+
+        Returns:
+            Optional[float]: The start time as a Unix timestamp, or None if it has never fully synced.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT started FROM scans WHERE src_path = ?", (src_path,)).fetchone()
+        return row[0] if row else None
+
+    def record_scan(self, src_path: str, started: float) -> None:
+        """Record that a sync of a source directory uploaded everything it found.
+
+        Args:
+            src_path (str): The source directory.
+            started (float): When the sync started, as a Unix timestamp.
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO scans (src_path, started) VALUES (?, ?)", (src_path, started))
+
+    def start_multipart(self, path: str, s3_key: str, upload_id: str, size: int, mtime_ns: int, part_size: int) -> None:
+        """Record a multipart upload of a file, replacing any earlier one.
+
+        Args:
+            path (str): Local file path.
+            s3_key (str): The S3 key being uploaded to.
+            upload_id (str): The S3 multipart upload ID.
+            size (int): File size in bytes.
+            mtime_ns (int): File modification time in nanoseconds.
+            part_size (int): Size of every part but the last.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM multipart_parts WHERE upload_id IN "
+                "(SELECT upload_id FROM multipart_uploads WHERE path = ?)",
+                (path,),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO multipart_uploads (path, s3_key, upload_id, size, mtime_ns, part_size, started) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, s3_key, upload_id, size, mtime_ns, part_size, time.time()),
+            )
+            self._conn.execute("COMMIT")
+
+    def record_part(self, upload_id: str, part_number: int, etag: str, checksum: Optional[str] = None) -> None:
+        """Record that S3 has confirmed one part of a multipart upload.
+
+        Args:
+            upload_id (str): The S3 multipart upload ID.
+            part_number (int): The part number, from 1.
+            etag (str): ETag S3 returned for the part.
+            checksum (Optional[str]): Base64 SHA256 of the part, if it was sent.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO multipart_parts (upload_id, part_number, etag, checksum) VALUES (?, ?, ?, ?)",
+                (upload_id, part_number, etag, checksum),
+            )
+
+    def get_multipart(self, path: str) -> Optional[MultipartRecord]:
+        """Return the unfinished multipart upload of a file, with its confirmed parts.
+
+        Args:
+            path (str): Local file path.
+
+        Returns:
+            Optional[MultipartRecord]: The upload, or None if there is none.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, s3_key, upload_id, size, mtime_ns, part_size, started FROM multipart_uploads "
+                "WHERE path = ?",
+                (path,),
+            ).fetchone()
+            if row is None:
+                return None
+            parts = self._conn.execute(
+                "SELECT part_number, etag, checksum FROM multipart_parts WHERE upload_id = ?", (row[2],)
+            ).fetchall()
+        return MultipartRecord(*row, parts={number: (etag, checksum) for number, etag, checksum in parts})
+
+    def multipart_uploads(self) -> List[MultipartRecord]:
+        """Return every unfinished multipart upload, without their parts.
+
+        Returns:
+            List[MultipartRecord]: The uploads.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, s3_key, upload_id, size, mtime_ns, part_size, started FROM multipart_uploads"
+            ).fetchall()
+        return [MultipartRecord(*row, parts={}) for row in rows]
+
+    def finish_multipart(self, upload_id: str) -> None:
+        """Forget a multipart upload once it is completed or aborted.
+
+        Args:
+            upload_id (str): The S3 multipart upload ID.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM multipart_parts WHERE upload_id = ?", (upload_id,))
+            self._conn.execute("DELETE FROM multipart_uploads WHERE upload_id = ?", (upload_id,))
+            self._conn.execute("COMMIT")
+
+    def record_summary(self, manifest: str, entry: ManifestEntry) -> None:
+        """Record the summary of an uploaded log, to be published to a manifest.
+
+        Args:
+            manifest (str): S3 key of the manifest the summary belongs in.
+            entry (ManifestEntry): The summary.
+        """
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO summaries ({SUMMARY_COLUMNS}, manifest, published) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (*entry, manifest),
+            )
+
+    def summaries(self, manifest: str, unpublished: bool = False) -> List[ManifestEntry]:
+        """Return the recorded summaries of a manifest.
+
+        Args:
+            manifest (str): S3 key of the manifest.
+            unpublished (bool): Only return summaries not yet published to the manifest in S3.
+
+        Returns:
+            List[ManifestEntry]: The summaries.
+        """
+        query = f"SELECT {SUMMARY_COLUMNS} FROM summaries WHERE manifest = ?"
+        with self._lock:
+            rows = self._conn.execute(query + " AND published = 0" if unpublished else query, (manifest,)).fetchall()
+        return [ManifestEntry(*row) for row in rows]
+
+    def mark_published(self, manifest: str, s3_keys: List[str]) -> None:
+        """Record that summaries have been published to their manifest in S3.
+
+        Args:
+            manifest (str): S3 key of the manifest.
+            s3_keys (List[str]): Keys of the objects whose summaries were published.
+        """
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE summaries SET published = 1 WHERE manifest = ? AND s3_key = ?",
+                [(manifest, s3_key) for s3_key in s3_keys],
+            )
+
+    def record_throughput(self, records: List[ThroughputRecord]) -> None:
+        """Record what a run uploaded, forgetting runs older than ``THROUGHPUT_HISTORY``.
+
+        Args:
+            records (List[ThroughputRecord]): The run's uploads, per node.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO throughput ({THROUGHPUT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", records
+            )
+            self._conn.execute("DELETE FROM throughput WHERE finished < ?", (time.time() - THROUGHPUT_HISTORY,))
+            self._conn.execute("COMMIT")
+
+    def throughput(self, since: float = 0.0) -> List[ThroughputRecord]:
+        """Return what recent runs uploaded.
+
+        Args:
+            since (float): Only return runs finished after this Unix timestamp.
+
+        Returns:
+            List[ThroughputRecord]: The runs' uploads, per node, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {THROUGHPUT_COLUMNS} FROM throughput WHERE finished > ? ORDER BY finished, node", (since,)
+            ).fetchall()
+        return [ThroughputRecord(*row) for row in rows]
+
+    def pending(self) -> List[FileRecord]:
+        """Return the files whose uploads were started but never confirmed.
+
+        Returns:
+            List[FileRecord]: The pending records.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {RECORD_COLUMNS} FROM files WHERE status = ?", (STATUS_PENDING,)
+            ).fetchall()
+        return [FileRecord(*row) for row in rows]
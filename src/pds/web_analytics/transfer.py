@@ -0,0 +1,273 @@
+"""Size-based routing of file uploads between a single PUT and multipart transfers, which can be resumed."""
+import base64
+import hashlib
+import logging
+import math
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+from boto3.s3.transfer import TransferConfig  # type: ignore
+from botocore.exceptions import ClientError  # type: ignore
+
+from .checksum import ChecksumHasher
+from .checksum import FileChecksum
+
+if TYPE_CHECKING:
+    from .sync_state import SyncState
+
+logger = logging.getLogger(__name__)
+
+# Files up to this size are sent with one put_object call instead of through the boto3 TransferManager
+DEFAULT_SMALL_FILE_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+# Threads uploading the parts of one large file; uploads of different files already run in parallel
+DEFAULT_MULTIPART_CONCURRENCY = 4
+# S3 accepts at most this many parts per upload
+MAX_PARTS = 10000
+# Multipart uploads started this many seconds ago and never completed are aborted
+DEFAULT_ABANDONED_UPLOAD_AGE = 7 * 24 * 3600
+
+
+def multipart_transfer_config(
+    chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE, concurrency: int = DEFAULT_MULTIPART_CONCURRENCY
+) -> TransferConfig:
+    """Build the TransferManager settings for files above the small-file threshold.
+
+    Files that fit in one chunk are still sent with a single PUT by the TransferManager.
+
+    Args:
+        chunksize (int): Size of each multipart part, in bytes.
+        concurrency (int): Number of threads uploading the parts of one file.
+
+    Returns:
+        TransferConfig: The settings, passed as ``Config`` to ``upload_file``.
+    """
+    return TransferConfig(multipart_threshold=chunksize, multipart_chunksize=chunksize, max_concurrency=concurrency)
+
+
+def put_small_file(
+    s3_client,
+    bucket_name: str,
+    local_path: str,
+    s3_key: str,
+    extra_args: Optional[Dict[str, Any]] = None,
+    callback: Optional[Callable[[int], None]] = None,
+    checksum: Optional[FileChecksum] = None,
+    hasher: Optional[ChecksumHasher] = None,
+) -> Dict[str, Any]:
+    """Upload a file with a single ``put_object`` call, reading it through a memory map.
+
+    The body is the read-only mapping of the file itself, so the file is never copied into a Python buffer and
+    botocore can rewind it to retry. Checksums not given are computed from the same mapping just before it is
+    sent, so the file is only read from disk once. No threads or futures are started, which makes this much
+    cheaper than ``upload_file`` for files of a few KB.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket_name (str): Target bucket.
+        local_path (str): Local file path to upload.
+        s3_key (str): S3 key for the file.
+        extra_args (Optional[Dict[str, Any]]): Extra ``put_object`` parameters, e.g. ``ContentType``.
+        callback (Optional[Callable[[int], None]]): Called with the size of the file before it is sent, like
+            the transfer ``Callback`` of ``upload_file``.
+        checksum (Optional[FileChecksum]): Checksums of the file, sent as ``ChecksumSHA256`` so S3 rejects a
+            body that does not match and botocore does not read the file to compute one of its own.
+        hasher (Optional[ChecksumHasher]): Without ``checksum``, the file's bytes are added to it as they are
+            checksummed, for the caller to record.
+
+    Returns:
+        Dict[str, Any]: The ``put_object`` response.
+    """
+    with open(local_path, "rb") as f:
+        # Empty files cannot be mapped
+        body: Any = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        try:
+            if checksum is None:
+                hasher = hasher if hasher is not None else ChecksumHasher()
+                hasher.update(body)
+                checksum = hasher.result()
+            if callback:
+                callback(len(body))
+            params = dict(extra_args or {}, ChecksumSHA256=checksum.sha256)
+            return s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=body, **params)
+        finally:
+            if isinstance(body, mmap.mmap):
+                body.close()
+
+
+def upload_multipart(
+    s3_client,
+    bucket_name: str,
+    local_path: str,
+    s3_key: str,
+    journal: "SyncState",
+    extra_args: Optional[Dict[str, Any]] = None,
+    callback: Optional[Callable[[int], None]] = None,
+    part_size: int = DEFAULT_MULTIPART_CHUNKSIZE,
+    concurrency: int = DEFAULT_MULTIPART_CONCURRENCY,
+    hasher: Optional[ChecksumHasher] = None,
+) -> Dict[str, Any]:
+    """Upload a file in parts, recording the upload ID and every confirmed part so it can be resumed.
+
+    If the journal holds an upload of the same file, unchanged since, to the same key, the parts S3 still
+    has for it are kept and only the others are sent. An upload of an older version of the file is aborted
+    and started over. When a part fails the upload is left in place for a later call to resume; it is only
+    forgotten once completed. Every part carries its SHA256 for S3 to verify.
+
+    With a ``hasher``, the checksums of the whole file are computed from the same reads as the parts: each part is
+    added to it in order, and the parts of a resumed upload already in S3 are read for it without being sent.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket_name (str): Target bucket.
+        local_path (str): Local file path to upload.
+        s3_key (str): S3 key for the file.
+        journal (SyncState): Where upload IDs and part ETags are recorded.
+        extra_args (Optional[Dict[str, Any]]): Extra ``create_multipart_upload`` parameters, e.g. ``ContentType``.
+        callback (Optional[Callable[[int], None]]): Called with the size of each part before it is sent, like
+            the transfer ``Callback`` of ``upload_file``.
+        part_size (int): Size of each part, raised if needed to stay within S3's limit of 10,000 parts.
+        concurrency (int): Number of parts uploaded at once.
+        hasher (Optional[ChecksumHasher]): Filled with the checksums of the whole file, if given.
+
+    Returns:
+        Dict[str, Any]: The ``complete_multipart_upload`` response.
+    """
+    stat_result = os.stat(local_path)
+    size, mtime_ns = stat_result.st_size, stat_result.st_mtime_ns
+    part_size = max(part_size, math.ceil(size / MAX_PARTS))
+    part_count = max(1, math.ceil(size / part_size))
+
+    upload_id = None
+    done: Dict[int, Tuple[str, Optional[str]]] = {}
+    record = journal.get_multipart(local_path)
+    if record is not None:
+        if (record.s3_key, record.size, record.mtime_ns, record.part_size) == (s3_key, size, mtime_ns, part_size):
+            uploaded = _uploaded_parts(s3_client, bucket_name, s3_key, record.upload_id)
+            if uploaded is not None:
+                upload_id = record.upload_id
+                # Keep the parts S3 has with the ETag recorded when they were sent
+                done = {number: part for number, part in record.parts.items() if uploaded.get(number) == part[0]}
+                logger.info(f"Resuming upload of {local_path}: {len(done)}/{part_count} parts already in S3")
+        else:
+            abort_multipart(s3_client, bucket_name, record.s3_key, record.upload_id)
+        if upload_id is None:
+            journal.finish_multipart(record.upload_id)
+
+    if upload_id is None:
+        response = s3_client.create_multipart_upload(
+            Bucket=bucket_name, Key=s3_key, ChecksumAlgorithm="SHA256", **(extra_args or {})
+        )
+        upload_id = response["UploadId"]
+        journal.start_multipart(local_path, s3_key, upload_id, size, mtime_ns, part_size)
+
+    # Parts are added to the hasher in order; one whose predecessors are still being read waits for them
+    hashed = threading.Condition()
+    next_hashed = [1]
+    failed = threading.Event()
+
+    def add_to_hasher(part_number: int, body: bytes) -> None:
+        with hashed:
+            while next_hashed[0] != part_number:
+                if failed.is_set():
+                    raise RuntimeError(f"Upload of {local_path} stopped before part {part_number}")
+                hashed.wait(timeout=1)
+            hasher.update(body)  # type: ignore[union-attr]
+            next_hashed[0] += 1
+            hashed.notify_all()
+
+    fd = os.open(local_path, os.O_RDONLY)
+    try:
+
+        def upload_part(part_number: int) -> None:
+            try:
+                body = os.pread(fd, part_size, (part_number - 1) * part_size)
+                if hasher is not None:
+                    add_to_hasher(part_number, body)
+            except BaseException:
+                failed.set()
+                raise
+            if part_number in done:
+                return
+            checksum = base64.b64encode(hashlib.sha256(body).digest()).decode("ascii")
+            if callback:
+                callback(len(body))
+            response = s3_client.upload_part(
+                Bucket=bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+                ChecksumSHA256=checksum,
+            )
+            journal.record_part(upload_id, part_number, response["ETag"], checksum)  # type: ignore[arg-type]
+            done[part_number] = (response["ETag"], checksum)
+
+        missing = [number for number in range(1, part_count + 1) if hasher is not None or number not in done]
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="part") as executor:
+            futures = [executor.submit(upload_part, number) for number in missing]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Stop sending parts; the ones confirmed so far are kept for the next attempt
+                failed.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        os.close(fd)
+
+    parts = [
+        {"PartNumber": number, "ETag": etag, **({"ChecksumSHA256": checksum} if checksum else {})}
+        for number, (etag, checksum) in sorted(done.items())
+    ]
+    response = s3_client.complete_multipart_upload(
+        Bucket=bucket_name, Key=s3_key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+    )
+    journal.finish_multipart(upload_id)  # type: ignore[arg-type]
+    return response
+
+
+def abort_multipart(s3_client, bucket_name: str, s3_key: str, upload_id: str) -> bool:
+    """Abort a multipart upload, discarding its parts.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket_name (str): The bucket.
+        s3_key (str): The key being uploaded to.
+        upload_id (str): The multipart upload ID.
+
+    Returns:
+        bool: True if the upload is gone, including when S3 no longer knew it.
+    """
+    try:
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+            return True
+        logger.warning(f"Failed to abort multipart upload {upload_id} for {s3_key}: {str(e)}")
+        return False
+
+
+def _uploaded_parts(s3_client, bucket_name: str, s3_key: str, upload_id: str) -> Optional[Dict[int, str]]:
+    """Return the ETag of every part S3 holds for a multipart upload, or None if the upload is gone."""
+    try:
+        parts: Dict[int, str] = {}
+        for page in s3_client.get_paginator("list_parts").paginate(Bucket=bucket_name, Key=s3_key, UploadId=upload_id):
+            for part in page.get("Parts", []):
+                parts[part["PartNumber"]] = part["ETag"]
+        return parts
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+            return None
+        raise
@@ -0,0 +1,248 @@
+"""An in-memory stand-in for the boto3 S3 client used by the sync tests."""
+import base64
+import hashlib
+import itertools
+import threading
+import types
+from datetime import datetime
+from datetime import timezone
+
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError
+from botocore.hooks import HierarchicalEmitter
+
+
+def client_error(code, operation, status=400, message=""):
+    """Build a botocore ClientError like the real client raises."""
+    return ClientError(
+        {"Error": {"Code": code, "Message": message or code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        operation,
+    )
+
+
+class FakeS3:
+    """A thread-safe, in-memory implementation of the S3 client calls S3Sync makes.
+
+    Objects are kept in ``self.objects`` as ``{key: {"Body": bytes, ...}}`` regardless of bucket.
+    Every call is recorded in ``self.calls`` as ``(operation, kwargs)``. Errors such as throttling can be
+    injected into the next calls of an operation with ``inject_errors``.
+    """
+
+    def __init__(self):
+        """Create an empty bucket."""
+        self.objects = {}
+        self.multipart = {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.exceptions = types.SimpleNamespace(NoSuchKey=type("NoSuchKey", (ClientError,), {}))
+        self.meta = types.SimpleNamespace(events=HierarchicalEmitter())
+        self._upload_ids = itertools.count(1)
+        self._injected = {}
+
+    def inject_errors(self, operation, error, times=1):
+        """Make the next ``times`` calls to an operation raise ``error``."""
+        with self.lock:
+            self._injected.setdefault(operation, []).extend([error] * times)
+
+    def _record(self, operation, kwargs):
+        with self.lock:
+            self.calls.append((operation, kwargs))
+            injected = self._injected.get(operation)
+            error = injected.pop(0) if injected else None
+        if error is not None:
+            raise error
+
+    def operations(self, name):
+        """Return the kwargs of every recorded call to an operation."""
+        with self.lock:
+            return [kwargs for operation, kwargs in self.calls if operation == name]
+
+    @staticmethod
+    def _read_body(body):
+        if hasattr(body, "read"):
+            return body.read()
+        return bytes(body)
+
+    def _store(self, key, data, kwargs):
+        obj = {k: v for k, v in kwargs.items() if k not in ("Bucket", "Key", "Body", "IfMatch", "IfNoneMatch")}
+        obj["Body"] = data
+        obj["ETag"] = '"%s"' % hashlib.md5(data).hexdigest()
+        with self.lock:
+            self._check_conditions(key, kwargs, "PutObject")
+            self.objects[key] = obj
+        return {"ETag": obj["ETag"]}
+
+    def _check_conditions(self, key, kwargs, operation):
+        """Raise the error S3 returns for a failed ``IfNoneMatch`` or ``IfMatch`` condition, under the lock."""
+        obj = self.objects.get(key)
+        if kwargs.get("IfNoneMatch") == "*" and obj is not None:
+            raise client_error("PreconditionFailed", operation, 412)
+        if "IfMatch" in kwargs:
+            if obj is None:
+                raise client_error("NoSuchKey", operation, 404)
+            if obj["ETag"] != kwargs["IfMatch"]:
+                raise client_error("PreconditionFailed", operation, 412)
+
+    def put_object(self, **kwargs):
+        """Store an object, honouring ``IfNoneMatch``/``IfMatch`` and checking its ``ChecksumSHA256``."""
+        self._record("put_object", kwargs)
+        data = self._read_body(kwargs.get("Body", b""))
+        checksum = kwargs.get("ChecksumSHA256")
+        if checksum is not None and checksum != base64.b64encode(hashlib.sha256(data).digest()).decode("ascii"):
+            raise client_error("BadDigest", "PutObject", 400)
+        return self._store(kwargs["Key"], data, kwargs)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):  # noqa: N803
+        """Store an object from a local file, wrapping errors in ``S3UploadFailedError`` like boto3."""
+        try:
+            self._record("upload_file", {"Filename": Filename, "Bucket": Bucket, "Key": Key, "ExtraArgs": ExtraArgs})
+        except ClientError as e:
+            raise S3UploadFailedError(f"Failed to upload {Filename} to {Bucket}/{Key}: {e}")
+        with open(Filename, "rb") as f:
+            data = f.read()
+        if Callback:
+            Callback(len(data))
+        self._store(Key, data, dict(ExtraArgs or {}))
+
+    def head_object(self, **kwargs):
+        """Return an object's metadata or raise a 404 ClientError."""
+        self._record("head_object", kwargs)
+        with self.lock:
+            obj = self.objects.get(kwargs["Key"])
+        if obj is None:
+            raise client_error("404", "HeadObject", 404, "Not Found")
+        return {"ContentLength": len(obj["Body"]), "ETag": obj["ETag"]}
+
+    def get_object(self, **kwargs):
+        """Return an object's body, honouring a ``Range`` header."""
+        self._record("get_object", kwargs)
+        with self.lock:
+            obj = self.objects.get(kwargs["Key"])
+        if obj is None:
+            raise client_error("NoSuchKey", "GetObject", 404)
+        data = obj["Body"]
+        if "Range" in kwargs:
+            start, end = kwargs["Range"].split("=")[1].split("-")
+            data = data[int(start) : int(end) + 1]
+        return {"Body": _Body(data), "ETag": obj["ETag"], "ContentLength": len(data)}
+
+    def delete_object(self, **kwargs):
+        """Delete an object, if it still has the ETag given as ``IfMatch``."""
+        self._record("delete_object", kwargs)
+        with self.lock:
+            self._check_conditions(kwargs["Key"], kwargs, "DeleteObject")
+            self.objects.pop(kwargs["Key"], None)
+        return {}
+
+    def list_objects_v2(self, **kwargs):
+        """List the objects under a prefix, after ``StartAfter``, in key order."""
+        self._record("list_objects_v2", kwargs)
+        prefix = kwargs.get("Prefix", "")
+        start_after = kwargs.get("StartAfter", "")
+        with self.lock:
+            keys = sorted(k for k in self.objects if k.startswith(prefix) and k > start_after)
+            contents = [{"Key": k, "Size": len(self.objects[k]["Body"]), "ETag": self.objects[k]["ETag"]} for k in keys]
+        return {"Contents": contents, "KeyCount": len(contents)}
+
+    def get_paginator(self, operation):
+        """Return a single-page paginator for a listing operation."""
+        assert operation in ("list_objects_v2", "list_parts", "list_multipart_uploads")
+        return _Paginator(getattr(self, operation))
+
+    def create_multipart_upload(self, **kwargs):
+        """Start a multipart upload."""
+        self._record("create_multipart_upload", kwargs)
+        upload_id = "upload-%d" % next(self._upload_ids)
+        with self.lock:
+            self.multipart[upload_id] = {
+                "Key": kwargs["Key"],
+                "Parts": {},
+                "Args": kwargs,
+                "Initiated": datetime.now(timezone.utc),
+            }
+        return {"UploadId": upload_id}
+
+    def upload_part(self, **kwargs):
+        """Store one part of a multipart upload, rejecting a body that does not match its ``ChecksumSHA256``."""
+        self._record("upload_part", kwargs)
+        data = self._read_body(kwargs["Body"])
+        checksum = kwargs.get("ChecksumSHA256")
+        if checksum is not None and checksum != base64.b64encode(hashlib.sha256(data).digest()).decode("ascii"):
+            raise client_error("BadDigest", "UploadPart", 400)
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        with self.lock:
+            upload = self.multipart.get(kwargs["UploadId"])
+            if upload is None:
+                raise client_error("NoSuchUpload", "UploadPart", 404)
+            upload["Parts"][kwargs["PartNumber"]] = (etag, data)
+        return {"ETag": etag}
+
+    def list_parts(self, **kwargs):
+        """List the parts uploaded so far for a multipart upload."""
+        self._record("list_parts", kwargs)
+        with self.lock:
+            upload = self.multipart.get(kwargs["UploadId"])
+            if upload is None:
+                raise client_error("NoSuchUpload", "ListParts", 404)
+            parts = [
+                {"PartNumber": number, "ETag": etag, "Size": len(data)}
+                for number, (etag, data) in sorted(upload["Parts"].items())
+            ]
+        return {"Parts": parts, "IsTruncated": False}
+
+    def list_multipart_uploads(self, **kwargs):
+        """List the multipart uploads in progress under a prefix."""
+        self._record("list_multipart_uploads", kwargs)
+        prefix = kwargs.get("Prefix", "")
+        with self.lock:
+            uploads = [
+                {"Key": upload["Key"], "UploadId": upload_id, "Initiated": upload["Initiated"]}
+                for upload_id, upload in sorted(self.multipart.items())
+                if upload["Key"].startswith(prefix)
+            ]
+        return {"Uploads": uploads, "IsTruncated": False}
+
+    def complete_multipart_upload(self, **kwargs):
+        """Assemble the parts of a multipart upload into an object."""
+        self._record("complete_multipart_upload", kwargs)
+        with self.lock:
+            upload = self.multipart.pop(kwargs["UploadId"], None)
+        if upload is None:
+            raise client_error("NoSuchUpload", "CompleteMultipartUpload", 404)
+        parts = kwargs["MultipartUpload"]["Parts"]
+        data = b"".join(upload["Parts"][part["PartNumber"]][1] for part in parts)
+        args = {k: v for k, v in upload["Args"].items() if k not in ("Bucket", "Key")}
+        response = self._store(upload["Key"], data, args)
+        with self.lock:
+            self.objects[upload["Key"]]["ETag"] = '"%s-%d"' % (hashlib.md5(data).hexdigest(), len(parts))
+        return response
+
+    def abort_multipart_upload(self, **kwargs):
+        """Discard a multipart upload."""
+        self._record("abort_multipart_upload", kwargs)
+        with self.lock:
+            upload = self.multipart.pop(kwargs["UploadId"], None)
+        if upload is None:
+            raise client_error("NoSuchUpload", "AbortMultipartUpload", 404)
+        return {}
+
+
+class _Body:
+    """A minimal StreamingBody."""
+
+    def __init__(self, data):
+        self._data = data
+
+    def read(self, amt=None):
+        data, self._data = self._data, b""
+        return data
+
+
+class _Paginator:
+    """A paginator returning the whole listing as one page."""
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        yield self.operation(**kwargs)
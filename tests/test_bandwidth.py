@@ -0,0 +1,211 @@
+"""Unit tests for the bandwidth limiting helpers."""
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from box import Box
+from pds.web_analytics.bandwidth import BandwidthSchedule
+from pds.web_analytics.bandwidth import parse_rate
+from pds.web_analytics.bandwidth import RateWindow
+from pds.web_analytics.bandwidth import Throttle
+from pds.web_analytics.bandwidth import TokenBucket
+from pds.web_analytics.s3_sync import S3Sync
+from tests.fake_s3 import FakeS3
+
+# A Wednesday
+WEDNESDAY_NOON = datetime(2025, 6, 11, 12, 0)
+
+
+class FakeClock:
+    """A monotonic clock that only advances when the code under test sleeps."""
+
+    def __init__(self):
+        """Start at zero."""
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        """Return the current time."""
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance the clock."""
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestParseRate(unittest.TestCase):
+    """Test cases for parse_rate."""
+
+    def test_units(self):
+        """Decimal and binary units should be accepted, with or without /s."""
+        self.assertEqual(parse_rate("5MB"), 5_000_000)
+        self.assertEqual(parse_rate("512KiB/s"), 512 * 1024)
+        self.assertEqual(parse_rate("1.5 GiB"), 1.5 * 1024**3)
+        self.assertEqual(parse_rate(2048), 2048)
+        self.assertEqual(parse_rate("100"), 100)
+
+    def test_unlimited(self):
+        """None and 'unlimited' should mean no limit."""
+        self.assertIsNone(parse_rate(None))
+        self.assertIsNone(parse_rate("unlimited"))
+
+    def test_invalid(self):
+        """Unknown units and non-positive rates should be rejected."""
+        for value in ("5 furlongs", "fast", 0, "-1MB"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_rate(value)
+
+
+class TestBandwidthSchedule(unittest.TestCase):
+    """Test cases for RateWindow and BandwidthSchedule."""
+
+    def test_business_hours_window(self):
+        """A window should override the default rate during its hours on its days."""
+        schedule = BandwidthSchedule.from_config(
+            {"rate": "50MB", "schedule": [{"hours": "08:00-18:00", "rate": "5MB", "days": ["mon", "tue", "wed"]}]}
+        )
+
+        self.assertEqual(schedule.rate_at(WEDNESDAY_NOON), 5_000_000)
+        self.assertEqual(schedule.rate_at(WEDNESDAY_NOON.replace(hour=18)), 50_000_000)
+        self.assertEqual(schedule.rate_at(datetime(2025, 6, 12, 12, 0)), 50_000_000)
+
+    def test_window_spanning_midnight(self):
+        """A window like 22:00-06:00 should cover the night after each of its days."""
+        window = RateWindow.from_config({"hours": "22:00-06:00", "rate": "unlimited", "days": ["Friday"]})
+        schedule = BandwidthSchedule("1MB", [window])
+
+        self.assertTrue(window.contains(datetime(2025, 6, 13, 23, 0)))
+        self.assertTrue(window.contains(datetime(2025, 6, 14, 5, 59)))
+        self.assertFalse(window.contains(datetime(2025, 6, 13, 5, 0)))
+        self.assertIsNone(schedule.rate_at(datetime(2025, 6, 13, 23, 0)))
+
+    def test_all_day_window(self):
+        """00:00-24:00 should cover the whole day."""
+        window = RateWindow.from_config({"hours": "00:00-24:00", "rate": "1MB", "days": ["sat", "sun"]})
+
+        self.assertTrue(window.contains(datetime(2025, 6, 14, 0, 0)))
+        self.assertTrue(window.contains(datetime(2025, 6, 15, 23, 59)))
+        self.assertFalse(window.contains(WEDNESDAY_NOON))
+
+    def test_plain_rate_and_no_limit(self):
+        """A plain rate should apply all day, and a config without limits should build no schedule."""
+        self.assertEqual(BandwidthSchedule.from_config("2MB").rate_at(WEDNESDAY_NOON), 2_000_000)
+        self.assertIsNone(BandwidthSchedule.from_config(None))
+        self.assertIsNone(BandwidthSchedule.from_config({"rate": "unlimited"}))
+
+    def test_invalid_window(self):
+        """Malformed hours and weekdays should be rejected."""
+        with self.assertRaises(ValueError):
+            RateWindow.from_config({"hours": "8-18", "rate": "1MB"})
+        with self.assertRaises(ValueError):
+            RateWindow.from_config({"hours": "08:00-18:00", "rate": "1MB", "days": ["someday"]})
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for TokenBucket."""
+
+    def make_bucket(self, config, moment=WEDNESDAY_NOON):
+        """Build a bucket on a fake clock."""
+        clock = FakeClock()
+        bucket = TokenBucket(
+            BandwidthSchedule.from_config(config), clock=clock, wall_clock=lambda: moment, sleep=clock.sleep
+        )
+        return bucket, clock
+
+    def test_holds_transfers_to_the_rate(self):
+        """After the initial burst, bytes should be released at the configured rate."""
+        bucket, clock = self.make_bucket("1MB")
+
+        for _ in range(10):
+            bucket.consume(1_000_000)
+
+        # The first second's worth goes out immediately, the other nine take a second each
+        self.assertAlmostEqual(clock.now, 9.0)
+
+    def test_idle_time_refills_only_one_burst(self):
+        """A long pause should not let a later transfer exceed one burst above the rate."""
+        bucket, clock = self.make_bucket("1MB")
+        bucket.consume(1_000_000)
+        clock.now += 3600
+
+        bucket.consume(3_000_000)
+
+        self.assertAlmostEqual(clock.sleeps[-1], 2.0)
+
+    def test_unlimited_window_never_sleeps(self):
+        """Outside any limit no time should be spent sleeping."""
+        bucket, clock = self.make_bucket({"schedule": [{"hours": "08:00-18:00", "rate": "1MB"}]}, datetime(2025, 1, 1))
+
+        bucket.consume(50_000_000)
+
+        self.assertEqual(clock.sleeps, [])
+
+    def test_ignores_rewinds(self):
+        """Negative amounts reported when boto3 retries a request should be ignored."""
+        bucket, clock = self.make_bucket("1MB")
+
+        bucket.consume(-5_000_000)
+        bucket.consume(1_000_000)
+
+        self.assertEqual(clock.sleeps, [])
+
+    def test_throttle_feeds_every_bucket(self):
+        """A throttle should draw from the host-wide and the node bucket."""
+        host, host_clock = self.make_bucket("10MB")
+        node, node_clock = self.make_bucket("1MB")
+        throttle = Throttle(host, None, node)
+
+        throttle(3_000_000)
+
+        self.assertEqual(host_clock.sleeps, [])
+        self.assertAlmostEqual(node_clock.now, 2.0)
+        self.assertFalse(Throttle(None))
+
+
+class TestS3SyncBandwidth(unittest.TestCase):
+    """Test cases for bandwidth limits in S3Sync."""
+
+    def setUp(self):
+        """Set up a log directory and a fake S3 client."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.log_dir = os.path.join(self.temp_dir, "geo", "geo-ode")
+        os.makedirs(self.log_dir)
+        for i in range(4):
+            with open(os.path.join(self.log_dir, f"u_ex2501{i + 1:02d}.log"), "wb") as f:
+                f.write(b"x" * 1000)
+        self.fake_s3 = FakeS3()
+        patcher = patch("boto3.client", return_value=self.fake_s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("pds.web_analytics.bandwidth.time.sleep")
+    def test_node_bandwidth_limits_uploads(self, mock_sleep):
+        """Uploads of a node with a bandwidth limit should be slowed to that rate."""
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=1, enable_gzip=False, bandwidth="1MB")
+
+        s3_sync.sync_directory((self.log_dir, Box({"include": ["u_ex25*"], "bandwidth": "1KB"})))
+
+        self.assertEqual(len(self.fake_s3.objects), 4)
+        # Sleeping is mocked, so the last upload waits for the whole debt: 4000 bytes at 1000 bytes/s, less the
+        # one second burst
+        self.assertAlmostEqual(max(call.args[0] for call in mock_sleep.call_args_list), 3.0, delta=0.1)
+
+    @patch("pds.web_analytics.bandwidth.time.sleep")
+    def test_host_bandwidth_applies_without_node_limit(self, mock_sleep):
+        """The host-wide limit should apply to nodes without their own."""
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=1, enable_gzip=False, bandwidth="2KB")
+
+        s3_sync.sync_directory((self.log_dir, Box({"include": ["u_ex25*"]})))
+
+        self.assertEqual(len(self.fake_s3.objects), 4)
+        self.assertAlmostEqual(max(call.args[0] for call in mock_sleep.call_args_list), 1.0, delta=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,112 @@
+"""Unit tests for coalescing small files into batches."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+from pds.web_analytics.coalesce import Batch
+from pds.web_analytics.coalesce import BatchMember
+from pds.web_analytics.coalesce import BatchReader
+from pds.web_analytics.coalesce import coalesce_settings
+from pds.web_analytics.coalesce import CoalesceSettings
+from pds.web_analytics.coalesce import plan_batches
+from pds.web_analytics.coalesce import segment_end
+from pds.web_analytics.coalesce import sources_key
+
+DAY = date(2025, 1, 31)
+
+
+def member(name, length, mtime_ns=0, start=0):
+    """Return a batch part of a made-up file."""
+    return BatchMember("/logs/" + name, name, start, start + length, False, mtime_ns)
+
+
+class TestCoalesce(unittest.TestCase):
+    """Test cases for coalescing small files."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_coalesce_settings(self):
+        """Test building settings from config entries."""
+        self.assertIsNone(coalesce_settings(None))
+        self.assertIsNone(coalesce_settings(False))
+        self.assertEqual(coalesce_settings(True), CoalesceSettings())
+        settings = coalesce_settings({"max_file_size": 4096, "target_size": 65536})
+        self.assertEqual((settings.max_file_size, settings.target_size), (4096, 65536))
+        with self.assertRaises(ValueError):
+            coalesce_settings({"target_size": 0})
+
+    def test_sources_key(self):
+        """Test that source manifests are kept outside the dataset prefixes."""
+        self.assertEqual(
+            sources_key("logs", "logs/atm/atm-ftp/batch-2025-01-31-0123.log.gz"),
+            "logs/_sources/atm/atm-ftp/batch-2025-01-31-0123.log.gz.json",
+        )
+
+    def test_plan_batches_packs_each_day_in_name_order(self):
+        """Test that parts are packed up to the target size, never across days, the same way every time."""
+        parts = [(DAY, member(f"f{i}", 40)) for i in (3, 1, 2, 4, 5)] + [(date(2025, 2, 1), member("g", 10))]
+
+        batches, held = plan_batches(parts, 100, ready_before_ns=1)
+        again, _ = plan_batches(reversed(parts), 100, ready_before_ns=1)
+
+        self.assertEqual(held, [])
+        self.assertEqual(
+            [[m.name for m in batch.members] for batch in batches], [["f1", "f2"], ["f3", "f4"], ["f5"], ["g"]]
+        )
+        self.assertEqual([batch.name() for batch in again], [batch.name() for batch in batches])
+        self.assertTrue(batches[0].name().startswith("batch-2025-01-31-"))
+        self.assertNotEqual(Batch(DAY, (member("f1", 41),)).name(), Batch(DAY, (member("f1", 40),)).name())
+
+    def test_plan_batches_holds_back_short_recent_batches(self):
+        """Test that the last batch of a day waits for more files while it is short and recently modified."""
+        parts = [(DAY, member("a", 60, mtime_ns=5)), (DAY, member("b", 60, mtime_ns=50)), (DAY, member("c", 10, 50))]
+
+        batches, held = plan_batches(parts, 100, ready_before_ns=10)
+
+        self.assertEqual([[m.name for m in batch.members] for batch in batches], [["a"]])
+        self.assertEqual([m.name for m in held], ["b", "c"])
+        self.assertEqual(len(plan_batches(parts, 100, ready_before_ns=100)[0]), 2)
+
+    def test_segment_end_stops_after_the_last_complete_line(self):
+        """Test that a file still being written is only read to the end of its last complete line."""
+        path = os.path.join(self.temp_dir, "ftp.log")
+        with open(path, "wb") as f:
+            f.write(b"one\ntwo\nthr")
+
+        self.assertEqual(segment_end(path, 0, 11, complete=False), 8)
+        self.assertIsNone(segment_end(path, 8, 11, complete=False))
+        self.assertEqual(segment_end(path, 8, 11, complete=True), 11)
+        self.assertIsNone(segment_end(path, 11, 11, complete=True))
+
+    def test_batch_reader_joins_parts_as_lines(self):
+        """Test reading byte ranges of plain files and whole gzipped files as one stream of lines."""
+        plain = os.path.join(self.temp_dir, "a.log")
+        with open(plain, "wb") as f:
+            f.write(b"old\nnew1\nnew2")
+        zipped = os.path.join(self.temp_dir, "b.log.gz")
+        with gzip.open(zipped, "wb") as f:
+            f.write(b"gz1\ngz2\n")
+        members = [
+            BatchMember(plain, "a.log", 4, 13, False, 0),
+            BatchMember(zipped, "b.log.gz", 0, os.path.getsize(zipped), True, 0),
+        ]
+
+        with BatchReader(members) as reader:
+            chunks = []
+            while chunk := reader.read(3):
+                chunks.append(chunk)
+
+        self.assertEqual(b"".join(chunks), b"new1\nnew2\ngz1\ngz2\n")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
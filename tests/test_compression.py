@@ -0,0 +1,97 @@
+"""Unit tests for the compression helpers."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pds.web_analytics.checksum import checksum_file
+from pds.web_analytics.compression import gzip_file
+from pds.web_analytics.line_filter import filter_rules
+
+
+class TestGzipFile(unittest.TestCase):
+    """Test cases for the gzip_file function."""
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.temp_dir, "access.log")
+        with open(self.source, "w") as f:
+            f.write('192.168.1.1 - - [25/Dec/2023:10:30:45 +0000] "GET /data/file.txt HTTP/1.1" 200 1024\n' * 500)
+
+    def tearDown(self):
+        """Clean up after each test."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_gzip_file_round_trip(self):
+        """The output should decompress to the input and report its sizes."""
+        target = self.source + ".gz"
+
+        stats = gzip_file(self.source, target, level=1, buffer_size=1024)
+
+        with open(self.source, "rb") as f_in, gzip.open(target, "rb") as f_out:
+            self.assertEqual(f_in.read(), f_out.read())
+        self.assertEqual(stats.source, self.source)
+        self.assertEqual(stats.target, target)
+        self.assertEqual(stats.raw_bytes, os.path.getsize(self.source))
+        self.assertEqual(stats.compressed_bytes, os.path.getsize(target))
+        self.assertGreater(stats.ratio, 1.0)
+        self.assertGreaterEqual(stats.mb_per_second, 0.0)
+        self.assertFalse(os.path.exists(target + ".tmp"))
+
+    def test_gzip_file_failure_leaves_no_partial_output(self):
+        """A failed compression should not leave a partial .gz behind."""
+        target = self.source + ".gz"
+
+        with patch("pds.web_analytics.compression.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                gzip_file(self.source, target)
+
+        self.assertFalse(os.path.exists(target))
+        self.assertFalse(os.path.exists(target + ".tmp"))
+        self.assertTrue(os.path.exists(self.source))
+
+    def test_gzip_file_checksums_output(self):
+        """The output should be checksummed as it is written, identically every time it is compressed."""
+        target = self.source + ".gz"
+
+        first = gzip_file(self.source, target)
+        os.utime(target, (0, 0))
+        second = gzip_file(self.source, target)
+
+        self.assertEqual(first.checksum, checksum_file(target))
+        self.assertEqual(first.checksum, second.checksum)
+        self.assertEqual(first.checksum.size, first.compressed_bytes)
+
+    def test_gzip_file_summarizes_input(self):
+        """The input should be summarized only when asked, from the same read as the compression."""
+        self.assertIsNone(gzip_file(self.source, self.source + ".gz").summary)
+
+        stats = gzip_file(self.source, self.source + ".gz", buffer_size=1000, summarize=True)
+
+        self.assertEqual(stats.summary.lines, 500)
+        self.assertEqual(stats.summary.raw_bytes, stats.raw_bytes)
+        self.assertEqual((stats.summary.start, stats.summary.log_format), (1703500245.0, "apache-common"))
+
+    def test_gzip_file_filters_lines(self):
+        """Records matching the line filter should be left out of the output and its summary, and counted."""
+        with open(self.source, "ab") as f:
+            f.write(b"#Fields: date time\n" + b'::1 - - [25/Dec/2023:10:31:00 +0000] "OPTIONS * HTTP/1.0" 200 -\n' * 3)
+        target = self.source + ".gz"
+
+        stats = gzip_file(self.source, target, buffer_size=1000, summarize=True, line_filter=filter_rules(True))
+
+        with gzip.open(target, "rb") as f:
+            output = f.read()
+        self.assertEqual(output.count(b"\n"), 500)
+        self.assertNotIn(b"::1", output)
+        self.assertEqual(stats.dropped, {"comments": 1, "loopback": 3, "dummy-connection": 0, "invalid-method": 0})
+        self.assertEqual((stats.summary.lines, stats.summary.raw_bytes), (500, len(output)))
+        self.assertEqual(stats.raw_bytes, os.path.getsize(self.source))
+        self.assertIsNone(gzip_file(self.source, target).dropped)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,239 @@
+"""Unit tests for the AdaptiveConcurrency controller."""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError
+from botocore.exceptions import EndpointConnectionError
+from pds.web_analytics.concurrency import AdaptiveConcurrency
+from pds.web_analytics.concurrency import classify_exception
+from pds.web_analytics.concurrency import ERROR
+from pds.web_analytics.concurrency import IGNORED
+from pds.web_analytics.concurrency import OK
+from pds.web_analytics.concurrency import THROTTLED
+from pds.web_analytics.s3_sync import FAILED
+from pds.web_analytics.s3_sync import S3Sync
+from pds.web_analytics.s3_sync import UPLOADED
+from tests.fake_s3 import client_error
+from tests.fake_s3 import FakeS3
+
+
+def slow_down():
+    """Return the error S3 raises when it throttles a request."""
+    return client_error("SlowDown", "PutObject", 503, "Please reduce your request rate.")
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    """Test cases for the AdaptiveConcurrency class."""
+
+    def run_request(self, limiter, error=None):
+        """Run one request through the limiter, optionally failing it."""
+        try:
+            with limiter.request():
+                if error is not None:
+                    raise error
+        except Exception:
+            pass
+
+    def test_classify_exception(self):
+        """Throttling and server errors should slow down; a missing key should not."""
+        self.assertEqual(classify_exception(slow_down()), THROTTLED)
+        self.assertEqual(classify_exception(client_error("Throttling", "ListObjectsV2", 400)), THROTTLED)
+        self.assertEqual(classify_exception(client_error("InternalError", "PutObject", 500)), ERROR)
+        self.assertEqual(classify_exception(EndpointConnectionError(endpoint_url="https://s3")), ERROR)
+        self.assertEqual(classify_exception(client_error("404", "HeadObject", 404)), OK)
+        self.assertEqual(classify_exception(FileNotFoundError("gone")), IGNORED)
+        try:
+            try:
+                raise slow_down()
+            except ClientError as e:
+                raise S3UploadFailedError(f"Failed to upload: {e}")
+        except S3UploadFailedError as wrapped:
+            self.assertEqual(classify_exception(wrapped), THROTTLED)
+
+    def test_limit_grows_only_while_fully_used(self):
+        """Healthy requests should raise the limit only when every slot is in use."""
+        limiter = AdaptiveConcurrency("test", max_limit=8, initial_limit=1)
+
+        for _ in range(10):
+            self.run_request(limiter)
+
+        # The first request used the only slot; afterwards one sequential request never fills two
+        self.assertEqual(limiter.limit, 2)
+
+    def test_limit_grows_under_load_up_to_the_maximum(self):
+        """Concurrent healthy requests should ramp the limit up to max_limit."""
+        limiter = AdaptiveConcurrency("test", max_limit=6, initial_limit=1)
+
+        def worker():
+            for _ in range(30):
+                with limiter.request():
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(limiter.limit, 6)
+        self.assertEqual(limiter.stats().requests, 240)
+
+    def test_throttling_halves_the_limit_once_per_cooldown(self):
+        """A burst of throttled requests should cut the limit once, not once per request."""
+        limiter = AdaptiveConcurrency("test", max_limit=16, initial_limit=16, min_cooldown=60)
+
+        for _ in range(5):
+            self.run_request(limiter, slow_down())
+
+        self.assertEqual(limiter.limit, 8)
+        self.assertEqual(limiter.stats().throttled, 5)
+
+    def test_limit_never_drops_below_minimum(self):
+        """Repeated throttling should stop at min_limit."""
+        limiter = AdaptiveConcurrency("test", max_limit=16, initial_limit=16, min_limit=2, min_cooldown=0)
+
+        for _ in range(10):
+            self.run_request(limiter, slow_down())
+
+        self.assertEqual(limiter.limit, 2)
+
+    def test_missing_key_does_not_reduce_limit(self):
+        """A 404 from head_object is a normal answer, not a sign of load."""
+        limiter = AdaptiveConcurrency("test", max_limit=4, initial_limit=4)
+
+        self.run_request(limiter, client_error("404", "HeadObject", 404))
+
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats().errors, 0)
+
+    def test_request_blocks_at_the_limit(self):
+        """No more requests than the limit should be in flight at once."""
+        limiter = AdaptiveConcurrency("test", max_limit=2, initial_limit=2)
+        release = threading.Event()
+        entered = threading.Semaphore(0)
+
+        def worker():
+            with limiter.request():
+                entered.release()
+                release.wait()
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(entered.acquire(timeout=1))
+        self.assertTrue(entered.acquire(timeout=1))
+        self.assertFalse(entered.acquire(timeout=0.1))
+        self.assertEqual(limiter.stats().in_flight, 2)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_stats_report_latencies(self):
+        """Stats should expose the observed latencies, per MiB for sized requests."""
+        limiter = AdaptiveConcurrency("upload", max_limit=4)
+
+        with patch("pds.web_analytics.concurrency.time.monotonic", side_effect=[10.0, 14.0]):
+            with limiter.request(size=4 * 1024 * 1024):
+                pass
+
+        stats = limiter.stats()
+        self.assertEqual(stats.requests, 1)
+        self.assertAlmostEqual(stats.latency_p50, 1.0)
+        self.assertAlmostEqual(stats.latency_p95, 1.0)
+        self.assertAlmostEqual(stats.latency_smoothed, 1.0)
+
+
+class TestS3SyncThrottling(unittest.TestCase):
+    """Test cases for S3Sync against an S3 stand-in that throttles."""
+
+    def setUp(self):
+        """Set up a log directory and a fake S3 client."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.temp_dir, "atm")
+        os.makedirs(self.log_dir)
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.fake_s3 = FakeS3()
+        patcher = patch("boto3.client", return_value=self.fake_s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_logs(self, count):
+        """Write some log files and return their paths."""
+        paths = [os.path.join(self.log_dir, f"access.2025-01-{i + 1:02d}.log") for i in range(count)]
+        for path in paths:
+            with open(path, "w") as f:
+                f.write("GET / 200\n")
+        return paths
+
+    def test_throttled_upload_cuts_upload_concurrency(self):
+        """A SlowDown from S3 should halve the uploads allowed in flight."""
+        path = self.write_logs(1)[0]
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=8, enable_gzip=False)
+        self.fake_s3.inject_errors("put_object", slow_down())
+
+        result = s3_sync.sync_file(path, "logs/atm/access.2025-01-01.log")
+
+        self.assertEqual(result, FAILED)
+        stats = s3_sync.upload_concurrency.stats()
+        self.assertEqual(stats.limit, 2)
+        self.assertEqual(stats.throttled, 1)
+
+    def test_throttled_transfer_cuts_upload_concurrency(self):
+        """A SlowDown behind the S3UploadFailedError of boto3's upload_file should count as throttling."""
+        path = self.write_logs(1)[0]
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=8, enable_gzip=False, small_file_threshold=0)
+        self.fake_s3.inject_errors("upload_file", slow_down())
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            self.assertFalse(s3_sync.upload_file(path, "logs/atm/access.2025-01-01.log"))
+
+        stats = s3_sync.upload_concurrency.stats()
+        self.assertEqual((stats.limit, stats.throttled), (2, 1))
+
+    def test_retried_requests_cut_concurrency(self):
+        """Requests that succeeded only after botocore retried them should back off their limiter."""
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=8, enable_gzip=False)
+
+        for operation, retries in (("PutObject", 1), ("HeadObject", 0), ("GetObject", 2)):
+            self.fake_s3.meta.events.emit(
+                f"after-call.s3.{operation}",
+                parsed={"ResponseMetadata": {"HTTPStatusCode": 200, "RetryAttempts": retries}},
+                model=SimpleNamespace(name=operation),
+            )
+
+        upload_stats, request_stats = s3_sync.concurrency_stats()
+        self.assertEqual((upload_stats.limit, upload_stats.throttled), (2, 1))
+        self.assertEqual(request_stats.throttled, 0)
+
+    def test_sync_recovers_from_throttling(self):
+        """Files after a throttled burst should still be uploaded at the reduced concurrency."""
+        paths = self.write_logs(12)
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=8, enable_gzip=False)
+        self.fake_s3.inject_errors("list_objects_v2", client_error("SlowDown", "ListObjectsV2", 503))
+        self.fake_s3.inject_errors("head_object", client_error("SlowDown", "HeadObject", 503), times=2)
+        self.fake_s3.inject_errors("put_object", slow_down(), times=3)
+
+        s3_sync.sync_directory((self.log_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(len(self.fake_s3.objects), 9)
+        upload_stats, request_stats = s3_sync.concurrency_stats()
+        self.assertEqual(upload_stats.throttled, 3)
+        self.assertEqual(request_stats.throttled, 3)
+        self.assertLess(upload_stats.limit, 8)
+
+        # The failed files are uploaded by the next run
+        s3_sync.sync_directory((self.log_dir, {"include": ["*.log"]}))
+        self.assertEqual(len(self.fake_s3.objects), 12)
+        self.assertEqual(s3_sync.sync_file(paths[0], "logs/atm/new.log"), UPLOADED)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
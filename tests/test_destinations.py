@@ -0,0 +1,75 @@
+"""Unit tests for the Destination class."""
+import threading
+import unittest
+from unittest.mock import patch
+
+from pds.web_analytics.destinations import Destination
+from tests.fake_s3 import FakeS3
+
+
+class TestDestination(unittest.TestCase):
+    """Test cases for the Destination class."""
+
+    def setUp(self):
+        """Patch the S3 client with a fake one."""
+        self.s3 = FakeS3()
+        patcher = patch("boto3.client", return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_from_config(self):
+        """Entries without a prefix should use the primary one, and entries without a bucket be rejected."""
+        destination = Destination.from_config({"s3_bucket": "dr-bucket"}, "logs/")
+        self.assertEqual((destination.name, destination.s3_subdir), ("s3://dr-bucket/logs", "logs"))
+        self.assertEqual(Destination.from_config({"s3_bucket": "dr", "s3_subdir": ""}, "logs").name, "s3://dr")
+        with self.assertRaises(ValueError):
+            Destination.from_config({"s3_subdir": "logs"}, "logs")
+
+    def test_key_replaces_the_primary_prefix(self):
+        """Keys should keep their path below the primary prefix, under the destination's own."""
+        destination = Destination("dr-bucket", "replica/logs")
+
+        self.assertEqual(
+            destination.key("/atm/atm-apache-http/access.log.gz"), "replica/logs/atm/atm-apache-http/access.log.gz"
+        )
+        self.assertEqual(Destination("dr-bucket", "").key("atm/access.log.gz"), "atm/access.log.gz")
+
+    def test_submit_refuses_copies_beyond_the_backlog(self):
+        """Copies beyond the threads and backlog should be refused at once instead of waiting."""
+        destination = Destination("dr-bucket", "logs", workers=1, max_backlog=1)
+        release = threading.Event()
+
+        futures = [destination.submit(release.wait) for _ in range(3)]
+        self.assertIsNone(futures[2])
+        release.set()
+        for future in futures[:2]:
+            self.assertTrue(future.result())
+        self.assertIsNotNone(destination.submit(release.wait))
+
+    def test_close_stops_the_threads_until_the_next_copy(self):
+        """Closing should wait for queued copies and stop the threads, which a later copy starts again."""
+        destination = Destination("dr-bucket", "logs", workers=2)
+        future = destination.submit(lambda: True)
+
+        destination.close()
+
+        self.assertTrue(future.done())
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith("copy")])
+        self.assertTrue(destination.submit(lambda: True).result())
+        destination.close()
+
+    def test_remote_object_uses_index_or_head(self):
+        """Existence checks should answer from a listing when it covers the key, and a HEAD request otherwise."""
+        self.s3.put_object(Bucket="dr-bucket", Key="logs/atm/a.log", Body=b"test content")
+        destination = Destination("dr-bucket", "logs")
+
+        index = destination.build_index("logs/atm/")
+        self.assertEqual(destination.remote_object("logs/atm/a.log", index)[0], 12)
+        self.assertIsNone(destination.remote_object("logs/atm/b.log", index))
+        self.assertEqual(self.s3.operations("head_object"), [])
+        self.assertEqual(destination.remote_object("logs/atm/a.log")[0], 12)
+        self.assertEqual(len(self.s3.operations("head_object")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+"""Unit tests for the dates of log files."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from datetime import datetime
+
+from pds.web_analytics.file_dates import date_from_contents
+from pds.web_analytics.file_dates import date_from_name
+from pds.web_analytics.file_dates import file_date
+
+
+class TestFileDates(unittest.TestCase):
+    """Test cases for parsing the dates of log files."""
+
+    def setUp(self):
+        """Create a temporary directory for log files."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def write_log(self, name, text, compress=False):
+        """Write a log file and return its path."""
+        path = os.path.join(self.temp_dir, name)
+        with (gzip.open if compress else open)(path, "wb") as f:
+            f.write(text.encode())
+        return path
+
+    def test_date_from_name(self):
+        """Test the date stamps of the rotated logs the nodes send."""
+        self.assertEqual(date_from_name("atm-atmos-apache.2025-01-31.txt"), date(2025, 1, 31))
+        self.assertEqual(date_from_name("atm-atmos-apache.2025-01-31.txt.gz"), date(2025, 1, 31))
+        self.assertEqual(date_from_name("u_ex250131.log"), date(2025, 1, 31))
+        self.assertEqual(date_from_name("access_log-20250131.gz"), date(2025, 1, 31))
+        self.assertEqual(date_from_name("xferlog.2025.01.31"), date(2025, 1, 31))
+
+    def test_date_from_name_without_date(self):
+        """Test that names without a valid date stamp give None."""
+        self.assertIsNone(date_from_name("access_log"))
+        self.assertIsNone(date_from_name("access_log.1"))
+        self.assertIsNone(date_from_name("access.2025-13-01.log"))
+        self.assertIsNone(date_from_name("u_ex251301.log"))
+        self.assertIsNone(date_from_name("request-12025010199.log"))
+
+    def test_date_from_name_skips_invalid_stamps(self):
+        """Test that an impossible date is skipped in favor of a later valid one."""
+        self.assertEqual(date_from_name("host-2025-02-30.access.2025-02-28.log"), date(2025, 2, 28))
+
+    def test_date_from_contents(self):
+        """Test the timestamps of the first records of each log format."""
+        logs = {
+            "apache": '192.168.1.1 - - [25/Dec/2023:10:30:45 +0000] "GET /data/file.txt HTTP/1.1" 200 1024\n',
+            "iis": "#Software: Microsoft IIS\n#Date: 2023-12-25 00:00:01\n2023-12-25 10:30:45 W3SVC1 GET /data 80\n",
+            "ftp": "Mon Dec 25 10:30:45 2023 1 192.168.1.1 1024 /data/file.txt a _ o r user ftp 0 * c\n",
+        }
+        for name, text in logs.items():
+            with self.subTest(name=name):
+                self.assertEqual(date_from_contents(self.write_log(name, text)), date(2023, 12, 25))
+                self.assertEqual(date_from_contents(self.write_log(name + ".gz", text, True)), date(2023, 12, 25))
+
+    def test_date_from_contents_without_timestamps(self):
+        """Test that unreadable files and files without timestamps give None."""
+        self.assertIsNone(date_from_contents(self.write_log("empty", "")))
+        self.assertIsNone(date_from_contents(self.write_log("text", "no timestamps here\n")))
+        self.assertIsNone(date_from_contents(os.path.join(self.temp_dir, "missing")))
+        with open(os.path.join(self.temp_dir, "truncated.gz"), "wb") as f:
+            f.write(b"\x1f\x8b\x08")
+        self.assertIsNone(date_from_contents(os.path.join(self.temp_dir, "truncated.gz")))
+
+    def test_file_date_falls_back_to_mtime(self):
+        """Test that files without a date stamp are dated by their modification time."""
+        mtime = datetime(2025, 1, 31, 12).timestamp()
+        self.assertEqual(file_date("access_log", mtime), date(2025, 1, 31))
+        self.assertEqual(file_date("access.2024-12-31.log", mtime), date(2024, 12, 31))
+
+    def test_file_date_reads_contents(self):
+        """Test that the first record dates a file without a date stamp in its name, when its path is given."""
+        path = self.write_log("access_log", '1.2.3.4 - - [25/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1\n')
+        mtime = datetime(2025, 1, 31, 12).timestamp()
+        self.assertEqual(file_date("access_log", mtime, path), date(2023, 12, 25))
+        self.assertEqual(file_date("access_log", mtime), date(2025, 1, 31))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
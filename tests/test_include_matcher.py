@@ -0,0 +1,59 @@
+"""Unit tests for the IncludeMatcher class."""
+import fnmatch
+import unittest
+
+from pds.web_analytics.include_matcher import compile_include_patterns
+from pds.web_analytics.include_matcher import IncludeMatcher
+
+
+class TestIncludeMatcher(unittest.TestCase):
+    """Test cases for the IncludeMatcher class."""
+
+    def test_production_patterns(self):
+        """Patterns from config_prod_final.yaml should match their node's log names only."""
+        cases = [
+            ("atm-atmos-apache.2025-*.txt.gz", "atm-atmos-apache.2025-06-01.txt.gz", True),
+            ("atm-atmos-apache.2025-*.txt.gz", "atm-atmos-apache.2024-06-01.txt.gz", False),
+            ("*.2025-*.txt.gz", "pds-proxy.2025-03-04.txt.gz", True),
+            ("*.2025-*.txt.gz", "pds-proxy.2025-03-04.log.gz", False),
+            ("u_ex25*.gz", "u_ex250101.log.gz", True),
+            ("u_ex25*.gz", "u_ex241231.log.gz", False),
+            ("*-2025*.gz", "access_log-20250101.gz", True),
+            ("*2025-*.log.gz", "localhost_access_log.2025-01-01.log.gz", True),
+        ]
+        for pattern, name, expected in cases:
+            with self.subTest(pattern=pattern, name=name):
+                self.assertEqual(IncludeMatcher([pattern]).match(name), expected)
+
+    def test_matches_fnmatch_semantics(self):
+        """Every kind of pattern should agree with fnmatch.fnmatchcase."""
+        patterns = ["*", "*.*", "file*", "*.log", "exact.txt", "a?c", "[ab]*.gz", "*mid*", "txt", ""]
+        names = ["file.txt", "abc", "a.gz", "b.gz", "c.gz", "exact.txt", "notexact.txt", "server.log", "midway", ""]
+        for pattern in patterns:
+            matcher = IncludeMatcher([pattern])
+            for name in names:
+                with self.subTest(pattern=pattern, name=name):
+                    self.assertEqual(matcher.match(name), fnmatch.fnmatchcase(name, pattern))
+
+    def test_multiple_patterns(self):
+        """A name should match if it matches any of the patterns."""
+        matcher = IncludeMatcher(["*.log", "access*", "u_ex25*.gz", "exact.txt"])
+
+        self.assertTrue(matcher.match("server.log"))
+        self.assertTrue(matcher.match("access.txt"))
+        self.assertTrue(matcher.match("u_ex250101.log.gz"))
+        self.assertTrue(matcher.match("exact.txt"))
+        self.assertFalse(matcher.match("other.txt"))
+
+    def test_no_suffix_catch_all(self):
+        """A bare pattern should no longer match names that merely end with it."""
+        self.assertFalse(IncludeMatcher(["txt"]).match("file.txt"))
+        self.assertFalse(IncludeMatcher(["Log"]).match("file.log"))
+
+    def test_compile_include_patterns_is_cached(self):
+        """The same patterns should compile to the same matcher."""
+        self.assertIs(compile_include_patterns(("*.log",)), compile_include_patterns(("*.log",)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
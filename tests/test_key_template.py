@@ -0,0 +1,52 @@
+"""Unit tests for S3 key templates."""
+import unittest
+from datetime import date
+
+from pds.web_analytics.key_template import KeyTemplate
+
+HIVE_TEMPLATE = "node={node}/dataset={dataset}/year={year}/month={month}/day={day}/{name}"
+
+
+class TestKeyTemplate(unittest.TestCase):
+    """Test cases for KeyTemplate."""
+
+    def test_render_hive_partitions(self):
+        """Test that a Hive-style template places a file under its date partitions."""
+        template = KeyTemplate(HIVE_TEMPLATE)
+
+        key = template.render("atm", "atm-apache-http", date(2025, 1, 5), "2025/atm-atmos-apache.2025-01-05.txt.gz")
+
+        self.assertEqual(
+            key, "node=atm/dataset=atm-apache-http/year=2025/month=01/day=05/atm-atmos-apache.2025-01-05.txt.gz"
+        )
+        self.assertTrue(template.uses_date)
+
+    def test_render_path(self):
+        """Test that {path} keeps the directories below the dataset."""
+        template = KeyTemplate("{node}/{dataset}/{path}")
+
+        self.assertEqual(
+            template.render("geo", "geo-ode", date(2025, 1, 5), "W3SVC1/u_ex250105.log.gz"),
+            "geo/geo-ode/W3SVC1/u_ex250105.log.gz",
+        )
+        self.assertFalse(template.uses_date)
+
+    def test_prefix(self):
+        """Test the prefix shared by every key of a dataset."""
+        self.assertEqual(
+            KeyTemplate(HIVE_TEMPLATE).prefix("atm", "atm-apache-http"), "node=atm/dataset=atm-apache-http/"
+        )
+        self.assertEqual(KeyTemplate("{node}/{year}/{dataset}-{name}").prefix("atm", "atm-apache-http"), "atm/")
+        self.assertEqual(KeyTemplate("{year}/{node}/{name}").prefix("atm", "atm-apache-http"), "")
+        self.assertEqual(KeyTemplate("{node}/{dataset}-{year}/{name}").prefix("atm", "atm-apache-http"), "atm/")
+
+    def test_invalid_templates(self):
+        """Test that templates with unknown fields or without a per-file field are rejected."""
+        for template in ("{node}/{host}/{name}", "{node}/{0}/{name}", "{node}/{year:04d}/{name}", "{node}/{day}/"):
+            with self.subTest(template=template):
+                with self.assertRaises(ValueError):
+                    KeyTemplate(template)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,153 @@
+"""Unit tests for coordinating sync workers with consistent hashing and S3 leases."""
+import threading
+import time
+import unittest
+from collections import Counter
+
+from pds.web_analytics.leases import cluster_settings
+from pds.web_analytics.leases import HashRing
+from pds.web_analytics.leases import lease_key
+from pds.web_analytics.leases import LeaseManager
+from tests.fake_s3 import client_error
+from tests.fake_s3 import FakeS3
+
+PATHS = [f"atm/atm-apache-http/access.2025-01-{day:02d}.log.gz" for day in range(1, 32)] + [
+    f"img/img-ftp/xferlog-{i}.gz" for i in range(300)
+]
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self, now=1000.0):
+        """Start at ``now``."""
+        self.now = now
+
+    def __call__(self):
+        """Return the current time."""
+        return self.now
+
+
+class TestLeases(unittest.TestCase):
+    """Test cases for cluster coordination."""
+
+    def test_cluster_settings(self):
+        """Test building settings from config entries."""
+        self.assertIsNone(cluster_settings(None))
+        settings = cluster_settings({"worker": "a", "workers": ["a", "b"], "lease_seconds": 60})
+        self.assertEqual((settings.worker, settings.workers, settings.lease_seconds), ("a", ("a", "b"), 60.0))
+        self.assertTrue(cluster_settings(True).worker)
+        with self.assertRaises(ValueError):
+            cluster_settings({"worker": "c", "workers": ["a", "b"]})
+        with self.assertRaises(ValueError):
+            cluster_settings({"worker": "a", "lease_seconds": 0})
+
+    def test_lease_key(self):
+        """Test that leases are kept outside the dataset prefixes."""
+        self.assertEqual(lease_key("logs", "logs/atm/atm-ftp/ftp.log.gz"), "logs/_leases/atm/atm-ftp/ftp.log.gz.json")
+
+    def test_hash_ring_spreads_paths_and_moves_few_of_them(self):
+        """Test that paths are split evenly, the same way in any worker order, and a new worker only takes its share."""
+        ring = HashRing(("a", "b", "c"))
+        owners = {path: ring.owner(path) for path in PATHS}
+
+        counts = Counter(owners.values())
+        self.assertEqual(set(counts), {"a", "b", "c"})
+        self.assertGreater(min(counts.values()), len(PATHS) / 6)
+        self.assertEqual({path: HashRing(("c", "a", "b")).owner(path) for path in PATHS}, owners)
+        grown = HashRing(("a", "b", "c", "d"))
+        moved = [path for path in PATHS if grown.owner(path) != owners[path]]
+        self.assertTrue(all(grown.owner(path) == "d" for path in moved))
+        self.assertLess(len(moved), len(PATHS) / 2)
+
+    def test_only_one_worker_takes_a_lease(self):
+        """Test that of several workers racing for a lease exactly one gets it, until it is released."""
+        s3 = FakeS3()
+        managers = [LeaseManager(s3, "bucket", "logs", f"worker-{i}") for i in range(8)]
+        leases = [None] * len(managers)
+        barrier = threading.Barrier(len(managers))
+
+        def take(i):
+            barrier.wait()
+            leases[i] = managers[i].acquire("logs/atm/ftp.log.gz")
+
+        threads = [threading.Thread(target=take, args=(i,)) for i in range(len(managers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        held = [lease for lease in leases if lease is not None]
+        self.assertEqual(len(held), 1)
+        managers[0].release(held[0])
+        self.assertNotIn(held[0].key, s3.objects)
+        self.assertIsNotNone(managers[1].acquire("logs/atm/ftp.log.gz"))
+
+    def test_expired_lease_is_taken_over_and_not_released_by_its_old_holder(self):
+        """Test that an expired lease passes to one new holder, and the old holder cannot remove it."""
+        s3 = FakeS3()
+        clock = Clock()
+        old = LeaseManager(s3, "bucket", "logs", "old", lease_seconds=60, clock=clock)
+        new = LeaseManager(s3, "bucket", "logs", "new", lease_seconds=60, clock=clock)
+        stale = old.acquire("logs/a.log.gz")
+
+        self.assertIsNone(new.acquire("logs/a.log.gz"))
+        clock.now += 61
+        taken = new.acquire("logs/a.log.gz")
+        old.release(stale)
+
+        self.assertIsNotNone(taken)
+        self.assertIn(b'"new"', s3.objects[taken.key]["Body"])
+        self.assertIsNone(old.acquire("logs/a.log.gz"))
+
+    def test_own_lease_is_taken_back(self):
+        """Test that a lease left behind by a failed release does not keep its holder from the upload."""
+        s3 = FakeS3()
+        manager = LeaseManager(s3, "bucket", "logs", "a", lease_seconds=3600, clock=Clock())
+        stale = manager.acquire("logs/a.log.gz")
+        s3.inject_errors("delete_object", client_error("InternalError", "DeleteObject", 500))
+        manager.release(stale)
+
+        taken = manager.acquire("logs/a.log.gz")
+
+        self.assertIsNotNone(taken)
+        self.assertIsNone(LeaseManager(s3, "bucket", "logs", "b", clock=Clock()).acquire("logs/a.log.gz"))
+
+    def test_held_lease_is_renewed_and_released(self):
+        """Test that a lease is renewed while held past its duration, and released afterwards."""
+        s3 = FakeS3()
+        manager = LeaseManager(s3, "bucket", "logs", "a", lease_seconds=0.3)
+        lease = manager.acquire("logs/a.log.gz")
+
+        with manager.held(lease):
+            time.sleep(0.5)
+            etag = s3.objects[lease.key]["ETag"]
+
+        self.assertGreaterEqual(len(s3.operations("put_object")), 3)
+        self.assertNotEqual(etag, lease.etag)
+        self.assertNotIn(lease.key, s3.objects)
+
+    def test_held_lease_taken_over_is_not_released(self):
+        """Test that a lease lost while held is left to the worker that took it over."""
+        s3 = FakeS3()
+        manager = LeaseManager(s3, "bucket", "logs", "a", lease_seconds=0.3)
+        lease = manager.acquire("logs/a.log.gz")
+
+        with manager.held(lease):
+            s3.objects[lease.key]["ETag"] = '"taken"'
+            time.sleep(0.2)
+
+        self.assertEqual(s3.objects[lease.key]["ETag"], '"taken"')
+        self.assertEqual(s3.operations("delete_object"), [])
+
+    def test_lease_errors_are_raised(self):
+        """Test that an error other than a lost race is not taken for a held lease."""
+        s3 = FakeS3()
+        s3.inject_errors("put_object", client_error("AccessDenied", "PutObject", 403))
+
+        with self.assertRaises(Exception):
+            LeaseManager(s3, "bucket", "logs", "a").acquire("logs/a.log.gz")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,93 @@
+"""Unit tests for the pre-upload line filter."""
+import unittest
+
+from pds.web_analytics.line_filter import filter_rules
+from pds.web_analytics.line_filter import LineFilter
+
+KEPT = [
+    b'192.168.1.1 - - [31/Jan/2025:10:30:45 +0000] "GET /data/file.txt HTTP/1.1" 200 1024 "-" "Mozilla/5.0"',
+    b'192.168.1.1 - - [31/Jan/2025:10:30:45 +0000] "get /data/file.txt HTTP/1.1" 200 1024',
+    b"2025-01-31 10:30:45 W3SVC1 10.0.0.1 GET /data/file.txt - 80 - 192.168.1.1 Mozilla/5.0 200 0 0 1024 0 15",
+    b"2025-01-31 10:30:45 10.0.0.1 POST /data/file.txt - 80 - 192.168.1.1 Mozilla/5.0 200 0 0 1024 0 15",
+    b"2025-01-31 10:30:45 192.168.1.1 anonymous MSFTPSVC1 10.0.0.1 21 RETR /data/file.txt 226 0 1024 0 15",
+    b"Fri Jan 31 10:30:45 2025 1 192.168.1.1 1024 /data/file.txt a _ o r user ftp 0 * c",
+]
+DROPPED = {
+    b"#Fields: date time s-sitename s-ip cs-method": "comments",
+    b'::1 - - [31/Jan/2025:10:30:45 +0000] "GET / HTTP/1.1" 200 10 "-" "curl"': "loopback",
+    b"2025-01-31 10:30:45 W3SVC1 10.0.0.1 GET / - 80 - 127.0.0.1 Mozilla/5.0 200 0 0 1024 0 15": "loopback",
+    b'10.0.0.2 - - [31/Jan/2025:10:30:45 +0000] "OPTIONS * HTTP/1.0" 200 - "-" '
+    b'"Apache/2.4.62 (Unix) (internal dummy connection)"': "dummy-connection",
+    b'192.168.1.1 - - [31/Jan/2025:10:30:45 +0000] "TRACE / HTTP/1.1" 405 10 "-" "Nessus"': "invalid-method",
+    b"2025-01-31 10:30:45 W3SVC1 10.0.0.1 SSTP_DUPLEX_POST /sra_{BA195980}/ - 443 - 192.168.1.1 - 200 0 0 0 0 15": (
+        "invalid-method"
+    ),
+}
+
+
+def run(line_filter, data, chunk_size):
+    """Feed data through a filter in chunks and return what it keeps."""
+    kept = b"".join(line_filter.update(data[i : i + chunk_size]) for i in range(0, len(data), chunk_size))
+    return kept + line_filter.flush()
+
+
+class TestLineFilter(unittest.TestCase):
+    """Test cases for the line filter."""
+
+    def test_builtin_rules(self):
+        """Test that each built-in rule drops its records and keeps ordinary traffic of every format."""
+        rules = filter_rules(True)
+        for line in KEPT:
+            with self.subTest(line=line):
+                line_filter = LineFilter(rules)
+                self.assertEqual(run(line_filter, line + b"\n", 1024), line + b"\n")
+                self.assertEqual(sum(line_filter.dropped.values()), 0)
+        for line, rule in DROPPED.items():
+            with self.subTest(line=line):
+                line_filter = LineFilter(rules)
+                self.assertEqual(run(line_filter, line + b"\n", 1024), b"")
+                self.assertEqual({name: count for name, count in line_filter.dropped.items() if count}, {rule: 1})
+
+    def test_records_split_across_chunks(self):
+        """Test that records are filtered whole wherever chunks are cut, including a last one without a newline."""
+        lines = KEPT + list(DROPPED)
+        data = b"\n".join(lines)
+        expected = b"\n".join(KEPT) + b"\n"
+
+        for chunk_size in (1, 7, 100, len(data)):
+            with self.subTest(chunk_size=chunk_size):
+                line_filter = LineFilter(filter_rules(True))
+                self.assertEqual(run(line_filter, data, chunk_size), expected)
+                self.assertEqual(
+                    line_filter.dropped,
+                    {"comments": 1, "loopback": 2, "dummy-connection": 1, "invalid-method": 2},
+                )
+
+    def test_custom_rules(self):
+        """Test configured patterns, counting records that match several rules under the first."""
+        rules = filter_rules(
+            [
+                "loopback",
+                {"name": "health-check", "pattern": "ELB-HealthChecker/|^::1 "},
+                {"name": "blank", "pattern": "^$"},
+            ]
+        )
+        data = b'::1 - - "ELB-HealthChecker/2.0"\n\n1.2.3.4 - - "ELB-HealthChecker/2.0"\n1.2.3.4 - - "curl"\n'
+
+        line_filter = LineFilter(rules)
+
+        self.assertEqual(run(line_filter, data, 10), b'1.2.3.4 - - "curl"\n')
+        self.assertEqual(line_filter.dropped, {"loopback": 1, "health-check": 1, "blank": 1})
+
+    def test_invalid_rules(self):
+        """Test that unknown rules, incomplete rules and invalid patterns are rejected."""
+        self.assertEqual(filter_rules(None), ())
+        self.assertEqual(filter_rules([]), ())
+        for config in (["spam"], [{"name": "no-pattern"}], [{"name": "bad", "pattern": "("}]):
+            with self.subTest(config=config):
+                with self.assertRaises(ValueError):
+                    filter_rules(config)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
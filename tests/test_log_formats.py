@@ -0,0 +1,74 @@
+"""Unit tests for log format detection."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pds.web_analytics.log_formats import classify_line
+from pds.web_analytics.log_formats import detect_file_format
+from pds.web_analytics.log_formats import detect_format
+
+# One record of each format handled by the grok alternatives in pds-filter.conf
+SAMPLES = {
+    "cloudfront-w3c": "2025-01-31\t10:30:45\tLAX50-P1\t1024\t192.168.1.1\tGET\td1.cloudfront.net\t/data/file.txt\t200\t-\t"
+    "Mozilla/5.0\t-\t-\tHit\tabc==\tpds.nasa.gov\thttps\t120\t0.002",
+    "iis-ftp": "2025-01-31 10:30:45 192.168.1.1 anonymous MSFTPSVC1 10.0.0.1 21 RETR /data/file.txt 226 0 1024 0 15",
+    "iis": "2025-01-31 10:30:45 W3SVC1 10.0.0.1 GET /data/file.txt - 80 - 192.168.1.1 Mozilla/5.0 200 0 0 1024 0 15",
+    "iis-nosite": "2025-01-31 10:30:45 10.0.0.1 GET /data/file.txt - 80 - 192.168.1.1 Mozilla/5.0 200 0 0 1024 0 15",
+    "xferlog": "Fri Jan 31 10:30:45 2025 1 192.168.1.1 1024 /data/file.txt a _ o r user ftp 0 * c",
+    "apache-combined": '192.168.1.1 - - [31/Jan/2025:10:30:45 +0000] "GET /data/file.txt HTTP/1.1" 200 1024 '
+    '"http://referrer.com" "Mozilla/5.0"',
+    "apache-common": '192.168.1.1 - - [31/Jan/2025:10:30:45 +0000] "GET /webapp/data HTTP/1.1" 200 1024',
+    "apache-minimal": '192.168.1.1 - - [31/Jan/2025:10:30:45 +0000] "GET /data/file.txt HTTP/1.1"',
+}
+
+
+class TestLogFormats(unittest.TestCase):
+    """Test cases for log format detection."""
+
+    def test_classify_line(self):
+        """Test that each sample record is classified as its own format."""
+        for name, line in SAMPLES.items():
+            with self.subTest(name=name):
+                self.assertEqual(classify_line(line.encode()).name, name)
+        self.assertIsNone(classify_line(b"not a log record"))
+
+    def test_classify_apache_variants(self):
+        """Test records with IPv6 clients, resolved host names and free-text user names."""
+        ipv6 = (
+            '::1 - - [31/Jan/2025:10:30:45 +0000] "OPTIONS * HTTP/1.0" 200 - "-" "Apache (internal dummy connection)"'
+        )
+        host = 'host.example.com - - [31/Jan/2025:10:30:45 +0000] "GET /data HTTP/1.1" 304 -'
+        user = '192.168.1.1 - John Smith [31/Jan/2025:10:30:45 -0700] "GET /data HTTP/1.1" 200 10 "-" "curl"'
+
+        self.assertEqual(classify_line(ipv6.encode()).name, "apache-combined")
+        self.assertEqual(classify_line(host.encode()).name, "apache-common")
+        self.assertEqual(classify_line(user.encode()).name, "apache-combined")
+
+    def test_detect_format_votes_past_comments(self):
+        """Test that comment lines are skipped and the format most records match wins."""
+        head = "#Software: Microsoft IIS 10.0\n#Fields: date time s-sitename s-ip cs-method\n"
+        head += (SAMPLES["iis"] + "\n") * 3 + SAMPLES["iis-nosite"] + "\ngarbage\n"
+
+        self.assertEqual(detect_format(head.encode()).name, "iis")
+        self.assertIsNone(detect_format(b"#Version: 1.0\ngarbage\n"))
+        self.assertIsNone(detect_format(b""))
+
+    def test_detect_file_format(self):
+        """Test detection on plain and gzipped files."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        plain = os.path.join(temp_dir, "xferlog")
+        with open(plain, "w") as f:
+            f.write(SAMPLES["xferlog"] + "\n")
+        with gzip.open(plain + ".gz", "wt") as f:
+            f.write(SAMPLES["apache-combined"] + "\n")
+
+        self.assertEqual(detect_file_format(plain).name, "xferlog")
+        self.assertEqual(detect_file_format(plain + ".gz").name, "apache-combined")
+        self.assertIsNone(detect_file_format(os.path.join(temp_dir, "missing")))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
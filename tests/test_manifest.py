@@ -0,0 +1,78 @@
+"""Unit tests for the manifests of uploaded logs."""
+import unittest
+
+from pds.web_analytics.manifest import manifest_key
+from pds.web_analytics.manifest import ManifestEntry
+from pds.web_analytics.manifest import ManifestIndex
+from pds.web_analytics.manifest import publish_manifest
+from pds.web_analytics.manifest import read_manifest
+from pds.web_analytics.summary import LogSummary
+from tests.fake_s3 import client_error
+from tests.fake_s3 import FakeS3
+
+DAY = 86400
+
+
+def entry(key, start, end, size=100):
+    """Return a manifest entry of a log covering the given days."""
+    start = start * DAY if start is not None else None
+    end = end * DAY - 1 if end is not None else None
+    return ManifestEntry(key, size, size * 10, size, start, end, "apache")
+
+
+class TestManifest(unittest.TestCase):
+    """Test cases for manifests."""
+
+    def test_manifest_key(self):
+        """Test that manifests are kept outside the dataset prefixes."""
+        self.assertEqual(manifest_key("logs", "atm/atm-apache-http"), "logs/_manifests/atm/atm-apache-http.jsonl")
+        self.assertEqual(manifest_key("", "atm/atm-apache-http"), "_manifests/atm/atm-apache-http.jsonl")
+
+    def test_json_round_trip(self):
+        """Test that entries survive JSON, with times to the second in UTC."""
+        summary = LogSummary(lines=3, raw_bytes=300, start=1703500245.0, end=1703586645.0, log_format="w3c")
+        original = ManifestEntry.from_summary("logs/atm/a.log.gz", 120, summary)
+
+        line = original.to_json()
+
+        self.assertIn('"start":"2023-12-25T10:30:45Z"', line)
+        self.assertEqual(ManifestEntry.from_json(line), original)
+        undated = ManifestEntry("logs/atm/b.log.gz", 10, 20, 1, None, None, None)
+        self.assertEqual(ManifestEntry.from_json(undated.to_json()), undated)
+
+    def test_covering(self):
+        """Test finding the entries that overlap a time range."""
+        index = ManifestIndex(
+            [entry("d3", 3, 4), entry("d1", 1, 2), entry("long", 0, 10), entry("d2", 2, 3), entry("none", None, None)]
+        )
+
+        self.assertEqual([e.key for e in index.entries], ["long", "d1", "d2", "d3"])
+        self.assertEqual([e.key for e in index.undated], ["none"])
+        self.assertEqual([e.key for e in index.covering(2 * DAY, 2 * DAY + 3600)], ["long", "d2"])
+        self.assertEqual([e.key for e in index.covering(10 * DAY, 11 * DAY)], [])
+        self.assertEqual([e.key for e in index.covering(0, 1)], ["long"])
+
+    def test_publish_merges_with_existing_manifest(self):
+        """Test that publishing adds entries to the manifest in S3 and replaces those of re-uploaded objects."""
+        s3 = FakeS3()
+        key = "logs/_manifests/atm/atm-apache-http.jsonl"
+        publish_manifest(s3, "bucket", key, [entry("d2", 2, 3), entry("d1", 1, 2)])
+
+        publish_manifest(s3, "bucket", key, [entry("d2", 2, 3, size=500), entry("d3", 3, 4)])
+
+        manifest = read_manifest(s3, "bucket", key)
+        self.assertEqual([(e.key, e.size) for e in manifest.entries], [("d1", 100), ("d2", 500), ("d3", 100)])
+        self.assertEqual(s3.objects[key]["Body"].decode().count("\n"), 3)
+
+    def test_read_missing_manifest(self):
+        """Test that a dataset without a manifest reads as empty, while other errors are raised."""
+        s3 = FakeS3()
+        self.assertEqual(len(read_manifest(s3, "bucket", "logs/_manifests/none.jsonl")), 0)
+
+        s3.inject_errors("get_object", client_error("AccessDenied", "GetObject", 403))
+        with self.assertRaises(Exception):
+            read_manifest(s3, "bucket", "logs/_manifests/none.jsonl")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
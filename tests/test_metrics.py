@@ -0,0 +1,153 @@
+"""Unit tests for the sync metrics."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pds.web_analytics.metrics import Histogram
+from pds.web_analytics.metrics import SyncMetrics
+from pds.web_analytics.s3_sync import S3Sync
+from tests.fake_s3 import FakeS3
+
+
+class TestHistogram(unittest.TestCase):
+    """Test cases for the Histogram class."""
+
+    def test_cumulative_buckets(self):
+        """Buckets should count the observations at or below each bound."""
+        histogram = Histogram((0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds)
+
+        self.assertEqual(histogram.cumulative(), [("0.1", 2), ("1.0", 3), ("+Inf", 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.total, 2.65)
+
+
+class TestSyncMetrics(unittest.TestCase):
+    """Test cases for the SyncMetrics class."""
+
+    def test_report_totals_and_rates(self):
+        """The report should total files and bytes over nodes and derive rates from the run duration."""
+        with patch("pds.web_analytics.metrics.time.monotonic", side_effect=[100.0, 110.0]):
+            metrics = SyncMetrics()
+            callback = metrics.transfer_callback("atm/atm-apache-http")
+            callback(4000)
+            callback(-1000)
+            callback(2000)
+            metrics.add_bytes("geo/geo-ode", 5000)
+            metrics.record_file("atm/atm-apache-http", "uploaded")
+            metrics.record_file("atm/atm-apache-http", "skipped")
+            metrics.record_file("geo/geo-ode", "uploaded")
+            metrics.record_phase("geo/geo-ode", "upload", 0.2)
+            metrics.record_dropped_lines("geo/geo-ode", {"comments": 2, "loopback": 0})
+            metrics.record_dropped_lines("geo/geo-ode", {"comments": 1})
+            metrics.transfer_callback("geo/geo-ode", destination="s3://dr/logs")(3000)
+            metrics.record_file("geo/geo-ode", "uploaded", "s3://dr/logs")
+            metrics.finish()
+
+        report = metrics.report()
+        self.assertEqual(report["duration_seconds"], 10.0)
+        self.assertEqual(report["files"], 3)
+        self.assertEqual(report["files_uploaded"], 2)
+        self.assertEqual(report["bytes_uploaded"], 10000)
+        self.assertEqual(report["bytes_per_second"], 1000.0)
+        self.assertEqual(report["files_per_second"], 0.2)
+        self.assertEqual(report["nodes"]["atm/atm-apache-http"]["bytes_uploaded"], 5000)
+        self.assertEqual(report["nodes"]["geo/geo-ode"]["phases"]["upload"]["count"], 1)
+        self.assertEqual(report["nodes"]["geo/geo-ode"]["lines_dropped"], {"comments": 3, "loopback": 0})
+        self.assertEqual(report["lines_dropped"], 3)
+        self.assertEqual(
+            report["nodes"]["geo/geo-ode"]["destinations"],
+            {"s3://dr/logs": {"files": {"uploaded": 1}, "bytes_uploaded": 3000}},
+        )
+
+    def test_transfer_callback_feeds_throttle(self):
+        """The transfer callback should pass the bytes on to a bandwidth limit."""
+        seen = []
+        metrics = SyncMetrics()
+
+        metrics.transfer_callback("node", seen.append)(512)
+
+        self.assertEqual(seen, [512])
+
+    def test_prometheus_text(self):
+        """The textfile should hold gauges and a phase histogram with escaped labels."""
+        metrics = SyncMetrics()
+        metrics.record_file('en/"odd"', "uploaded")
+        metrics.record_phase("en/proxy", "check", 0.02)
+        metrics.record_dropped_lines("en/proxy", {"invalid-method": 4})
+        metrics.record_file("en/proxy", "failed", "s3://dr/logs")
+        metrics.finish()
+
+        text = metrics.prometheus_text()
+
+        self.assertIn("# TYPE s3_log_sync_phase_seconds histogram\n", text)
+        self.assertIn('s3_log_sync_phase_seconds_bucket{node="en/proxy",phase="check",le="0.025"} 1\n', text)
+        self.assertIn('s3_log_sync_phase_seconds_bucket{node="en/proxy",phase="check",le="+Inf"} 1\n', text)
+        self.assertIn('s3_log_sync_phase_seconds_count{node="en/proxy",phase="check"} 1\n', text)
+        self.assertIn('s3_log_sync_files{node="en/\\"odd\\"",result="uploaded"} 1\n', text)
+        self.assertIn('s3_log_sync_lines_dropped{node="en/proxy",rule="invalid-method"} 4\n', text)
+        self.assertIn(
+            's3_log_sync_destination_files{node="en/proxy",destination="s3://dr/logs",result="failed"} 1\n', text
+        )
+        self.assertIn('s3_log_sync_destination_bytes_uploaded{node="en/proxy",destination="s3://dr/logs"} 0\n', text)
+        self.assertNotIn('phase="upload"', text)
+
+
+class TestS3SyncMetrics(unittest.TestCase):
+    """Test cases for the metrics S3Sync collects during a run."""
+
+    def setUp(self):
+        """Set up two nodes of logs and a fake S3 client."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.config = {}
+        for node in ("atm/atm-apache-http", "geo/geo-ode"):
+            log_dir = os.path.join(self.temp_dir, "logs", node)
+            os.makedirs(log_dir)
+            for i in range(3):
+                with open(os.path.join(log_dir, f"access.2025-01-0{i + 1}.log"), "wb") as f:
+                    f.write(b"GET / 200\n" * 100)
+            self.config[log_dir] = {"include": ["*.log"]}
+        self.fake_s3 = FakeS3()
+        patcher = patch("boto3.client", return_value=self.fake_s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_writes_report_and_prometheus_file(self):
+        """A run should write a JSON report and a Prometheus textfile with per-node phases."""
+        report_file = os.path.join(self.temp_dir, "report.json")
+        prometheus_file = os.path.join(self.temp_dir, "s3_log_sync.prom")
+        s3_sync = S3Sync(
+            self.config,
+            os.path.join(self.temp_dir, "logs"),
+            "bucket",
+            "logs",
+            enable_gzip=True,
+            delete=True,
+            report_file=report_file,
+            prometheus_file=prometheus_file,
+        )
+
+        s3_sync.run()
+
+        with open(report_file) as f:
+            report = json.load(f)
+        self.assertEqual(report["files_uploaded"], 6)
+        self.assertEqual(report["bytes_uploaded"], sum(len(obj["Body"]) for obj in self.fake_s3.objects.values()))
+        phases = report["nodes"]["geo/geo-ode"]["phases"]
+        for phase in ("scan", "check", "compress", "upload", "delete"):
+            self.assertGreater(phases[phase]["count"], 0, phase)
+        self.assertEqual(phases["upload"]["count"], 3)
+
+        with open(prometheus_file) as f:
+            text = f.read()
+        self.assertIn('s3_log_sync_files{node="atm/atm-apache-http",result="uploaded"} 3\n', text)
+        self.assertFalse(os.path.exists(prometheus_file + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
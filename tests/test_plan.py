@@ -0,0 +1,58 @@
+"""Unit tests for sync plans and their estimates."""
+import unittest
+
+from pds.web_analytics.plan import SyncPlan
+from pds.web_analytics.plan import throughput
+from pds.web_analytics.sync_state import ThroughputRecord
+
+
+class TestPlan(unittest.TestCase):
+    """Test cases for sync plans."""
+
+    def test_throughput_of_recent_runs(self):
+        """Test that rates count each run's duration once, and ratios are kept per node."""
+        records = [
+            ThroughputRecord(1000.0, "atm", 10.0, 5, 600, 60),
+            ThroughputRecord(1000.0, "en", 10.0, 5, 400, 100),
+            ThroughputRecord(2000.0, "atm", 30.0, 5, 1000, 100),
+        ]
+
+        rate = throughput(records)
+
+        self.assertEqual(rate.runs, 2)
+        self.assertEqual(rate.bytes_per_second, 50.0)
+        self.assertEqual(rate.ratios, {"atm": 0.1, "en": 0.25})
+        self.assertIsNone(throughput([]))
+
+    def test_plan_estimates(self):
+        """Test that nodes with a history use their own ratio, and others the default for the files to gzip."""
+        plan = SyncPlan()
+        plan.node("atm").add_upload(1000, 1000)
+        plan.node("en").add_upload(500, 300, files=4, batch=True)
+        plan.node("en").add_upload(100, 0, replace=True)
+
+        report = plan.to_dict([ThroughputRecord(1000.0, "atm", 10.0, 5, 500, 100)])
+
+        self.assertEqual(report["files"], 6)
+        self.assertEqual(report["raw_bytes"], 1600)
+        self.assertEqual(report["nodes"]["atm"]["estimated_bytes"], 200)
+        self.assertEqual(report["nodes"]["en"]["estimated_bytes"], 30 + 300)
+        self.assertEqual((report["nodes"]["en"]["batches"], report["nodes"]["en"]["replaced"]), (1, 1))
+        self.assertEqual(report["projected_seconds"], 32.0)
+        self.assertEqual(report["nodes"]["atm"]["projected_seconds"], 20.0)
+        self.assertEqual(report["throughput"], {"runs": 1, "bytes_per_second": 50.0})
+
+    def test_plan_without_history_has_no_projection(self):
+        """Test that durations are left out rather than guessed without any recorded run."""
+        plan = SyncPlan()
+        plan.node("atm").add_upload(1000, 1000)
+
+        report = plan.to_dict()
+
+        self.assertIsNone(report["projected_seconds"])
+        self.assertIsNone(report["throughput"])
+        self.assertEqual(report["estimated_bytes"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,72 @@
+"""Unit tests for the S3KeyIndex class."""
+import unittest
+from unittest.mock import MagicMock
+
+from pds.web_analytics.s3_index import S3KeyIndex
+
+
+def make_client(pages):
+    """Build a mock S3 client whose list_objects_v2 paginator yields the given pages."""
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = pages
+    return client
+
+
+class TestS3KeyIndex(unittest.TestCase):
+    """Test cases for the S3KeyIndex class."""
+
+    def test_from_listing_paginates_prefix(self):
+        """Every page of the listing should end up in the index."""
+        client = make_client(
+            [
+                {"Contents": [{"Key": "logs/a.gz", "Size": 10, "ETag": '"' + "a" * 32 + '"'}]},
+                {"Contents": [{"Key": "logs/b.gz", "Size": 20, "ETag": '"' + "b" * 32 + '-3"'}]},
+                {},
+            ]
+        )
+
+        index = S3KeyIndex.from_listing(client, "bucket", "logs/", start_after="logs/")
+
+        client.get_paginator.assert_called_once_with("list_objects_v2")
+        client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="bucket", Prefix="logs/", StartAfter="logs/"
+        )
+        self.assertEqual(len(index), 2)
+        self.assertIn("logs/a.gz", index)
+        self.assertIn("logs/b.gz", index)
+        self.assertNotIn("logs/c.gz", index)
+
+    def test_lookup_returns_size_and_etag(self):
+        """Sizes and ETags, including multipart ETags, should round-trip through the index."""
+        index = S3KeyIndex("logs/")
+        index.add_many([("logs/a.gz", 10, '"' + "0123456789abcdef" * 2 + '"')])
+        index.add_many([("logs/b.gz", 20, '"' + "f" * 32 + '-12"'), ("logs/c.gz", 30, "not-an-etag")])
+
+        self.assertEqual(index.lookup("logs/a.gz"), (10, '"' + "0123456789abcdef" * 2 + '"'))
+        self.assertEqual(index.size("logs/b.gz"), 20)
+        self.assertEqual(index.etag("logs/b.gz"), '"' + "f" * 32 + '-12"')
+        self.assertEqual(index.lookup("logs/c.gz"), (30, None))
+        self.assertIsNone(index.lookup("logs/d.gz"))
+
+    def test_merges_many_runs(self):
+        """Entries added across many pages should all be found after the runs are merged."""
+        index = S3KeyIndex("logs/")
+        for page in range(50):
+            index.add_many((f"logs/file-{page}-{i}.gz", page * 100 + i, None) for i in range(100))
+
+        self.assertEqual(len(index), 5000)
+        for page in range(0, 50, 7):
+            for i in range(0, 100, 13):
+                self.assertEqual(index.size(f"logs/file-{page}-{i}.gz"), page * 100 + i)
+
+    def test_covers(self):
+        """Only keys inside the listed range can be answered from the index."""
+        index = S3KeyIndex("logs/node/", start_after="logs/node/u_ex2501")
+
+        self.assertTrue(index.covers("logs/node/u_ex250101.log.gz"))
+        self.assertFalse(index.covers("logs/node/u_ex2412.log.gz"))
+        self.assertFalse(index.covers("logs/other/u_ex250101.log.gz"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
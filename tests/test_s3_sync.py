@@ -1,19 +1,41 @@
 """Unit tests for the S3Sync class."""
 import gzip
 import io
+import json
 import os
 import shutil
+import sqlite3
 import subprocess
 import tempfile
+import threading
 import time
 import unittest
+from collections import Counter
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest.mock import ANY
 from unittest.mock import call
 from unittest.mock import MagicMock
 from unittest.mock import Mock
 from unittest.mock import patch
 
 from box import Box
+from pds.web_analytics.checksum import checksum_file
+from pds.web_analytics.checksum import ChecksumHasher
+from pds.web_analytics.concurrency import LIMITED_MAX_ATTEMPTS
+from pds.web_analytics.manifest import read_manifest
 from pds.web_analytics.s3_sync import S3Sync
+from pds.web_analytics.s3_sync import SKIPPED
+from pds.web_analytics.s3_sync import UPLOADED
+from pds.web_analytics.scheduler import FairScheduler
+from pds.web_analytics.seekable import read_block_index
+from tests.fake_s3 import client_error
+from tests.fake_s3 import FakeS3
+
+
+# ETag S3 gives a single-part upload of "test content"
+TEST_CONTENT_ETAG = '"9473fdd0d880a43c21b7778d34872157"'
 
 
 class TestS3Sync(unittest.TestCase):
@@ -57,7 +79,7 @@ class TestS3Sync(unittest.TestCase):
         self.assertEqual(s3_sync.bucket_name, "test-bucket")
         self.assertEqual(s3_sync.profile_name, "test-profile")
         mock_session.assert_called_once_with(profile_name="test-profile")
-        mock_session_instance.client.assert_called_once_with("s3")
+        mock_session_instance.client.assert_called_with("s3", config=ANY)
 
     @patch("boto3.client")
     def test_init_without_profile(self, mock_client):
@@ -75,7 +97,32 @@ class TestS3Sync(unittest.TestCase):
 
         self.assertFalse(s3_sync.enable_gzip)
         self.assertIsNone(s3_sync.profile_name)
-        mock_client.assert_called_once_with("s3")
+        mock_client.assert_called_with("s3", config=ANY)
+
+    @patch("boto3.client")
+    def test_only_limited_requests_have_fewer_retries(self, mock_client):
+        """Test that requests outside the adaptive limiters keep botocore's standard retries."""
+        plain, limited = MagicMock(), MagicMock()
+        mock_client.side_effect = [plain, limited]
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs")
+
+        plain_config, limited_config = [kwargs["config"] for _, kwargs in mock_client.call_args_list]
+        self.assertEqual(plain_config.retries, {"mode": "standard"})
+        self.assertEqual(limited_config.retries, {"mode": "standard", "max_attempts": LIMITED_MAX_ATTEMPTS})
+        self.assertEqual((s3_sync.s3_client, s3_sync.limited_client), (plain, limited))
+        self.assertIs(s3_sync.stream_uploader.s3_client, limited)
+        limited.meta.events.register.assert_called_once_with("after-call.s3", ANY)
+        plain.meta.events.register.assert_not_called()
+
+    @patch("boto3.client")
+    def test_init_sizes_connection_pool_for_workers(self, mock_client):
+        """Test that the shared S3 client has a connection per upload thread."""
+        s3_sync = S3Sync(self.sample_config, "/test/logs", "test-bucket", "logs", workers=32)
+
+        self.assertEqual(s3_sync.workers, 32)
+        client_config = mock_client.call_args.kwargs["config"]
+        self.assertEqual(client_config.max_pool_connections, 32)
 
     @patch("boto3.client")
     def test_init_with_gzip_disabled(self, mock_client):
@@ -136,97 +183,69 @@ class TestS3Sync(unittest.TestCase):
             s3_sync = S3Sync({}, "/test", "bucket", "logs")
             self.assertFalse(s3_sync.is_gzipped("/nonexistent/file.txt"))
 
-    def test_gzip_file_in_place(self):
-        """Test gzip_file_in_place method."""
-        # Create a test file
-        test_file = os.path.join(self.temp_dir, "test.txt")
-        test_content = "This is test content for gzipping"
+    @patch("boto3.client")
+    def test_sync_file_gzips_in_place(self, mock_client):
+        """Test that a file to compress is replaced by its .gz, which is uploaded and logged with its ratio."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        test_file = os.path.join(self.temp_dir, "access.log")
         with open(test_file, "w") as f:
-            f.write(test_content)
-
-        with patch("boto3.client"):
-            s3_sync = S3Sync({}, "/test", "bucket", "logs")
-            gzipped_path = s3_sync.gzip_file_in_place(test_file)
+            f.write("log line\n" * 1000)
 
-            # Check that the original file is removed
-            self.assertFalse(os.path.exists(test_file))
-
-            # Check that the gzipped file exists
-            self.assertTrue(os.path.exists(gzipped_path))
-            self.assertEqual(gzipped_path, test_file + ".gz")
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", gzip_level=1, gzip_buffer_size=4096)
+        with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
+            self.assertEqual(s3_sync.sync_file(test_file, "logs/access.log.gz", compress=True), UPLOADED)
 
-            # Check that the gzipped file contains the original content
-            with gzip.open(gzipped_path, "rt") as f:
-                content = f.read()
-            self.assertEqual(content, test_content)
+        self.assertFalse(os.path.exists(test_file))
+        with gzip.open(test_file + ".gz", "rt") as f:
+            self.assertEqual(f.read(), "log line\n" * 1000)
+        self.assertEqual(gzip.decompress(fake_s3.objects["logs/access.log.gz"]["Body"]), b"log line\n" * 1000)
+        message = mock_logger.info.call_args_list[0][0][0]
+        self.assertIn("ratio", message)
+        self.assertIn("MB/s", message)
 
-    def test_ensure_files_are_gzipped_with_mixed_files(self):
-        """Test ensure_files_are_gzipped with mixed file types."""
-        # Create test directory structure
+    @patch("boto3.client")
+    def test_sync_directory_gzips_only_plain_files(self, mock_client):
+        """Test that only plain files are gzipped, and files already gzipped by extension or contents are left as is."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
         test_dir = os.path.join(self.temp_dir, "test_logs")
         os.makedirs(test_dir)
-
-        # Create different types of files
-        files = {
-            "already_gzipped.gz": b"gzipped content",
-            "plain_text.txt": "plain text content",
-            "another_log.log": "log content",
-            "already_gzipped_content": b"content that looks gzipped",
-        }
-
-        for filename, content in files.items():
-            filepath = os.path.join(test_dir, filename)
-            if isinstance(content, bytes):
-                with open(filepath, "wb") as f:
-                    f.write(content)
-            else:
-                with open(filepath, "w") as f:
-                    f.write(content)
-
-        # Create a gzipped file with proper magic bytes
-        gzipped_file = os.path.join(test_dir, "properly_gzipped.gz")
-        with gzip.open(gzipped_file, "wb") as f:
+        with open(os.path.join(test_dir, "plain_text.txt"), "w") as f:
+            f.write("plain text content")
+        with open(os.path.join(test_dir, "named.gz"), "wb") as f:
+            f.write(b"gzipped content")
+        with gzip.open(os.path.join(test_dir, "unnamed"), "wb") as f:
             f.write(b"properly gzipped content")
 
-        with patch("boto3.client"):
-            s3_sync = S3Sync({}, "/test", "bucket", "logs", enable_gzip=True)
-
-            with patch("pds.web_analytics.s3_sync.logger"):
-                s3_sync.ensure_files_are_gzipped(test_dir)
-
-            # Check that plain text files were gzipped
-            self.assertFalse(os.path.exists(os.path.join(test_dir, "plain_text.txt")))
-            self.assertTrue(os.path.exists(os.path.join(test_dir, "plain_text.txt.gz")))
-
-            self.assertFalse(os.path.exists(os.path.join(test_dir, "another_log.log")))
-            self.assertTrue(os.path.exists(os.path.join(test_dir, "another_log.log.gz")))
+        s3_sync = S3Sync({test_dir: {"include": ["*"]}}, self.temp_dir, "bucket", "logs")
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*"]}))
 
-            # Check that already gzipped files were not re-gzipped
-            self.assertTrue(os.path.exists(os.path.join(test_dir, "already_gzipped.gz")))
-            self.assertTrue(os.path.exists(os.path.join(test_dir, "properly_gzipped.gz")))
+        self.assertEqual(sorted(os.listdir(test_dir)), ["named.gz", "plain_text.txt.gz", "unnamed"])
+        self.assertEqual(
+            gzip.decompress(fake_s3.objects["logs/test_logs/plain_text.txt.gz"]["Body"]), b"plain text content"
+        )
+        self.assertEqual(fake_s3.objects["logs/test_logs/named.gz"]["Body"], b"gzipped content")
 
-    def test_ensure_files_are_gzipped_disabled(self):
-        """Test ensure_files_are_gzipped when gzip is disabled."""
+    @patch("boto3.client")
+    def test_sync_directory_without_gzip(self, mock_client):
+        """Test that files are uploaded as they are and left in place when gzip is disabled."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
         test_dir = os.path.join(self.temp_dir, "test_logs")
         os.makedirs(test_dir)
-
-        # Create a test file
         test_file = os.path.join(test_dir, "test.txt")
         with open(test_file, "w") as f:
             f.write("test content")
 
-        with patch("boto3.client"):
-            s3_sync = S3Sync({}, "/test", "bucket", "logs", enable_gzip=False)
-
-            with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
-                s3_sync.ensure_files_are_gzipped(test_dir)
-
-            # Check that the file was not gzipped
-            self.assertTrue(os.path.exists(test_file))
-            self.assertFalse(os.path.exists(test_file + ".gz"))
+        s3_sync = S3Sync({test_dir: {"include": ["*"]}}, self.temp_dir, "bucket", "logs", enable_gzip=False)
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*"]}))
 
-            # Check that the correct debug message was logged
-            mock_logger.debug.assert_called_with(f"Gzip compression disabled, skipping compression for: {test_dir}")
+        self.assertTrue(os.path.exists(test_file))
+        self.assertFalse(os.path.exists(test_file + ".gz"))
+        self.assertEqual(fake_s3.objects["logs/test_logs/test.txt"]["Body"], b"test content")
 
     def test_should_upload_file(self):
         """Test should_upload_file method with various patterns."""
@@ -261,9 +280,78 @@ class TestS3Sync(unittest.TestCase):
             result = s3_sync.upload_file("/path/to/file.gz", "logs/file.gz")
             self.assertTrue(result)
             mock_s3_client.upload_file.assert_called_once_with(
-                "/path/to/file.gz", "bucket", "logs/file.gz", ExtraArgs={"ContentType": "application/gzip"}
+                "/path/to/file.gz",
+                "bucket",
+                "logs/file.gz",
+                ExtraArgs={"ContentType": "application/gzip", "ChecksumAlgorithm": "SHA256"},
+                Config=s3_sync.transfer_config,
             )
 
+    @patch("boto3.client")
+    def test_upload_file_puts_small_files(self, mock_client):
+        """Test that files under the threshold are sent with one put_object call, checksummed from the same map."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        bodies = []
+        mock_s3_client.put_object.side_effect = lambda **kwargs: bodies.append(kwargs["Body"].read())
+        small_file = os.path.join(self.temp_dir, "small.log")
+        with open(small_file, "w") as f:
+            f.write("test content")
+        empty_file = os.path.join(self.temp_dir, "empty.log")
+        open(empty_file, "w").close()
+        callback = MagicMock()
+        hasher = ChecksumHasher()
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", small_file_threshold=1024)
+
+        self.assertTrue(s3_sync.upload_file(small_file, "logs/small.log", callback=callback, hasher=hasher))
+        self.assertEqual(bodies, [b"test content"])
+        callback.assert_called_once_with(12)
+        self.assertEqual(hasher.result(), checksum_file(small_file))
+        mock_s3_client.put_object.assert_called_once_with(
+            Bucket="bucket",
+            Key="logs/small.log",
+            Body=ANY,
+            ContentType="text/plain",
+            ChecksumSHA256=hasher.result().sha256,
+        )
+
+        mock_s3_client.put_object.side_effect = None
+        self.assertTrue(s3_sync.upload_file(empty_file, "logs/empty.log"))
+        mock_s3_client.put_object.assert_called_with(
+            Bucket="bucket",
+            Key="logs/empty.log",
+            Body=b"",
+            ContentType="text/plain",
+            ChecksumSHA256=checksum_file(empty_file).sha256,
+        )
+        mock_s3_client.upload_file.assert_not_called()
+
+    @patch("boto3.client")
+    def test_upload_file_transfers_large_files(self, mock_client):
+        """Test that files over the threshold go through the TransferManager with the multipart settings."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        large_file = os.path.join(self.temp_dir, "large.log")
+        with open(large_file, "wb") as f:
+            f.write(b"x" * 2048)
+
+        s3_sync = S3Sync(
+            {},
+            self.temp_dir,
+            "bucket",
+            "logs",
+            small_file_threshold=1024,
+            multipart_chunksize=8 * 1024 * 1024,
+            multipart_concurrency=2,
+        )
+
+        self.assertTrue(s3_sync.upload_file(large_file, "logs/large.log"))
+        mock_s3_client.put_object.assert_not_called()
+        config = mock_s3_client.upload_file.call_args.kwargs["Config"]
+        self.assertEqual(config.multipart_chunksize, 8 * 1024 * 1024)
+        self.assertEqual(config.max_concurrency, 2)
+
     def test_upload_file_failure(self):
         """Test upload_file method with upload failure."""
         with patch("boto3.client") as mock_client:
@@ -285,19 +373,6 @@ class TestS3Sync(unittest.TestCase):
         self.assertEqual(S3Sync.convert_size(1024 * 1024), "1.0MB")
         self.assertEqual(S3Sync.convert_size(1024 * 1024 * 1024), "1.0GB")
 
-    def test_get_bytes(self):
-        """Test get_bytes static method."""
-        self.assertEqual(S3Sync.get_bytes(1, "KiB"), 1024)
-        self.assertEqual(S3Sync.get_bytes(1, "MiB"), 1024 * 1024)
-        self.assertEqual(S3Sync.get_bytes(1, "GiB"), 1024 * 1024 * 1024)
-
-    def test_get_throughput(self):
-        """Test get_throughput static method."""
-        # Test with known values
-        start_time = time.monotonic() - 1.0  # 1 second ago
-        throughput = S3Sync.get_throughput(1024 * 1024, start_time)  # 1MB in 1 second
-        self.assertIn("1.00 MB/s", throughput)
-
     @patch("boto3.client")
     def test_file_exists_in_s3_exists(self, mock_client):
         """Test file_exists_in_s3 method when file exists in S3."""
@@ -397,7 +472,7 @@ class TestS3Sync(unittest.TestCase):
             s3_sync.sync_directory(path_tuple)
 
         # Check that upload was called
-        mock_s3_client.upload_file.assert_called_once()
+        mock_s3_client.put_object.assert_called_once()
 
     @patch("boto3.client")
     def test_sync_directory_no_files(self, mock_client):
@@ -419,6 +494,7 @@ class TestS3Sync(unittest.TestCase):
                 s3_sync.sync_directory(path_tuple)
 
             # Check that no upload was called
+            mock_s3_client.put_object.assert_not_called()
             mock_s3_client.upload_file.assert_not_called()
 
     @patch("boto3.client")
@@ -448,17 +524,1016 @@ class TestS3Sync(unittest.TestCase):
             self.assertTrue(os.path.exists(test_file))
             self.assertFalse(os.path.exists(test_file + ".gz"))
 
-    def test_process_progress(self):
-        """Test process_progress method."""
+    @patch("boto3.client")
+    def test_sync_directory_uploads_concurrently(self, mock_client):
+        """Test that sync_directory spreads uploads across the worker threads."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.exceptions.NoSuchKey = Exception
+        mock_s3_client.head_object.side_effect = Exception("NoSuchKey")
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for i in range(8):
+            with open(os.path.join(test_dir, f"test{i}.log"), "w") as f:
+                f.write("test content")
+
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+
+        def slow_upload(*args, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+
+        mock_s3_client.put_object.side_effect = slow_upload
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=4, enable_gzip=False)
+
+        with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(mock_s3_client.put_object.call_count, 8)
+        self.assertGreater(max_in_flight[0], 1)
+        self.assertLessEqual(max_in_flight[0], 4)
+        mock_logger.info.assert_any_call(f"{test_dir} sync to logs/test_logs: 8/8 files uploaded successfully.")
+
+    @patch("boto3.client")
+    def test_sync_directory_uploads_newest_first(self, mock_client):
+        """Test that sync_directory uploads recent logs ahead of older ones, whatever order the scan finds them in."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [{}]
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for name in ("access.2025-01-02.log", "u_ex250103.log", "access.2024-12-31.log", "undated.log"):
+            with open(os.path.join(test_dir, name), "w") as f:
+                f.write("test content")
+        # Files without a date stamp are placed by their modification time
+        mtime = datetime(2025, 1, 1, 12).timestamp()
+        os.utime(os.path.join(test_dir, "undated.log"), (mtime, mtime))
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=1, enable_gzip=False)
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        uploaded = [kwargs["Key"].rsplit("/", 1)[1] for _, kwargs in mock_s3_client.put_object.call_args_list]
+        self.assertEqual(uploaded, ["u_ex250103.log", "access.2025-01-02.log", "undated.log", "access.2024-12-31.log"])
+
+    @patch("boto3.client")
+    def test_sync_directory_gzips_in_place_while_scanning(self, mock_client):
+        """Test that files gzipped in place during the scan are uploaded once each, and none is passed over."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for i in range(1000):
+            with open(os.path.join(test_dir, f"access{i:04d}.log"), "w") as f:
+                f.write(f"log line {i}\n")
+
+        s3_sync = S3Sync({test_dir: {"include": ["*.log"]}}, self.temp_dir, "bucket", "logs", workers=4)
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.run()
+
+        puts = Counter(kwargs["Key"] for kwargs in fake_s3.operations("put_object"))
+        self.assertEqual(len(puts), 1000)
+        self.assertEqual(set(puts.values()), {1})
+        self.assertEqual(sorted(os.listdir(test_dir)), [f"access{i:04d}.log.gz" for i in range(1000)])
+
+    @patch("boto3.client")
+    def test_sync_directory_queues_files_while_scanning(self, mock_client):
+        """Test that no more than the priority window of files waits to be queued while the tree is walked."""
+        mock_client.return_value = FakeS3()
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for day in range(1, 21):
+            with open(os.path.join(test_dir, f"access.2025-01-{day:02d}.log"), "w") as f:
+                f.write("test content")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=1, enable_gzip=False)
+        submitted = []
+        waiting = []
+        scan = s3_sync.scan_directory
+
+        def counting_scan(*args):
+            for found, item in enumerate(scan(*args)):
+                waiting.append(found - len(submitted))
+                yield item
+
+        with FairScheduler(1) as scheduler, patch.object(s3_sync, "scan_directory", counting_scan):
+            submit = scheduler.submit
+            scheduler.submit = lambda *args: submitted.append(args) or submit(*args)
+            with patch("pds.web_analytics.s3_sync.PRIORITY_WINDOW_PER_WORKER", 4), patch(
+                "pds.web_analytics.s3_sync.logger"
+            ):
+                s3_sync.sync_directory((test_dir, {"include": ["*.log"]}), scheduler)
+
+        self.assertEqual(len(submitted), 20)
+        self.assertEqual(max(waiting), 4)
+        self.assertEqual(len(mock_client.return_value.objects), 20)
+
+    @patch("boto3.client")
+    def test_sync_directory_window_gzips_during_scan(self, mock_client):
+        """Test that files queued from the window are gzipped while the scan lists their directory, and uploaded once."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for i in range(2000):
+            with open(os.path.join(test_dir, f"access.2025-01-01.{i:04d}.log"), "w") as f:
+                f.write(f"log line {i}\n")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", workers=2)
+        gzipped_during_scan = []
+        scan = s3_sync.scan_directory
+
+        def watching_scan(*args):
+            yield from scan(*args)
+            gzipped_during_scan.append(sum(name.endswith(".gz") for name in os.listdir(test_dir)))
+
+        with FairScheduler(2) as scheduler, patch.object(s3_sync, "scan_directory", watching_scan):
+            with patch("pds.web_analytics.s3_sync.PRIORITY_WINDOW_PER_WORKER", 1), patch(
+                "pds.web_analytics.s3_sync.logger"
+            ):
+                s3_sync.sync_directory((test_dir, {"include": ["*.log"]}), scheduler)
+
+        self.assertGreater(gzipped_during_scan[0], 0)
+        puts = Counter(kwargs["Key"] for kwargs in fake_s3.operations("put_object"))
+        self.assertEqual(len(puts), 2000)
+        self.assertEqual(set(puts.values()), {1})
+        self.assertFalse([name for name in os.listdir(test_dir) if not name.endswith(".log.gz")])
+
+    @patch("boto3.client")
+    def test_sync_directory_with_key_template(self, mock_client):
+        """Test that a key template places files under date partitions from their names or first records."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [{}]
+
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-apache-http")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "access.2025-01-02.log"), "w") as f:
+            f.write("test content")
+        with open(os.path.join(test_dir, "access_log"), "w") as f:
+            f.write('1.2.3.4 - - [25/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1\n')
+
+        src_paths = {test_dir: {"include": ["access*"]}}
+        template = "node={node}/dataset={dataset}/year={year}/month={month}/day={day}/{name}"
+        s3_sync = S3Sync(src_paths, self.temp_dir, "bucket", "logs", enable_gzip=False, key_template=template)
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, src_paths[test_dir]))
+
+        mock_s3_client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="bucket", Prefix="logs/node=atm/dataset=atm-apache-http/"
+        )
+        self.assertEqual(
+            sorted(kwargs["Key"] for _, kwargs in mock_s3_client.put_object.call_args_list),
+            [
+                "logs/node=atm/dataset=atm-apache-http/year=2023/month=12/day=25/access_log",
+                "logs/node=atm/dataset=atm-apache-http/year=2025/month=01/day=02/access.2025-01-02.log",
+            ],
+        )
+
+    @patch("boto3.client")
+    def test_key_template_collisions_are_not_uploaded(self, mock_client):
+        """Test that a file given the key of a same-named file in another subdirectory is failed, not uploaded."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-apache-http")
+        for host in ("web1", "web2"):
+            os.makedirs(os.path.join(test_dir, host))
+            with open(os.path.join(test_dir, host, "access.2025-01-02.log"), "w") as f:
+                f.write(f"{host} content")
+        src_paths = {test_dir: {"include": ["access*"]}}
+        template = "{node}/{year}/{name}"
+        s3_sync = S3Sync(
+            src_paths, self.temp_dir, "bucket", "logs", enable_gzip=False, key_template=template, state_file=":memory:"
+        )
+
+        with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
+            s3_sync.run()
+
+        self.assertEqual(list(s3.objects), ["logs/atm/2025/access.2025-01-02.log"])
+        self.assertIn("same key", mock_logger.error.call_args[0][0])
+        self.assertIsNone(s3_sync.state.last_scan(test_dir))
+
+        # Later runs skip the uploaded file, and the local state still tells its key is taken
+        with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
+            s3_sync.run()
+
+        self.assertEqual(len(s3.operations("put_object")), 1)
+        self.assertIn("same key", mock_logger.error.call_args[0][0])
+
+    @patch("boto3.client")
+    def test_subdirectory_key_template_overrides_default(self, mock_client):
+        """Test that a subdirectory's key template replaces the top-level one and that bad templates fail early."""
+        src_paths = {"/logs/atm/atm-apache-http": {"key_template": "{node}/{year}/{name}"}, "/logs/en/en-http": {}}
+
+        s3_sync = S3Sync(src_paths, "/logs", "bucket", "logs", key_template="{dataset}/{path}")
+
+        self.assertEqual(s3_sync.key_templates["/logs/atm/atm-apache-http"].template, "{node}/{year}/{name}")
+        self.assertEqual(s3_sync.key_templates["/logs/en/en-http"].template, "{dataset}/{path}")
+        with self.assertRaises(ValueError):
+            S3Sync(src_paths, "/logs", "bucket", "logs", key_template="{node}/{host}/{name}")
+
+    @patch("boto3.client")
+    def test_sync_directory_publishes_manifest(self, mock_client):
+        """Test that the summaries of compressed logs are added to their dataset's manifest after each pass."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-apache-http")
+        os.makedirs(test_dir)
+        line = '1.2.3.4 - - [{}/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1\n'
+        with open(os.path.join(test_dir, "access.2023-12-24.log"), "w") as f:
+            f.write(line.format(24) * 3)
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", state_file=":memory:", manifests=True)
+        s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+        with open(os.path.join(test_dir, "access.2023-12-25.log"), "w") as f:
+            f.write(line.format(25) * 2)
+        s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        manifest = read_manifest(s3, "bucket", "logs/_manifests/atm/atm-apache-http.jsonl")
+        self.assertEqual(
+            [(entry.key, entry.size, entry.lines) for entry in manifest.entries],
+            [
+                (key, len(s3.objects[key]["Body"]), lines)
+                for key, lines in (
+                    ("logs/atm/atm-apache-http/access.2023-12-24.log.gz", 3),
+                    ("logs/atm/atm-apache-http/access.2023-12-25.log.gz", 2),
+                )
+            ],
+        )
+        self.assertEqual(manifest.entries[1].start, datetime(2023, 12, 25, 10, 30, 45, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(s3_sync.state.summaries("logs/_manifests/atm/atm-apache-http.jsonl", unpublished=True), [])
+
+    @patch("boto3.client")
+    def test_seekable_uploads_publish_block_indexes(self, mock_client):
+        """Test that seekable uploads get a block index, including a .gz left behind by a failed upload."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-apache-http")
+        os.makedirs(test_dir)
+        line = '1.2.3.4 - - [25/Dec/2023:10:{:02d}:45 +0000] "GET / HTTP/1.1" 200 1\n'
+        content = "".join(line.format(minute) for minute in range(60)).encode()
+        key = "logs/atm/atm-apache-http/access.log.gz"
+
+        for streaming in (True, False):
+            with self.subTest(streaming=streaming):
+                s3.objects.clear()
+                with open(os.path.join(test_dir, "access.log"), "wb") as f:
+                    f.write(content)
+                s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", streaming=streaming, seekable_block_size=1024)
+                s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+                index = read_block_index(s3, "bucket", "logs/_indexes/atm/atm-apache-http/access.log.gz.json")
+                body = s3.objects[key]["Body"]
+                self.assertGreater(len(index), 1)
+                self.assertEqual(index.compressed_bytes, len(body))
+                self.assertEqual(gzip.decompress(body), content)
+                self.assertEqual(
+                    index.blocks[-1].end, datetime(2023, 12, 25, 10, 59, 45, tzinfo=timezone.utc).timestamp()
+                )
+
+        # The .gz written in place by the last pass is indexed from its members when it is uploaded again
+        s3.objects.clear()
+        s3_sync.sync_directory((test_dir, {"include": ["*.log", "*.gz"]}))
+        self.assertEqual(read_block_index(s3, "bucket", "logs/_indexes/" + key[5:] + ".json").blocks, index.blocks)
+
+    def coalescing_sync(self, s3, test_dir):
+        """Return a sync that coalesces files of up to 100 bytes in ``test_dir``, with local state."""
+        config = {"include": ["*.log"], "coalesce": {"max_file_size": 100, "target_size": 1000, "max_wait": 60}}
+        return S3Sync({test_dir: config}, self.temp_dir, "bucket", "logs", state_file=":memory:")
+
+    def write_old_file(self, path, content):
+        """Write a file last modified a day ago."""
+        with open(path, "ab") as f:
+            f.write(content)
+        os.utime(path, (time.time() - 86400, time.time() - 86400))
+
+    @patch("boto3.client")
+    def test_small_files_are_coalesced_once(self, mock_client):
+        """Test that small files go into one batch with a source manifest, and later passes add only new lines."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-ftp")
+        os.makedirs(test_dir)
+        for hour in range(3):
+            self.write_old_file(os.path.join(test_dir, f"ftp-{hour}.2025-01-31.log"), b"line %d\n" % hour)
+        self.write_old_file(os.path.join(test_dir, "big.2025-01-31.log"), b"x" * 200 + b"\n")
+        s3_sync = self.coalescing_sync(s3, test_dir)
+
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+        self.write_old_file(os.path.join(test_dir, "ftp-2.2025-01-31.log"), b"line 3\n")
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+
+        batches = sorted(key for key in s3.objects if "/batch-2025-01-31-" in key and "_sources" not in key)
+        self.assertEqual(len(batches), 2)
+        self.assertIn("logs/atm/atm-ftp/big.2025-01-31.log.gz", s3.objects)
+        lines = b"".join(gzip.decompress(s3.objects[key]["Body"]) for key in batches).splitlines()
+        self.assertEqual(sorted(lines), [b"line 0", b"line 1", b"line 2", b"line 3"])
+        sources = json.loads(s3.objects["logs/_sources/" + batches[0][5:] + ".json"]["Body"])
+        self.assertIn(
+            sources["sources"][0]["path"], ("atm/atm-ftp/ftp-0.2025-01-31.log", "atm/atm-ftp/ftp-2.2025-01-31.log")
+        )
+        self.assertEqual(len(s3.operations("put_object")), 5)
+
+    @patch("boto3.client")
+    def test_interrupted_batch_is_not_uploaded_twice(self, mock_client):
+        """Test that a batch whose upload failed is uploaded again as it was, and one that reached S3 is not."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-ftp")
+        os.makedirs(test_dir)
+        paths = [os.path.join(test_dir, f"ftp-{hour}.2025-01-31.log") for hour in range(2)]
+        for path in paths:
+            self.write_old_file(path, b"partial")
+        s3_sync = self.coalescing_sync(s3, test_dir)
+        s3.inject_errors("put_object", client_error("InternalError", "PutObject", 500))
+
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+        self.assertEqual([key for key in s3.objects if "batch-" in key], [])
+        self.assertEqual(s3_sync.state.get(paths[0]).status, "pending")
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+
+        batch = next(key for key in s3.objects if "batch-" in key and "_sources" not in key)
+        self.assertEqual(gzip.decompress(s3.objects[batch]["Body"]), b"partial\npartial\n")
+        # A run interrupted after the upload leaves the files pending; the next one finds the batch in S3
+        for path in paths:
+            s3_sync.state.mark_pending(path, 7, os.stat(path).st_mtime_ns, batch)
+        s3.calls.clear()
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+
+        self.assertEqual(
+            [kwargs["Key"] for kwargs in s3.operations("put_object")], ["logs/_sources/" + batch[5:] + ".json"]
+        )
+        self.assertEqual(s3_sync.state.get(paths[1]).status, "uploaded")
+
+    @patch("boto3.client")
+    def test_cluster_workers_split_the_tree(self, mock_client):
+        """Test that workers sharing a tree each upload the files that hash to them, and together upload all once."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-ftp")
+        os.makedirs(test_dir)
+        for i in range(20):
+            with open(os.path.join(test_dir, f"ftp-{i}.log"), "w") as f:
+                f.write(f"line {i}\n")
+        workers = [
+            S3Sync(
+                {test_dir: {"include": ["*.log"]}},
+                self.temp_dir,
+                "bucket",
+                "logs",
+                streaming=True,
+                cluster={"worker": worker, "workers": ["a", "b"]},
+            )
+            for worker in ("a", "b")
+        ]
+
+        for worker in workers:
+            worker.sync_directory((test_dir, worker.src_paths[test_dir]))
+
+        uploads = Counter(kwargs["Key"] for kwargs in s3.operations("put_object") if "_leases" not in kwargs["Key"])
+        self.assertEqual(set(uploads), {f"logs/atm/atm-ftp/ftp-{i}.log.gz" for i in range(20)})
+        self.assertEqual(set(uploads.values()), {1})
+        self.assertEqual([key for key in s3.objects if "_leases" in key], [])
+
+    @patch("boto3.client")
+    def test_leased_file_is_left_to_its_holder(self, mock_client):
+        """Test that a file another worker holds the lease on is left to it until the lease is released or expires."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-ftp")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "ftp.log"), "w") as f:
+            f.write("line\n")
+        lease = "logs/_leases/atm/atm-ftp/ftp.log.gz.json"
+        s3.objects[lease] = {"Body": json.dumps({"owner": "b:1", "expires": time.time() + 600}).encode(), "ETag": '"1"'}
+        s3_sync = S3Sync(
+            {test_dir: {"include": ["*.log"]}},
+            self.temp_dir,
+            "bucket",
+            "logs",
+            streaming=True,
+            state_file=":memory:",
+            cluster={"worker": "a"},
+        )
+
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+        self.assertNotIn("logs/atm/atm-ftp/ftp.log.gz", s3.objects)
+        self.assertIsNone(s3_sync.state.last_scan(test_dir))
+
+        s3.objects[lease]["Body"] = json.dumps({"owner": "b:1", "expires": time.time() - 1}).encode()
+        s3_sync.sync_directory((test_dir, s3_sync.src_paths[test_dir]))
+        self.assertIn("logs/atm/atm-ftp/ftp.log.gz", s3.objects)
+        self.assertNotIn(lease, s3.objects)
+        self.assertIsNotNone(s3_sync.state.last_scan(test_dir))
+
+    @patch("boto3.client")
+    def test_plan_reports_uploads_without_making_them(self, mock_client):
+        """Test that a plan looks files up in S3 without touching them, and projects durations from past runs."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-ftp")
+        os.makedirs(test_dir)
+        for name in ("a.log", "b.log"):
+            with open(os.path.join(test_dir, name), "w") as f:
+                f.write("line\n" * 100)
+        with gzip.open(os.path.join(test_dir, "c.log.gz"), "wb") as f:
+            f.write(b"line\n" * 100)
+        s3.put_object(Bucket="bucket", Key="logs/atm/atm-ftp/a.log.gz", Body=b"uploaded before")
+        s3.calls.clear()
+        s3_sync = S3Sync({test_dir: {"include": ["*.log"]}}, self.temp_dir, "bucket", "logs", state_file=":memory:")
+
+        plan = s3_sync.plan()
+
+        node = plan["nodes"]["atm/atm-ftp"]
+        self.assertEqual((plan["files"], node["existing_files"]), (2, 1))
+        self.assertEqual(node["raw_bytes"], 500 + os.path.getsize(os.path.join(test_dir, "c.log.gz")))
+        self.assertIsNone(plan["projected_seconds"])
+        self.assertEqual({operation for operation, _ in s3.calls}, {"list_objects_v2"})
+        self.assertEqual(sorted(os.listdir(test_dir)), ["a.log", "b.log", "c.log.gz"])
+        self.assertIsNone(s3_sync.state.get(os.path.join(test_dir, "b.log")))
+
+        s3_sync.run()
+        plan = s3_sync.plan()
+
+        self.assertEqual((plan["files"], plan["nodes"]["atm/atm-ftp"]["unchanged_files"]), (0, 3))
+        self.assertEqual(plan["throughput"]["runs"], 1)
+        self.assertEqual(plan["projected_seconds"], 0.0)
+
+    @patch("boto3.client")
+    def test_plan_only_reads_the_local_state(self, mock_client):
+        """Test that a plan neither creates a missing state database nor writes to an existing one."""
+        mock_client.return_value = FakeS3()
+        test_dir = os.path.join(self.temp_dir, "atm", "atm-ftp")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "a.log"), "w") as f:
+            f.write("line\n" * 100)
+        state_file = os.path.join(self.temp_dir, "config.state.db")
+        src_paths = {test_dir: {"include": ["*.log"]}}
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync = S3Sync(src_paths, self.temp_dir, "bucket", "logs", state_file=state_file, read_only_state=True)
+        self.assertEqual(s3_sync.plan()["files"], 1)
+        self.assertIsNone(s3_sync.state)
+        self.assertFalse(os.path.exists(state_file))
+
+        S3Sync(src_paths, self.temp_dir, "bucket", "logs", state_file=state_file).state.close()
+        s3_sync = S3Sync(src_paths, self.temp_dir, "bucket", "logs", state_file=state_file, read_only_state=True)
+
+        self.assertEqual(s3_sync.plan()["files"], 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            s3_sync.state.record_scan(test_dir, 0.0)
+
+    @patch("boto3.client")
+    def test_uploads_carry_detected_log_format(self, mock_client):
+        """Test that uploaded logs are tagged with their detected format, and unrecognized ones are not tagged."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "access.log"), "w") as f:
+            f.write('1.2.3.4 - - [25/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1 "-" "curl/8.0"\n')
+        with open(os.path.join(test_dir, "notes.log"), "w") as f:
+            f.write("test content\n")
+
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming):
+                s3.calls.clear()
+                s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", streaming=streaming)
+                s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+                puts = {kwargs["Key"]: kwargs for kwargs in s3.operations("put_object")}
+                self.assertEqual(puts["logs/test_logs/access.log.gz"]["Metadata"], {"log-format": "apache-combined"})
+                self.assertNotIn("Metadata", puts["logs/test_logs/notes.log.gz"])
+                s3.objects.clear()
+
+    @patch("boto3.client")
+    def test_sync_directory_filters_lines(self, mock_client):
+        """Test that the configured line filter applies to gzipped logs unless a subdirectory turns it off."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        data = b"#Fields: date time\n2025-01-31 10:30:45 10.0.0.1 GET / - 80 - 1.2.3.4 curl 200 0 0\n"
+        src_paths = {
+            os.path.join(self.temp_dir, "iis"): {"include": ["*.log"]},
+            os.path.join(self.temp_dir, "raw"): {"include": ["*.log"], "line_filter": []},
+        }
+
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming):
+                s3.objects.clear()
+                for test_dir in src_paths:
+                    shutil.rmtree(test_dir, ignore_errors=True)
+                    os.makedirs(test_dir)
+                    with open(os.path.join(test_dir, "u_ex250131.log"), "wb") as f:
+                        f.write(data)
+                s3_sync = S3Sync(src_paths, self.temp_dir, "bucket", "logs", streaming=streaming, line_filter=True)
+                for path_tuple in src_paths.items():
+                    s3_sync.sync_directory(path_tuple)
+
+                self.assertEqual(gzip.decompress(s3.objects["logs/iis/u_ex250131.log.gz"]["Body"]), data[19:])
+                self.assertEqual(gzip.decompress(s3.objects["logs/raw/u_ex250131.log.gz"]["Body"]), data)
+                nodes = s3_sync.metrics.report()["nodes"]
+                self.assertEqual(nodes["iis"]["lines_dropped"]["comments"], 1)
+                self.assertEqual(nodes["raw"]["lines_dropped"], {})
+
+    @patch("boto3.client")
+    def test_sync_directory_copies_to_destinations(self, mock_client):
+        """Test that every file is also copied to the additional destinations, with the same content and metadata."""
+        s3, mirror = FakeS3(), FakeS3()
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        data = b'1.2.3.4 - - [25/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1 "-" "curl/8.0"\n'
+
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming):
+                mock_client.side_effect = [s3, s3, mirror]
+                s3.objects.clear()
+                mirror.objects.clear()
+                shutil.rmtree(test_dir, ignore_errors=True)
+                os.makedirs(test_dir)
+                with open(os.path.join(test_dir, "access.log"), "wb") as f:
+                    f.write(data)
+                destinations = [{"s3_bucket": "dr-bucket", "s3_subdir": "replica", "region": "us-east-1"}]
+                s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", streaming=streaming, destinations=destinations)
+                s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+                original = s3.objects["logs/test_logs/access.log.gz"]
+                copy = mirror.objects["replica/test_logs/access.log.gz"]
+                self.assertEqual(gzip.decompress(copy["Body"]), data)
+                self.assertEqual(copy["Body"], original["Body"])
+                self.assertEqual(copy["Metadata"], {"log-format": "apache-combined"})
+                self.assertEqual(mirror.operations("put_object")[0]["Bucket"], "dr-bucket")
+                node = s3_sync.metrics.report()["nodes"]["test_logs"]
+                self.assertEqual(node["files"], {"uploaded": 1})
+                self.assertEqual(
+                    node["destinations"]["s3://dr-bucket/replica"],
+                    {"files": {"uploaded": 1}, "bytes_uploaded": len(copy["Body"])},
+                )
+        mock_client.assert_called_with("s3", region_name="us-east-1", config=ANY)
+
+    @patch("boto3.client")
+    def test_failed_copies_are_retried_alone(self, mock_client):
+        """Test that a failed copy is made on the next pass without uploading to the primary bucket again."""
+        s3, mirror = FakeS3(), FakeS3()
+        mock_client.side_effect = [s3, s3, mirror]
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "access.log"), "w") as f:
+            f.write("test content\n")
+        mirror.inject_errors("put_object", client_error("InternalError", "PutObject", 500))
+
+        s3_sync = S3Sync(
+            {},
+            self.temp_dir,
+            "bucket",
+            "logs",
+            streaming=True,
+            delete=True,
+            state_file=":memory:",
+            destinations=[{"s3_bucket": "dr-bucket"}],
+        )
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertIn("logs/test_logs/access.log.gz", s3.objects)
+        self.assertEqual(mirror.objects, {})
+        # The source waits for the copy, and the directory is listed again on the next pass
+        self.assertTrue(os.path.exists(os.path.join(test_dir, "access.log")))
+        self.assertIsNone(s3_sync.state.last_scan(test_dir))
+        self.assertEqual(
+            s3_sync.metrics.report()["nodes"]["test_logs"]["destinations"]["s3://dr-bucket/logs"]["files"],
+            {"failed": 1},
+        )
+
+        s3.calls.clear()
+        s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(s3.operations("put_object"), [])
+        self.assertEqual(gzip.decompress(mirror.objects["logs/test_logs/access.log.gz"]["Body"]), b"test content\n")
+        self.assertFalse(os.path.exists(os.path.join(test_dir, "access.log")))
+        self.assertIsNotNone(s3_sync.state.last_scan(test_dir))
+
+    @patch("boto3.client")
+    def test_destination_existence_is_checked_per_destination(self, mock_client):
+        """Test that a file already in the primary bucket is still copied to a destination that lacks it."""
+        s3, mirror = FakeS3(), FakeS3()
+        mock_client.side_effect = [s3, s3, mirror]
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for name in ("old.log", "new.log"):
+            with open(os.path.join(test_dir, name), "w") as f:
+                f.write("test content")
+        s3.put_object(Bucket="bucket", Key="logs/test_logs/old.log", Body=b"test content")
+        mirror.put_object(Bucket="dr-bucket", Key="dr/test_logs/new.log", Body=b"test content")
+
+        s3_sync = S3Sync(
+            {},
+            self.temp_dir,
+            "bucket",
+            "logs",
+            enable_gzip=False,
+            state_file=":memory:",
+            destinations=[{"s3_bucket": "dr-bucket", "s3_subdir": "dr"}],
+        )
+        s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual([kwargs["Key"] for kwargs in s3.operations("put_object")[1:]], ["logs/test_logs/new.log"])
+        self.assertEqual([kwargs["Key"] for kwargs in mirror.operations("put_object")[1:]], ["dr/test_logs/old.log"])
+        self.assertEqual(mirror.operations("list_objects_v2")[0]["Prefix"], "dr/test_logs/")
+        for name in ("old.log", "new.log"):
+            stat_result = os.stat(os.path.join(test_dir, name))
+            self.assertTrue(s3_sync.is_unchanged_since_sync(os.path.join(test_dir, name), stat_result))
+
+    @patch("boto3.client")
+    def test_copy_threads_are_stopped_after_run_and_watch(self, mock_client):
+        """Test that a run stops the copy threads of the destinations, and watch only once it stops."""
+        mock_client.return_value = FakeS3()
+        s3_sync = S3Sync(
+            {self.temp_dir: {"include": ["*.log"]}}, self.temp_dir, "bucket", "logs", destinations=[{"s3_bucket": "dr"}]
+        )
+        stop_event = threading.Event()
+
+        with patch.object(s3_sync.destinations[0], "close") as mock_close, patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.run()
+            mock_close.assert_called_once()
+            with patch.object(s3_sync, "run", side_effect=stop_event.set):
+                s3_sync.watch(interval=0.01, stop_event=stop_event)
+
+        self.assertEqual(mock_close.call_count, 2)
+
+    @patch("boto3.client")
+    def test_failed_manifest_update_is_retried(self, mock_client):
+        """Test that summaries that could not be published are published on the next pass, without state too."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "access.log"), "w") as f:
+            f.write("test content\n")
+        s3.inject_errors("get_object", client_error("InternalError", "GetObject", 500))
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", streaming=True, manifests=True)
+        with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+            s3_sync.update_manifest("test_logs")
+
+        mock_logger.error.assert_called_once()
+        manifest = read_manifest(s3, "bucket", "logs/_manifests/test_logs.jsonl")
+        self.assertEqual(
+            [(entry.key, entry.lines) for entry in manifest.undated], [("logs/test_logs/access.log.gz", 1)]
+        )
+
+    @patch("boto3.client")
+    def test_sync_directory_uses_listing_index(self, mock_client):
+        """Test that sync_directory answers existence checks from one listing instead of HEAD requests."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "logs/test_logs/old.log", "Size": 12, "ETag": TEST_CONTENT_ETAG}]}
+        ]
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        for name in ("old.log", "new.log"):
+            with open(os.path.join(test_dir, name), "w") as f:
+                f.write("test content")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", enable_gzip=False)
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        mock_s3_client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="bucket", Prefix="logs/test_logs/"
+        )
+        mock_s3_client.head_object.assert_not_called()
+        mock_s3_client.put_object.assert_called_once_with(
+            Bucket="bucket", Key="logs/test_logs/new.log", Body=ANY, ContentType="text/plain", ChecksumSHA256=ANY
+        )
+
+    def test_listing_start_after(self):
+        """Test that listings of date-stamped logs start just before the earliest matching name."""
+        self.assertEqual(S3Sync.listing_start_after("geo/geo-ode/", ["u_ex25*.gz", "u_ex26*.gz"]), "geo/geo-ode/u_ex2")
+        self.assertIsNone(S3Sync.listing_start_after("en/en-http/", ["*.2025-*.txt.gz"]))
+        self.assertIsNone(S3Sync.listing_start_after("en/en-http/", []))
+
+    @patch("boto3.client")
+    def test_sync_directory_with_state_prunes_unchanged_directories(self, mock_client):
+        """Test that directories older than the last successful sync are not listed again."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        old_dir = os.path.join(test_dir, "2024")
+        new_dir = os.path.join(test_dir, "2025")
+        os.makedirs(old_dir)
+        os.makedirs(new_dir)
+        for directory in (old_dir, new_dir):
+            with open(os.path.join(directory, "access.log"), "w") as f:
+                f.write("log content")
+        an_hour_ago = time.time() - 3600
+        os.utime(old_dir, (an_hour_ago, an_hour_ago))
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", enable_gzip=False, state_file=":memory:")
+        s3_sync.state.record_scan(test_dir, time.time())
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(list(s3.objects), ["logs/test_logs/2025/access.log"])
+
+        # A full scan still finds the file in the unchanged directory
+        s3_sync.full_scan = True
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(sorted(s3.objects), ["logs/test_logs/2024/access.log", "logs/test_logs/2025/access.log"])
+
+    @patch("boto3.client")
+    def test_sync_directory_with_state_uploads_appended_files(self, mock_client):
+        """Test that a log appended to after its upload is uploaded again, although its directory is unchanged."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        log_file = os.path.join(test_dir, "access.log")
+        with open(log_file, "w") as f:
+            f.write("first line\n")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", enable_gzip=False, state_file=":memory:")
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+        self.assertEqual(s3.objects["logs/test_logs/access.log"]["Body"], b"first line\n")
+
+        # Appending changes the file's mtime but not its directory's
+        with open(log_file, "a") as f:
+            f.write("second line\n")
+        an_hour_ago = time.time() - 3600
+        os.utime(test_dir, (an_hour_ago, an_hour_ago))
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(s3.objects["logs/test_logs/access.log"]["Body"], b"first line\nsecond line\n")
+
+    def test_scan_directory_yields_files_with_stat(self):
+        """Test that scan_directory yields every file in the tree once, with its stat."""
+        nested = os.path.join(self.temp_dir, "a", "b")
+        os.makedirs(nested)
+        for path in (os.path.join(self.temp_dir, "top.log"), os.path.join(nested, "deep.log")):
+            with open(path, "w") as f:
+                f.write("12345")
+
         with patch("boto3.client"):
             s3_sync = S3Sync({}, "/test", "bucket", "logs")
+            found = dict(s3_sync.scan_directory(self.temp_dir))
+
+        self.assertEqual(sorted(found), [os.path.join(nested, "deep.log"), os.path.join(self.temp_dir, "top.log")])
+        self.assertTrue(all(stat_result.st_size == 5 for stat_result in found.values()))
+
+    @patch("boto3.client")
+    def test_sync_directory_leaves_files_still_being_written(self, mock_client):
+        """Test that recently modified files wait until they settle, even once their directory is pruned."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        rotated = os.path.join(test_dir, "access.2025-01-01.log")
+        current = os.path.join(test_dir, "access.2025-01-02.log")
+        for path in (rotated, current):
+            with open(path, "w") as f:
+                f.write("log content")
+        two_hours_ago = time.time() - 7200
+        os.utime(rotated, (two_hours_ago, two_hours_ago))
+        os.utime(test_dir, (two_hours_ago, two_hours_ago))
+
+        s3_sync = S3Sync(
+            {}, self.temp_dir, "bucket", "logs", enable_gzip=False, state_file=":memory:", settle_seconds=60
+        )
+        s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(list(s3.objects), ["logs/test_logs/access.2025-01-01.log"])
+        self.assertLessEqual(s3_sync.state.last_scan(test_dir), two_hours_ago)
+
+        # Once the file stops changing it is picked up, although its directory has not changed since
+        os.utime(current, (two_hours_ago, two_hours_ago))
+        s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(
+            sorted(s3.objects), ["logs/test_logs/access.2025-01-01.log", "logs/test_logs/access.2025-01-02.log"]
+        )
+
+    @patch("boto3.client")
+    def test_watch_runs_passes_until_stopped(self, mock_client):
+        """Test that watch keeps running passes, surviving a failed one, until the stop event is set."""
+        s3_sync = S3Sync(self.sample_config, "/test/logs", "bucket", "logs")
+        stop_event = threading.Event()
+        passes = []
+
+        def run():
+            passes.append(time.monotonic())
+            if len(passes) == 1:
+                raise RuntimeError("listing failed")
+            if len(passes) == 3:
+                stop_event.set()
+
+        with patch.object(s3_sync, "run", side_effect=run), patch("pds.web_analytics.s3_sync.logger") as mock_logger:
+            s3_sync.watch(interval=0.01, stop_event=stop_event)
+
+        self.assertEqual(len(passes), 3)
+        mock_logger.error.assert_called_once_with("Sync pass failed: listing failed")
+
+    @patch("boto3.client")
+    def test_sync_directory_falls_back_to_head_object(self, mock_client):
+        """Test that existence checks fall back to HEAD requests when the prefix cannot be listed."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.side_effect = Exception("AccessDenied")
+        mock_s3_client.head_object.return_value = {"ContentLength": 12}
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "test.log"), "w") as f:
+            f.write("test content")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", enable_gzip=False)
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        mock_s3_client.head_object.assert_called_once_with(Bucket="bucket", Key="logs/test_logs/test.log")
+        mock_s3_client.put_object.assert_not_called()
+
+    @patch("boto3.client")
+    def test_sync_directory_streaming_leaves_original(self, mock_client):
+        """Test that streaming mode uploads compressed files under .gz keys without touching local files."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        plain_file = os.path.join(test_dir, "access.log")
+        with open(plain_file, "w") as f:
+            f.write("plain log content")
+        gzipped_file = os.path.join(test_dir, "old.log.gz")
+        with gzip.open(gzipped_file, "wb") as f:
+            f.write(b"old log content")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", streaming=True)
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(sorted(os.listdir(test_dir)), ["access.log", "old.log.gz"])
+        self.assertEqual(sorted(s3.objects), ["logs/test_logs/access.log.gz", "logs/test_logs/old.log.gz"])
+        self.assertEqual(gzip.decompress(s3.objects["logs/test_logs/access.log.gz"]["Body"]), b"plain log content")
+        self.assertEqual(s3.objects["logs/test_logs/access.log.gz"]["ContentType"], "application/gzip")
+
+    @patch("boto3.client")
+    def test_sync_directory_with_state_skips_unchanged_files(self, mock_client):
+        """Test that a repeat run with local state makes no S3 requests for unchanged files."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        with open(os.path.join(test_dir, "access.log"), "w") as f:
+            f.write("log content")
+        state_file = os.path.join(self.temp_dir, "state.db")
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            S3Sync({}, self.temp_dir, "bucket", "logs", state_file=state_file).sync_directory(
+                (test_dir, {"include": ["*.log"]})
+            )
+            self.assertEqual(list(s3.objects), ["logs/test_logs/access.log.gz"])
+            calls_after_first_run = len(s3.calls)
+
+            S3Sync({}, self.temp_dir, "bucket", "logs", state_file=state_file).sync_directory(
+                (test_dir, {"include": ["*.log"]})
+            )
 
-            # Mock time.monotonic to return a fixed value
-            with patch("time.monotonic", return_value=100.0):
-                with patch("pds.web_analytics.s3_sync.logger") as mock_logger:
-                    # Use the correct format that the method expects
-                    s3_sync.process_progress("upload: 1024.0 1024.0/2048.0 MiB 50% 2.5 MiB/s", "/test/path", 99.0)
-                    mock_logger.info.assert_called_once()
+        self.assertEqual(len(s3.calls), calls_after_first_run)
+
+    @patch("boto3.client")
+    def test_sync_directory_with_state_verifies_interrupted_uploads(self, mock_client):
+        """Test that an upload left pending by an interrupted run is confirmed from S3 instead of re-sent."""
+        s3 = FakeS3()
+        mock_client.return_value = s3
+
+        test_dir = os.path.join(self.temp_dir, "test_logs")
+        os.makedirs(test_dir)
+        file_path = os.path.join(test_dir, "access.log")
+        with open(file_path, "w") as f:
+            f.write("log content")
+        s3.put_object(Bucket="bucket", Key="logs/test_logs/access.log", Body=b"log content")
+        state_file = os.path.join(self.temp_dir, "state.db")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", enable_gzip=False, state_file=state_file)
+        stat_result = os.stat(file_path)
+        s3_sync.state.mark_pending(file_path, stat_result.st_size, stat_result.st_mtime_ns, "logs/test_logs/access.log")
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            s3_sync.sync_directory((test_dir, {"include": ["*.log"]}))
+
+        self.assertEqual(s3.operations("upload_file"), [])
+        self.assertEqual(s3_sync.state.pending(), [])
+        self.assertTrue(s3_sync.state.is_synced(file_path, stat_result.st_size, stat_result.st_mtime_ns))
+
+    @patch("boto3.client")
+    def test_sync_file_force_skips_existence_check(self, mock_client):
+        """Test that force uploads without asking S3 whether the key exists."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+
+        file_path = os.path.join(self.temp_dir, "file.log")
+        with open(file_path, "w") as f:
+            f.write("test content")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", force=True)
+
+        self.assertEqual(s3_sync.sync_file(file_path, "logs/file.log"), UPLOADED)
+        mock_s3_client.head_object.assert_not_called()
+
+    @patch("boto3.client")
+    def test_sync_file_skips_existing(self, mock_client):
+        """Test that sync_file does not upload a key that already exists in S3."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.head_object.return_value = {"ContentLength": 12, "ETag": TEST_CONTENT_ETAG}
+        file_path = os.path.join(self.temp_dir, "file.log")
+        with open(file_path, "w") as f:
+            f.write("test content")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs")
+
+        self.assertEqual(s3_sync.sync_file(file_path, "logs/file.log"), SKIPPED)
+        mock_s3_client.put_object.assert_not_called()
+        mock_s3_client.upload_file.assert_not_called()
+
+    @patch("boto3.client")
+    def test_sync_file_replaces_changed_object(self, mock_client):
+        """Test that a file changed since its upload is uploaded again, with its checksum for S3 to verify."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        file_path = os.path.join(self.temp_dir, "access.log")
+        with open(file_path, "w") as f:
+            f.write("GET / 200\n")
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", enable_gzip=False)
+        with patch("pds.web_analytics.s3_sync.logger"):
+            self.assertEqual(s3_sync.sync_file(file_path, "logs/access.log"), UPLOADED)
+            self.assertEqual(s3_sync.sync_file(file_path, "logs/access.log"), SKIPPED)
+
+            # The log is appended to after it was uploaded
+            with open(file_path, "a") as f:
+                f.write("GET /robots.txt 404\n")
+            self.assertEqual(s3_sync.sync_file(file_path, "logs/access.log"), UPLOADED)
+
+        with open(file_path, "rb") as f:
+            self.assertEqual(fake_s3.objects["logs/access.log"]["Body"], f.read())
+        puts = fake_s3.operations("put_object")
+        self.assertEqual(len(puts), 2)
+        self.assertEqual(puts[-1]["ChecksumSHA256"], checksum_file(file_path).sha256)
+
+    @patch("boto3.client")
+    def test_sync_file_compares_multipart_objects_with_state(self, mock_client):
+        """Test that files are only read to compare with objects when the local state cannot settle it."""
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        multipart_etag = '"' + "1" * 32 + '-2"'
+        mock_s3_client.head_object.return_value = {"ContentLength": 12, "ETag": multipart_etag}
+        file_path = os.path.join(self.temp_dir, "file.log")
+        with open(file_path, "w") as f:
+            f.write("test content")
+        checksum = checksum_file(file_path)
+
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", state_file=os.path.join(self.temp_dir, "state.db"))
+        s3_sync.state.mark_uploaded(file_path, 12, 0, "logs/file.log", multipart_etag)
+        self.assertEqual(s3_sync.sync_file(file_path, "logs/file.log"), SKIPPED)
+        mock_s3_client.put_object.assert_not_called()
+        self.assertEqual(s3_sync.state.get(file_path).checksum, checksum.sha256)
+
+        # Unchanged since an upload whose checksum is recorded, the file is not read again
+        with patch("pds.web_analytics.s3_sync.checksum_file") as mock_checksum:
+            self.assertEqual(s3_sync.sync_file(file_path, "logs/file.log"), SKIPPED)
+        mock_checksum.assert_not_called()
+
+        s3_sync.state.mark_uploaded(file_path, 12, 0, "logs/file.log", multipart_etag, "b3RoZXI=")
+        with patch("pds.web_analytics.s3_sync.logger"):
+            self.assertEqual(s3_sync.sync_file(file_path, "logs/file.log"), UPLOADED)
+        mock_s3_client.put_object.assert_called_once()
+        self.assertEqual(s3_sync.state.get(file_path).checksum, checksum.sha256)
 
 
 class TestS3SyncIntegration(unittest.TestCase):
@@ -539,8 +1614,8 @@ class TestS3SyncIntegration(unittest.TestCase):
         # Check that already gzipped file was not re-gzipped
         self.assertTrue(os.path.exists(os.path.join(self.atm_dir, "old.log.gz")))
 
-        # Verify that upload_file was called for the gzipped files
-        self.assertGreater(mock_s3_client.upload_file.call_count, 0)
+        # Verify that the gzipped files were uploaded
+        self.assertGreater(mock_s3_client.put_object.call_count, 0)
 
     @patch("boto3.client")
     def test_sync_with_gzip_disabled(self, mock_client):
@@ -571,8 +1646,118 @@ class TestS3SyncIntegration(unittest.TestCase):
         self.assertTrue(os.path.exists(os.path.join(self.atm_dir, "error.log")))
         self.assertFalse(os.path.exists(os.path.join(self.atm_dir, "error.log.gz")))
 
-        # Verify that upload_file was called for the original files
-        self.assertGreater(mock_s3_client.upload_file.call_count, 0)
+        # Verify that the original files were uploaded
+        self.assertGreater(mock_s3_client.put_object.call_count, 0)
+
+    @patch("boto3.client")
+    def test_run_shares_workers_between_nodes(self, mock_client):
+        """A node with a large backlog should not hold back the other nodes or exceed the workers."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        big_dir = os.path.join(self.temp_dir, "en", "en-http-pdscloud-prod1")
+        os.makedirs(big_dir)
+        for i in range(20):
+            with open(os.path.join(big_dir, f"proxy.2025-01-{i + 1:02d}.txt"), "w") as f:
+                f.write("proxy log")
+
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+        put_object = fake_s3.put_object
+
+        def slow_upload(**kwargs):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.02)
+            put_object(**kwargs)
+            with lock:
+                in_flight[0] -= 1
+
+        fake_s3.put_object = slow_upload
+
+        config = {
+            big_dir: Box({"include": ["*.txt"], "max_workers": 1}),
+            os.path.join(self.temp_dir, "atm", "atm-apache-http"): Box({"include": ["*.log"], "weight": 2}),
+        }
+        s3_sync = S3Sync(config, self.temp_dir, "bucket", "logs", workers=2, enable_gzip=False, state_file=None)
+        s3_sync.run()
+
+        keys = [kwargs["Key"] for kwargs in fake_s3.operations("put_object")]
+        self.assertEqual(len(keys), 22)
+        self.assertEqual(max_in_flight[0], 2)
+        atm_positions = [i for i, key in enumerate(keys) if key.startswith("logs/atm/")]
+        self.assertLess(max(atm_positions), 10)
+
+    @patch("boto3.client")
+    def test_interrupted_large_upload_resumes_on_next_run(self, mock_client):
+        """A large upload killed part way should be resumed by the next run instead of starting over."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        log_path = os.path.join(self.atm_dir, "big.log.gz")
+        with open(log_path, "wb") as f:
+            f.write(os.urandom(5000))
+        config = {os.path.join(self.temp_dir, "atm", "atm-apache-http"): {"include": ["big.log.gz"]}}
+        state_file = os.path.join(self.temp_dir, "state.db")
+
+        def make_sync():
+            return S3Sync(
+                config,
+                self.temp_dir,
+                "bucket",
+                "logs",
+                state_file=state_file,
+                small_file_threshold=1024,
+                multipart_chunksize=1024,
+                multipart_concurrency=1,
+            )
+
+        # The connection drops after two parts
+        upload_part = fake_s3.upload_part
+
+        def flaky_upload_part(**kwargs):
+            if kwargs["PartNumber"] > 2:
+                raise client_error("RequestTimeout", "UploadPart")
+            return upload_part(**kwargs)
+
+        fake_s3.upload_part = flaky_upload_part
+        first = make_sync()
+        with patch("pds.web_analytics.s3_sync.logger"):
+            first.run()
+        first.state.close()
+        self.assertNotIn("logs/atm/atm-apache-http/big.log.gz", fake_s3.objects)
+        fake_s3.upload_part = upload_part
+
+        make_sync().run()
+
+        with open(log_path, "rb") as f:
+            self.assertEqual(fake_s3.objects["logs/atm/atm-apache-http/big.log.gz"]["Body"], f.read())
+        self.assertEqual(len(fake_s3.operations("create_multipart_upload")), 1)
+        self.assertEqual([kwargs["PartNumber"] for kwargs in fake_s3.operations("upload_part")], [1, 2, 3, 4, 5])
+        self.assertEqual(fake_s3.multipart, {})
+
+    @patch("boto3.client")
+    def test_abandoned_multipart_uploads_are_aborted(self, mock_client):
+        """Multipart uploads older than the configured age should be aborted, recent ones left alone."""
+        fake_s3 = FakeS3()
+        mock_client.return_value = fake_s3
+        s3_sync = S3Sync({}, self.temp_dir, "bucket", "logs", state_file=os.path.join(self.temp_dir, "state.db"))
+        old_journaled = fake_s3.create_multipart_upload(Bucket="bucket", Key="logs/atm/a.gz")["UploadId"]
+        old_unknown = fake_s3.create_multipart_upload(Bucket="bucket", Key="logs/atm/b.gz")["UploadId"]
+        recent = fake_s3.create_multipart_upload(Bucket="bucket", Key="logs/atm/c.gz")["UploadId"]
+        elsewhere = fake_s3.create_multipart_upload(Bucket="bucket", Key="other/d.gz")["UploadId"]
+        s3_sync.state.start_multipart("/logs/atm/a.gz", "logs/atm/a.gz", old_journaled, 100, 1000, 40)
+        long_ago = datetime.now(timezone.utc) - timedelta(days=8)
+        for upload_id in (old_journaled, old_unknown, elsewhere):
+            fake_s3.multipart[upload_id]["Initiated"] = long_ago
+        with s3_sync.state._lock:
+            s3_sync.state._conn.execute("UPDATE multipart_uploads SET started = ?", (long_ago.timestamp(),))
+
+        with patch("pds.web_analytics.s3_sync.logger"):
+            self.assertEqual(s3_sync.abort_abandoned_uploads(), 2)
+
+        self.assertEqual(sorted(fake_s3.multipart), sorted([recent, elsewhere]))
+        self.assertEqual(s3_sync.state.multipart_uploads(), [])
 
 
 class TestLoadConfigWithEnvVars(unittest.TestCase):
@@ -820,6 +2005,73 @@ class TestParseArgs(unittest.TestCase):
         self.assertEqual(args.aws_profile, "test-profile")
         self.assertTrue(args.no_gzip)
 
+    @patch("sys.argv", ["script.py", "-c", "config.yaml", "-d", "/logs", "--workers", "16"])
+    def test_parse_args_with_workers(self):
+        """Test parse_args with --workers option."""
+        os.environ["AWS_PROFILE"] = "test-profile"
+
+        from pds.web_analytics.s3_sync import parse_args
+
+        args = parse_args()
+
+        self.assertEqual(args.workers, 16)
+
+    @patch("sys.argv", ["script.py", "-c", "config.yaml", "-d", "/logs", "--gzip-level", "9"])
+    def test_parse_args_with_gzip_level(self):
+        """Test parse_args with --gzip-level option."""
+        os.environ["AWS_PROFILE"] = "test-profile"
+
+        from pds.web_analytics.s3_sync import parse_args
+
+        args = parse_args()
+
+        self.assertEqual(args.gzip_level, 9)
+
+    @patch("sys.argv", ["script.py", "-c", "config.yaml", "-d", "/logs", "--stream"])
+    def test_parse_args_with_stream(self):
+        """Test parse_args with --stream flag."""
+        os.environ["AWS_PROFILE"] = "test-profile"
+
+        from pds.web_analytics.s3_sync import parse_args
+
+        args = parse_args()
+
+        self.assertTrue(args.stream)
+
+    @patch("sys.argv", ["script.py", "-c", "config.yaml", "-d", "/logs", "--state-file", "/var/lib/sync.db"])
+    def test_parse_args_with_state_file(self):
+        """Test parse_args with --state-file option."""
+        os.environ["AWS_PROFILE"] = "test-profile"
+
+        from pds.web_analytics.s3_sync import parse_args
+
+        args = parse_args()
+
+        self.assertEqual(args.state_file, "/var/lib/sync.db")
+        self.assertFalse(args.no_state)
+
+    @patch("sys.argv", ["script.py", "-c", "config.yaml", "-d", "/logs", "--full-scan"])
+    def test_parse_args_with_full_scan(self):
+        """Test parse_args with --full-scan flag."""
+        os.environ["AWS_PROFILE"] = "test-profile"
+
+        from pds.web_analytics.s3_sync import parse_args
+
+        args = parse_args()
+
+        self.assertTrue(args.full_scan)
+
+    @patch("sys.argv", ["script.py", "-c", "config.yaml", "-d", "/logs", "--plan"])
+    def test_parse_args_with_plan(self):
+        """Test parse_args with --plan flag."""
+        os.environ["AWS_PROFILE"] = "test-profile"
+
+        from pds.web_analytics.s3_sync import parse_args
+
+        args = parse_args()
+
+        self.assertTrue(args.plan)
+
 
 if __name__ == "__main__":
     # Run the tests
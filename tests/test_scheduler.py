@@ -0,0 +1,116 @@
+"""Unit tests for the FairScheduler class."""
+import threading
+import time
+import unittest
+
+from pds.web_analytics.scheduler import FairScheduler
+
+
+class TestFairScheduler(unittest.TestCase):
+    """Test cases for the FairScheduler class."""
+
+    def run_blocked(self, scheduler, submit):
+        """Hold the single worker busy while ``submit`` queues work, then release it."""
+        gate = threading.Event()
+        scheduler.add_node("gate")
+        scheduler.submit("gate", 0, gate.wait)
+        time.sleep(0.05)
+        submit()
+        gate.set()
+
+    def test_weights_share_workers(self):
+        """A node with three times the weight should get three times the files while both are busy."""
+        order = []
+        with FairScheduler(1, queue_depth=10) as scheduler:
+            scheduler.add_node("big", weight=3)
+            scheduler.add_node("small", weight=1)
+
+            def submit():
+                for _ in range(8):
+                    scheduler.submit("big", 1024, order.append, "big")
+                    scheduler.submit("small", 1024, order.append, "small")
+
+            self.run_blocked(scheduler, submit)
+
+        self.assertEqual(len(order), 16)
+        self.assertEqual(order[:8].count("big"), 6)
+
+    def test_large_backlog_does_not_starve_other_nodes(self):
+        """A node submitting after another has queued many files should be served next."""
+        order = []
+        with FairScheduler(1, queue_depth=50) as scheduler:
+            scheduler.add_node("proxy")
+            scheduler.add_node("atm")
+
+            def submit():
+                for _ in range(50):
+                    scheduler.submit("proxy", 1024, order.append, "proxy")
+                scheduler.submit("atm", 1024, order.append, "atm")
+
+            self.run_blocked(scheduler, submit)
+
+        self.assertLessEqual(order.index("atm"), 1)
+
+    def test_max_workers_caps_a_node(self):
+        """A node should never run more files at once than its max_workers."""
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+
+        def work():
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+
+        with FairScheduler(4) as scheduler:
+            scheduler.add_node("capped", max_workers=2)
+            for _ in range(8):
+                scheduler.submit("capped", 0, work)
+            scheduler.drain("capped")
+
+        self.assertEqual(max_in_flight[0], 2)
+
+    def test_submit_blocks_while_node_queue_is_full(self):
+        """Submitting should wait for a queue slot instead of growing the queue."""
+        gate = threading.Event()
+        with FairScheduler(1, queue_depth=1) as scheduler:
+            scheduler.add_node("node")
+            scheduler.submit("node", 0, gate.wait)
+            time.sleep(0.05)
+            scheduler.submit("node", 0, lambda: None)
+
+            submitted = threading.Event()
+            thread = threading.Thread(target=lambda: (scheduler.submit("node", 0, lambda: None), submitted.set()))
+            thread.start()
+            self.assertFalse(submitted.wait(0.1))
+            gate.set()
+            self.assertTrue(submitted.wait(1))
+            thread.join()
+
+    def test_future_reports_result_and_exception(self):
+        """Futures should carry the result or the exception of the call."""
+
+        def fail():
+            raise ValueError("boom")
+
+        with FairScheduler(2) as scheduler:
+            scheduler.add_node("node")
+            ok = scheduler.submit("node", 0, lambda x: x * 2, 21)
+            bad = scheduler.submit("node", 0, fail)
+            scheduler.drain("node")
+
+        self.assertEqual(ok.result(), 42)
+        self.assertIsInstance(bad.exception(), ValueError)
+
+    def test_invalid_weight(self):
+        """A non-positive weight should be rejected."""
+        with FairScheduler(1) as scheduler:
+            with self.assertRaises(ValueError):
+                scheduler.add_node("node", weight=0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,143 @@
+"""Unit tests for seekable gzip output and its block indexes."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from datetime import timezone
+
+from pds.web_analytics.compression import gzip_file
+from pds.web_analytics.seekable import Block
+from pds.web_analytics.seekable import BlockCompressor
+from pds.web_analytics.seekable import BlockIndex
+from pds.web_analytics.seekable import byte_ranges
+from pds.web_analytics.seekable import index_gzip_file
+from pds.web_analytics.seekable import index_key
+from pds.web_analytics.seekable import read_block_index
+from pds.web_analytics.seekable import read_blocks
+from tests.fake_s3 import FakeS3
+
+LINE = '1.2.3.4 - - [25/Dec/2023:{:02d}:{:02d}:00 +0000] "GET /data/file.txt HTTP/1.1" 200 1024\n'
+
+
+def apache_log(hours):
+    """Return an Apache log with one record a minute over the given hours."""
+    return "".join(LINE.format(hour, minute) for hour in hours for minute in range(60)).encode()
+
+
+def epoch(hour, minute):
+    """Return the Unix timestamp of a record of ``apache_log``."""
+    return datetime(2023, 12, 25, hour, minute, tzinfo=timezone.utc).timestamp()
+
+
+class TestSeekable(unittest.TestCase):
+    """Test cases for seekable gzip output."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_index_key(self):
+        """Test that indexes are kept outside the dataset prefixes."""
+        self.assertEqual(
+            index_key("logs", "logs/atm/atm-apache-http/access.log.gz"),
+            "logs/_indexes/atm/atm-apache-http/access.log.gz.json",
+        )
+        self.assertEqual(index_key("", "atm/access.log.gz"), "_indexes/atm/access.log.gz.json")
+
+    def test_blocks_end_at_line_endings_and_decompress_alone(self):
+        """Test that each block is a gzip member of whole lines, and the members together are the log."""
+        log = apache_log(range(4))
+        compressor = BlockCompressor(6, block_size=4096)
+
+        output = b"".join(compressor.compress(log[i : i + 1000]) for i in range(0, len(log), 1000))
+        output += compressor.flush()
+
+        index = compressor.index
+        self.assertGreater(len(index), 4)
+        self.assertEqual(gzip.decompress(output), log)
+        self.assertEqual((index.compressed_bytes, index.raw_bytes), (len(output), len(log)))
+        self.assertEqual(index.log_format, "apache-common")
+        self.assertEqual(sum(block.lines for block in index.blocks), 240)
+        for block in index.blocks:
+            raw = gzip.decompress(output[block.offset : block.offset + block.length])
+            self.assertEqual(raw, log[block.raw_offset : block.raw_offset + block.raw_length])
+            self.assertTrue(raw.endswith(b"\n"))
+            self.assertGreaterEqual(block.raw_length, 4096 if block is not index.blocks[-1] else 1)
+        self.assertEqual((index.blocks[0].start, index.blocks[-1].end), (epoch(0, 0), epoch(3, 59)))
+
+    def test_empty_log_is_one_empty_block(self):
+        """Test that an empty log still gives a valid gzip stream."""
+        compressor = BlockCompressor(6)
+
+        output = compressor.compress(b"") + compressor.flush()
+
+        self.assertEqual(gzip.decompress(output), b"")
+        self.assertEqual(compressor.index.blocks, [Block(0, len(output), 0, 0, 0, None, None)])
+
+    def test_covering_and_byte_ranges(self):
+        """Test finding the blocks of a time range and merging adjacent ones into range requests."""
+        index = BlockIndex(
+            [
+                Block(0, 10, 0, 100, 5, 0.0, 99.0),
+                Block(10, 10, 100, 100, 5, 100.0, 199.0),
+                Block(20, 10, 200, 100, 5, None, None),
+                Block(30, 10, 300, 100, 5, 300.0, 399.0),
+            ]
+        )
+
+        self.assertEqual([block.offset for block in index.covering(150, 350)], [10, 30])
+        self.assertEqual(byte_ranges(index.blocks), [(0, 39)])
+        self.assertEqual(byte_ranges(index.covering(0, 350)), [(0, 19), (30, 39)])
+        self.assertEqual(byte_ranges(index.blocks, max_range=20), [(0, 19), (20, 39)])
+        self.assertEqual(BlockIndex.from_json(index.to_json()).blocks, index.blocks)
+
+    def test_read_blocks_fetches_ranges_of_a_time_range(self):
+        """Test reading the records of a time range from S3 with range GETs of their blocks only."""
+        log = apache_log(range(6))
+        compressor = BlockCompressor(6, block_size=8192)
+        s3 = FakeS3()
+        s3.put_object(Bucket="bucket", Key="logs/a.log.gz", Body=compressor.compress(log) + compressor.flush())
+        s3.put_object(Bucket="bucket", Key="logs/_indexes/a.log.gz.json", Body=compressor.index.to_json())
+
+        index = read_block_index(s3, "bucket", "logs/_indexes/a.log.gz.json")
+        blocks = index.covering(epoch(2, 30), epoch(2, 40))
+        records = b"".join(read_blocks(s3, "bucket", "logs/a.log.gz", blocks, max_range=1)).splitlines()
+
+        self.assertIn(LINE.format(2, 35).encode().rstrip(), records)
+        self.assertLess(len(records), 120)
+        self.assertEqual(len(s3.operations("get_object")), 1 + len(blocks))
+        self.assertIsNone(read_block_index(s3, "bucket", "logs/_indexes/missing.json"))
+
+    def test_gzip_file_writes_seekable_output(self):
+        """Test that in-place compression with a block size writes blocks that index_gzip_file finds again."""
+        source = os.path.join(self.temp_dir, "access.log")
+        with open(source, "wb") as f:
+            f.write(apache_log(range(2)))
+
+        stats = gzip_file(source, source + ".gz", block_size=2048, summarize=True)
+
+        self.assertEqual(index_gzip_file(source + ".gz", 1000, block_size=2048).blocks, stats.blocks.blocks)
+        self.assertEqual(stats.summary.lines, 120)
+        with gzip.open(source + ".gz", "rb") as f:
+            self.assertEqual(f.read(), apache_log(range(2)))
+
+    def test_index_gzip_file_rejects_ordinary_gzip(self):
+        """Test that single-member and corrupt gzip files are not indexed."""
+        path = os.path.join(self.temp_dir, "access.log.gz")
+        with gzip.open(path, "wb") as f:
+            f.write(apache_log(range(2)))
+        self.assertIsNone(index_gzip_file(path, 1000, block_size=2048))
+
+        with open(path, "wb") as f:
+            f.write(b"not gzip")
+        self.assertIsNone(index_gzip_file(path, 1000))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,174 @@
+"""Unit tests for the GzipStreamUploader class."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from pds.web_analytics.line_filter import filter_rules
+from pds.web_analytics.streaming import GzipStreamUploader
+from pds.web_analytics.streaming import MIN_PART_SIZE
+from pds.web_analytics.streaming import StreamCopy
+from tests.fake_s3 import client_error
+from tests.fake_s3 import FakeS3
+
+
+class TestGzipStreamUploader(unittest.TestCase):
+    """Test cases for the GzipStreamUploader class."""
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.s3 = FakeS3()
+
+    def tearDown(self):
+        """Clean up after each test."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_file(self, name, data):
+        """Write a local file and return its path."""
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_small_file_uses_single_put(self):
+        """Output smaller than one part should be sent with one put_object."""
+        data = b"GET /index.html 200\n" * 100
+        path = self.write_file("access.log", data)
+        uploader = GzipStreamUploader(self.s3, "bucket")
+
+        stats = uploader.upload(path, "logs/access.log.gz", {"ContentType": "application/gzip"})
+
+        self.assertEqual(stats.parts, 0)
+        self.assertEqual(stats.raw_bytes, len(data))
+        self.assertEqual(gzip.decompress(self.s3.objects["logs/access.log.gz"]["Body"]), data)
+        self.assertEqual(self.s3.objects["logs/access.log.gz"]["ContentType"], "application/gzip")
+        self.assertEqual(self.s3.operations("create_multipart_upload"), [])
+        self.assertIsNone(stats.summary)
+        # The local file is only read
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_large_file_uses_multipart(self):
+        """Output larger than one part should be streamed as ordered multipart parts."""
+        data = os.urandom(MIN_PART_SIZE * 2 + 12345)
+        path = self.write_file("access.log", data)
+        uploader = GzipStreamUploader(self.s3, "bucket", level=1, buffer_size=256 * 1024, part_size=MIN_PART_SIZE)
+
+        stats = uploader.upload(path, "logs/access.log.gz", {"ContentType": "application/gzip"})
+
+        self.assertGreaterEqual(stats.parts, 2)
+        self.assertEqual(stats.compressed_bytes, len(self.s3.objects["logs/access.log.gz"]["Body"]))
+        self.assertEqual(gzip.decompress(self.s3.objects["logs/access.log.gz"]["Body"]), data)
+        self.assertEqual(self.s3.objects["logs/access.log.gz"]["ContentType"], "application/gzip")
+        parts_sent = sorted(self.s3.operations("upload_part"), key=lambda kwargs: kwargs["PartNumber"])
+        self.assertTrue(all(len(kwargs["Body"]) == MIN_PART_SIZE for kwargs in parts_sent[:-1]))
+        # S3 verifies every part against its SHA256
+        self.assertEqual(self.s3.operations("create_multipart_upload")[0]["ChecksumAlgorithm"], "SHA256")
+        self.assertTrue(all("ChecksumSHA256" in kwargs for kwargs in self.s3.operations("upload_part")))
+        parts = self.s3.operations("complete_multipart_upload")[0]["MultipartUpload"]["Parts"]
+        self.assertTrue(all("ChecksumSHA256" in part for part in parts))
+
+    def test_upload_summarizes_file(self):
+        """The file should be summarized from the same read as the compression when asked."""
+        data = b'1.2.3.4 - - [25/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1\n' * 100
+        path = self.write_file("access.log", data)
+
+        stats = GzipStreamUploader(self.s3, "bucket").upload(path, "logs/access.log.gz", summarize=True)
+
+        self.assertEqual((stats.summary.lines, stats.summary.raw_bytes), (100, len(data)))
+        self.assertEqual((stats.summary.end, stats.summary.log_format), (1703500245.0, "apache-common"))
+
+    def test_upload_filters_lines(self):
+        """Records matching the line filter should be left out of the upload, however the file is cut into parts."""
+        line = b'1.2.3.4 - - [25/Dec/2023:10:30:45 +0000] "GET / HTTP/1.1" 200 1\n'
+        noise = b'1.2.3.4 - - [25/Dec/2023:10:30:46 +0000] "SSTP_DUPLEX_POST /sra HTTP/1.1" 400 1\n'
+        data = (line + noise) * 100
+        path = self.write_file("access.log", data[:-1])
+        uploader = GzipStreamUploader(self.s3, "bucket", buffer_size=1000)
+
+        stats = uploader.upload(path, "logs/access.log.gz", line_filter=filter_rules(["invalid-method"]))
+
+        self.assertEqual(gzip.decompress(self.s3.objects["logs/access.log.gz"]["Body"]), line * 100)
+        self.assertEqual((stats.raw_bytes, stats.dropped), (len(data) - 1, {"invalid-method": 100}))
+
+    def test_failed_part_aborts_upload(self):
+        """A failed part upload should abort the multipart upload and raise."""
+        data = os.urandom(MIN_PART_SIZE * 2)
+        path = self.write_file("access.log", data)
+        uploader = GzipStreamUploader(self.s3, "bucket", level=1, part_size=MIN_PART_SIZE)
+
+        def failing_upload_part(**kwargs):
+            raise client_error("InternalError", "UploadPart", 500)
+
+        self.s3.upload_part = failing_upload_part
+
+        with self.assertRaises(Exception):
+            uploader.upload(path, "logs/access.log.gz")
+
+        self.assertEqual(len(self.s3.operations("abort_multipart_upload")), 1)
+        self.assertNotIn("logs/access.log.gz", self.s3.objects)
+        self.assertEqual(self.s3.multipart, {})
+
+    def test_copies_are_fed_the_compressed_parts(self):
+        """Copies should receive the same object as the upload, from a single read and compression of the file."""
+        data = os.urandom(MIN_PART_SIZE * 2 + 12345)
+        path = self.write_file("access.log", data)
+        mirror = FakeS3()
+        uploader = GzipStreamUploader(self.s3, "bucket", level=1, part_size=MIN_PART_SIZE)
+        copy = StreamCopy(GzipStreamUploader(mirror, "dr-bucket"), "dr/access.log.gz", {"ContentType": "text/plain"})
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(copy.run)
+            stats = uploader.upload(path, "logs/access.log.gz", copies=[copy])
+            etag = future.result()
+
+        self.assertEqual(mirror.objects["dr/access.log.gz"]["Body"], self.s3.objects["logs/access.log.gz"]["Body"])
+        self.assertEqual(mirror.objects["dr/access.log.gz"]["ContentType"], "text/plain")
+        self.assertEqual(len(mirror.operations("upload_part")), stats.parts)
+        self.assertTrue(etag)
+
+    def test_copy_of_a_failed_upload_is_not_completed(self):
+        """A copy should only get its last part once the upload it copies has succeeded."""
+        path = self.write_file("access.log", b"GET / 200\n" * 100)
+        mirror = FakeS3()
+        uploader = GzipStreamUploader(self.s3, "bucket", level=1, part_size=MIN_PART_SIZE)
+        copy = StreamCopy(GzipStreamUploader(mirror, "dr-bucket"), "dr/access.log.gz")
+        self.s3.inject_errors("put_object", client_error("InternalError", "PutObject", 500))
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(copy.run)
+            with self.assertRaises(Exception):
+                uploader.upload(path, "logs/access.log.gz", copies=[copy])
+            with self.assertRaises(RuntimeError):
+                future.result()
+
+        self.assertTrue(copy.abandoned)
+        self.assertEqual(mirror.objects, {})
+
+    def test_copy_that_falls_behind_is_abandoned(self):
+        """A copy with no thread to upload it should be dropped without holding back the upload."""
+        data = os.urandom(MIN_PART_SIZE * 3)
+        path = self.write_file("access.log", data)
+        mirror = FakeS3()
+        uploader = GzipStreamUploader(self.s3, "bucket", level=1, part_size=MIN_PART_SIZE)
+        copy = StreamCopy(GzipStreamUploader(mirror, "dr-bucket"), "dr/access.log.gz", max_lag=1)
+
+        uploader.upload(path, "logs/access.log.gz", copies=[copy])
+
+        self.assertIn("logs/access.log.gz", self.s3.objects)
+        self.assertTrue(copy.abandoned)
+        with self.assertRaises(RuntimeError):
+            copy.run()
+        self.assertEqual(mirror.calls, [])
+
+    def test_rejects_small_parts(self):
+        """Part sizes below the S3 minimum should be rejected."""
+        with self.assertRaises(ValueError):
+            GzipStreamUploader(self.s3, "bucket", part_size=1024)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
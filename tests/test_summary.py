@@ -0,0 +1,99 @@
+"""Unit tests for the summaries of log files."""
+import unittest
+from datetime import datetime
+from datetime import timezone
+
+from pds.web_analytics.summary import DETECT_SIZE
+from pds.web_analytics.summary import LogSummarizer
+
+
+def utc(*args):
+    """Return the Unix timestamp of a UTC time."""
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def apache_line(day, clock, offset="+0000"):
+    """Return an Apache combined log line."""
+    return f'192.168.1.1 - - [{day}/Dec/2023:{clock} {offset}] "GET /data/file.txt HTTP/1.1" 200 1024 "-" "curl"\n'
+
+
+def summarize(text, chunk_size=None):
+    """Summarize text fed in chunks of the given size, or all at once."""
+    data = text.encode()
+    summarizer = LogSummarizer()
+    chunk_size = chunk_size or len(data) or 1
+    for offset in range(0, len(data), chunk_size):
+        summarizer.update(data[offset : offset + chunk_size])
+    return summarizer.result()
+
+
+class TestLogSummarizer(unittest.TestCase):
+    """Test cases for LogSummarizer."""
+
+    def test_apache_summary(self):
+        """Test the line count, sizes, time range and format of an Apache log."""
+        text = apache_line(25, "10:30:45") + apache_line(25, "10:29:59") + apache_line(25, "11:00:00", "-0700")
+
+        summary = summarize(text)
+
+        self.assertEqual(summary.lines, 3)
+        self.assertEqual(summary.raw_bytes, len(text))
+        self.assertEqual(summary.start, utc(2023, 12, 25, 10, 29, 59))
+        self.assertEqual(summary.end, utc(2023, 12, 25, 18, 0, 0))
+        self.assertEqual(summary.log_format, "apache-combined")
+
+    def test_records_across_days_and_chunks(self):
+        """Test records out of order across midnight, fed in chunks that split lines and the detection sample."""
+        lines = [apache_line(24, f"23:{minute:02d}:00") for minute in range(60)] * 40
+        text = "".join(lines) + apache_line(25, "00:00:01") + apache_line(24, "22:59:59") + apache_line(26, "01:00:00")
+        self.assertGreater(len(text), DETECT_SIZE)
+
+        for chunk_size in (None, 1000, 4093):
+            with self.subTest(chunk_size=chunk_size):
+                summary = summarize(text, chunk_size)
+                self.assertEqual(summary.lines, len(lines) + 3)
+                self.assertEqual(summary.start, utc(2023, 12, 24, 22, 59, 59))
+                self.assertEqual(summary.end, utc(2023, 12, 26, 1, 0, 0))
+
+    def test_w3c_summary(self):
+        """Test IIS and CloudFront W3C logs, whose comment lines have no timestamps."""
+        iis = "#Software: Microsoft IIS\n#Date: 2023-12-25 00:00:01\n2023-12-25 10:30:45 W3SVC1 10.0.0.1 GET /data 80\n"
+        cloudfront = "#Version: 1.0\n2023-12-25\t10:30:45\tLAX1\t1024\t1.2.3.4\tGET\n2023-12-26\t00:00:00\tLAX1\n"
+
+        self.assertEqual(summarize(iis)[2:], (utc(2023, 12, 25, 10, 30, 45), utc(2023, 12, 25, 10, 30, 45), "iis"))
+        self.assertEqual(
+            summarize(cloudfront)[2:], (utc(2023, 12, 25, 10, 30, 45), utc(2023, 12, 26), "cloudfront-w3c")
+        )
+
+    def test_xferlog_summary(self):
+        """Test FTP transfer logs, whose timestamps are in local time."""
+        text = "Mon Dec 25 10:30:45 2023 1 1.2.3.4 1024 /data/a.txt a _ o r user ftp 0 * c\n"
+        text += "Tue Dec 26 09:00:00 2023 1 1.2.3.4 1024 /data/b.txt a _ o r user ftp 0 * c\n"
+
+        summary = summarize(text)
+
+        self.assertEqual(summary.start, datetime(2023, 12, 25, 10, 30, 45).timestamp())
+        self.assertEqual(summary.end, datetime(2023, 12, 26, 9, 0, 0).timestamp())
+        self.assertEqual(summary.log_format, "xferlog")
+
+    def test_unrecognized_format_is_still_timed(self):
+        """Test that a log in no known format is timed by the timestamp style of its records."""
+        text = "2023-12-25 10:30:45 custom record\n2023-12-25 11:00:00 custom record\n"
+
+        self.assertEqual(summarize(text)[2:], (utc(2023, 12, 25, 10, 30, 45), utc(2023, 12, 25, 11), None))
+
+    def test_last_line_without_newline(self):
+        """Test that a last line without a newline is counted and its timestamp used."""
+        summary = summarize(apache_line(25, "10:30:45") + apache_line(25, "12:00:00").rstrip("\n"))
+
+        self.assertEqual(summary.lines, 2)
+        self.assertEqual(summary.end, utc(2023, 12, 25, 12, 0, 0))
+
+    def test_unrecognized_and_empty_logs(self):
+        """Test that logs without recognized timestamps still have their lines and bytes counted."""
+        self.assertEqual(summarize("one\ntwo\nthree"), (3, 13, None, None, None))
+        self.assertEqual(summarize(""), (0, 0, None, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
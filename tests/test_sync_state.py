@@ -0,0 +1,179 @@
+"""Unit tests for the SyncState class."""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from pds.web_analytics.manifest import ManifestEntry
+from pds.web_analytics.sync_state import SyncState
+from pds.web_analytics.sync_state import ThroughputRecord
+
+
+class TestSyncState(unittest.TestCase):
+    """Test cases for the SyncState class."""
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "config.state.db")
+        self.state = SyncState(self.db_path)
+
+    def tearDown(self):
+        """Clean up after each test."""
+        self.state.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_unknown_file_is_not_synced(self):
+        """A file that was never recorded should not be skipped."""
+        self.assertIsNone(self.state.get("/logs/a.gz"))
+        self.assertFalse(self.state.is_synced("/logs/a.gz", 10, 1000))
+
+    def test_uploaded_file_is_synced_until_it_changes(self):
+        """An uploaded file should be skipped only while its size and mtime match."""
+        self.state.mark_uploaded("/logs/a.gz", 10, 1000, "logs/a.gz", '"etag"')
+
+        self.assertTrue(self.state.is_synced("/logs/a.gz", 10, 1000))
+        self.assertFalse(self.state.is_synced("/logs/a.gz", 11, 1000))
+        self.assertFalse(self.state.is_synced("/logs/a.gz", 10, 2000))
+        self.assertEqual(self.state.get("/logs/a.gz").etag, '"etag"')
+
+    def test_pending_uploads_survive_reopen(self):
+        """Uploads that were started but not confirmed should be reported after reopening the database."""
+        self.state.mark_pending("/logs/a.gz", 10, 1000, "logs/a.gz")
+        self.state.mark_pending("/logs/b.gz", 20, 1000, "logs/b.gz")
+        self.state.mark_uploaded("/logs/b.gz", 20, 1000, "logs/b.gz")
+        self.state.close()
+
+        self.state = SyncState(self.db_path)
+
+        pending = self.state.pending()
+        self.assertEqual([record.path for record in pending], ["/logs/a.gz"])
+        self.assertFalse(self.state.is_synced("/logs/a.gz", 10, 1000))
+        self.assertTrue(self.state.is_synced("/logs/b.gz", 20, 1000))
+
+    def test_forget(self):
+        """Forgotten files should no longer have a record."""
+        self.state.mark_uploaded("/logs/a.gz", 10, 1000, "logs/a.gz")
+        self.state.forget("/logs/a.gz")
+
+        self.assertIsNone(self.state.get("/logs/a.gz"))
+
+    def test_copies_are_recorded_per_destination(self):
+        """A copy should count for its destination only, until the file changes or is forgotten."""
+        self.state.mark_copied("s3://dr/logs", "/logs/a.gz", 10, 1000, "logs/a.gz", '"etag"')
+
+        self.assertTrue(self.state.is_copied("s3://dr/logs", "/logs/a.gz", 10, 1000))
+        self.assertFalse(self.state.is_copied("s3://dr/logs", "/logs/a.gz", 10, 2000))
+        self.assertFalse(self.state.is_copied("s3://other/logs", "/logs/a.gz", 10, 1000))
+        self.assertEqual(self.state.get_copy("s3://dr/logs", "/logs/a.gz").s3_key, "logs/a.gz")
+        self.state.forget("/logs/a.gz")
+        self.assertIsNone(self.state.get_copy("s3://dr/logs", "/logs/a.gz"))
+
+    def test_checksum_is_recorded(self):
+        """The checksum of an uploaded file should be kept, and cleared by a new pending upload."""
+        self.state.mark_uploaded("/logs/a.gz", 10, 1000, "logs/a.gz", checksum="c2hhMjU2")
+        self.assertEqual(self.state.get("/logs/a.gz").checksum, "c2hhMjU2")
+
+        self.state.mark_pending("/logs/a.gz", 12, 2000, "logs/a.gz")
+        self.assertIsNone(self.state.get("/logs/a.gz").checksum)
+
+    def test_databases_without_checksums_are_migrated(self):
+        """A database written before checksums were recorded should gain the column and keep its records."""
+        self.state.close()
+        os.remove(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(
+            "CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "s3_key TEXT NOT NULL, etag TEXT, status TEXT NOT NULL, updated REAL NOT NULL);"
+            "INSERT INTO files VALUES ('/logs/a.gz', 10, 1000, 'logs/a.gz', NULL, 'uploaded', 0);"
+        )
+        conn.close()
+
+        self.state = SyncState(self.db_path)
+
+        self.assertTrue(self.state.is_synced("/logs/a.gz", 10, 1000))
+        self.assertIsNone(self.state.get("/logs/a.gz").checksum)
+        self.state.mark_uploaded("/logs/b.gz", 10, 1000, "logs/b.gz", checksum="c2hhMjU2")
+        self.assertEqual(self.state.get("/logs/b.gz").checksum, "c2hhMjU2")
+
+    def test_read_only_databases_are_never_created_or_migrated(self):
+        """A database opened read-only should be read as it is, and refused if missing or outdated."""
+        self.state.mark_uploaded("/logs/a.gz", 10, 1000, "logs/a.gz")
+        missing = os.path.join(self.temp_dir, "missing.state.db")
+        outdated = os.path.join(self.temp_dir, "outdated.state.db")
+        conn = sqlite3.connect(outdated)
+        conn.execute("CREATE TABLE files (path TEXT PRIMARY KEY)")
+        conn.close()
+
+        reader = SyncState(self.db_path, read_only=True)
+
+        self.assertTrue(reader.is_synced("/logs/a.gz", 10, 1000))
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.forget("/logs/a.gz")
+        reader.close()
+        with self.assertRaises(sqlite3.Error):
+            SyncState(missing, read_only=True)
+        self.assertFalse(os.path.exists(missing))
+        with self.assertRaises(sqlite3.Error):
+            SyncState(outdated, read_only=True)
+        conn = sqlite3.connect(outdated)
+        self.assertEqual(
+            [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")], ["files"]
+        )
+        conn.close()
+
+    def test_multipart_uploads_survive_reopen(self):
+        """A multipart upload and its confirmed parts should be kept until it is finished."""
+        self.state.start_multipart("/logs/a.gz", "logs/a.gz", "upload-1", 100, 1000, 40)
+        self.state.record_part("upload-1", 1, '"etag1"', "c2hhMQ==")
+        self.state.record_part("upload-1", 2, '"etag2"')
+        self.state.close()
+
+        self.state = SyncState(self.db_path)
+
+        record = self.state.get_multipart("/logs/a.gz")
+        self.assertEqual((record.upload_id, record.size, record.part_size), ("upload-1", 100, 40))
+        self.assertEqual(record.parts, {1: ('"etag1"', "c2hhMQ=="), 2: ('"etag2"', None)})
+        self.assertEqual([upload.upload_id for upload in self.state.multipart_uploads()], ["upload-1"])
+
+        # Starting over replaces the upload and its parts
+        self.state.start_multipart("/logs/a.gz", "logs/a.gz", "upload-2", 120, 2000, 40)
+        self.assertEqual(self.state.get_multipart("/logs/a.gz").parts, {})
+
+        self.state.finish_multipart("upload-2")
+        self.assertIsNone(self.state.get_multipart("/logs/a.gz"))
+        self.assertEqual(self.state.multipart_uploads(), [])
+
+    def test_summaries_are_kept_until_published(self):
+        """Summaries should be listed as unpublished until their manifest is updated, and kept afterwards."""
+        first = ManifestEntry("logs/atm/a.gz", 10, 100, 2, 1000.0, 2000.0, "apache")
+        second = ManifestEntry("logs/atm/b.gz", 20, 200, 4, None, None, None)
+        self.state.record_summary("logs/_manifests/atm.jsonl", first)
+        self.state.record_summary("logs/_manifests/atm.jsonl", second)
+        self.state.record_summary("logs/_manifests/en.jsonl", first._replace(key="logs/en/a.gz"))
+
+        self.state.mark_published("logs/_manifests/atm.jsonl", ["logs/atm/a.gz"])
+
+        self.assertEqual(self.state.summaries("logs/_manifests/atm.jsonl", unpublished=True), [second])
+        self.assertEqual(sorted(self.state.summaries("logs/_manifests/atm.jsonl")), [first, second])
+
+        # A re-uploaded object needs publishing again
+        self.state.record_summary("logs/_manifests/atm.jsonl", first._replace(size=11))
+        self.assertEqual(len(self.state.summaries("logs/_manifests/atm.jsonl", unpublished=True)), 2)
+
+    def test_throughput_history_is_pruned(self):
+        """Throughput should be listed oldest first, and runs past the history window forgotten."""
+        now = time.time()
+        old = ThroughputRecord(now - 40 * 86400, "atm", 10.0, 1, 100, 10)
+        recent = [ThroughputRecord(now - 60, node, 20.0, 2, 2000, 200) for node in ("atm", "en")]
+        self.state.record_throughput([old])
+        self.state.record_throughput(recent)
+
+        self.assertEqual(self.state.throughput(), recent)
+        self.assertEqual(self.state.throughput(since=now), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,129 @@
+"""Unit tests for the upload helpers."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from pds.web_analytics.checksum import checksum_file
+from pds.web_analytics.checksum import ChecksumHasher
+from pds.web_analytics.sync_state import SyncState
+from pds.web_analytics.transfer import upload_multipart
+from tests.fake_s3 import client_error
+from tests.fake_s3 import FakeS3
+
+PART_SIZE = 1024
+
+
+class TestUploadMultipart(unittest.TestCase):
+    """Test cases for resumable multipart uploads."""
+
+    def setUp(self):
+        """Set up a file of several parts, a fake S3 and a journal."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.path = os.path.join(self.temp_dir, "access.log.gz")
+        with open(self.path, "wb") as f:
+            f.write(os.urandom(PART_SIZE * 4 + 100))
+        self.s3 = FakeS3()
+        self.journal = SyncState(os.path.join(self.temp_dir, "state.db"))
+        self.addCleanup(self.journal.close)
+
+    def upload(self, **kwargs):
+        """Upload the file to logs/access.log.gz one part at a time."""
+        return upload_multipart(
+            self.s3,
+            "bucket",
+            self.path,
+            "logs/access.log.gz",
+            self.journal,
+            part_size=PART_SIZE,
+            concurrency=1,
+            **kwargs
+        )
+
+    def interrupt_after(self, parts):
+        """Run an upload that fails after sending some parts."""
+        original = self.s3.upload_part
+        sent = []
+
+        def upload_part(**kwargs):
+            if len(sent) == parts:
+                raise client_error("RequestTimeout", "UploadPart", 400)
+            sent.append(kwargs["PartNumber"])
+            return original(**kwargs)
+
+        self.s3.upload_part = upload_part
+        with self.assertRaises(Exception):
+            self.upload()
+        self.s3.upload_part = original
+
+    def assert_uploaded(self):
+        """Check the object holds the file and the journal has forgotten the upload."""
+        with open(self.path, "rb") as f:
+            self.assertEqual(self.s3.objects["logs/access.log.gz"]["Body"], f.read())
+        self.assertIsNone(self.journal.get_multipart(self.path))
+        self.assertEqual(self.s3.multipart, {})
+
+    def test_upload_sends_parts_with_checksums(self):
+        """A fresh upload should send every part with its SHA256 and complete."""
+        sizes = []
+
+        self.upload(extra_args={"ContentType": "application/gzip"}, callback=sizes.append)
+
+        self.assert_uploaded()
+        self.assertEqual(sizes, [PART_SIZE] * 4 + [100])
+        self.assertTrue(all("ChecksumSHA256" in kwargs for kwargs in self.s3.operations("upload_part")))
+        created = self.s3.operations("create_multipart_upload")[0]
+        self.assertEqual((created["ChecksumAlgorithm"], created["ContentType"]), ("SHA256", "application/gzip"))
+
+    def test_interrupted_upload_resumes(self):
+        """An upload that failed part way should resume with only the missing parts."""
+        self.interrupt_after(2)
+        record = self.journal.get_multipart(self.path)
+        self.assertEqual(sorted(record.parts), [1, 2])
+
+        self.upload()
+
+        self.assert_uploaded()
+        self.assertEqual(len(self.s3.operations("create_multipart_upload")), 1)
+        self.assertEqual([kwargs["PartNumber"] for kwargs in self.s3.operations("upload_part")], [1, 2, 3, 4, 5])
+
+    def test_upload_checksums_the_whole_file_from_its_parts(self):
+        """The hasher should get the whole file in order, parts already in S3 included, from parallel reads."""
+        self.interrupt_after(2)
+        hasher = ChecksumHasher()
+
+        upload_multipart(
+            self.s3, "bucket", self.path, "logs/access.log.gz", self.journal, part_size=PART_SIZE, hasher=hasher
+        )
+
+        self.assert_uploaded()
+        self.assertEqual(hasher.result(), checksum_file(self.path))
+        self.assertEqual(len(self.s3.operations("upload_part")), 5)
+
+    def test_upload_of_changed_file_starts_over(self):
+        """A recorded upload of an older version of the file should be aborted and replaced."""
+        self.interrupt_after(2)
+        with open(self.path, "ab") as f:
+            f.write(b"appended")
+
+        self.upload()
+
+        self.assert_uploaded()
+        self.assertEqual(len(self.s3.operations("create_multipart_upload")), 2)
+        self.assertEqual(len(self.s3.operations("abort_multipart_upload")), 1)
+
+    def test_upload_gone_from_s3_starts_over(self):
+        """A recorded upload that S3 no longer has should be started again from the first part."""
+        self.interrupt_after(2)
+        self.s3.multipart.clear()
+
+        self.upload()
+
+        self.assert_uploaded()
+        self.assertEqual(len(self.s3.operations("create_multipart_upload")), 2)
+        self.assertEqual(len(self.s3.operations("upload_part")), 7)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)